@@ -0,0 +1,123 @@
+# benchmarks/fixtures.py
+"""
+Offline inputs for the benchmark suite: saved screener.in pages and
+synthetic FINANCIALS_QUARTERLY fact rows of configurable size.
+"""
+import glob
+import os
+import random
+from typing import Dict, List, Tuple
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+MONTHS = ["Mar", "Jun", "Sep", "Dec"]
+
+QUARTERLY_ROWS = [
+    "Sales +", "Expenses +", "Operating Profit", "OPM %", "Other Income +", "Interest",
+    "Depreciation", "Profit before tax", "Tax %", "Net Profit +", "EPS in Rs",
+]
+ANNUAL_ROWS = QUARTERLY_ROWS + ["Dividend Payout %"]
+BALANCE_SHEET_ROWS = [
+    "Equity Capital", "Reserves", "Borrowings +", "Other Liabilities +", "Total Liabilities",
+    "Fixed Assets +", "CWIP", "Investments", "Other Assets +", "Total Assets",
+]
+CASH_FLOW_ROWS = [
+    "Cash from Operating Activity +", "Cash from Investing Activity +",
+    "Cash from Financing Activity +", "Net Cash Flow",
+]
+RATIO_ROWS = [
+    "Debtor Days", "Inventory Days", "Days Payable", "Cash Conversion Cycle",
+    "Working Capital Days", "ROCE %",
+]
+
+SAMPLE_METRICS = [
+    ("Sales", "Income Statement"), ("Net Profit", "Income Statement"), ("Operating Profit", "Income Statement"),
+    ("Total Assets", "Balance Sheet"), ("Equity", "Balance Sheet"), ("Borrowings", "Balance Sheet"),
+    ("Cash from Operating Activity", "Cash Flow"), ("ROE %", "Financial Ratios"),
+    ("ROCE %", "Financial Ratios"), ("Current Ratio", "Financial Ratios"), ("EPS", "Per Share Data"),
+    ("Face Value", "Other Financial Metrics"),
+]
+
+
+def quarter_labels(count: int, last_year: int = 2024) -> List[str]:
+    labels = []
+    year, month = last_year, len(MONTHS) - 1
+    for _ in range(count):
+        labels.append(f"{MONTHS[month]} {year}")
+        month -= 1
+        if month < 0:
+            month, year = len(MONTHS) - 1, year - 1
+    return list(reversed(labels))
+
+
+def _raw_value(rng: random.Random, metric: str) -> str:
+    """Format a number the way screener.in renders it (thousands separators, %, negatives)"""
+    if "%" in metric:
+        return f"{rng.uniform(-5, 45):.1f}%"
+    value = rng.uniform(-2000, 250000)
+    text = f"{abs(value):,.0f}"
+    return f"-{text}" if value < 0 and rng.random() < 0.5 else text
+
+
+def _table(rng: random.Random, periods: List[str], rows: List[str]) -> str:
+    head = "".join(f"<th>{p}</th>" for p in periods)
+    body = ""
+    for metric in rows:
+        cells = "".join(f"<td>{_raw_value(rng, metric)}</td>" for _ in periods)
+        body += f'<tr><td class="text">{metric}\xa0</td>{cells}</tr>\n'
+    return f'<table class="data-table"><thead><tr><th></th>{head}</tr></thead><tbody>\n{body}</tbody></table>'
+
+
+def synthetic_screener_html(seed: int = 0, n_quarters: int = 13, n_years: int = 12) -> str:
+    """Build a page with the same section/table layout the extract_* functions parse"""
+    rng = random.Random(seed)
+    quarters = quarter_labels(n_quarters)
+    years = [f"Mar {2024 - n_years + 1 + i}" for i in range(n_years)]
+    return f"""<!DOCTYPE html>
+<html><head><title>Synthetic screener page</title></head><body>
+<div class="breadcrumb">Home › Large Cap › Refineries</div>
+<section id="quarters" class="card">{_table(rng, quarters, QUARTERLY_ROWS)}</section>
+<section id="profit-loss" class="card">{_table(rng, years, ANNUAL_ROWS)}</section>
+<section id="balance-sheet" class="card">{_table(rng, years, BALANCE_SHEET_ROWS)}</section>
+<section id="cash-flow" class="card">{_table(rng, years, CASH_FLOW_ROWS)}</section>
+<section id="ratios" class="card ratios">{_table(rng, years, RATIO_ROWS)}</section>
+</body></html>
+"""
+
+
+def load_html_fixtures() -> Dict[str, str]:
+    """Saved pages in fixtures/ keyed by file stem (screener_<STOCK>.html)"""
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.html"))):
+        with open(path, encoding="utf-8") as f:
+            pages[os.path.splitext(os.path.basename(path))[0]] = f.read()
+    return pages
+
+
+def synthetic_fact_rows(n_stocks: int, n_quarters: int = 12, seed: int = 0) -> List[Tuple]:
+    """(STOCK_CODE, METRIC, QUARTER, VALUE, METRIC_CATEGORY) rows as returned by the sector query"""
+    rng = random.Random(seed)
+    quarters = quarter_labels(n_quarters)
+    rows = []
+    for s in range(n_stocks):
+        stock = f"STK{s:05d}"
+        for metric, metric_category in SAMPLE_METRICS:
+            for quarter in quarters:
+                rows.append((stock, metric, quarter, f"{rng.uniform(-100, 250000):.2f}", metric_category))
+    rows.sort(key=lambda r: (r[4], r[0], r[1]))
+    return rows
+
+
+def raw_values(count: int, seed: int = 0) -> List[str]:
+    """Mix of raw cell strings covering every branch of clean_value"""
+    rng = random.Random(seed)
+    templates = [
+        lambda: f"{rng.uniform(0, 300000):,.0f}",
+        lambda: f"{rng.uniform(-50, 50):.1f}%",
+        lambda: f"({rng.randint(1, 9999):,})",
+        lambda: f"{rng.uniform(0, 9):.1f}x",
+        lambda: "-",
+        lambda: f"+{rng.randint(1, 999)}",
+        lambda: "\xa0" + f"{rng.uniform(0, 5000):.2f}",
+    ]
+    return [rng.choice(templates)() for _ in range(count)]
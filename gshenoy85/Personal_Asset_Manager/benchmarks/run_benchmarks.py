@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the hot pure-Python paths: value/metric cleaning,
+categorisation, the extract_* family, the quarterly/sector pivots and the
+same views served from the in-memory matrix store.
+
+Runs fully offline against saved screener pages in benchmarks/fixtures/ and
+synthetic fact tables from 10 to 5,000 stocks.
+
+Usage:
+    python benchmarks/run_benchmarks.py                    # run and compare with baseline
+    python benchmarks/run_benchmarks.py --save-baseline    # record a new baseline
+    python benchmarks/run_benchmarks.py --filter pivot --sizes 10,100
+    python benchmarks/run_benchmarks.py --record RELIANCE  # save a live page as a fixture
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCH_DIR))
+sys.path.append(BENCH_DIR)
+
+from fixtures import (  # noqa: E402
+    FIXTURES_DIR, load_html_fixtures, raw_values, synthetic_fact_rows, synthetic_screener_html
+)
+
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+BASELINE_PATH = os.path.join(RESULTS_DIR, "baseline.json")
+LATEST_PATH = os.path.join(RESULTS_DIR, "latest.json")
+DEFAULT_SIZES = [10, 100, 1000, 5000]
+
+
+class Benchmark:
+    """A named callable processing `items` units of work per call"""
+
+    def __init__(self, name: str, func: Callable[[], object], items: int):
+        self.name = name
+        self.func = func
+        self.items = items
+
+    def run(self, min_time: float, repeat: int) -> Dict:
+        # Calibrate the inner loop so each repeat lasts at least min_time
+        loops = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(loops):
+                self.func()
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time or loops >= 1_000_000:
+                break
+            loops *= 2 if elapsed == 0 else max(2, int(min_time / elapsed) + 1)
+
+        timings = []
+        for _ in range(repeat):
+            gc.collect()
+            start = time.perf_counter()
+            for _ in range(loops):
+                self.func()
+            timings.append((time.perf_counter() - start) / loops)
+
+        # Allocation profile of a single call
+        gc.collect()
+        tracemalloc.start()
+        self.func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        best = min(timings)
+        return {
+            "name": self.name,
+            "items": self.items,
+            "seconds_per_call": best,
+            "items_per_second": self.items / best if best else float("inf"),
+            "peak_alloc_kib": round(peak / 1024, 1),
+            "loops": loops,
+            "repeat": repeat,
+        }
+
+
+def build_benchmarks(sizes: List[int]) -> List[Benchmark]:
+    import stock_recommender as sr
+    from bs4 import BeautifulSoup
+    from serialization import dumps
+
+    benches = []
+
+    values = raw_values(10_000)
+    benches.append(Benchmark("clean_value[10k]", lambda: [sr.clean_value(v) for v in values], len(values)))
+
+    names = [f" Metric\xa0{i % 97}  name +" for i in range(10_000)]
+    benches.append(Benchmark("clean_metric_name[10k]", lambda: [sr.clean_metric_name(n) for n in names], len(names)))
+
+    pages = load_html_fixtures() or {"synthetic": synthetic_screener_html()}
+    soups = {name: BeautifulSoup(html, "html.parser") for name, html in pages.items()}
+
+    metric_names = sorted({m for soup in soups.values() for m in sr.extract_all_financial_data(soup, "BENCH")[0]})
+    metric_names += [f"Custom metric {i}" for i in range(200)]
+    benches.append(Benchmark(f"categorize_metric[{len(metric_names)}]",
+                             lambda: [sr.categorize_metric(m) for m in metric_names], len(metric_names)))
+
+    for name, html in pages.items():
+        soup = soups[name]
+        quarters = sr.extract_quarterly_data(soup, "BENCH")[1]
+        benches.append(Benchmark(f"parse_html[{name}]", lambda h=html: BeautifulSoup(h, "html.parser"), 1))
+        benches.append(Benchmark(f"extract_all_financial_data[{name}]",
+                                 lambda s=soup: sr.extract_all_financial_data(s, "BENCH"), 1))
+        for fn in (sr.extract_quarterly_data, sr.extract_annual_data):
+            benches.append(Benchmark(f"{fn.__name__}[{name}]", lambda f=fn, s=soup: f(s, "BENCH"), 1))
+        for fn in (sr.extract_ratios_data, sr.extract_balance_sheet_data,
+                   sr.extract_cashflow_data, sr.extract_per_share_data):
+            benches.append(Benchmark(f"{fn.__name__}[{name}]",
+                                     lambda f=fn, s=soup, q=quarters: f(s, "BENCH", q), 1))
+
+    # Quarterly pivot: one stock's decoded (metric, quarter, value) rows for one category
+    category_rows = [(m, q, v) for _, m, q, v, _ in synthetic_fact_rows(1, n_quarters=40)]
+    benches.append(Benchmark(f"quarterly_pivot[{len(category_rows)} rows]",
+                             lambda: sr.pivot_category_rows(category_rows), len(category_rows)))
+
+    # Sector pivot and serialisation across universe sizes
+    for n_stocks in sizes:
+        rows = synthetic_fact_rows(n_stocks)
+        benches.append(Benchmark(f"sector_pivot[{n_stocks} stocks]", lambda r=rows: sr.pivot_sector_rows(r), len(rows)))
+        _, payload = sr.pivot_sector_rows(rows)
+        benches.append(Benchmark(f"sector_serialise[{n_stocks} stocks]", lambda p=payload: dumps(p), len(rows)))
+
+    # The same universes served from the in-memory matrix store
+    from matrix_store import FinancialMatrix, MatrixStore
+    from screening import screen
+    from star_schema import StockInfo, stock_id
+    for n_stocks in sizes:
+        rows = synthetic_fact_rows(n_stocks)
+        ids = {info.name: info.metric_id for info in sr.METRIC_REGISTRY.register({r[1] for r in rows})}
+        facts: Dict[str, List] = {}
+        for stock, metric, quarter, value, _ in rows:
+            facts.setdefault(stock, []).append((ids[metric], quarter, float(value)))
+        store = MatrixStore(sr.METRIC_REGISTRY)
+        store.publish(FinancialMatrix.empty(), "benchmark")
+        for stock, stock_facts in facts.items():
+            store.upsert(StockInfo(stock_id(stock), stock, "Bench", "Bench"), stock_facts)
+        benches.append(Benchmark(f"matrix_sector[{n_stocks} stocks]",
+                                 lambda s=store: s.sector_series("Bench"), len(rows)))
+        benches.append(Benchmark(f"matrix_category_series[{n_stocks} stocks]",
+                                 lambda s=store: s.category_series("STK00000", "Income Statement"), 1))
+        benches.append(Benchmark(f"screen[{n_stocks} stocks]",
+                                 lambda s=store: screen(s, "ROE % > 20 and Sales QoQ growth > 5%",
+                                                        scoring="ROCE %:1, Borrowings:-1"), n_stocks))
+
+    return benches
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(results: List[Dict], baseline: Dict, threshold: float) -> int:
+    """Print per-benchmark deltas; return the number of regressions beyond threshold"""
+    previous = {r["name"]: r for r in baseline.get("results", [])}
+    regressions = 0
+    print(f"\nComparison with baseline {baseline.get('revision', '?')} ({baseline.get('timestamp', '?')}):")
+    for result in results:
+        old = previous.get(result["name"])
+        if not old:
+            print(f"  {result['name']:<55} (new)")
+            continue
+        delta = result["seconds_per_call"] / old["seconds_per_call"] - 1
+        marker = ""
+        if delta > threshold:
+            marker = "  ❌ REGRESSION"
+            regressions += 1
+        elif delta < -threshold:
+            marker = "  ✅ faster"
+        print(f"  {result['name']:<55} {delta:+7.1%}{marker}")
+    return regressions
+
+
+def record_fixture(stock: str):
+    """Save a live screener page into fixtures/ for future offline runs"""
+    import requests
+    import stock_recommender as sr
+
+    url = sr.SCREENER_URL.format(stock)
+    res = requests.get(url, headers=sr.HEADERS, timeout=30)
+    res.raise_for_status()
+    path = os.path.join(FIXTURES_DIR, f"screener_{stock}.html")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(res.text)
+    print(f"✅ Saved {url} to {path}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Stock recommender micro-benchmarks")
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="Universe sizes for pivots")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per timing repeat")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing repeats (best is reported)")
+    parser.add_argument("--save-baseline", action="store_true", help="Store results as the new baseline")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Relative slowdown counted as a regression")
+    parser.add_argument("--record", metavar="STOCK", help="Fetch and save a live screener page as a fixture")
+    args = parser.parse_args(argv)
+
+    if args.record:
+        record_fixture(args.record)
+        return 0
+
+    # Keep per-extraction info logs out of the timings
+    logging.disable(logging.INFO)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    results = []
+    print(f"{'benchmark':<55} {'ms/call':>10} {'items/s':>14} {'peak KiB':>10}")
+    for bench in build_benchmarks(sizes):
+        if args.filter and args.filter not in bench.name:
+            continue
+        result = bench.run(args.min_time, args.repeat)
+        results.append(result)
+        print(f"{result['name']:<55} {result['seconds_per_call'] * 1000:>10.3f} "
+              f"{result['items_per_second']:>14,.0f} {result['peak_alloc_kib']:>10,.1f}")
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": sys.version.split()[0],
+        "results": results,
+    }
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    with open(LATEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Baseline saved to {args.baseline}")
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
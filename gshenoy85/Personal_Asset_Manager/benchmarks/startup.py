@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark: time to import the app and its CLI entry points in a
+fresh interpreter, plus the heaviest modules pulled in at import time.
+
+Every sample is a new subprocess, so nothing is shared with previous runs
+except the OS file cache and compiled .pyc files.
+
+Usage:
+    python benchmarks/startup.py                    # 5 runs per scenario
+    python benchmarks/startup.py --runs 10 --top 25
+    python benchmarks/startup.py --budget 0.5       # exit 1 if importing the app takes longer
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+
+SCENARIOS = {
+    "import stock_recommender": "import stock_recommender",
+    "import run_app": "import run_app",
+    "import emergency_fix": "import emergency_fix",
+    "first request (/metrics)": "import stock_recommender as sr; sr.app.test_client().get('/metrics')",
+}
+
+_TIMER = "import time; _t = time.perf_counter(); {code}; print(time.perf_counter() - _t)"
+
+
+def run_python(args: List[str]) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], cwd=APP_DIR, capture_output=True, text=True)
+
+
+def time_scenario(code: str, runs: int) -> List[float]:
+    """Seconds spent executing `code` in each of `runs` fresh interpreters"""
+    timings = []
+    for _ in range(runs):
+        result = run_python(["-c", _TIMER.format(code=code)])
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return timings
+
+
+def heaviest_imports(module: str, top: int) -> List[Tuple[str, int, int]]:
+    """(module, self µs, cumulative µs) from `python -X importtime`, slowest cumulative first"""
+    result = run_python(["-X", "importtime", "-c", f"import {module}"])
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        rows.append((name, int(own), int(cumulative)))
+    # Top-level imports only (nested ones are already included in their parent's cumulative time)
+    depth = {name: len(name) - len(name.lstrip()) for name, _, _ in rows}
+    shallow = min(depth.values(), default=0)
+    top_level = [(name.strip(), own, cum) for name, own, cum in rows if depth[name] <= shallow + 2]
+    return sorted(top_level, key=lambda r: r[2], reverse=True)[:top]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Stock recommender cold-start benchmark")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per scenario")
+    parser.add_argument("--top", type=int, default=15, help="Heaviest imports to list")
+    parser.add_argument("--budget", type=float, help="Fail if importing stock_recommender exceeds this (s)")
+    args = parser.parse_args(argv)
+
+    # Warm the .pyc cache so the first sample does not include bytecode compilation
+    run_python(["-c", "import stock_recommender, run_app, emergency_fix"])
+
+    results: Dict[str, List[float]] = {}
+    print(f"{'scenario':<32} {'median ms':>10} {'min ms':>10} {'max ms':>10}")
+    for name, code in SCENARIOS.items():
+        timings = results[name] = time_scenario(code, args.runs)
+        print(f"{name:<32} {statistics.median(timings) * 1000:>10.1f} "
+              f"{min(timings) * 1000:>10.1f} {max(timings) * 1000:>10.1f}")
+
+    print(f"\nHeaviest imports under stock_recommender:")
+    print(f"{'module':<48} {'cumulative ms':>14} {'self ms':>10}")
+    for name, own, cumulative in heaviest_imports("stock_recommender", args.top):
+        print(f"{name:<48} {cumulative / 1000:>14.1f} {own / 1000:>10.1f}")
+
+    if args.budget is not None:
+        median = statistics.median(results["import stock_recommender"])
+        if median > args.budget:
+            print(f"\n❌ Import took {median:.3f}s, over the {args.budget:.3f}s budget")
+            return 1
+        print(f"\n✅ Import took {median:.3f}s, within the {args.budget:.3f}s budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+# checkpoint.py
+"""
+Durable per-run checkpoints for bulk loads (load_all_data).
+
+A run records its stock list when it starts. Each stock then moves through
+pending -> fetched -> parsed -> merged, or ends failed with a reason. Every
+transition is committed to SQLite (CHECKPOINT_PATH) at once, so a crash or
+restart loses at most the stock in flight.
+
+    python stock_recommender.py --load-data --resume            # continue the newest run
+    python stock_recommender.py --load-data --resume RUN_ID
+    python stock_recommender.py --load-data --retry-failed      # only the failed stocks of the newest run
+    python checkpoint.py status [RUN_ID]
+    python checkpoint.py runs
+
+Resuming reloads every stock that is not merged or failed, including one
+stopped mid-way at fetched or parsed. The MERGE is idempotent, so redoing
+such a stock is safe. A resumed run keeps its own stock list even if the
+universe listing has changed since it started.
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                            "work", "load_checkpoints.db"))
+
+PENDING, FETCHED, PARSED, MERGED, FAILED = "pending", "fetched", "parsed", "merged", "failed"
+STATES = (PENDING, FETCHED, PARSED, MERGED, FAILED)
+FINISHED = (MERGED, FAILED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS load_runs (
+    run_id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL,
+    description TEXT
+);
+CREATE TABLE IF NOT EXISTS load_stocks (
+    run_id TEXT NOT NULL,
+    stock TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    reason TEXT,
+    metrics INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (run_id, stock)
+);
+CREATE INDEX IF NOT EXISTS load_stocks_state ON load_stocks (run_id, state, seq);
+"""
+
+
+class CheckpointError(ValueError):
+    """Unknown run or nothing to resume"""
+
+
+class LoadCheckpoint:
+    """Per-run, per-stock load state in one SQLite file (short-lived connections, safe across threads)"""
+
+    def __init__(self, path: str = CHECKPOINT_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        db = sqlite3.connect(path, timeout=30)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+        finally:
+            db.close()
+
+    @contextmanager
+    def _db(self) -> Iterator[sqlite3.Connection]:
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def start(self, stocks: Sequence[str], run_id: Optional[str] = None, description: str = "") -> str:
+        """Record a new run and its stock list; returns the run id"""
+        now = time.time()
+        # The random suffix keeps runs started in the same second (several shards) apart
+        run_id = run_id or f"{time.strftime('load-%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        with self._db() as db:
+            if db.execute("SELECT 1 FROM load_runs WHERE run_id = ?", (run_id,)).fetchone():
+                raise CheckpointError(f"Load run {run_id} already exists; resume it instead")
+            db.execute("INSERT INTO load_runs (run_id, created_at, updated_at, description) VALUES (?, ?, ?, ?)",
+                       (run_id, now, now, description))
+            db.executemany("INSERT OR IGNORE INTO load_stocks (run_id, stock, seq, updated_at) VALUES (?, ?, ?, ?)",
+                           [(run_id, stock, seq, now) for seq, stock in enumerate(stocks)])
+        logger.info(f"📝 Load run {run_id} started with {len(stocks)} stocks")
+        return run_id
+
+    def resolve(self, run_id: Optional[str] = None) -> str:
+        """The given run id (checked) or, for None/'latest', the newest run"""
+        with self._db() as db:
+            if run_id in (None, "", "latest"):
+                row = db.execute("SELECT run_id FROM load_runs ORDER BY created_at DESC LIMIT 1").fetchone()
+            else:
+                row = db.execute("SELECT run_id FROM load_runs WHERE run_id = ?", (run_id,)).fetchone()
+        if row is None:
+            raise CheckpointError(f"No load run {run_id}" if run_id not in (None, "", "latest") else "No load runs recorded")
+        return row[0]
+
+    def remaining(self, run_id: str) -> List[str]:
+        """Stocks not yet merged or failed, in the run's original order"""
+        with self._db() as db:
+            db.execute("UPDATE load_runs SET finished_at = NULL WHERE run_id = ?", (run_id,))
+            return [row[0] for row in db.execute(
+                "SELECT stock FROM load_stocks WHERE run_id = ? AND state NOT IN (?, ?) ORDER BY seq",
+                (run_id, *FINISHED))]
+
+    def reset_failed(self, run_id: str) -> List[str]:
+        """Put the run's failed stocks back to pending and return them"""
+        now = time.time()
+        with self._db() as db:
+            stocks = [row[0] for row in db.execute(
+                "SELECT stock FROM load_stocks WHERE run_id = ? AND state = ? ORDER BY seq", (run_id, FAILED))]
+            db.execute("UPDATE load_stocks SET state = ?, reason = NULL, updated_at = ? WHERE run_id = ? AND state = ?",
+                       (PENDING, now, run_id, FAILED))
+            db.execute("UPDATE load_runs SET finished_at = NULL, updated_at = ? WHERE run_id = ?", (now, run_id))
+        return stocks
+
+    def mark(self, run_id: str, stock: str, state: str, reason: Optional[str] = None, metrics: Optional[int] = None):
+        if state not in STATES:
+            raise ValueError(f"Unknown checkpoint state {state!r}")
+        now = time.time()
+        with self._db() as db:
+            db.execute("""UPDATE load_stocks SET state = ?, reason = ?, metrics = COALESCE(?, metrics),
+                              attempts = attempts + (? = 'fetched'), updated_at = ?
+                          WHERE run_id = ? AND stock = ?""",
+                       (state, reason[:1000] if reason else None, metrics, state, now, run_id, stock))
+            db.execute("UPDATE load_runs SET updated_at = ? WHERE run_id = ?", (now, run_id))
+
+    def finish(self, run_id: str):
+        with self._db() as db:
+            db.execute("UPDATE load_runs SET finished_at = ? WHERE run_id = ?", (time.time(), run_id))
+
+    def counts(self, run_id: str) -> Dict[str, int]:
+        with self._db() as db:
+            rows = db.execute("SELECT state, COUNT(*) FROM load_stocks WHERE run_id = ? GROUP BY state",
+                              (run_id,)).fetchall()
+        counts = {state: 0 for state in STATES}
+        counts.update(rows)
+        return counts
+
+    def status(self, run_id: str) -> Dict:
+        with self._db() as db:
+            created, updated, finished, description = db.execute(
+                "SELECT created_at, updated_at, finished_at, description FROM load_runs WHERE run_id = ?",
+                (run_id,)).fetchone()
+            failures = db.execute("""SELECT stock, reason, attempts FROM load_stocks
+                                     WHERE run_id = ? AND state = ? ORDER BY seq""", (run_id, FAILED)).fetchall()
+        return {
+            "run": run_id,
+            "description": description,
+            "created_at": created,
+            "updated_at": updated,
+            "finished": finished is not None,
+            "counts": self.counts(run_id),
+            "failures": [{"stock": stock, "reason": reason, "attempts": attempts}
+                         for stock, reason, attempts in failures],
+        }
+
+    def runs(self, limit: int = 20) -> List[Dict]:
+        with self._db() as db:
+            rows = db.execute("""SELECT r.run_id, r.created_at, r.finished_at, r.description,
+                                        COUNT(s.stock), SUM(s.state = 'merged'), SUM(s.state = 'failed')
+                                 FROM load_runs r LEFT JOIN load_stocks s ON s.run_id = r.run_id
+                                 GROUP BY r.run_id ORDER BY r.created_at DESC LIMIT ?""", (limit,)).fetchall()
+        return [{"run": run_id, "created_at": created, "finished": finished is not None, "description": description,
+                 "stocks": total, "merged": merged or 0, "failed": failed or 0}
+                for run_id, created, finished, description, total, merged, failed in rows]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Inspect bulk-load checkpoints")
+    commands = parser.add_subparsers(dest="command", required=True)
+    status = commands.add_parser("status", help="per-state counts and failures of a run")
+    status.add_argument("run", nargs="?", default="latest")
+    commands.add_parser("runs", help="recent runs")
+    args = parser.parse_args(argv)
+
+    checkpoint = LoadCheckpoint()
+    try:
+        if args.command == "runs":
+            print(json.dumps(checkpoint.runs(), indent=2))
+        else:
+            print(json.dumps(checkpoint.status(checkpoint.resolve(args.run)), indent=2))
+    except CheckpointError as e:
+        print(e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
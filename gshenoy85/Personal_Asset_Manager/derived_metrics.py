@@ -0,0 +1,314 @@
+# derived_metrics.py
+"""
+Derived metrics computed once at ingest and stored as ordinary facts.
+
+DERIVED_CATALOG declares each derived series as an operation over raw
+metrics:
+
+- growth: % change against the value `months` earlier (QoQ, YoY)
+- ratio: numerator / denominator (margins, scaled to %)
+- rolling_sum: sum over the last `months`, one point per quarter (TTM)
+- cagr: compound annual growth rate over `months`
+
+An input written "Sales|Revenue" uses the first name the stock reports.
+Each name also matches its scraped form with screener.in's trailing " +"
+expander marker ("Sales +", "Net Profit +").
+
+refresh_derived() reads the full stored input history of a batch of
+stocks from FACT_FINANCIALS and lays it out as a (stock, input, month)
+array. It computes every catalogue entry with shifted-array arithmetic
+over the month axis. The results replace the stocks' previous derived
+facts in FACT_FINANCIALS, in the caller's transaction.
+
+DERIVED_STATE keeps a fingerprint of each stock's inputs and of the
+catalogue, so stocks whose inputs did not change are skipped.
+
+    python derived_metrics.py catalog
+    python derived_metrics.py backfill [--force] [--batch-size 200]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import sys
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from metric_registry import EXPANDER_SUFFIX, metric_id
+from star_schema import StockInfo, period_label, write_facts
+
+logger = logging.getLogger(__name__)
+
+DERIVED_CATEGORY = "Derived Metrics"
+
+CREATE_DERIVED_STATE_SQL = """
+    CREATE TABLE IF NOT EXISTS DERIVED_STATE (
+        STOCK_ID NUMBER(18, 0),
+        CATALOG_VERSION STRING,
+        INPUT_HASH STRING,
+        COMPUTED_AT TIMESTAMP
+    )
+"""
+
+
+class DerivedMetric(NamedTuple):
+    name: str
+    op: str  # "growth" | "ratio" | "rolling_sum" | "cagr"
+    inputs: Tuple[str, ...]
+    months: int = 0
+    scale: float = 1.0
+
+
+DERIVED_CATALOG: Tuple[DerivedMetric, ...] = (
+    DerivedMetric("Sales QoQ Growth %", "growth", ("Sales|Revenue",), 3),
+    DerivedMetric("Sales YoY Growth %", "growth", ("Sales|Revenue",), 12),
+    DerivedMetric("Net Profit QoQ Growth %", "growth", ("Net Profit",), 3),
+    DerivedMetric("Net Profit YoY Growth %", "growth", ("Net Profit",), 12),
+    DerivedMetric("Operating Margin %", "ratio", ("Operating Profit|Financing Profit", "Sales|Revenue"), scale=100.0),
+    DerivedMetric("Net Margin %", "ratio", ("Net Profit", "Sales|Revenue"), scale=100.0),
+    DerivedMetric("Sales TTM", "rolling_sum", ("Sales|Revenue",), 12),
+    DerivedMetric("Net Profit TTM", "rolling_sum", ("Net Profit",), 12),
+    DerivedMetric("Sales 3Y CAGR %", "cagr", ("Sales|Revenue",), 36),
+    DerivedMetric("Net Profit 3Y CAGR %", "cagr", ("Net Profit",), 36),
+)
+
+# Quarterly spacing of rolling sums (TTM = the last four quarters)
+ROLLING_STEP_MONTHS = 3
+
+
+def catalog_version(catalog: Sequence[DerivedMetric] = DERIVED_CATALOG) -> str:
+    """Fingerprint of the catalogue definitions; editing it recomputes every stock"""
+    return hashlib.blake2b(repr(tuple(catalog)).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def input_names(catalog: Sequence[DerivedMetric] = DERIVED_CATALOG) -> List[str]:
+    """Every raw metric name any catalogue entry may read"""
+    names = []
+    for metric in catalog:
+        for spec in metric.inputs:
+            names.extend(name for name in spec.split("|") if name not in names)
+    return names
+
+
+def input_variants(name: str) -> Tuple[str, str]:
+    """The catalogue name and its scraped form with the expander marker"""
+    return name, name + EXPANDER_SUFFIX
+
+
+def period_months(pid: int) -> Optional[int]:
+    """Months since year 0 of a calendar period id (yyyymm), None for other labels"""
+    if pid >= 10_000_000:
+        return None
+    year, month = divmod(pid, 100)
+    return year * 12 + month - 1
+
+
+def _shift(series: np.ndarray, months: int) -> np.ndarray:
+    """series[..., t - months] at position t (NaN before the start)"""
+    shifted = np.full_like(series, np.nan)
+    if months < series.shape[-1]:
+        shifted[..., months:] = series[..., :series.shape[-1] - months]
+    return shifted
+
+
+def compute_derived(grid: np.ndarray, names: Sequence[str],
+                    catalog: Sequence[DerivedMetric] = DERIVED_CATALOG) -> Dict[str, np.ndarray]:
+    """(stock, input, month) grid of raw values -> {derived name: (stock, month) values}"""
+    index = {name: i for i, name in enumerate(names)}
+
+    def series(spec: str) -> np.ndarray:
+        result = np.full((grid.shape[0], grid.shape[2]), np.nan)
+        for name in spec.split("|"):
+            if name in index:
+                result = np.where(np.isnan(result), grid[:, index[name], :], result)
+        return result
+
+    derived = {}
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        for metric in catalog:
+            values = series(metric.inputs[0])
+            if metric.op == "growth":
+                previous = _shift(values, metric.months)
+                result = (values - previous) / np.abs(previous) * 100.0
+            elif metric.op == "ratio":
+                result = values / series(metric.inputs[1])
+            elif metric.op == "rolling_sum":
+                result = sum(_shift(values, lag) for lag in range(0, metric.months, ROLLING_STEP_MONTHS))
+            elif metric.op == "cagr":
+                start = _shift(values, metric.months)
+                ok = (values > 0) & (start > 0)
+                result = np.where(ok, (np.where(ok, values / start, 1.0) ** (12.0 / metric.months) - 1.0) * 100.0,
+                                  np.nan)
+            else:
+                raise ValueError(f"Unknown derived metric operation {metric.op!r}")
+            derived[metric.name] = np.where(np.isfinite(result), result * metric.scale, np.nan)
+    return derived
+
+
+def _fingerprints(rows_by_stock: Dict[int, List[Tuple[int, int, float]]], version: str) -> Dict[int, str]:
+    fingerprints = {}
+    for sid, rows in rows_by_stock.items():
+        digest = hashlib.blake2b(version.encode("utf-8"), digest_size=16)
+        for mid, pid, value in sorted(rows):
+            digest.update(f"{mid}:{pid}:{value!r};".encode("utf-8"))
+        fingerprints[sid] = digest.hexdigest()
+    return fingerprints
+
+
+def _placeholders(count: int) -> str:
+    return ",".join(["%s"] * count)
+
+
+def refresh_derived(cur, stocks: Sequence[StockInfo], registry, force: bool = False,
+                    catalog: Sequence[DerivedMetric] = DERIVED_CATALOG) -> Dict[int, List[Tuple[int, str, float]]]:
+    """
+    Recompute the derived facts of stocks whose stored inputs changed; the caller commits.
+    Returns {stock_id: [(metric_id, period label, value)]} for the stocks that were recomputed.
+    """
+    stocks = list({info.stock_id: info for info in stocks}.values())
+    if not stocks:
+        return {}
+    names = input_names(catalog)
+    input_ids = {metric_id(variant): i for i, name in enumerate(names) for variant in input_variants(name)}
+    sids = [info.stock_id for info in stocks]
+
+    cur.execute(f"""
+        SELECT STOCK_ID, METRIC_ID, PERIOD_ID, VALUE
+        FROM FACT_FINANCIALS
+        WHERE STOCK_ID IN ({_placeholders(len(sids))}) AND METRIC_ID IN ({_placeholders(len(input_ids))})
+    """, (*sids, *input_ids))
+    rows_by_stock: Dict[int, List[Tuple[int, int, float]]] = {sid: [] for sid in sids}
+    for sid, mid, pid, value in cur.fetchall():
+        if value is not None:
+            rows_by_stock[int(sid)].append((int(mid), int(pid), float(value)))
+
+    version = catalog_version(catalog)
+    fingerprints = _fingerprints(rows_by_stock, version)
+    if not force:
+        cur.execute(f"""
+            SELECT STOCK_ID, INPUT_HASH FROM DERIVED_STATE
+            WHERE STOCK_ID IN ({_placeholders(len(sids))}) AND CATALOG_VERSION=%s
+        """, (*sids, version))
+        stored = {int(sid): digest for sid, digest in cur.fetchall()}
+        stocks = [info for info in stocks if stored.get(info.stock_id) != fingerprints[info.stock_id]]
+        if not stocks:
+            return {}
+
+    # Dense month axis spanning every input period of the batch
+    months = {pid: period_months(pid) for sid in (s.stock_id for s in stocks)
+              for _, pid, _ in rows_by_stock[sid]}
+    months = {pid: m for pid, m in months.items() if m is not None}
+    derived_facts: Dict[int, List[Tuple[int, str, float]]] = {info.stock_id: [] for info in stocks}
+    derived_ids = {metric.name: metric_id(metric.name) for metric in catalog}
+    periods: Dict[int, str] = {}
+    if months:
+        first = min(months.values())
+        width = max(months.values()) - first + 1
+        grid = np.full((len(stocks), len(names), width), np.nan)
+        for s, info in enumerate(stocks):
+            for mid, pid, value in rows_by_stock[info.stock_id]:
+                if pid in months:
+                    grid[s, input_ids[mid], months[pid] - first] = value
+
+        # Derived points only at periods where the stock reported one of the inputs
+        reported = ~np.isnan(grid).all(axis=1)
+        pid_at = {m - first: pid for pid, m in months.items()}
+        for name, values in compute_derived(grid, names, catalog).items():
+            for s, t in zip(*np.nonzero(~np.isnan(values) & reported)):
+                label = periods.setdefault(pid_at[t], period_label(pid_at[t]))
+                derived_facts[stocks[s].stock_id].append((derived_ids[name], label, float(values[s, t])))
+
+    # Derived metrics get their own category and reach DIM_METRIC in this transaction
+    # (a registry full before the catalogue was added refuses them, and their facts are skipped)
+    infos = registry.register(derived_ids, category=DERIVED_CATEGORY)
+    stored_ids = {info.metric_id for info in registry.registered(infos)}
+    registry.touch(derived_ids)
+    registry.persist(cur)
+    derived_facts = {sid: [fact for fact in facts if fact[0] in stored_ids] for sid, facts in derived_facts.items()}
+
+    # Replace the previous derived facts (values that can no longer be computed must go too)
+    recomputed = [info.stock_id for info in stocks]
+    cur.execute(f"""
+        DELETE FROM FACT_FINANCIALS
+        WHERE STOCK_ID IN ({_placeholders(len(recomputed))}) AND METRIC_ID IN ({_placeholders(len(derived_ids))})
+    """, (*recomputed, *derived_ids.values()))
+    label_ids = {label: pid for pid, label in periods.items()}
+    write_facts(cur, [], periods, [(sid, mid, label_ids[label], value)
+                                       for sid, facts in derived_facts.items() for mid, label, value in facts])
+
+    placeholders = ",".join(["(%s, %s, %s)"] * len(recomputed))
+    params = []
+    for sid in recomputed:
+        params.extend([sid, version, fingerprints[sid]])
+    cur.execute(f"""
+        MERGE INTO DERIVED_STATE AS tgt
+        USING (
+            SELECT column1 AS STOCK_ID, column2 AS CATALOG_VERSION, column3 AS INPUT_HASH
+            FROM VALUES {placeholders}
+        ) AS src
+        ON tgt.STOCK_ID = src.STOCK_ID
+        WHEN MATCHED THEN
+            UPDATE SET CATALOG_VERSION = src.CATALOG_VERSION, INPUT_HASH = src.INPUT_HASH,
+                       COMPUTED_AT = CURRENT_TIMESTAMP()
+        WHEN NOT MATCHED THEN
+            INSERT (STOCK_ID, CATALOG_VERSION, INPUT_HASH, COMPUTED_AT)
+            VALUES (src.STOCK_ID, src.CATALOG_VERSION, src.INPUT_HASH, CURRENT_TIMESTAMP())
+    """, tuple(params))
+    return derived_facts
+
+
+def backfill(connect, registry, force: bool = False, batch_size: int = 200) -> Dict:
+    """Refresh derived metrics for every stock in DIM_STOCK, one transaction per batch"""
+    started = time.perf_counter()
+    conn = connect()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT STOCK_ID, STOCK_CODE, INDUSTRY, CATEGORY FROM DIM_STOCK ORDER BY STOCK_CODE")
+        stocks = [StockInfo(int(sid), code, industry, category) for sid, code, industry, category in cur.fetchall()]
+        recomputed = facts = 0
+        for start in range(0, len(stocks), batch_size):
+            try:
+                with registry.transaction():
+                    result = refresh_derived(cur, stocks[start:start + batch_size], registry, force=force)
+                    conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            recomputed += len(result)
+            facts += sum(len(rows) for rows in result.values())
+    finally:
+        conn.close()
+    summary = {"stocks": len(stocks), "recomputed": recomputed, "facts": facts,
+               "catalog_version": catalog_version(), "seconds": round(time.perf_counter() - started, 3)}
+    logger.info(f"🧮 Derived metrics: {recomputed}/{len(stocks)} stocks recomputed ({facts} facts)")
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Inspect or backfill the derived metrics")
+    parser.add_argument("command", choices=["catalog", "backfill"])
+    parser.add_argument("--force", action="store_true", help="Recompute stocks whose inputs did not change")
+    parser.add_argument("--batch-size", type=int, default=200, help="Stocks per transaction")
+    args = parser.parse_args(argv)
+
+    if args.command == "catalog":
+        print(f"Catalog version {catalog_version()}")
+        for metric in DERIVED_CATALOG:
+            window = f" over {metric.months} months" if metric.months else ""
+            print(f"  {metric.name:<28} {metric.op}({', '.join(metric.inputs)}){window}")
+        return 0
+
+    import stock_recommender
+    stock_recommender.create_snowflake_table()
+    stock_recommender.load_metric_registry()
+    summary = backfill(stock_recommender.snowflake_connect, stock_recommender.METRIC_REGISTRY,
+                       force=args.force, batch_size=args.batch_size)
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,104 @@
+# downsampling.py
+"""
+Shape-preserving downsampling of chart series (Largest-Triangle-Three-Buckets).
+
+All series of a metric category share one quarter axis, so they are
+downsampled together: each bucket keeps the single period with the largest
+triangle area summed over every series, after scaling each series to [0, 1]
+so no metric dominates by magnitude. Every bucket step is one vectorised
+NumPy operation across all metrics, and the shared axis never exceeds
+max_points. Missing values are NaN; periods where every series is missing
+are dropped.
+"""
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+MIN_POINTS = 3
+
+
+def lttb_indices(y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Select at most max_points shared columns of y using multi-series LTTB.
+    y: (n_series, n_points) float array with NaN for gaps.
+    Returns the sorted indices of the kept columns.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    if y.ndim == 1:
+        y = y[np.newaxis, :]
+    # Columns without any value cannot be selected; work on the rest
+    cols = np.flatnonzero((~np.isnan(y)).any(axis=0))
+    if max_points < MIN_POINTS or len(cols) <= max_points:
+        return cols
+    y = y[:, cols]
+    n_series, n_points = y.shape
+    valid = ~np.isnan(y)
+
+    # Scale each series to [0, 1] so every metric weighs the same in the summed area
+    low = np.where(valid, y, np.inf).min(axis=1, keepdims=True)
+    span = np.where(valid, y, -np.inf).max(axis=1, keepdims=True) - low
+    y = (y - low) / np.where(span > 0, span, 1.0)
+
+    rows = np.arange(n_series)
+    kept = [0]
+    # Per-series anchor: the series' value at the last kept column where it had one
+    first = np.argmax(valid, axis=1)
+    a_x = np.where(valid[:, 0], 0, first).astype(np.float64)
+    a_y = y[rows, a_x.astype(np.intp)]
+
+    every = (n_points - 2) / (max_points - 2)
+    for i in range(max_points - 2):
+        start = int(np.floor(i * every)) + 1
+        end = min(int(np.floor((i + 1) * every)) + 1, n_points - 1)
+        if end <= start:
+            continue
+        next_start = end
+        next_end = min(int(np.floor((i + 2) * every)) + 1, n_points)
+
+        # Average of the next bucket (falls back to the anchor when the bucket is all NaN)
+        next_block = y[:, next_start:next_end]
+        next_valid = ~np.isnan(next_block)
+        counts = next_valid.sum(axis=1)
+        sums = np.where(next_valid, next_block, 0.0).sum(axis=1)
+        avg_y = np.where(counts > 0, sums / np.maximum(counts, 1), a_y)
+        avg_x = (next_start + next_end - 1) / 2.0
+
+        bucket_x = np.arange(start, end, dtype=np.float64)
+        bucket_y = y[:, start:end]
+
+        # Triangle area between each series' anchor, the candidate and the next bucket average
+        area = np.abs(
+            (a_x[:, None] - avg_x) * (bucket_y - a_y[:, None])
+            - (a_x[:, None] - bucket_x[None, :]) * (avg_y[:, None] - a_y[:, None])
+        )
+        total = np.where(np.isnan(area), 0.0, area).sum(axis=0)
+
+        chosen = start + int(np.argmax(total))
+        kept.append(chosen)
+        has_value = valid[:, chosen]
+        a_x = np.where(has_value, chosen, a_x)
+        a_y = np.where(has_value, y[:, chosen], a_y)
+
+    kept.append(n_points - 1)
+    return cols[np.array(kept)]
+
+
+def downsample_series(quarters: List[str], series: Dict[str, List[Optional[float]]],
+                      max_points: int) -> Tuple[List[str], Dict[str, List[Optional[float]]]]:
+    """
+    Downsample every series of a category to at most max_points shared quarters.
+    Each series holds None at kept quarters where it has no value.
+    """
+    if not series or len(quarters) <= max_points or max_points < MIN_POINTS:
+        return quarters, series
+
+    metrics = list(series.keys())
+    y = np.array([[np.nan if v is None else v for v in series[m]] for m in metrics], dtype=np.float64)
+    keep = lttb_indices(y, max_points)
+
+    new_quarters = [quarters[k] for k in keep]
+    new_series = {
+        metric: [None if np.isnan(v) else float(v) for v in row]
+        for metric, row in zip(metrics, y[:, keep])
+    }
+    return new_quarters, new_series
@@ -0,0 +1,313 @@
+# html_archive.py
+"""
+Compressed, content-addressed archive of fetched screener.in pages, with offline re-extraction.
+
+Every page that get_financial_data downloads is stored gzip-compressed
+under ARCHIVE_DIR/objects/<sha256[:2]>/<sha256>.html.gz. Identical pages
+are stored once. An SQLite index (ARCHIVE_DIR/index.db) records each
+fetch: stock, URL, time, HTTP status, content hash, raw and stored size,
+latency and the caching headers.
+
+After a parser fix, `reextract` runs the current extractors over the
+newest archived page of every stock, in parallel across cores and with no
+network traffic. It compares the result with the facts in the warehouse
+and merges only the values that changed or are new. Derived metrics are
+refreshed only for the stocks it touched. With --prune it also deletes
+stored raw facts that the fixed parser no longer produces for the
+periods on the page, such as values filed under a wrong metric name.
+Older quarters that have rolled off the page are never pruned.
+
+    python html_archive.py stats
+    python html_archive.py history RELIANCE
+    python html_archive.py reextract [--stocks TCS,ITC] [--workers 8] [--dry-run] [--prune]
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import math
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive"))
+ARCHIVE_COMPRESSION_LEVEL = int(os.getenv("ARCHIVE_COMPRESSION_LEVEL", "6"))
+# Re-extraction processes (0 = one per core)
+ARCHIVE_WORKERS = int(os.getenv("ARCHIVE_WORKERS", "0"))
+
+_KEPT_HEADERS = ("content-type", "date", "etag", "last-modified", "cache-control", "age")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    stock TEXT NOT NULL,
+    url TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    status INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    raw_size INTEGER NOT NULL,
+    stored_size INTEGER NOT NULL,
+    elapsed_ms REAL,
+    headers TEXT
+);
+CREATE INDEX IF NOT EXISTS pages_stock ON pages (stock, fetched_at);
+"""
+
+
+class ArchiveError(ValueError):
+    """Missing or corrupted archive object"""
+
+
+class ArchivedPage(NamedTuple):
+    stock: str
+    url: str
+    fetched_at: float
+    status: int
+    content_hash: str
+    raw_size: int
+    stored_size: int
+    elapsed_ms: Optional[float]
+    headers: Dict[str, str]
+
+
+def object_path(root: str, content_hash: str) -> str:
+    return os.path.join(root, "objects", content_hash[:2], f"{content_hash}.html.gz")
+
+
+def read_object(root: str, content_hash: str) -> bytes:
+    """Decompressed page bytes, verified against their content hash"""
+    try:
+        with open(object_path(root, content_hash), "rb") as f:
+            content = gzip.decompress(f.read())
+    except (OSError, EOFError) as e:
+        raise ArchiveError(f"Cannot read archived page {content_hash}: {e}")
+    if hashlib.sha256(content).hexdigest() != content_hash:
+        raise ArchiveError(f"Archived page {content_hash} is corrupted (hash mismatch)")
+    return content
+
+
+class HtmlArchive:
+    """Content-addressed page store plus its fetch index"""
+
+    def __init__(self, root: str = ARCHIVE_DIR):
+        self.root = root
+        os.makedirs(os.path.join(root, "objects"), exist_ok=True)
+        self.index_path = os.path.join(root, "index.db")
+        with self._db() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+
+    @contextmanager
+    def _db(self) -> Iterator[sqlite3.Connection]:
+        db = sqlite3.connect(self.index_path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def store(self, stock: str, url: str, content: bytes, status: int = 200, headers: Optional[Dict] = None,
+              elapsed: Optional[float] = None, fetched_at: Optional[float] = None) -> ArchivedPage:
+        """Archive one fetched page; the compressed object is written only if it is new"""
+        content_hash = hashlib.sha256(content).hexdigest()
+        path = object_path(self.root, content_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # mtime=0 keeps the compressed bytes a pure function of the page
+            data = gzip.compress(content, compresslevel=ARCHIVE_COMPRESSION_LEVEL, mtime=0)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+        stored_size = os.path.getsize(path)
+        kept = {k.lower(): v for k, v in (headers or {}).items() if k.lower() in _KEPT_HEADERS}
+        page = ArchivedPage(stock.upper(), url, fetched_at or time.time(), status, content_hash, len(content),
+                            stored_size, round(elapsed * 1000, 1) if elapsed is not None else None, kept)
+        with self._db() as db:
+            db.execute("""INSERT INTO pages (stock, url, fetched_at, status, content_hash, raw_size, stored_size,
+                                             elapsed_ms, headers)
+                          VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", page[:-1] + (json.dumps(kept),))
+        return page
+
+    def read(self, content_hash: str) -> bytes:
+        return read_object(self.root, content_hash)
+
+    @staticmethod
+    def _page(row: Tuple) -> ArchivedPage:
+        return ArchivedPage(*row[:-1], json.loads(row[-1] or "{}"))
+
+    _COLUMNS = "stock, url, fetched_at, status, content_hash, raw_size, stored_size, elapsed_ms, headers"
+
+    def latest(self, stocks: Optional[Sequence[str]] = None) -> List[ArchivedPage]:
+        """The newest archived page of each stock (or of the given stocks), by stock code"""
+        query = f"""SELECT {self._COLUMNS} FROM pages p
+                    WHERE id = (SELECT id FROM pages q WHERE q.stock = p.stock
+                                ORDER BY fetched_at DESC, id DESC LIMIT 1)"""
+        params: Tuple = ()
+        if stocks:
+            codes = sorted({s.upper() for s in stocks})
+            query += f" AND stock IN ({', '.join('?' * len(codes))})"
+            params = tuple(codes)
+        with self._db() as db:
+            rows = db.execute(query + " ORDER BY stock", params).fetchall()
+        return [self._page(row) for row in rows]
+
+    def history(self, stock: str) -> List[ArchivedPage]:
+        with self._db() as db:
+            rows = db.execute(f"SELECT {self._COLUMNS} FROM pages WHERE stock = ? ORDER BY fetched_at DESC",
+                              (stock.upper(),)).fetchall()
+        return [self._page(row) for row in rows]
+
+    def stats(self) -> Dict:
+        with self._db() as db:
+            pages, stocks, objects = db.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT stock), COUNT(DISTINCT content_hash) FROM pages").fetchone()
+            raw, stored = db.execute("""SELECT COALESCE(SUM(raw_size), 0), COALESCE(SUM(stored_size), 0) FROM
+                                        (SELECT DISTINCT content_hash, raw_size, stored_size FROM pages)""").fetchone()
+        return {
+            "root": self.root,
+            "pages": pages,
+            "stocks": stocks,
+            "objects": objects,
+            "raw_bytes": raw,
+            "stored_bytes": stored,
+            "compression_ratio": round(raw / stored, 2) if stored else None,
+        }
+
+
+# ------------------- Offline re-extraction -------------------
+def _init_extractor():
+    # Extractors log every section at INFO; keep worker output to problems
+    logging.getLogger().setLevel(logging.WARNING)
+
+
+def _extract_page(job: Tuple[str, ArchivedPage]) -> Tuple[ArchivedPage, Dict, List, str, str, Optional[str]]:
+    """Worker: run the current extractors over one archived page"""
+    root, page = job
+    try:
+        import stock_recommender
+
+        data, quarters, category, industry = stock_recommender.parse_financial_page(
+            read_object(root, page.content_hash), page.stock)
+        return page, data, quarters, category, industry, None
+    except Exception as e:
+        return page, {}, [], "", "", f"{type(e).__name__}: {e}"
+
+
+def reextract(archive: Optional[HtmlArchive] = None, stocks: Optional[Sequence[str]] = None,
+              workers: int = ARCHIVE_WORKERS, dry_run: bool = False, prune: bool = False) -> Dict:
+    """Re-run the extractors over the archive and merge only the facts that changed; returns a summary"""
+    import stock_recommender
+    from derived_metrics import DERIVED_CATALOG
+    from metric_registry import metric_id
+    from star_schema import period_id, stock_id
+
+    started = time.perf_counter()
+    archive = archive or HtmlArchive()
+    pages = archive.latest(stocks)
+    derived_ids = {metric_id(metric.name) for metric in DERIVED_CATALOG}
+    summary = {"pages": len(pages), "stocks_changed": 0, "facts_changed": 0, "facts_new": 0,
+               "facts_pruned": 0, "unchanged": 0, "errors": [], "dry_run": dry_run}
+    if not pages:
+        return summary
+
+    stock_recommender.create_snowflake_table()
+    conn = stock_recommender.snowflake_connect()
+    workers = workers or os.cpu_count() or 1
+    try:
+        cur = conn.cursor()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_extractor) as pool:
+            jobs = [(archive.root, page) for page in pages]
+            for page, data, quarters, category, industry, error in pool.map(_extract_page, jobs, chunksize=4):
+                if error or not (data and quarters):
+                    summary["errors"].append({"stock": page.stock, "error": error or "no data extracted"})
+                    continue
+                sid = stock_id(page.stock)
+                facts = {(mid, period_id(quarter)): (mid, quarter, value)
+                         for mid, quarter, value in stock_recommender.quarterly_facts(data, quarters)}
+                cur.execute("SELECT METRIC_ID, PERIOD_ID, VALUE FROM FACT_FINANCIALS WHERE STOCK_ID = %s", (sid,))
+                stored = {(mid, pid): value for mid, pid, value in cur.fetchall()}
+                cur.execute("SELECT INDUSTRY, CATEGORY FROM DIM_STOCK WHERE STOCK_ID = %s", (sid,))
+                dimension = cur.fetchone()
+
+                changed = [fact for key, fact in facts.items()
+                           if key not in stored or stored[key] is None
+                           or not math.isclose(stored[key], fact[2], rel_tol=1e-9, abs_tol=1e-9)]
+                new = sum(1 for key in facts if key not in stored)
+                # Only periods the page shows: quarters that rolled off the page keep their stored facts
+                page_periods = {period_id(quarter) for quarter in quarters}
+                stale = [key for key in stored if key not in facts and key[1] in page_periods
+                         and key[0] not in derived_ids] if prune else []
+                relabelled = dimension is not None and tuple(dimension) != (industry, category)
+                if not (changed or stale or relabelled):
+                    summary["unchanged"] += 1
+                    continue
+
+                summary["stocks_changed"] += 1
+                summary["facts_new"] += new
+                summary["facts_changed"] += len(changed) - new
+                summary["facts_pruned"] += len(stale)
+                logger.info(f"🛠️ {page.stock}: {len(changed) - new} corrected, {new} new, {len(stale)} pruned facts"
+                            f"{' (dry run)' if dry_run else ''}")
+                if dry_run:
+                    continue
+                try:
+                    for mid, pid in stale:
+                        cur.execute("DELETE FROM FACT_FINANCIALS WHERE STOCK_ID = %s AND METRIC_ID = %s "
+                                    "AND PERIOD_ID = %s", (sid, mid, pid))
+                    # Commits the deletes together with the corrected facts and refreshed derived metrics
+                    stock_recommender.merge_stock_facts(conn, page.stock, category, industry, changed, data.keys())
+                except Exception as e:
+                    conn.rollback()
+                    summary["errors"].append({"stock": page.stock, "error": f"{type(e).__name__}: {e}"})
+    finally:
+        conn.close()
+    summary["elapsed_seconds"] = round(time.perf_counter() - started, 2)
+    logger.info(f"✅ Re-extraction over {len(pages)} archived pages: {summary['stocks_changed']} stocks changed, "
+                f"{summary['facts_changed']} facts corrected, {summary['facts_new']} new, "
+                f"{summary['facts_pruned']} pruned, {len(summary['errors'])} errors")
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Raw screener.in page archive and offline re-extraction")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stats", help="archive size and compression")
+    history = commands.add_parser("history", help="archived fetches of one stock")
+    history.add_argument("stock")
+    run = commands.add_parser("reextract", help="re-run the extractors over the archive and merge corrections")
+    run.add_argument("--stocks", default=None, help="comma-separated stock codes (default: every archived stock)")
+    run.add_argument("--workers", type=int, default=ARCHIVE_WORKERS, help="processes (default: one per core)")
+    run.add_argument("--dry-run", action="store_true", help="report the corrections without writing them")
+    run.add_argument("--prune", action="store_true",
+                     help="delete stored raw facts of the page's periods that the extractors no longer produce")
+    args = parser.parse_args(argv)
+
+    archive = HtmlArchive()
+    if args.command == "stats":
+        print(json.dumps(archive.stats(), indent=2))
+    elif args.command == "history":
+        print(json.dumps([page._asdict() for page in archive.history(args.stock)], indent=2))
+    else:
+        stocks = [s.strip() for s in args.stocks.split(",") if s.strip()] if args.stocks else None
+        summary = reextract(archive, stocks, args.workers, args.dry_run, args.prune)
+        print(json.dumps(summary, indent=2))
+        return 1 if summary["errors"] else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+# ingest_workers.py
+"""
+Distributed ingest: a coordinator and N worker processes sharing a leased work queue.
+
+The coordinator enqueues the universe (or one shard of it) as a run in the
+work queue (see work_queue.py). It then starts local worker processes,
+restarts any that die while work remains, re-queues expired leases and
+logs progress until every item is done or failed. Workers scrape and merge
+one stock at a time through stock_recommender.ingest_stock. Each worker
+leases WORK_LEASE_BATCH items at a time, and a background thread
+heartbeats those leases every lease/3 seconds. A crashed worker therefore
+loses its items only for the rest of one lease period.
+
+More workers, on this host or on others pointed at the same WORK_QUEUE_URL,
+give more parsing CPU. Each worker process holds its own warehouse pool
+and a 1/N share of the screener.in rate limits (SCREENER_RATE_PROCESSES,
+which the coordinator sets to --workers). When workers join a run from
+other hosts, set SCREENER_RATE_PROCESSES to the total worker count.
+
+    python ingest_workers.py coordinator --workers 4            # enqueue the universe and run it locally
+    python ingest_workers.py enqueue --run nightly --shards 2 --shard 0
+    python ingest_workers.py worker --run nightly               # join a run from any host
+    python ingest_workers.py status [--run nightly]
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from work_queue import DONE, FAILED, LEASED, QUEUED, WORK_LEASE_SECONDS, WorkQueue, open_work_queue
+
+logger = logging.getLogger(__name__)
+
+WORK_LEASE_BATCH = int(os.getenv("WORK_LEASE_BATCH", "2"))
+WORK_POLL_INTERVAL = float(os.getenv("WORK_POLL_INTERVAL", "2"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+# A worker slot that keeps dying is not restarted more than this many times
+WORKER_MAX_RESTARTS = int(os.getenv("WORKER_MAX_RESTARTS", "5"))
+
+
+def new_run_id() -> str:
+    return time.strftime("%Y%m%d-%H%M%S")
+
+
+def new_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:4]}"
+
+
+class _Heartbeat(threading.Thread):
+    """Keeps a worker's current leases alive while it processes them"""
+
+    def __init__(self, queue: WorkQueue, run_id: str, worker: str, lease_seconds: float):
+        super().__init__(name="lease-heartbeat", daemon=True)
+        self.queue, self.run_id, self.worker, self.lease_seconds = queue, run_id, worker, lease_seconds
+        self.held: List[str] = []
+        self._stop = threading.Event()
+
+    def run(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            held = list(self.held)
+            try:
+                if self.queue.heartbeat(self.run_id, self.worker, held, self.lease_seconds) < len(held):
+                    logger.warning(f"⚠️ {self.worker} no longer holds every lease it is working on")
+            except Exception as e:
+                logger.warning(f"Lease heartbeat failed: {e}")
+
+    def stop(self):
+        self._stop.set()
+
+
+def run_worker(queue: WorkQueue, run_id: str, process: Callable[[str], int], worker: Optional[str] = None,
+               batch: int = WORK_LEASE_BATCH, lease_seconds: float = WORK_LEASE_SECONDS,
+               stop: Optional[threading.Event] = None) -> Dict:
+    """Lease and process items until the run has nothing queued or leased (or stop is set)"""
+    worker = worker or new_worker_id()
+    stop = stop or threading.Event()
+    queue.register_worker(run_id, worker)
+    heartbeat = _Heartbeat(queue, run_id, worker, lease_seconds)
+    heartbeat.start()
+    done = failed = 0
+    logger.info(f"👷 Worker {worker} joined run {run_id}")
+    try:
+        while not stop.is_set():
+            items = queue.lease(run_id, worker, batch, lease_seconds)
+            if not items:
+                counts = queue.counts(run_id)
+                if counts[QUEUED] == 0 and counts[LEASED] == 0:
+                    break
+                # Items are still leased by others or waiting out a retry delay
+                stop.wait(WORK_POLL_INTERVAL)
+                continue
+            heartbeat.held = [item.item for item in items]
+            for position, item in enumerate(items):
+                if stop.is_set():
+                    queue.release(run_id, worker, [i.item for i in items[position:]])
+                    break
+                try:
+                    metrics = process(item.item)
+                except Exception as e:
+                    logger.error(f"❌ {item.item} failed (attempt {item.attempts}): {e}")
+                    queue.fail(run_id, item.item, worker, f"{type(e).__name__}: {e}")
+                    failed += 1
+                else:
+                    queue.complete(run_id, item.item, worker, json.dumps({"metrics": metrics}))
+                    done += 1
+                heartbeat.held = [i.item for i in items[position + 1:]]
+    finally:
+        heartbeat.stop()
+    logger.info(f"👷 Worker {worker} finished: {done} done, {failed} failed")
+    return {"worker": worker, "done": done, "failed": failed}
+
+
+def stock_processor() -> Callable[[str], int]:
+    """process(symbol) backed by the app's scraper and warehouse pool"""
+    import stock_recommender
+
+    stock_recommender.create_snowflake_table()
+
+    def process(symbol: str) -> int:
+        conn = stock_recommender.snowflake_connect()
+        try:
+            return stock_recommender.ingest_stock(conn, symbol)
+        finally:
+            conn.close()
+    return process
+
+
+def enqueue_universe(queue: WorkQueue, run_id: str, shard: int = 0, shards: int = 1,
+                     symbols: Optional[List[str]] = None) -> int:
+    if symbols is None:
+        from stock_recommender import UNIVERSE
+        symbols = [listing.symbol for listing in UNIVERSE.current().shard(shard, shards)]
+    added = queue.enqueue(run_id, symbols)
+    logger.info(f"📥 Run {run_id}: {added} new items enqueued ({len(symbols)} requested)")
+    return added
+
+
+def _spawn_worker(run_id: str, batch: int, lease_seconds: float, processes: int = 1) -> subprocess.Popen:
+    command = [sys.executable, os.path.abspath(__file__), "worker", "--run", run_id,
+               "--batch", str(batch), "--lease", str(lease_seconds)]
+    # Sibling workers split screener.in's rate limits between them (see rate_control.py)
+    env = dict(os.environ, SCREENER_RATE_PROCESSES=os.environ.get("SCREENER_RATE_PROCESSES") or str(processes))
+    return subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+
+
+def run_coordinator(queue: WorkQueue, run_id: str, workers: int = INGEST_WORKERS, batch: int = WORK_LEASE_BATCH,
+                    lease_seconds: float = WORK_LEASE_SECONDS, spawn: Callable = _spawn_worker) -> Dict[str, int]:
+    """Run local workers over an enqueued run until it drains; returns the final state counts"""
+    started = time.perf_counter()
+    processes = [spawn(run_id, batch, lease_seconds, workers) for _ in range(workers)]
+    restarts = [0] * workers
+    last_report = 0.0
+    stopping = False
+
+    def _terminate(signum, frame):
+        nonlocal stopping
+        stopping = True
+    previous = signal.signal(signal.SIGTERM, _terminate)
+    try:
+        while True:
+            queue.reap(run_id)
+            counts = queue.counts(run_id)
+            remaining = counts[QUEUED] + counts[LEASED]
+            if time.monotonic() - last_report >= 10 or not remaining:
+                last_report = time.monotonic()
+                total = sum(counts.values())
+                logger.info(f"📊 Run {run_id}: {counts[DONE]}/{total} done, {counts[FAILED]} failed, "
+                            f"{counts[LEASED]} in progress, {counts[QUEUED]} queued")
+            if stopping or not remaining:
+                break
+            for slot, process in enumerate(processes):
+                if process.poll() is not None and restarts[slot] < WORKER_MAX_RESTARTS:
+                    if process.returncode != 0:
+                        logger.warning(f"⚠️ Worker slot {slot} exited with {process.returncode}; restarting")
+                    restarts[slot] += 1
+                    processes[slot] = spawn(run_id, batch, lease_seconds, workers)
+            if all(process.poll() is not None for process in processes):
+                logger.error("❌ Every worker has exited and none can be restarted; stopping")
+                break
+            time.sleep(WORK_POLL_INTERVAL)
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+        if stopping:
+            # Workers release their leases on SIGTERM and exit after the current stock
+            for process in processes:
+                if process.poll() is None:
+                    process.terminate()
+        for process in processes:
+            process.wait()
+    counts = queue.counts(run_id)
+    logger.info(f"✅ Run {run_id} finished in {time.perf_counter() - started:.1f}s: {counts}")
+    return counts
+
+
+def _print_status(queue: WorkQueue, run_id: str):
+    print(json.dumps({
+        "run": run_id,
+        "counts": queue.counts(run_id),
+        "workers": queue.workers(run_id),
+        "failures": queue.failures(run_id),
+    }, indent=2))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(processName)s %(message)s")
+    parser = argparse.ArgumentParser(description="Distributed stock ingest over a leased work queue")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="add the universe (or a shard, or --symbols) to a run")
+    coordinator = commands.add_parser("coordinator", help="enqueue a run and process it with local workers")
+    for command in (enqueue, coordinator):
+        command.add_argument("--run", default=None, help="run id (default: a new timestamped run)")
+        command.add_argument("--shard", type=int, default=0)
+        command.add_argument("--shards", type=int, default=1)
+        command.add_argument("--symbols", default=None, help="comma-separated symbols instead of the universe")
+    coordinator.add_argument("--workers", type=int, default=INGEST_WORKERS)
+
+    worker = commands.add_parser("worker", help="process items of a run until it drains")
+    worker.add_argument("--run", default=None, help="run id (default: the newest run)")
+    worker.add_argument("--id", default=None, help="worker id (default: host-pid-random)")
+    for command in (coordinator, worker):
+        command.add_argument("--batch", type=int, default=WORK_LEASE_BATCH, help="items leased at a time")
+        command.add_argument("--lease", type=float, default=WORK_LEASE_SECONDS, help="lease length in seconds")
+
+    status = commands.add_parser("status", help="show a run's progress, workers and failures")
+    status.add_argument("--run", default=None, help="run id (default: the newest run)")
+
+    args = parser.parse_args(argv)
+    queue = open_work_queue()
+
+    if args.command in ("enqueue", "coordinator"):
+        run_id = args.run or new_run_id()
+        symbols = [s.strip().upper() for s in args.symbols.split(",") if s.strip()] if args.symbols else None
+        enqueue_universe(queue, run_id, args.shard, args.shards, symbols)
+        if args.command == "enqueue":
+            print(run_id)
+            return 0
+        counts = run_coordinator(queue, run_id, args.workers, args.batch, args.lease)
+        return 0 if counts[FAILED] == 0 else 1
+
+    run_id = args.run or next(iter(queue.runs()), None)
+    if run_id is None:
+        print("No runs in the work queue", file=sys.stderr)
+        return 1
+    if args.command == "status":
+        _print_status(queue, run_id)
+        return 0
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    run_worker(queue, run_id, stock_processor(), args.id, args.batch, args.lease, stop)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,285 @@
+# instrumentation.py
+"""
+Lightweight in-process metrics with Prometheus text exposition.
+
+Counters and latency histograms are registered in a module-level REGISTRY and
+rendered by the /metrics route. Metrics are per process; with several workers
+each one exposes its own series.
+"""
+import bisect
+import functools
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from tracing import start_span
+
+# Latency buckets in seconds (5 ms .. 60 s) covering SQL, scraping and rendering
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape_label(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base class holding the name, help text, label names and a lock"""
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class _Timer:
+    """Context manager / decorator observing elapsed time into a histogram"""
+
+    def __init__(self, histogram: "Histogram", labels: Dict):
+        self._histogram = histogram
+        self._labels = labels
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._histogram.observe(time.perf_counter() - self._start, **self._labels)
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Timer(self._histogram, self._labels):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+class Histogram(_Metric):
+    """Cumulative latency histogram with fixed buckets"""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels) -> _Timer:
+        """Time a block (`with hist.time(...)`) or a function (`@hist.time(...)`)"""
+        return _Timer(self, labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[2] if series else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self._series.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ------------------- Application Metrics -------------------
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds", "Flask request latency by route", ("endpoint", "method", "status"))
+SNOWFLAKE_CONNECT_DURATION = REGISTRY.histogram(
+    "snowflake_connect_duration_seconds", "Time to open a Snowflake connection")
+SQL_STATEMENT_DURATION = REGISTRY.histogram(
+    "sql_statement_duration_seconds", "SQL statement latency by calling function and verb", ("statement",))
+SCREENER_FETCH_DURATION = REGISTRY.histogram(
+    "screener_fetch_duration_seconds", "screener.in page fetch latency", ("status",))
+EXTRACT_DURATION = REGISTRY.histogram(
+    "extract_duration_seconds", "HTML extraction latency by extract_* function", ("function",))
+
+FALLBACK_TOTAL = REGISTRY.counter(
+    "fallback_total", "Requests or loads served from fallback data", ("reason",))
+CACHE_REQUESTS_TOTAL = REGISTRY.counter(
+    "cache_requests_total", "Cache lookups by cache and result", ("cache", "result"))
+ROWS_MERGED_TOTAL = REGISTRY.counter(
+    "rows_merged_total", "Fact rows sent to MERGE INTO FACT_FINANCIALS")
+SCRAPE_ERRORS_TOTAL = REGISTRY.counter(
+    "scrape_errors_total", "screener.in scrape failures by kind", ("kind",))
+
+WAREHOUSE_POOL_CONNECTIONS = REGISTRY.gauge(
+    "warehouse_pool_connections", "Pooled warehouse connections by state", ("state",))
+SCREENER_RATE_LIMIT = REGISTRY.gauge(
+    "screener_rate_limit", "Adaptive screener.in request rate limit (requests/second)")
+SCREENER_CONCURRENCY_LIMIT = REGISTRY.gauge(
+    "screener_concurrency_limit", "Adaptive limit on concurrent screener.in requests")
+SCREENER_INFLIGHT = REGISTRY.gauge(
+    "screener_inflight", "screener.in requests in flight")
+SCREENER_THROTTLE_TOTAL = REGISTRY.counter(
+    "screener_throttle_total", "Multiplicative rate cuts by cause (429, 5xx, error, latency)", ("reason",))
+
+
+# ------------------- Instrumented DB-API Wrappers -------------------
+class InstrumentedCursor:
+    """Cursor proxy timing every execute() into SQL_STATEMENT_DURATION"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, statement, *args, **kwargs):
+        # Label by calling function and SQL verb to keep cardinality bounded
+        caller = sys._getframe(1).f_code.co_name
+        verb = statement.lstrip().split(None, 1)[0].upper() if statement and statement.strip() else "UNKNOWN"
+        label = f"{caller}:{verb}"
+        with start_span("sql", statement=label, sql=" ".join(statement.split())[:160]), \
+                SQL_STATEMENT_DURATION.time(statement=label):
+            self._cursor.execute(statement, *args, **kwargs)
+        return self
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """Connection proxy handing out InstrumentedCursor objects"""
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._connection.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
@@ -0,0 +1,87 @@
+# jobs.py
+"""
+Background job queue for long-running work triggered from requests.
+
+Jobs run on a small per-process thread pool instead of ad-hoc threads, so a
+graceful shutdown can stop accepting new work and wait for queued and running
+jobs to finish. Each job runs as its own trace linked to the submitting span.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from tracing import current_context, run_linked
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+
+
+class JobQueue:
+    """ThreadPoolExecutor wrapper that tracks pending jobs and supports draining"""
+
+    def __init__(self, max_workers: int = JOB_WORKERS):
+        self.max_workers = max_workers
+        self._executor = None
+        self._pending = 0
+        self._accepting = True
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def submit(self, func: Callable, *args, name: Optional[str] = None, **kwargs) -> Future:
+        with self._lock:
+            if not self._accepting:
+                raise RuntimeError("Job queue is shutting down")
+            if self._executor is None:
+                # Created lazily so a pre-forking server never forks with live worker threads
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+            self._pending += 1
+            executor = self._executor
+        job = run_linked(func, current_context(), name=name)
+        future = executor.submit(job, *args, **kwargs)
+        future.add_done_callback(self._job_done)
+        return future
+
+    def _job_done(self, future: Future):
+        if future.exception() is not None:
+            logger.error(f"❌ Background job failed: {future.exception()}")
+        with self._lock:
+            self._pending -= 1
+            if self._pending == 0:
+                self._idle.notify_all()
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return self._pending
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Stop accepting jobs and wait for queued/running ones; False if the timeout expired"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._accepting = False
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    logger.warning(f"⚠️ {self._pending} background jobs still running after drain timeout")
+                    return False
+                logger.info(f"⏳ Draining {self._pending} background jobs")
+                self._idle.wait(remaining)
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+        return True
+
+    def reset_after_fork(self):
+        """Drop executor and lock state inherited from the parent process"""
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._executor = None
+        self._pending = 0
+        self._accepting = True
+
+
+JOB_QUEUE = JobQueue()
@@ -0,0 +1,158 @@
+# loadtest/fake_screener.py
+"""
+Local HTTP server standing in for screener.in.
+
+Serves /company/<STOCK>/consolidated/ from benchmarks/fixtures/screener_<STOCK>.html
+when a recorded page exists, otherwise from a synthetic page seeded by the
+stock code so every stock gets stable but distinct numbers. Latency, 429
+(rate limited) and 5xx rates are configurable to reproduce a throttling
+upstream.
+
+Usage:
+    python loadtest/fake_screener.py --port 8765 --latency-ms 300 --rate-429 0.05
+    SCREENER_URL=http://127.0.0.1:8765/company/{}/consolidated/ python stock_recommender.py
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+LOADTEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(os.path.dirname(LOADTEST_DIR), "benchmarks"))
+
+from fixtures import load_html_fixtures, synthetic_screener_html  # noqa: E402
+
+_PATH_RE = re.compile(r"^/company/(?P<stock>[^/]+)/")
+
+
+class ScreenerBehaviour:
+    """Latency and failure injection shared by all request handlers"""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, rate_429: float = 0.0,
+                 rate_5xx: float = 0.0, retry_after: int = 1, seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.retry_after = retry_after
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts = {"200": 0, "404": 0, "429": 0, "503": 0}
+
+    def delay(self) -> float:
+        with self._lock:
+            jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, self.latency_ms + jitter) / 1000.0
+
+    def outcome(self) -> int:
+        with self._lock:
+            roll = self._rng.random()
+        if roll < self.rate_429:
+            return 429
+        if roll < self.rate_429 + self.rate_5xx:
+            return 503
+        return 200
+
+    def count(self, status: int):
+        with self._lock:
+            self.counts[str(status)] = self.counts.get(str(status), 0) + 1
+
+
+class PageStore:
+    """Recorded fixture pages with a synthetic fallback per stock code"""
+
+    def __init__(self):
+        self._recorded = {name[len("screener_"):].upper(): html
+                          for name, html in load_html_fixtures().items() if name.startswith("screener_")}
+        self._synthetic: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def get(self, stock: str) -> bytes:
+        stock = stock.upper()
+        if stock in self._recorded:
+            return self._recorded[stock].encode("utf-8")
+        with self._lock:
+            page = self._synthetic.get(stock)
+            if page is None:
+                page = self._synthetic[stock] = synthetic_screener_html(seed=zlib.crc32(stock.encode())).encode("utf-8")
+        return page
+
+
+def make_handler(store: PageStore, behaviour: ScreenerBehaviour):
+    class ScreenerHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(behaviour.delay())
+            match = _PATH_RE.match(self.path)
+            if not match:
+                return self._send(404, b"Not found")
+            status = behaviour.outcome()
+            if status == 429:
+                return self._send(429, b"Too many requests", {"Retry-After": str(behaviour.retry_after)})
+            if status != 200:
+                return self._send(status, b"Service unavailable")
+            self._send(200, store.get(match.group("stock")), {"Content-Type": "text/html; charset=utf-8"})
+
+        def _send(self, status: int, body: bytes, headers: Optional[Dict[str, str]] = None):
+            behaviour.count(status)
+            self.send_response(status)
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ScreenerHandler
+
+
+def start_server(host: str = "127.0.0.1", port: int = 0,
+                 behaviour: Optional[ScreenerBehaviour] = None) -> ThreadingHTTPServer:
+    """Start the fake screener in a daemon thread; port 0 picks a free port"""
+    behaviour = behaviour or ScreenerBehaviour()
+    server = ThreadingHTTPServer((host, port), make_handler(PageStore(), behaviour))
+    server.daemon_threads = True
+    server.behaviour = behaviour
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def screener_url(server: ThreadingHTTPServer) -> str:
+    """SCREENER_URL template pointing at a running fake server"""
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/company/{{}}/consolidated/"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Fake screener.in server for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Mean response delay")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- jitter around the mean")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429")
+    args = parser.parse_args(argv)
+
+    behaviour = ScreenerBehaviour(args.latency_ms, args.jitter_ms, args.rate_429, args.rate_5xx, args.retry_after)
+    server = start_server(args.host, args.port, behaviour)
+    print(f"🌐 Fake screener listening on {screener_url(server)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
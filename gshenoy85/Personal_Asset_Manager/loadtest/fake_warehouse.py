@@ -0,0 +1,185 @@
+# loadtest/fake_warehouse.py
+"""
+SQLite-backed local stand-in for the Snowflake connector.
+
+Enable it with WAREHOUSE_CONNECTOR=fake_warehouse:connect (loadtest/ on sys.path). All
+connections share one database file (FAKE_WAREHOUSE_PATH) so several app
+workers see the same data. The Snowflake dialect used by stock_recommender is
+translated on the fly: %s placeholders, CURRENT_TIMESTAMP(), FROM VALUES,
+INFORMATION_SCHEMA.TABLES and MERGE INTO ... USING (...) AS src statements.
+FAKE_WAREHOUSE_LATENCY_MS adds a per-statement delay to mimic warehouse
+round trips.
+"""
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Optional
+
+FAKE_WAREHOUSE_PATH = os.getenv("FAKE_WAREHOUSE_PATH",
+                                os.path.join(tempfile.gettempdir(), "fake_warehouse.sqlite3"))
+FAKE_WAREHOUSE_LATENCY_MS = float(os.getenv("FAKE_WAREHOUSE_LATENCY_MS", "0"))
+
+_MERGE_RE = re.compile(
+    r"^\s*MERGE\s+INTO\s+(?P<target>\w+)(?:\s+AS\s+(?P<alias>\w+))?\s+USING\s*\(",
+    re.IGNORECASE | re.DOTALL,
+)
+_MERGE_TAIL_RE = re.compile(
+    r"\)\s*AS\s+(?P<src>\w+)\s+ON\s+(?P<on>.*?)"
+    r"(?:\s+WHEN\s+MATCHED\s+THEN\s+UPDATE\s+SET\s+(?P<set>.*?))?"
+    r"\s+WHEN\s+NOT\s+MATCHED\s+THEN\s+INSERT\s*\((?P<cols>[^)]*)\)\s*VALUES\s*\((?P<vals>.*)\)\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+_schema_lock = threading.Lock()
+# sqlite_master shaped like Snowflake's INFORMATION_SCHEMA.TABLES (single schema PUBLIC)
+_INFORMATION_SCHEMA_TABLES = (
+    "(SELECT 'PUBLIC' AS TABLE_SCHEMA, name AS TABLE_NAME, "
+    "CASE type WHEN 'table' THEN 'BASE TABLE' ELSE 'VIEW' END AS TABLE_TYPE "
+    "FROM sqlite_master WHERE type IN ('table', 'view'))"
+)
+# MERGE keys per table, indexed when the table is created
+_MERGE_KEYS = {
+    "FINANCIALS_QUARTERLY": "STOCK_CODE, METRIC, QUARTER",
+    "FACT_FINANCIALS": "STOCK_ID, METRIC_ID, PERIOD_ID",
+    "DIM_STOCK": "STOCK_ID",
+    "DIM_METRIC": "METRIC_ID",
+    "DIM_PERIOD": "PERIOD_ID",
+    "DERIVED_STATE": "STOCK_ID",
+}
+
+
+def _translate(statement: str, placeholders: bool = False) -> str:
+    """Rewrite Snowflake-only syntax into SQLite"""
+    sql = statement.replace("%s", "?") if placeholders else statement
+    sql = re.sub(r"CURRENT_TIMESTAMP\(\)", "CURRENT_TIMESTAMP", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"CURRENT_SCHEMA\(\)", "'PUBLIC'", sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bINFORMATION_SCHEMA\.TABLES\b", _INFORMATION_SCHEMA_TABLES, sql, flags=re.IGNORECASE)
+    sql = re.sub(r"\bSTRING\b", "TEXT", sql)
+    # SELECT ... FROM VALUES (..),(..)  ->  SELECT ... FROM (VALUES (..),(..))
+    match = re.search(r"\bFROM\s+VALUES\b", sql, flags=re.IGNORECASE)
+    if match:
+        sql = sql[:match.start()] + "FROM (VALUES" + sql[match.end():] + ")"
+    return sql
+
+
+def _split_merge(statement: str):
+    """Break a MERGE into (target, alias, source_select, src_alias, on, set, cols, vals)"""
+    head = _MERGE_RE.match(statement)
+    if not head:
+        return None
+    tail_start = statement.upper().rfind(") AS ")
+    tail = _MERGE_TAIL_RE.match(statement[tail_start:])
+    if not tail:
+        return None
+    source = statement[head.end():tail_start]
+    return (head.group("target"), head.group("alias") or head.group("target"), source,
+            tail.group("src"), tail.group("on"), tail.group("set"), tail.group("cols"), tail.group("vals"))
+
+
+class FakeCursor:
+    """DB-API cursor over a shared SQLite connection"""
+
+    def __init__(self, connection: "FakeConnection"):
+        self._connection = connection
+        self._cursor = connection._db.cursor()
+        self.rowcount = -1
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, statement: str, params: Optional[tuple] = None):
+        if FAKE_WAREHOUSE_LATENCY_MS:
+            time.sleep(FAKE_WAREHOUSE_LATENCY_MS / 1000.0)
+        merge = _split_merge(statement)
+        if merge:
+            self._execute_merge(*merge, params=params)
+            return self
+        sql = _translate(statement, placeholders=params is not None)
+        self._cursor.execute(sql, tuple(params or ()))
+        self.rowcount = self._cursor.rowcount
+        if re.match(r"\s*CREATE\s+TABLE", sql, re.IGNORECASE):
+            self._connection._ensure_keys()
+        return self
+
+    def executemany(self, statement: str, seq_of_params):
+        for params in seq_of_params:
+            self.execute(statement, params)
+        return self
+
+    def _execute_merge(self, target, alias, source, src_alias, on, assignments, cols, vals, params=None):
+        """MERGE emulated as UPDATE ... FROM followed by INSERT ... WHERE NOT EXISTS"""
+        cur = self._cursor
+        cur.execute("DROP TABLE IF EXISTS temp._merge_src")
+        # Bound parameters can only appear in the USING (...) source select
+        cur.execute(f"CREATE TEMP TABLE _merge_src AS {_translate(source, placeholders=params is not None)}",
+                    tuple(params or ()))
+        updated = 0
+        if assignments:
+            assignments = _translate(assignments)
+            cur.execute(f"UPDATE {target} AS {alias} SET {assignments} "
+                        f"FROM temp._merge_src AS {src_alias} WHERE {on}")
+            updated = cur.rowcount
+        cur.execute(f"INSERT INTO {target} ({cols}) SELECT {_translate(vals)} FROM temp._merge_src AS {src_alias} "
+                    f"WHERE NOT EXISTS (SELECT 1 FROM {target} AS {alias} WHERE {on})")
+        self.rowcount = updated + cur.rowcount
+        cur.execute("DROP TABLE temp._merge_src")
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size: int = 1000):
+        return self._cursor.fetchmany(size)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def close(self):
+        self._cursor.close()
+
+
+class FakeConnection:
+    """DB-API connection to the shared SQLite file"""
+
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level="DEFERRED")
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+
+    def _ensure_keys(self):
+        """Snowflake MERGE keys have no constraint; index them so lookups stay fast"""
+        with _schema_lock:
+            tables = {row[0] for row in self._db.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+            for table, columns in _MERGE_KEYS.items():
+                if table in tables:
+                    self._db.execute(f"CREATE INDEX IF NOT EXISTS IX_{table}_KEY ON {table} ({columns})")
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self._db.commit()
+
+    def rollback(self):
+        self._db.rollback()
+
+    def close(self):
+        self._db.close()
+
+
+def connect(path: Optional[str] = None) -> FakeConnection:
+    """Connector factory referenced by WAREHOUSE_CONNECTOR"""
+    return FakeConnection(path or FAKE_WAREHOUSE_PATH)
+
+
+def reset(path: Optional[str] = None):
+    """Delete the shared database file (and its WAL side files)"""
+    path = path or FAKE_WAREHOUSE_PATH
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Hermetic load test for the Flask routes.
+
+Starts the fake screener (loadtest/fake_screener.py), points the app at the
+SQLite warehouse stand-in (loadtest/fake_warehouse.py), seeds it through
+/load-single and then drives /quarterly, /visualize, /sector, the series API,
+/load-single and /load-data concurrently. Reports p50/p95/p99 latency, error
+counts and throughput per route. No screener.in or Snowflake access is needed.
+
+Usage:
+    python loadtest/run_load.py                                   # 30 s, 8 clients
+    python loadtest/run_load.py --concurrency 32 --duration 60 --latency-ms 250 --rate-429 0.05
+    python loadtest/run_load.py --mix quarterly=5,series=10,load-single=1
+    python loadtest/run_load.py --target http://127.0.0.1:5000    # app already running
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+LOADTEST_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(LOADTEST_DIR)
+sys.path.append(APP_DIR)
+sys.path.append(LOADTEST_DIR)
+
+import requests  # noqa: E402
+
+import fake_screener  # noqa: E402
+
+DEFAULT_STOCKS = ["RELIANCE", "TCS", "ITC", "HDFCBANK", "PIDILITIND", "CUMMINSIND", "HATSUN", "BALAMINES"]
+DEFAULT_MIX = "quarterly=4,visualize=2,sector=2,series=6,load-single=1,load-data=0.1"
+SERIES_CATEGORIES = ["Income Statement", "Balance Sheet", "Cash Flow", "Financial Ratios"]
+
+
+def build_request(route: str, base: str, stocks: List[str], sectors: List[str],
+                  rng: random.Random) -> Tuple[str, str, Optional[Dict]]:
+    """(method, url, form) for one request against the given route"""
+    stock = rng.choice(stocks)
+    if route == "quarterly":
+        return "GET", f"{base}/quarterly/{stock}", None
+    if route == "visualize":
+        return "POST", f"{base}/visualize", {"stock": stock}
+    if route == "sector":
+        return "GET", f"{base}/sector/{rng.choice(sectors)}", None
+    if route == "series":
+        category = rng.choice(SERIES_CATEGORIES)
+        return "GET", f"{base}/api/v1/stock/{stock}/series?category={category}", None
+    if route == "load-single":
+        return "POST", f"{base}/load-single/{stock}", None
+    if route == "load-data":
+        return "POST", f"{base}/load-data", None
+    raise ValueError(f"Unknown route: {route}")
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        if part.strip():
+            route, _, weight = part.partition("=")
+            mix[route.strip()] = float(weight or 1)
+    return {route: weight for route, weight in mix.items() if weight > 0}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def is_error(route: str, response: requests.Response) -> bool:
+    """HTTP failures, plus JSON bodies reporting status=error from the load endpoints"""
+    if response.status_code >= 400:
+        return True
+    if route in ("load-single", "load-data"):
+        try:
+            return response.json().get("status") == "error"
+        except ValueError:
+            return True
+    return False
+
+
+class LoadResults:
+    """Per-route latencies and error counts collected by all clients"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, route: str, seconds: float, error: bool):
+        with self._lock:
+            self.latencies.setdefault(route, []).append(seconds)
+            if error:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def summary(self, elapsed: float) -> Dict:
+        routes = {}
+        total = 0
+        for route, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            total += len(values)
+            routes[route] = {
+                "requests": len(values),
+                "errors": self.errors.get(route, 0),
+                "rps": len(values) / elapsed,
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+                "max_ms": values[-1] * 1000,
+            }
+        return {"elapsed_s": elapsed, "requests": total, "errors": sum(self.errors.values()),
+                "throughput_rps": total / elapsed if elapsed else 0.0, "routes": routes}
+
+
+def client_loop(base: str, mix: Dict[str, float], stocks: List[str], sectors: List[str],
+                deadline: float, results: LoadResults, seed: int, timeout: float):
+    rng = random.Random(seed)
+    routes, weights = list(mix), list(mix.values())
+    session = requests.Session()
+    while time.perf_counter() < deadline:
+        route = rng.choices(routes, weights)[0]
+        method, url, form = build_request(route, base, stocks, sectors, rng)
+        start = time.perf_counter()
+        try:
+            response = session.request(method, url, data=form, timeout=timeout)
+            error = is_error(route, response)
+        except requests.RequestException:
+            error = True
+        results.record(route, time.perf_counter() - start, error)
+
+
+def start_local_app(args) -> Tuple[str, object]:
+    """Configure the fakes through the environment, then import and serve the app"""
+    behaviour = fake_screener.ScreenerBehaviour(args.latency_ms, args.jitter_ms, args.rate_429,
+                                                args.rate_5xx, seed=args.seed)
+    screener = fake_screener.start_server(behaviour=behaviour)
+    os.environ["SCREENER_URL"] = fake_screener.screener_url(screener)
+    os.environ["WAREHOUSE_CONNECTOR"] = "fake_warehouse:connect"
+    os.environ["FAKE_WAREHOUSE_PATH"] = args.warehouse_path
+    os.environ["FAKE_WAREHOUSE_LATENCY_MS"] = str(args.warehouse_latency_ms)
+
+    import fake_warehouse
+    fake_warehouse.reset(args.warehouse_path)
+
+    from werkzeug.serving import make_server
+    import stock_recommender
+
+    server = make_server("127.0.0.1", 0, stock_recommender.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", screener
+
+
+def seed_warehouse(base: str, stocks: List[str], timeout: float):
+    """Load every stock once so read routes hit real rows instead of the fallback"""
+    for stock in stocks:
+        response = requests.post(f"{base}/load-single/{stock}", timeout=timeout)
+        status = "✅" if not is_error("load-single", response) else "❌"
+        print(f"  {status} seeded {stock}")
+
+
+def print_report(summary: Dict, screener=None):
+    print(f"\n{'route':<14} {'reqs':>7} {'errs':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for route, r in summary["routes"].items():
+        print(f"{route:<14} {r['requests']:>7} {r['errors']:>6} {r['rps']:>8.1f} {r['p50_ms']:>9.1f} "
+              f"{r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['max_ms']:>9.1f}")
+    print(f"\n📊 {summary['requests']} requests, {summary['errors']} errors in {summary['elapsed_s']:.1f}s "
+          f"→ {summary['throughput_rps']:.1f} req/s")
+    if screener is not None:
+        print(f"🌐 Fake screener responses: {screener.behaviour.counts}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Hermetic load test for the stock recommender")
+    parser.add_argument("--target", help="Base URL of an already running app (skips the local fakes)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of load")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Route weights, e.g. quarterly=4,series=6")
+    parser.add_argument("--stocks", default=",".join(DEFAULT_STOCKS), help="Stock codes to request")
+    parser.add_argument("--sectors", default="Large Cap", help="Sector names for /sector")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="Fake screener mean latency")
+    parser.add_argument("--jitter-ms", type=float, default=100.0, help="Fake screener latency jitter")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Fake screener 429 rate")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="Fake screener 503 rate")
+    parser.add_argument("--warehouse-latency-ms", type=float, default=0.0, help="Fake warehouse per-statement delay")
+    parser.add_argument("--warehouse-path", default=os.path.join(tempfile.gettempdir(), "loadtest_warehouse.sqlite3"))
+    parser.add_argument("--no-seed", action="store_true", help="Skip seeding the warehouse before the run")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for request selection")
+    parser.add_argument("--json", metavar="PATH", help="Also write the summary as JSON")
+    args = parser.parse_args(argv)
+
+    stocks = [s.strip().upper() for s in args.stocks.split(",") if s.strip()]
+    sectors = [s.strip() for s in args.sectors.split(",") if s.strip()]
+    mix = parse_mix(args.mix)
+
+    screener = None
+    if args.target:
+        base = args.target.rstrip("/")
+    else:
+        # Per-request logs would dominate the output and the timings
+        import logging
+        logging.disable(logging.WARNING)
+        base, screener = start_local_app(args)
+        print(f"🚀 App on {base}, fake screener on {fake_screener.screener_url(screener)}")
+
+    if not args.no_seed:
+        print("🌱 Seeding warehouse")
+        seed_warehouse(base, stocks, args.timeout)
+
+    print(f"🔥 {args.concurrency} clients for {args.duration:.0f}s, mix {mix}")
+    results = LoadResults()
+    start = time.perf_counter()
+    deadline = start + args.duration
+    clients = [threading.Thread(target=client_loop, args=(base, mix, stocks, sectors, deadline, results,
+                                                           args.seed + i, args.timeout))
+               for i in range(args.concurrency)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    summary = results.summary(time.perf_counter() - start)
+
+    print_report(summary, screener)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
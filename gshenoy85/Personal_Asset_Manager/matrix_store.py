@@ -0,0 +1,455 @@
+# matrix_store.py
+"""
+In-memory stock x metric x period matrix of the whole universe.
+
+A FinancialMatrix holds every fact in one dense float32 array (NaN marks a
+missing value) plus index maps for the three axes. A stock's metrics, one
+metric across the universe or a single cell are then numpy slices rather
+than warehouse queries. MatrixStore keeps the current matrix for the
+process. It is loaded in one pass over FACT_FINANCIALS, or from a
+memory-mapped snapshot (see snapshot.py), and updated incrementally as
+stocks are ingested.
+
+Arrays have spare capacity on every axis. Adding a stock, metric or period
+publishes a new FinancialMatrix that shares the array while it still fits,
+so a reader holding the previous matrix only ever sees the cells it
+indexed. New facts are written into the stock's row in place.
+"""
+import logging
+import threading
+import time
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from serialization import format_number
+from star_schema import StockInfo, period_id, period_label
+
+logger = logging.getLogger(__name__)
+
+DTYPE = np.float32
+FETCH_CHUNK_ROWS = 50_000
+_MIN_CAPACITY = (16, 32, 8)
+
+
+def _capacity(current: int, needed: int) -> int:
+    """Double the current capacity until `needed` fits"""
+    capacity = max(current, 1)
+    while capacity < needed:
+        capacity *= 2
+    return capacity
+
+
+def to_python_values(values: np.ndarray) -> List[Optional[float]]:
+    """float32 cells as JSON-ready floats at float32 precision (None for missing)"""
+    return [None if v != v else float(f"{v:.7g}") for v in values.tolist()]
+
+
+class FinancialMatrix:
+    """One immutable set of axes over a (stock, metric, period) float32 array"""
+
+    __slots__ = ("values", "stocks", "stock_index", "metric_ids", "metric_index",
+                 "period_ids", "period_labels", "period_index", "version", "_sector_rows")
+
+    def __init__(self, values: np.ndarray, stocks: Sequence[StockInfo], metric_ids: Sequence[int],
+                 period_ids: Sequence[int], period_labels: Sequence[str], version: int = 0):
+        self.values = values
+        self.stocks = tuple(stocks)
+        self.stock_index = {info.stock_code.upper(): i for i, info in enumerate(self.stocks)}
+        self.metric_ids = tuple(metric_ids)
+        self.metric_index = {mid: j for j, mid in enumerate(self.metric_ids)}
+        self.period_ids = tuple(period_ids)
+        self.period_labels = tuple(period_labels)
+        self.period_index = {pid: k for k, pid in enumerate(self.period_ids)}
+        self.version = version
+        self._sector_rows: Optional[Dict[str, np.ndarray]] = None
+
+    @classmethod
+    def empty(cls) -> "FinancialMatrix":
+        return cls(np.full(_MIN_CAPACITY, np.nan, dtype=DTYPE), (), (), (), ())
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        return len(self.stocks), len(self.metric_ids), len(self.period_ids)
+
+    @property
+    def data(self) -> np.ndarray:
+        """View of the populated cells"""
+        stocks, metrics, periods = self.shape
+        return self.values[:stocks, :metrics, :periods]
+
+    def stock_row(self, stock_code: str) -> Optional[int]:
+        return self.stock_index.get(stock_code.upper())
+
+    def stock_slice(self, stock_code: str) -> Optional[np.ndarray]:
+        """(metric, period) view of one stock"""
+        i = self.stock_row(stock_code)
+        if i is None:
+            return None
+        _, metrics, periods = self.shape
+        return self.values[i, :metrics, :periods]
+
+    def metric_slice(self, mid: int) -> Optional[np.ndarray]:
+        """(stock, period) view of one metric across the universe"""
+        j = self.metric_index.get(mid)
+        if j is None:
+            return None
+        stocks, _, periods = self.shape
+        return self.values[:stocks, j, :periods]
+
+    def value(self, stock_code: str, mid: int, label: str) -> Optional[float]:
+        i, j, k = self.stock_row(stock_code), self.metric_index.get(mid), self.period_index.get(period_id(label))
+        if i is None or j is None or k is None:
+            return None
+        cell = float(self.values[i, j, k])
+        return None if cell != cell else cell
+
+    def sector_rows(self) -> Dict[str, np.ndarray]:
+        """Stock rows per sector CATEGORY, built once per matrix"""
+        if self._sector_rows is None:
+            grouped: Dict[str, List[int]] = {}
+            for i, info in enumerate(self.stocks):
+                grouped.setdefault(info.category, []).append(i)
+            self._sector_rows = {category: np.array(rows) for category, rows in grouped.items()}
+        return self._sector_rows
+
+    def extend(self, stock: StockInfo, metric_ids: Iterable[int], periods: Dict[int, str]) -> "FinancialMatrix":
+        """This matrix if every key is known, else a new one (sharing the array when it fits)"""
+        stocks = list(self.stocks)
+        row = self.stock_row(stock.stock_code)
+        if row is None:
+            stocks.append(stock)
+        elif stocks[row] != stock:
+            stocks[row] = stock
+        new_metrics = [mid for mid in dict.fromkeys(metric_ids) if mid not in self.metric_index]
+        new_periods = [pid for pid in periods if pid not in self.period_index]
+        if row is not None and stocks[row] is self.stocks[row] and not new_metrics and not new_periods:
+            return self
+
+        shape = (len(stocks), len(self.metric_ids) + len(new_metrics), len(self.period_ids) + len(new_periods))
+        values = self.values
+        if any(needed > have for needed, have in zip(shape, values.shape)):
+            values = np.full(tuple(_capacity(have, needed) for have, needed in zip(values.shape, shape)),
+                             np.nan, dtype=DTYPE)
+            old_stocks, old_metrics, old_periods = self.shape
+            values[:old_stocks, :old_metrics, :old_periods] = self.data
+        return FinancialMatrix(values, stocks, self.metric_ids + tuple(new_metrics),
+                               self.period_ids + tuple(new_periods),
+                               self.period_labels + tuple(periods[pid] for pid in new_periods),
+                               self.version + 1)
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Plain arrays of the populated matrix and its axes (see from_arrays)"""
+        return {
+            "values": self.data,
+            "stock_ids": np.array([info.stock_id for info in self.stocks], dtype=np.int64),
+            "stock_codes": np.array([info.stock_code for info in self.stocks], dtype=str),
+            "industries": np.array([info.industry for info in self.stocks], dtype=str),
+            "categories": np.array([info.category for info in self.stocks], dtype=str),
+            "metric_ids": np.array(self.metric_ids, dtype=np.int64),
+            "period_ids": np.array(self.period_ids, dtype=np.int64),
+            "period_labels": np.array(self.period_labels, dtype=str),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], version: int = 0) -> "FinancialMatrix":
+        stocks = [StockInfo(int(sid), str(code), str(industry), str(category)) for sid, code, industry, category
+                  in zip(arrays["stock_ids"], arrays["stock_codes"], arrays["industries"], arrays["categories"])]
+        # asarray keeps a memory-mapped matrix mapped
+        return cls(np.asarray(arrays["values"], dtype=DTYPE), stocks,
+                   [int(mid) for mid in arrays["metric_ids"]], [int(pid) for pid in arrays["period_ids"]],
+                   [str(label) for label in arrays["period_labels"]], version)
+
+
+class MatrixStore:
+    """The process's current FinancialMatrix plus category-aware reads over it"""
+
+    def __init__(self, registry):
+        # MetricRegistry: metric ids -> names and categories
+        self._registry = registry
+        self._matrix: Optional[FinancialMatrix] = None
+        self._write_lock = threading.Lock()
+        self._replay: Optional[List[Tuple[StockInfo, Sequence[Tuple[int, str, float]]]]] = None
+        self._columns: Tuple[Tuple, Dict[str, np.ndarray]] = ((), {})
+        self._refreshing = False
+        self._last_refresh = 0.0
+        self.loaded_at: Optional[float] = None
+        self.source: Optional[str] = None
+
+    @property
+    def registry(self):
+        return self._registry
+
+    @property
+    def matrix(self) -> Optional[FinancialMatrix]:
+        return self._matrix
+
+    @property
+    def ready(self) -> bool:
+        return self._matrix is not None
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.loaded_at if self.loaded_at else float("inf")
+
+    def begin_refresh(self, max_age: float = 0) -> bool:
+        """Claim a background refresh once the data is older than max_age and no refresh ran for as long"""
+        with self._write_lock:
+            now = time.time()
+            if self._refreshing or self.age < max_age or now - self._last_refresh < max_age:
+                return False
+            self._refreshing = True
+            self._last_refresh = now
+            return True
+
+    def end_refresh(self):
+        """Release a refresh claim and stop buffering ingests for replay (a no-op after publish())"""
+        with self._write_lock:
+            self._replay = None
+            self._refreshing = False
+
+    # ---- loading ----
+    def publish(self, matrix: FinancialMatrix, source: str, loaded_at: Optional[float] = None):
+        """Swap in a freshly loaded matrix and replay ingests that raced the load"""
+        with self._write_lock:
+            replay, self._replay = self._replay or [], None
+            self._matrix = matrix
+            self.loaded_at = loaded_at or time.time()
+            self.source = source
+            self._refreshing = False
+        for stock, facts in replay:
+            self.upsert(stock, facts)
+
+    def load(self, cur) -> int:
+        """Build the matrix from the star schema in one pass; returns the number of facts"""
+        with self._write_lock:
+            self._replay = []
+        try:
+            cur.execute("SELECT STOCK_ID, STOCK_CODE, INDUSTRY, CATEGORY FROM DIM_STOCK")
+            stocks = {int(sid): StockInfo(int(sid), code, industry or "", category or "")
+                      for sid, code, industry, category in cur.fetchall()}
+            cur.execute("SELECT PERIOD_ID, QUARTER FROM DIM_PERIOD")
+            labels = {int(pid): label for pid, label in cur.fetchall()}
+
+            cur.execute("SELECT STOCK_ID, METRIC_ID, PERIOD_ID, VALUE FROM FACT_FINANCIALS")
+            key_chunks, value_chunks = [], []
+            while True:
+                rows = cur.fetchmany(FETCH_CHUNK_ROWS)
+                if not rows:
+                    break
+                # Ids are 56-bit, so they stay int64; None values become NaN
+                key_chunks.append(np.array([row[:3] for row in rows], dtype=np.int64))
+                value_chunks.append(np.array([row[3] for row in rows], dtype=DTYPE))
+        except Exception:
+            self.end_refresh()
+            raise
+
+        keys = np.concatenate(key_chunks) if key_chunks else np.empty((0, 3), dtype=np.int64)
+        values = np.concatenate(value_chunks) if value_chunks else np.empty(0, dtype=DTYPE)
+
+        stock_ids = np.array(sorted(stocks), dtype=np.int64)
+        known = np.isin(keys[:, 0], stock_ids)
+        keys, values = keys[known], values[known]
+        stock_rows = np.searchsorted(stock_ids, keys[:, 0])
+        metric_ids, metric_cols = np.unique(keys[:, 1], return_inverse=True)
+        period_ids, period_cols = np.unique(keys[:, 2], return_inverse=True)
+
+        shape = (len(stock_ids), len(metric_ids), len(period_ids))
+        matrix_values = np.full(tuple(max(n, floor) for n, floor in zip(shape, _MIN_CAPACITY)), np.nan, dtype=DTYPE)
+        matrix_values[stock_rows, metric_cols, period_cols] = values
+        matrix = FinancialMatrix(
+            matrix_values, [stocks[int(sid)] for sid in stock_ids], [int(mid) for mid in metric_ids],
+            [int(pid) for pid in period_ids],
+            [labels.get(int(pid)) or period_label(int(pid)) or str(pid) for pid in period_ids],
+        )
+        self.publish(matrix, "warehouse")
+        logger.info(f"🧮 Matrix store loaded: {shape[0]} stocks × {shape[1]} metrics × {shape[2]} periods "
+                    f"({len(values)} facts, {matrix_values.nbytes / 1e6:.1f} MB)")
+        return len(values)
+
+    # ---- ingest ----
+    def upsert(self, stock: StockInfo, facts: Sequence[Tuple[int, str, float]]) -> int:
+        """Write one stock's (metric_id, period label, value) facts; ignored until the store is loaded"""
+        with self._write_lock:
+            if self._replay is not None:
+                self._replay.append((stock, facts))
+            matrix = self._matrix
+            if matrix is None or not facts:
+                return 0
+            periods = {period_id(label): label for _, label, _ in facts}
+            matrix = matrix.extend(stock, [mid for mid, _, _ in facts], periods)
+            i = matrix.stock_row(stock.stock_code)
+            cols = np.array([matrix.metric_index[mid] for mid, _, _ in facts])
+            period_cols = np.array([matrix.period_index[period_id(label)] for _, label, _ in facts])
+            matrix.values[i, cols, period_cols] = np.array([value for _, _, value in facts], dtype=DTYPE)
+            self._matrix = matrix
+        return len(facts)
+
+    # ---- reads ----
+    def _columns_by_category(self, matrix: FinancialMatrix) -> Dict[str, np.ndarray]:
+        """Metric axis positions per metric category (cached per matrix/registry version)"""
+        snapshot = self._registry.snapshot
+        key, columns = self._columns
+        if key == (matrix.version, len(matrix.metric_ids), snapshot.version):
+            return columns
+        grouped: Dict[str, List[int]] = {}
+        for j, mid in enumerate(matrix.metric_ids):
+            info = snapshot.by_id.get(mid)
+            if info is not None:
+                grouped.setdefault(info.category, []).append(j)
+        columns = {category: np.array(cols) for category, cols in grouped.items()}
+        self._columns = ((matrix.version, len(matrix.metric_ids), snapshot.version), columns)
+        return columns
+
+    def _metric_names(self, matrix: FinancialMatrix, cols: np.ndarray) -> List[str]:
+        by_id = self._registry.snapshot.by_id
+        return [by_id[matrix.metric_ids[j]].name for j in cols]
+
+    def category_index(self, stock_code: str) -> Optional[Tuple[List[Dict], List[str]]]:
+        """(categories with metric counts, sorted quarters) of a stock, None if it is not loaded"""
+        matrix = self._matrix
+        block = matrix.stock_slice(stock_code) if matrix else None
+        if block is None:
+            return None
+        present = ~np.isnan(block)
+        metric_has_data = present.any(axis=1)
+        categories = []
+        for category, cols in sorted(self._columns_by_category(matrix).items()):
+            count = int(np.count_nonzero(metric_has_data[cols]))
+            if count:
+                categories.append({"name": category, "metric_count": count})
+        quarters = sorted(matrix.period_labels[k] for k in np.flatnonzero(present.any(axis=0)))
+        return categories, quarters
+
+    def category_series(self, stock_code: str, category: str) -> Optional[Tuple[List[str], Dict[str, List]]]:
+        """Same payload as the warehouse series query, sliced from the matrix"""
+        matrix = self._matrix
+        block = matrix.stock_slice(stock_code) if matrix else None
+        if block is None:
+            return None
+        cols = self._columns_by_category(matrix).get(category)
+        if cols is None:
+            return [], {}
+        block = block[cols]
+        present = ~np.isnan(block)
+        rows = np.flatnonzero(present.any(axis=1))
+        periods = sorted(np.flatnonzero(present.any(axis=0)), key=lambda k: matrix.period_labels[k])
+        names = self._metric_names(matrix, cols[rows])
+        series = {name: to_python_values(block[r, periods]) for name, r in sorted(zip(names, rows))}
+        return [matrix.period_labels[k] for k in periods], series
+
+    def batch_series(self, stock_codes: Sequence[str],
+                     metric_ids: Sequence[int]) -> Optional[Tuple[List[str], List[List[List]]]]:
+        """(quarters in date order, values[metric][stock][period]) on a shared axis, None unless all stocks are loaded"""
+        matrix = self._matrix
+        rows = [matrix.stock_row(code) for code in stock_codes] if matrix else [None]
+        if any(i is None for i in rows):
+            return None
+        _, _, periods = matrix.shape
+        known = [(n, matrix.metric_index[mid]) for n, mid in enumerate(metric_ids) if mid in matrix.metric_index]
+        block = np.full((len(metric_ids), len(rows), periods), np.nan, dtype=DTYPE)
+        if known and rows:
+            targets, cols = zip(*known)
+            block[list(targets)] = matrix.values[np.ix_(rows, cols, range(periods))].transpose(1, 0, 2)
+        period_cols = sorted(np.flatnonzero(~np.isnan(block).all(axis=(0, 1))), key=lambda k: matrix.period_ids[k])
+        values = [[to_python_values(block[m, s, period_cols]) for s in range(len(rows))] for m in range(len(metric_ids))]
+        return [matrix.period_labels[k] for k in period_cols], values
+
+    def sector_categories(self) -> List[str]:
+        matrix = self._matrix
+        return sorted(c for c in matrix.sector_rows() if c) if matrix else []
+
+    def sector_series(self, sector: str) -> Optional[Tuple[List[str], Dict[str, Dict[str, List]]]]:
+        """pivot_sector_rows output for every stock in a sector CATEGORY, None if it has no stocks"""
+        matrix = self._matrix
+        stock_rows = matrix.sector_rows().get(sector) if matrix else None
+        if stock_rows is None:
+            return None
+        _, metrics, periods = matrix.shape
+        block = matrix.values[stock_rows, :metrics, :periods]
+        present = ~np.isnan(block)
+        period_cols = sorted(np.flatnonzero(present.any(axis=(0, 1))), key=lambda k: matrix.period_labels[k])
+        stock_order = sorted(range(len(stock_rows)), key=lambda r: matrix.stocks[stock_rows[r]].stock_code)
+
+        categorized = {}
+        for category, cols in sorted(self._columns_by_category(matrix).items()):
+            metric_order = sorted(zip(self._metric_names(matrix, cols), cols))
+            series = {}
+            for r in stock_order:
+                code = matrix.stocks[stock_rows[r]].stock_code
+                for name, j in metric_order:
+                    if present[r, j].any():
+                        series[f"{code} - {name}"] = to_python_values(block[r, j, period_cols])
+            if series:
+                categorized[category] = series
+        return [matrix.period_labels[k] for k in period_cols], categorized
+
+    def stock_financials(self, stock_code: str) -> Optional[Dict]:
+        """One stock in the FALLBACK_FINANCIAL_DATA entry shape (periods in date order)"""
+        matrix = self._matrix
+        block = matrix.stock_slice(stock_code) if matrix else None
+        if block is None:
+            return None
+        present = ~np.isnan(block)
+        rows = np.flatnonzero(present.any(axis=1))
+        periods = sorted(np.flatnonzero(present.any(axis=0)), key=lambda k: matrix.period_ids[k])
+        by_id = self._registry.snapshot.by_id
+        data = {}
+        for r in rows:
+            info = by_id.get(matrix.metric_ids[r])
+            if info is not None:
+                data[info.name] = [format_number(v) for v in to_python_values(block[r, periods])]
+        stock = matrix.stocks[matrix.stock_row(stock_code)]
+        return {
+            "data": data,
+            "quarters": [matrix.period_labels[k] for k in periods],
+            "category": stock.category,
+            "industry": stock.industry,
+        }
+
+    def stats(self) -> Dict:
+        matrix = self._matrix
+        if matrix is None:
+            return {"loaded": False}
+        stocks, metrics, periods = matrix.shape
+        return {
+            "loaded": True,
+            "source": self.source,
+            "stocks": stocks,
+            "metrics": metrics,
+            "periods": periods,
+            "facts": int(np.count_nonzero(~np.isnan(matrix.data))),
+            "bytes": int(matrix.values.nbytes),
+            "version": matrix.version,
+            "age_seconds": round(self.age, 1),
+        }
+
+
+class FallbackView(Mapping):
+    """Read-only stock code -> fallback entry mapping over the loaded matrix"""
+
+    def __init__(self, store: MatrixStore):
+        self._store = store
+        self._matrix = store.matrix
+
+    def __getitem__(self, stock_code: str) -> Dict:
+        entry = self._store.stock_financials(stock_code) if stock_code in self else None
+        if entry is None:
+            raise KeyError(stock_code)
+        return entry
+
+    def __contains__(self, stock_code) -> bool:
+        return isinstance(stock_code, str) and self._matrix.stock_row(stock_code) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return (info.stock_code for info in self._matrix.stocks)
+
+    def __len__(self) -> int:
+        return self._matrix.shape[0]
+
+    def sector_codes(self) -> Dict[str, List[str]]:
+        """Stock codes per sector CATEGORY, from the matrix's stock index (no entry is built)"""
+        stocks = self._matrix.stocks
+        return {category: [stocks[i].stock_code for i in rows]
+                for category, rows in self._matrix.sector_rows().items()}
@@ -0,0 +1,247 @@
+# metric_registry.py
+"""
+Registry of known financial metrics backed by the DIM_METRIC table.
+
+Readers use an immutable MetricSnapshot (read-only mappings and tuples) through
+a single attribute read, so lookups from request threads never lock. Writers
+(new metrics found while scraping or rendering fallback data) take a lock,
+build a new snapshot that includes the additions and swap it in. The new
+metrics are queued and MERGEd into DIM_METRIC by the next persist() call, in
+the same transaction as the fact rows. Callers wrap that transaction in
+transaction(), so rows whose write was rolled back are queued again. Once
+METRIC_REGISTRY_MAX_METRICS is reached new names are refused, and facts of
+refused names are not stored (registered()).
+
+Metric ids are derived from the canonical name, so every worker process
+assigns the same id without coordinating.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from types import MappingProxyType
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+METRIC_REGISTRY_MAX_METRICS = int(os.getenv("METRIC_REGISTRY_MAX_METRICS", "20000"))
+# screener.in marks expandable rows "Sales +"; the scraped name is stored as-is
+EXPANDER_SUFFIX = " +"
+
+CREATE_DIM_METRIC_SQL = """
+    CREATE TABLE IF NOT EXISTS DIM_METRIC (
+        METRIC_ID NUMBER(18, 0),
+        METRIC_NAME STRING,
+        METRIC_CATEGORY STRING,
+        FIRST_SEEN TIMESTAMP,
+        LAST_SEEN TIMESTAMP
+    )
+"""
+
+
+def canonical_metric_name(name: str) -> str:
+    """Whitespace-normalised metric name used as the registry key"""
+    return re.sub(r"\s+", " ", str(name).replace("\xa0", " ")).strip()
+
+
+def metric_id(name: str) -> int:
+    """Stable 56-bit id of a canonical metric name"""
+    return int(hashlib.blake2b(name.encode("utf-8"), digest_size=7).hexdigest(), 16)
+
+
+class MetricInfo(NamedTuple):
+    metric_id: int
+    name: str
+    category: str
+    first_seen: str
+    last_seen: str
+
+
+class MetricSnapshot:
+    """Immutable view of all registered metrics"""
+
+    __slots__ = ("by_name", "by_id", "by_category", "version")
+
+    def __init__(self, metrics: Dict[str, MetricInfo], version: int):
+        self.by_name = MappingProxyType(dict(metrics))
+        self.by_id = MappingProxyType({info.metric_id: info for info in metrics.values()})
+        grouped: Dict[str, List[str]] = {}
+        for info in metrics.values():
+            grouped.setdefault(info.category, []).append(info.name)
+        self.by_category = MappingProxyType({category: tuple(sorted(names)) for category, names in grouped.items()})
+        self.version = version
+
+    def __len__(self) -> int:
+        return len(self.by_name)
+
+    def categories(self) -> Dict[str, List[str]]:
+        return {category: list(names) for category, names in self.by_category.items() if names}
+
+    def category_counts(self) -> List[Tuple[str, int]]:
+        """(category, metric count), largest first"""
+        return sorted(((c, len(n)) for c, n in self.by_category.items()), key=lambda r: (-r[1], r[0]))
+
+
+def _now() -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S")
+
+
+class MetricRegistry:
+    """Copy-on-write metric registry with lock-free reads"""
+
+    def __init__(self, categorize: Callable[[str], str], max_metrics: int = METRIC_REGISTRY_MAX_METRICS):
+        self._categorize = categorize
+        self.max_metrics = max_metrics
+        self._snapshot = MetricSnapshot({}, 0)
+        self._pending: Dict[str, MetricInfo] = {}
+        self._write_lock = threading.Lock()
+        # Rows persisted inside the current thread's transaction() block
+        self._local = threading.local()
+        self._overflow_logged = False
+        self.loaded = False
+
+    @property
+    def snapshot(self) -> MetricSnapshot:
+        return self._snapshot
+
+    def lookup(self, name: str) -> Optional[MetricInfo]:
+        by_name = self._snapshot.by_name
+        info = by_name.get(name)
+        if info is None:
+            info = by_name.get(canonical_metric_name(name))
+        return info
+
+    def resolve(self, name: str) -> Optional[MetricInfo]:
+        """lookup() that also finds the scraped row with the expander marker ("Sales" -> "Sales +")"""
+        return self.lookup(name) or self.lookup(canonical_metric_name(name) + EXPANDER_SUFFIX)
+
+    def category_of(self, name: str) -> str:
+        """Registered category of a metric, registering it on first sight"""
+        info = self.lookup(name)
+        if info is not None:
+            return info.category
+        return self.register([name])[0].category
+
+    def register(self, names: Iterable[str], category: Optional[str] = None) -> List[MetricInfo]:
+        """Add unknown metrics (one snapshot swap per call, category overriding the patterns) and queue them"""
+        names = [canonical_metric_name(n) for n in names]
+        with self._write_lock:
+            current = self._snapshot
+            additions = {}
+            now = _now()
+            for name in names:
+                if name in current.by_name or name in additions:
+                    continue
+                if len(current) + len(additions) >= self.max_metrics:
+                    if not self._overflow_logged:
+                        logger.warning(f"⚠️ Metric registry full ({self.max_metrics}); new metrics are not stored")
+                        self._overflow_logged = True
+                    continue
+                additions[name] = MetricInfo(metric_id(name), name, category or self._categorize(name), now, now)
+            if additions:
+                self._snapshot = MetricSnapshot({**current.by_name, **additions}, current.version + 1)
+                self._pending.update(additions)
+            snapshot = self._snapshot
+        return [snapshot.by_name.get(n) or MetricInfo(metric_id(n), n, category or self._categorize(n), "", "")
+                for n in names]
+
+    def adopt(self, infos: Iterable[MetricInfo]) -> int:
+        """Add metrics already stored elsewhere (e.g. a snapshot) without queueing them for DIM_METRIC"""
+        with self._write_lock:
+            current = self._snapshot
+            additions = {info.name: info for info in infos if info.name and info.name not in current.by_name}
+            if additions:
+                self._snapshot = MetricSnapshot({**current.by_name, **additions}, current.version + 1)
+        return len(additions)
+
+    def touch(self, names: Iterable[str]):
+        """Queue last_seen updates for metrics seen in a load"""
+        now = _now()
+        infos = [info for info in self.register(names) if info.first_seen]
+        with self._write_lock:
+            for info in infos:
+                self._pending[info.name] = info._replace(last_seen=now)
+
+    def load(self, cur) -> int:
+        """Replace the snapshot with DIM_METRIC, keeping metrics registered in memory but not stored yet"""
+        cur.execute("SELECT METRIC_ID, METRIC_NAME, METRIC_CATEGORY, FIRST_SEEN, LAST_SEEN FROM DIM_METRIC")
+        metrics = {name: MetricInfo(int(mid), name, category, str(first or ""), str(last or ""))
+                   for mid, name, category, first, last in cur.fetchall()}
+        with self._write_lock:
+            for name, info in self._snapshot.by_name.items():
+                metrics.setdefault(name, info)
+            self._snapshot = MetricSnapshot(metrics, self._snapshot.version + 1)
+            self.loaded = True
+        return len(metrics)
+
+    def registered(self, infos: Iterable[MetricInfo]) -> List[MetricInfo]:
+        """The infos whose metric is in the registry (register() also answers for names refused when full)"""
+        by_name = self._snapshot.by_name
+        return [info for info in infos if info.name in by_name]
+
+    @contextmanager
+    def transaction(self):
+        """
+        Scope of one caller transaction: if the block raises (and the caller rolls
+        back), the rows persist() wrote inside it are queued again for the next
+        persist() instead of being lost from DIM_METRIC.
+        """
+        outer = getattr(self._local, "persisted", None)
+        self._local.persisted = persisted = []
+        try:
+            yield
+        except BaseException:
+            self.requeue(persisted)
+            raise
+        finally:
+            self._local.persisted = outer
+        if outer is not None:
+            outer.extend(persisted)
+
+    def requeue(self, infos: Iterable[MetricInfo]):
+        """Queue rows again whose DIM_METRIC write was rolled back"""
+        with self._write_lock:
+            for info in infos:
+                self._pending.setdefault(info.name, info)
+
+    def persist(self, cur) -> int:
+        """MERGE queued metrics into DIM_METRIC; the caller commits (inside transaction() to survive a rollback)"""
+        with self._write_lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        rows = list(pending.values())
+        placeholders = ",".join(["(%s, %s, %s, %s, %s)"] * len(rows))
+        params = []
+        for info in rows:
+            params.extend([info.metric_id, info.name, info.category, info.first_seen, info.last_seen])
+        try:
+            cur.execute(f"""
+                MERGE INTO DIM_METRIC AS tgt
+                USING (
+                    SELECT
+                        column1 AS METRIC_ID,
+                        column2 AS METRIC_NAME,
+                        column3 AS METRIC_CATEGORY,
+                        column4 AS FIRST_SEEN,
+                        column5 AS LAST_SEEN
+                    FROM VALUES {placeholders}
+                ) AS src
+                ON tgt.METRIC_ID = src.METRIC_ID
+                WHEN MATCHED THEN
+                    UPDATE SET LAST_SEEN = src.LAST_SEEN
+                WHEN NOT MATCHED THEN
+                    INSERT (METRIC_ID, METRIC_NAME, METRIC_CATEGORY, FIRST_SEEN, LAST_SEEN)
+                    VALUES (src.METRIC_ID, src.METRIC_NAME, src.METRIC_CATEGORY, src.FIRST_SEEN, src.LAST_SEEN)
+            """, tuple(params))
+        except Exception:
+            # Re-queue so the next load retries
+            self.requeue(rows)
+            raise
+        persisted = getattr(self._local, "persisted", None)
+        if persisted is not None:
+            persisted.extend(rows)
+        return len(rows)
@@ -0,0 +1,313 @@
+# parquet_dataset.py
+"""
+Partitioned Parquet export and bulk import of the fact data.
+
+Export streams FACT_FINANCIALS, joined to its dimensions, in chunks of
+EXPORT_CHUNK_ROWS. It writes one Parquet file per (period year, sector)
+partition, hive-style:
+
+    <out>/period_year=2024/sector=Large%20Cap/part-0.parquet
+
+Each chunk becomes a row group, so memory stays flat however large the
+table is. _manifest.json (skipped by dataset readers) lists every file with
+its partition, row count, size, SHA-256 and period range, plus the schema
+and the metric dimension. Notebooks can read the directory directly with
+pyarrow.dataset or pandas.read_parquet.
+
+Import verifies each file against the manifest, then loads the files in
+parallel on IMPORT_WORKERS threads. The target is either the warehouse
+(a connection and one transaction per file) or the in-memory
+matrix store.
+
+    python parquet_dataset.py export exports/2024-06-01
+    python parquet_dataset.py import exports/2024-06-01 --target warehouse --workers 8
+    python parquet_dataset.py import exports/2024-06-01 --target store
+
+pyarrow is an optional dependency (pip install pyarrow) needed only here.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from metric_registry import MetricInfo
+from star_schema import StockInfo, write_facts
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "100000"))
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "4"))
+MANIFEST_NAME = "_manifest.json"  # leading underscore: skipped by dataset readers
+FORMAT_VERSION = 1
+
+EXPORT_SQL = """
+    SELECT
+        s.STOCK_CODE, f.STOCK_ID, s.INDUSTRY, s.CATEGORY,
+        m.METRIC_NAME, f.METRIC_ID, m.METRIC_CATEGORY,
+        p.QUARTER, f.PERIOD_ID, p.PERIOD_YEAR,
+        f.VALUE, f.UPDATED_AT
+    FROM FACT_FINANCIALS f
+    JOIN DIM_STOCK s ON s.STOCK_ID = f.STOCK_ID
+    JOIN DIM_METRIC m ON m.METRIC_ID = f.METRIC_ID
+    JOIN DIM_PERIOD p ON p.PERIOD_ID = f.PERIOD_ID
+"""
+
+# File columns; period_year and sector live in the partition path
+_COLUMNS = ["stock_code", "stock_id", "industry", "metric", "metric_id", "metric_category",
+            "quarter", "period_id", "value", "updated_at"]
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise RuntimeError("Parquet export/import needs pyarrow: pip install pyarrow") from e
+    return pyarrow, pyarrow.parquet
+
+
+def file_schema():
+    pa, _ = _require_pyarrow()
+    return pa.schema([
+        ("stock_code", pa.string()), ("stock_id", pa.int64()), ("industry", pa.string()),
+        ("metric", pa.string()), ("metric_id", pa.int64()), ("metric_category", pa.string()),
+        ("quarter", pa.string()), ("period_id", pa.int64()), ("value", pa.float64()),
+        ("updated_at", pa.string()),
+    ])
+
+
+def partition_path(period_year: Optional[int], sector: str) -> str:
+    """Hive-style relative directory of a partition (sector URI-encoded)"""
+    year = "none" if period_year is None else str(int(period_year))
+    return os.path.join(f"period_year={year}", f"sector={quote(sector or 'none', safe='')}")
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_json(path: str, payload: Dict):
+    directory = os.path.dirname(path) or "."
+    with tempfile.NamedTemporaryFile("w", dir=directory, delete=False, suffix=".tmp", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2)
+    os.replace(f.name, path)
+
+
+def export_dataset(cur, out_dir: str, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Dict:
+    """Stream the joined fact rows into partitioned Parquet files and write _manifest.json"""
+    pa, pq = _require_pyarrow()
+    schema = file_schema()
+    os.makedirs(out_dir, exist_ok=True)
+    started = time.perf_counter()
+
+    writers: Dict[Tuple, "pq.ParquetWriter"] = {}
+    partitions: Dict[Tuple, Dict] = {}
+    metrics: Dict[int, Dict] = {}
+    total = 0
+    try:
+        cur.execute(EXPORT_SQL)
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if not rows:
+                break
+            grouped: Dict[Tuple, List[Tuple]] = {}
+            for row in rows:
+                code, sid, industry, sector, metric, mid, metric_category, quarter, pid, year, value, updated = row
+                grouped.setdefault((year, sector or ""), []).append(
+                    (code, int(sid), industry or "", metric, int(mid), metric_category, quarter, int(pid),
+                     None if value is None else float(value), None if updated is None else str(updated)))
+                metrics.setdefault(int(mid), {"metric_id": int(mid), "name": metric, "category": metric_category})
+
+            for key, part_rows in grouped.items():
+                if key not in writers:
+                    relative = os.path.join(partition_path(*key), "part-0.parquet")
+                    os.makedirs(os.path.join(out_dir, os.path.dirname(relative)), exist_ok=True)
+                    writers[key] = pq.ParquetWriter(os.path.join(out_dir, relative), schema, compression="zstd")
+                    partitions[key] = {"path": relative, "period_year": key[0], "sector": key[1], "rows": 0,
+                                       "min_period_id": None, "max_period_id": None}
+                columns = list(zip(*part_rows))
+                writers[key].write_table(pa.table(dict(zip(_COLUMNS, columns)), schema=schema))
+                part = partitions[key]
+                part["rows"] += len(part_rows)
+                period_ids = columns[_COLUMNS.index("period_id")]
+                low, high = min(period_ids), max(period_ids)
+                part["min_period_id"] = low if part["min_period_id"] is None else min(part["min_period_id"], low)
+                part["max_period_id"] = high if part["max_period_id"] is None else max(part["max_period_id"], high)
+            total += len(rows)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    files = []
+    for part in sorted(partitions.values(), key=lambda p: p["path"]):
+        path = os.path.join(out_dir, part["path"])
+        files.append({**part, "bytes": os.path.getsize(path), "sha256": sha256_file(path)})
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "created_at": time.time(),
+        "rows": total,
+        "partitioning": ["period_year", "sector"],
+        "schema": [{"name": field.name, "type": str(field.type)} for field in schema],
+        "metrics": sorted(metrics.values(), key=lambda m: m["name"] or ""),
+        "files": files,
+    }
+    _write_json(os.path.join(out_dir, MANIFEST_NAME), manifest)
+    logger.info(f"📦 Exported {total} facts into {len(files)} files in {time.perf_counter() - started:.2f}s")
+    return manifest
+
+
+def read_manifest(in_dir: str) -> Dict:
+    with open(os.path.join(in_dir, MANIFEST_NAME), encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported dataset format {manifest.get('format')} (expected {FORMAT_VERSION})")
+    return manifest
+
+
+def read_partition(in_dir: str, entry: Dict, verify: bool = True) -> Tuple[List[StockInfo], Dict[int, str], List[Tuple]]:
+    """(stocks, periods, (stock_id, metric_id, period_id, value) facts) of one manifest file"""
+    _, pq = _require_pyarrow()
+    path = os.path.join(in_dir, entry["path"])
+    if verify and sha256_file(path) != entry["sha256"]:
+        raise ValueError(f"{entry['path']} does not match its manifest checksum")
+    columns = pq.read_table(path, columns=["stock_code", "stock_id", "industry", "quarter", "period_id",
+                                           "metric_id", "value"]).to_pydict()
+    if len(columns["stock_id"]) != entry["rows"]:
+        raise ValueError(f"{entry['path']} has {len(columns['stock_id'])} rows, manifest says {entry['rows']}")
+
+    stocks = {sid: StockInfo(sid, code, industry, entry["sector"])
+              for sid, code, industry in zip(columns["stock_id"], columns["stock_code"], columns["industry"])}
+    periods = dict(zip(columns["period_id"], columns["quarter"]))
+    facts = [fact for fact in zip(columns["stock_id"], columns["metric_id"], columns["period_id"], columns["value"])
+             if fact[3] is not None]
+    return list(stocks.values()), periods, facts
+
+
+def _metric_infos(manifest: Dict) -> List[MetricInfo]:
+    now = time.strftime("%Y-%m-%d %H:%M:%S")
+    return [MetricInfo(m["metric_id"], m["name"], m["category"], now, now) for m in manifest["metrics"] if m["name"]]
+
+
+def import_dataset(in_dir: str, target: str, registry, connect: Optional[Callable] = None, store=None,
+                   workers: int = IMPORT_WORKERS, verify: bool = True) -> Dict:
+    """Load every file of an exported dataset into the warehouse or a MatrixStore, files in parallel"""
+    manifest = read_manifest(in_dir)
+    started = time.perf_counter()
+
+    # Metrics first, so every fact row resolves through DIM_METRIC / the registry
+    infos = _metric_infos(manifest)
+    registry.adopt(infos)
+    if target == "warehouse":
+        registry.touch(info.name for info in infos)
+        conn = connect()
+        try:
+            with registry.transaction():
+                registry.persist(conn.cursor())
+                conn.commit()
+        finally:
+            conn.close()
+    elif target == "store":
+        if not store.ready:
+            from matrix_store import FinancialMatrix
+            store.publish(FinancialMatrix.empty(), "import")
+    else:
+        raise ValueError(f"Unknown import target {target!r}")
+
+    def load_file(entry: Dict) -> int:
+        stocks, periods, facts = read_partition(in_dir, entry, verify)
+        if target == "store":
+            labels = periods
+            by_stock: Dict[int, List] = {}
+            for sid, mid, pid, value in facts:
+                by_stock.setdefault(sid, []).append((mid, labels[pid], value))
+            for stock in stocks:
+                store.upsert(stock, by_stock.get(stock.stock_id, []))
+            return len(facts)
+        conn = connect()
+        try:
+            written = write_facts(conn.cursor(), stocks, periods, facts)
+            conn.commit()
+            return written
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    loaded, errors = 0, []
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="import") as pool:
+        futures = {pool.submit(load_file, entry): entry for entry in manifest["files"]}
+        for future in as_completed(futures):
+            entry = futures[future]
+            try:
+                loaded += future.result()
+            except Exception as e:
+                logger.error(f"❌ Import of {entry['path']} failed: {e}")
+                errors.append({"path": entry["path"], "error": str(e)})
+
+    summary = {
+        "target": target,
+        "files": len(manifest["files"]),
+        "rows": loaded,
+        "errors": errors,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    logger.info(f"📥 Imported {loaded} facts from {len(manifest['files'])} files into {target} "
+                f"in {summary['seconds']}s ({len(errors)} failed)")
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export or import the fact data as partitioned Parquet")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("directory", help="Dataset directory (holds _manifest.json)")
+    parser.add_argument("--target", choices=["warehouse", "store"], default="warehouse",
+                        help="Where import writes (default: warehouse)")
+    parser.add_argument("--workers", type=int, default=IMPORT_WORKERS, help="Files imported in parallel")
+    parser.add_argument("--chunk-rows", type=int, default=EXPORT_CHUNK_ROWS, help="Rows fetched per export chunk")
+    parser.add_argument("--no-verify", action="store_true", help="Skip checksum verification on import")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="After a store import, write the matrix to SNAPSHOT_PATH for the app to open")
+    args = parser.parse_args(argv)
+
+    import stock_recommender as sr
+    if args.command == "export" or args.target == "warehouse":
+        sr.create_snowflake_table()
+
+    if args.command == "export":
+        conn = sr.snowflake_connect()
+        try:
+            manifest = export_dataset(conn.cursor(), args.directory, args.chunk_rows)
+        finally:
+            conn.close()
+        print(f"✅ Exported {manifest['rows']} facts into {len(manifest['files'])} files under {args.directory}")
+        return 0
+
+    store = sr.get_matrix_store() if args.target == "store" else None
+    if args.target == "store" and store is None:
+        print("❌ Matrix store is disabled (MATRIX_STORE_ENABLED)")
+        return 1
+    summary = import_dataset(args.directory, args.target, sr.METRIC_REGISTRY, connect=sr.snowflake_connect,
+                             store=store, workers=args.workers, verify=not args.no_verify)
+    if store is not None and args.snapshot:
+        from snapshot import SNAPSHOT_PATH, export_snapshot
+        export_snapshot(store, SNAPSHOT_PATH)
+    print(json.dumps(summary, indent=2))
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
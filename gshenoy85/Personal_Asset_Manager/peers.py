@@ -0,0 +1,268 @@
+# peers.py
+"""
+Peer similarity search over normalised financial profile vectors.
+
+Every loaded stock gets one vector of PEER_FEATURES. Each feature is a
+screening expression (see screening.py) over the matrix store, such as
+growth, margins, returns, interest cover or the working capital cycle.
+Features are standardised against the universe with robust statistics
+(median and IQR), clipped to ±4, and missing values sit at the median
+(0). Stocks with fewer than PEER_MIN_FEATURES known features are not
+indexed.
+
+The index is exact: a float32 (stocks, features) array and one vectorised
+distance computation per query, well under a millisecond for thousands
+of stocks. Index kinds are looked up in INDEX_KINDS by PEER_INDEX_KIND,
+so an approximate index with the same build/update/query methods can be
+dropped in once the universe outgrows brute force.
+
+Ingests mark their stock dirty. The next query re-featurises only the
+dirty stocks against the frozen normalisation. The whole index is rebuilt
+when the matrix store is reloaded, or once more than PEER_REBUILD_FRACTION
+of the stocks changed since the last build.
+"""
+import logging
+import os
+import threading
+import time
+import warnings
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from matrix_store import MatrixStore
+from screening import ScreenContext, ScreenError, compile_expression
+
+logger = logging.getLogger(__name__)
+
+PEER_INDEX_KIND = os.getenv("PEER_INDEX_KIND", "exact")
+PEER_MIN_FEATURES = int(os.getenv("PEER_MIN_FEATURES", "3"))
+PEER_REBUILD_FRACTION = float(os.getenv("PEER_REBUILD_FRACTION", "0.2"))
+PEER_MAX_K = 100
+
+# (feature name, screening expression) over metrics the screener ingest stores (the
+# quarterly, ratio and derived rows); features whose metrics are unknown are skipped
+PEER_FEATURES: Tuple[Tuple[str, str], ...] = (
+    ("Sales growth", "Sales YoY growth"),
+    ("Profit growth", "Net Profit YoY growth"),
+    ("Sales 3Y CAGR", "Sales 3Y CAGR %"),
+    ("Operating margin", "OPM %"),
+    ("Net margin", "Net Margin %"),
+    ("ROCE", "ROCE %"),
+    ("Interest coverage", "Operating Profit / Interest"),
+    ("Working capital cycle", "Cash Conversion Cycle"),
+)
+_CLIP = 4.0
+
+
+class ExactPeerIndex:
+    """Brute-force nearest neighbours over a capacity-doubling float32 array"""
+
+    kind = "exact"
+
+    def __init__(self, dimensions: int):
+        self.vectors = np.zeros((16, dimensions), dtype=np.float32)
+        self.norms = np.zeros(16, dtype=np.float32)
+        self.codes: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self.active = np.zeros(16, dtype=bool)
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.active[:len(self.codes)]))
+
+    def build(self, codes: Sequence[str], vectors: np.ndarray, valid: np.ndarray):
+        for code, vector, ok in zip(codes, vectors, valid):
+            self.update(code, vector if ok else None)
+
+    def update(self, code: str, vector: Optional[np.ndarray]):
+        """Insert, replace or (vector None) deactivate one stock"""
+        row = self.rows.get(code)
+        if row is None:
+            if vector is None:
+                return
+            row = len(self.codes)
+            if row == len(self.vectors):
+                grow = len(self.vectors)
+                self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+                self.norms = np.concatenate([self.norms, np.zeros(grow, dtype=np.float32)])
+                self.active = np.concatenate([self.active, np.zeros(grow, dtype=bool)])
+            self.codes.append(code)
+            self.rows[code] = row
+        if vector is None:
+            self.active[row] = False
+            return
+        self.vectors[row] = vector
+        self.norms[row] = float(np.dot(vector, vector))
+        self.active[row] = True
+
+    def vector(self, code: str) -> Optional[np.ndarray]:
+        row = self.rows.get(code)
+        return self.vectors[row] if row is not None and self.active[row] else None
+
+    def query(self, vector: np.ndarray, k: int, exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        """k nearest (code, euclidean distance), closest first"""
+        n = len(self.codes)
+        distances = self.norms[:n] + float(np.dot(vector, vector)) - 2.0 * (self.vectors[:n] @ vector)
+        distances = np.where(self.active[:n], np.maximum(distances, 0.0), np.inf)
+        if exclude in self.rows:
+            distances[self.rows[exclude]] = np.inf
+        k = min(k, int(np.count_nonzero(np.isfinite(distances))))
+        if k <= 0:
+            return []
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest], kind="stable")]
+        return [(self.codes[i], float(np.sqrt(distances[i]))) for i in nearest]
+
+
+INDEX_KINDS = {"exact": ExactPeerIndex}
+
+
+class PeerService:
+    """Feature extraction, normalisation and the peer index for one matrix store"""
+
+    def __init__(self, features: Sequence[Tuple[str, str]] = PEER_FEATURES, index_kind: str = PEER_INDEX_KIND):
+        if index_kind not in INDEX_KINDS:
+            raise ValueError(f"Unknown PEER_INDEX_KIND {index_kind!r} (known: {', '.join(INDEX_KINDS)})")
+        self._all_features = tuple(features)
+        self._index_kind = index_kind
+        self._lock = threading.Lock()
+        self._dirty: Set[str] = set()
+        self._index = None
+        self._features: Tuple[Tuple[str, object], ...] = ()
+        self._center = self._scale = None
+        self._raw: Dict[str, np.ndarray] = {}
+        self._built_for: Optional[float] = None
+        self._built_at = 0.0
+        self._updates = 0
+
+    def mark_dirty(self, stock_code: str):
+        """Called after an ingest; the stock is re-featurised on the next query"""
+        with self._lock:
+            self._dirty.add(stock_code.upper())
+
+    def _feature_matrix(self, store: MatrixStore, rows: np.ndarray) -> np.ndarray:
+        ctx = ScreenContext(store.matrix, rows)
+        if not self._features:
+            return np.empty((len(rows), 0))
+        return np.column_stack([node.evaluate(ctx) for _, node in self._features])
+
+    def _normalise(self, raw: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(standardised vectors, whether each row has enough features)"""
+        with np.errstate(invalid="ignore"):
+            z = np.clip((raw - self._center) / self._scale, -_CLIP, _CLIP)
+        known = ~np.isnan(z)
+        enough = known.sum(axis=1) >= max(1, min(PEER_MIN_FEATURES, len(self._features)))
+        return np.where(known, z, 0.0).astype(np.float32), enough
+
+    def rebuild(self, store: MatrixStore):
+        """Full rebuild: resolve features, refit the normalisation and index every stock"""
+        started = time.perf_counter()
+        matrix = store.matrix
+        features = []
+        for name, expression in self._all_features:
+            try:
+                features.append((name, compile_expression(expression, store.registry)))
+            except ScreenError:
+                continue
+        self._features = tuple(features)
+
+        rows = np.arange(matrix.shape[0])
+        raw = self._feature_matrix(store, rows)
+        with warnings.catch_warnings():
+            # A feature no stock reports has NaN statistics; it then standardises to "missing"
+            warnings.simplefilter("ignore", RuntimeWarning)
+            center = np.nanmedian(raw, axis=0) if len(raw) else np.zeros(raw.shape[1])
+            q75, q25 = np.nanpercentile(raw, [75, 25], axis=0) if len(raw) else (center, center)
+        scale = (q75 - q25) / 1.349
+        scale = np.where(np.isfinite(scale) & (scale > 0), scale, 1.0)
+        self._center, self._scale = np.where(np.isfinite(center), center, 0.0), scale
+
+        codes = [stock.stock_code for stock in matrix.stocks]
+        vectors, valid = self._normalise(raw)
+        index = INDEX_KINDS[self._index_kind](len(self._features))
+        index.build(codes, vectors, valid)
+        self._raw = dict(zip(codes, raw))
+        self._index = index
+        self._built_for = store.loaded_at
+        self._built_at = time.time()
+        self._updates = 0
+        logger.info(f"🧭 Peer index built: {len(index)} of {len(codes)} stocks × {len(self._features)} features "
+                    f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    def _apply_dirty(self, store: MatrixStore, codes: Set[str]):
+        matrix = store.matrix
+        rows = [(code, matrix.stock_row(code)) for code in codes]
+        rows = [(code, row) for code, row in rows if row is not None]
+        if not rows:
+            return
+        raw = self._feature_matrix(store, np.array([row for _, row in rows], dtype=np.intp))
+        vectors, valid = self._normalise(raw)
+        for (code, _), raw_row, vector, ok in zip(rows, raw, vectors, valid):
+            self._raw[code] = raw_row
+            self._index.update(code, vector if ok else None)
+        self._updates += len(rows)
+
+    def ensure_current(self, store: MatrixStore):
+        """Rebuild after a store reload or heavy churn, else fold in the dirty stocks"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            size = len(self._index.codes) if self._index is not None else 0
+            if (self._index is None or self._built_for != store.loaded_at
+                    or self._updates + len(dirty) > PEER_REBUILD_FRACTION * max(size, 1)):
+                self.rebuild(store)
+            elif dirty:
+                self._apply_dirty(store, dirty)
+
+    def peers(self, store: MatrixStore, stock_code: str, k: int = 10) -> Optional[Dict]:
+        """k most similar stocks with their distances and raw feature values; None if the stock is unknown"""
+        started = time.perf_counter()
+        self.ensure_current(store)
+        code = stock_code.upper()
+        index = self._index
+        vector = index.vector(code)
+        if vector is None:
+            return None
+        matrix = store.matrix
+        k = max(1, min(int(k), PEER_MAX_K))
+        names = [name for name, _ in self._features]
+
+        def describe(peer_code: str) -> Dict:
+            raw = self._raw.get(peer_code)
+            return {name: (None if raw is None or np.isnan(raw[f]) else float(f"{raw[f]:.6g}"))
+                    for f, name in enumerate(names)}
+
+        peers = []
+        for peer_code, distance in index.query(vector, k, exclude=code):
+            row = matrix.stock_row(peer_code)
+            stock = matrix.stocks[row] if row is not None else None
+            peers.append({
+                "code": peer_code,
+                "industry": stock.industry if stock else None,
+                "category": stock.category if stock else None,
+                "distance": round(distance, 4),
+                "similarity": round(1.0 / (1.0 + distance), 4),
+                "features": describe(peer_code),
+            })
+        return {
+            "stock": code,
+            "k": k,
+            "features": names,
+            "profile": describe(code),
+            "peers": peers,
+            "index": self.stats(),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+
+    def stats(self) -> Dict:
+        index = self._index
+        return {
+            "kind": self._index_kind,
+            "built": index is not None,
+            "indexed": len(index) if index is not None else 0,
+            "features": [name for name, _ in self._features],
+            "unavailable_features": [name for name, _ in self._all_features
+                                     if name not in {n for n, _ in self._features}] if index is not None else [],
+            "incremental_updates": self._updates,
+            "pending": len(self._dirty),
+            "age_seconds": round(time.time() - self._built_at, 1) if index is not None else None,
+        }
@@ -0,0 +1,163 @@
+# pooling.py
+"""
+Per-process warehouse connection pool.
+
+snowflake_connect() hands out PooledConnection proxies; calling close() on one
+rolls back any uncommitted work and returns the underlying connection to the
+pool instead of closing it, so the existing `conn = snowflake_connect() ...
+conn.close()` call sites reuse sessions without changes. The pool never
+blocks: when no idle connection is available a new one is opened, and at most
+`max_idle` connections are kept for reuse. Connections that are never closed
+(for example after an exception) are simply dropped with their proxy.
+
+After a fork the child must call reset_after_fork(): sockets inherited from
+the parent process cannot be shared.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Callable, List, Tuple
+
+from instrumentation import CACHE_REQUESTS_TOTAL, WAREHOUSE_POOL_CONNECTIONS
+
+logger = logging.getLogger(__name__)
+
+WAREHOUSE_POOL_SIZE = int(os.getenv("WAREHOUSE_POOL_SIZE", "4"))
+WAREHOUSE_POOL_MAX_IDLE_SECONDS = float(os.getenv("WAREHOUSE_POOL_MAX_IDLE_SECONDS", "1800"))
+
+
+def _is_closed(connection) -> bool:
+    is_closed = getattr(connection, "is_closed", None)
+    try:
+        return bool(is_closed()) if callable(is_closed) else False
+    except Exception:
+        return True
+
+
+class PooledConnection:
+    """Connection proxy whose close() returns the connection to its pool"""
+
+    def __init__(self, pool: "ConnectionPool", connection):
+        self._pool = pool
+        self._connection = connection
+
+    def close(self):
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            self._pool.release(connection)
+
+    def discard(self):
+        """Close the underlying connection instead of returning it (e.g. after a network error)"""
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            self._pool.discard(connection)
+
+    def __getattr__(self, name):
+        if self._connection is None:
+            raise RuntimeError("Connection already returned to the pool")
+        return getattr(self._connection, name)
+
+
+class ConnectionPool:
+    """Thread-safe LIFO pool of idle connections created by `factory`"""
+
+    def __init__(self, factory: Callable, max_idle: int = WAREHOUSE_POOL_SIZE,
+                 max_idle_seconds: float = WAREHOUSE_POOL_MAX_IDLE_SECONDS):
+        self.factory = factory
+        self.max_idle = max_idle
+        self.max_idle_seconds = max_idle_seconds
+        self._idle: List[Tuple[object, float]] = []
+        self._in_use = 0
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> PooledConnection:
+        self._check_fork()
+        while True:
+            with self._lock:
+                entry = self._idle.pop() if self._idle else None
+                self._in_use += 1
+            if entry is None:
+                CACHE_REQUESTS_TOTAL.inc(cache="warehouse_pool", result="miss")
+                try:
+                    connection = self.factory()
+                except Exception:
+                    with self._lock:
+                        self._in_use -= 1
+                    raise
+                break
+            connection, idle_since = entry
+            if time.monotonic() - idle_since <= self.max_idle_seconds and not _is_closed(connection):
+                CACHE_REQUESTS_TOTAL.inc(cache="warehouse_pool", result="hit")
+                break
+            with self._lock:
+                self._in_use -= 1
+            self._close_quietly(connection)
+        self._update_gauges()
+        return PooledConnection(self, connection)
+
+    def release(self, connection):
+        """Return a connection; rolled back first so no transaction leaks into the next user"""
+        if os.getpid() != self._pid:
+            return
+        try:
+            connection.rollback()
+        except Exception:
+            self.discard(connection)
+            return
+        to_close = None
+        with self._lock:
+            self._in_use -= 1
+            if len(self._idle) < self.max_idle and not _is_closed(connection):
+                self._idle.append((connection, time.monotonic()))
+            else:
+                to_close = connection
+        if to_close is not None:
+            self._close_quietly(to_close)
+        self._update_gauges()
+
+    def discard(self, connection):
+        with self._lock:
+            self._in_use -= 1
+        self._close_quietly(connection)
+        self._update_gauges()
+
+    def close_all(self):
+        """Close every idle connection (shutdown hook); in-use ones close when released"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self.max_idle = 0
+        for connection, _ in idle:
+            self._close_quietly(connection)
+        if idle:
+            logger.info(f"🔌 Closed {len(idle)} pooled warehouse connections")
+        self._update_gauges()
+
+    def reset_after_fork(self):
+        """Forget connections inherited from the parent without closing the shared sockets"""
+        with self._lock:
+            self._idle = []
+            self._in_use = 0
+            self._pid = os.getpid()
+        self._update_gauges()
+
+    def _check_fork(self):
+        if os.getpid() != self._pid:
+            self.reset_after_fork()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"idle": len(self._idle), "in_use": self._in_use, "max_idle": self.max_idle}
+
+    def _update_gauges(self):
+        stats = self.stats()
+        WAREHOUSE_POOL_CONNECTIONS.set(stats["idle"], state="idle")
+        WAREHOUSE_POOL_CONNECTIONS.set(stats["in_use"], state="in_use")
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except Exception as e:
+            logger.warning(f"Error closing pooled connection: {e}")
@@ -0,0 +1,218 @@
+# profiling.py
+"""
+Opt-in per-request profiling.
+
+When PROFILING_ENABLED is set, a fraction of requests (PROFILE_SAMPLE_RATE) and
+any request sending `X-Profile: 1` together with `X-Profile-Token:
+<PROFILE_ADMIN_TOKEN>` are profiled. Two modes are available:
+
+- "sampling" (default): a helper thread samples the request thread's stack
+  every PROFILE_INTERVAL_MS; cheap enough for production traffic.
+- "deterministic": sys.setprofile records every call with its self time in
+  microseconds; exact, but slows the profiled request down noticeably.
+
+Profiles are written to PROFILE_DIR in folded-stack format (one
+"frame;frame;frame count" line per stack), which flamegraph.pl, speedscope
+and inferno read directly, with a JSON sidecar holding request metadata.
+"""
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0").lower() in ("1", "true", "yes")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN", "")
+PROFILE_MODE = os.getenv("PROFILE_MODE", "sampling")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "100"))
+
+PROFILE_HEADER = "X-Profile"
+TOKEN_HEADER = "X-Profile-Token"
+
+_PROFILE_ID_RE = re.compile(r"^[\w-]+$")
+
+
+def _frame_label(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def fold_stack(frame) -> str:
+    """Root-to-leaf stack of a frame as a folded-stack key"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    """Periodically samples one thread's stack from a helper thread"""
+    unit = "samples"
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000.0
+        self.stacks = Counter()
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def start(self):
+        self._thread_id = threading.get_ident()
+        self._sampler = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._sampler.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self.stacks[fold_stack(frame)] += 1
+
+    def stop(self) -> Dict[str, int]:
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        return dict(self.stacks)
+
+
+class TracingProfiler:
+    """Deterministic profiler recording self time (µs) per call stack of the current thread"""
+    unit = "microseconds"
+
+    def __init__(self):
+        self.stacks = Counter()
+        self._stack: List[List] = []  # [label, start, child_time]
+
+    def start(self):
+        sys.setprofile(self._on_event)
+
+    def _on_event(self, frame, event, arg):
+        now = time.perf_counter()
+        if event == "call" or event == "c_call":
+            label = _frame_label(frame.f_code) if event == "call" else \
+                f"<built-in>:{getattr(arg, '__qualname__', getattr(arg, '__name__', '?'))}"
+            self._stack.append([label, now, 0.0])
+        elif self._stack and event in ("return", "c_return", "c_exception"):
+            path = ";".join(entry[0] for entry in self._stack)
+            label, start, child_time = self._stack.pop()
+            elapsed = now - start
+            self.stacks[path] += int((elapsed - child_time) * 1_000_000)
+            if self._stack:
+                self._stack[-1][2] += elapsed
+
+    def stop(self) -> Dict[str, int]:
+        sys.setprofile(None)
+        return {stack: value for stack, value in self.stacks.items() if value > 0}
+
+
+def new_profiler(mode: str = PROFILE_MODE):
+    return TracingProfiler() if mode == "deterministic" else SamplingProfiler()
+
+
+def should_profile(headers) -> bool:
+    """Profile on a valid admin header, otherwise for a random PROFILE_SAMPLE_RATE fraction"""
+    if not PROFILING_ENABLED:
+        return False
+    if headers.get(PROFILE_HEADER) == "1" and is_authorized(headers.get(TOKEN_HEADER)):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def is_authorized(token: Optional[str]) -> bool:
+    """Constant-time comparison with PROFILE_ADMIN_TOKEN; no token configured means no access"""
+    return bool(PROFILE_ADMIN_TOKEN) and bool(token) and hmac.compare_digest(token, PROFILE_ADMIN_TOKEN)
+
+
+def function_totals(stacks: Dict[str, int], limit: int = 25) -> List[Tuple[str, int, int]]:
+    """(frame, inclusive, self) totals, largest inclusive first"""
+    inclusive, own = Counter(), Counter()
+    for stack, value in stacks.items():
+        frames = stack.split(";")
+        own[frames[-1]] += value
+        for frame in set(frames):
+            inclusive[frame] += value
+    return [(frame, total, own[frame]) for frame, total in inclusive.most_common(limit)]
+
+
+class ProfileStore:
+    """Folded-stack files plus JSON metadata sidecars in one directory"""
+
+    def __init__(self, directory: str = PROFILE_DIR, max_files: int = PROFILE_MAX_FILES):
+        self.directory = directory
+        self.max_files = max_files
+        self._lock = threading.Lock()
+
+    def _path(self, profile_id: str, suffix: str) -> str:
+        if not _PROFILE_ID_RE.match(profile_id):
+            raise ValueError(f"Invalid profile id: {profile_id}")
+        return os.path.join(self.directory, f"{profile_id}{suffix}")
+
+    def save(self, stacks: Dict[str, int], meta: Dict) -> str:
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        meta = dict(meta, id=profile_id, total=sum(stacks.values()), stacks=len(stacks))
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._path(profile_id, ".folded"), "w", encoding="utf-8") as f:
+                f.writelines(f"{stack} {value}\n" for stack, value in sorted(stacks.items()))
+            with open(self._path(profile_id, ".json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            self._prune()
+        logger.info(f"🔥 Saved {meta.get('mode')} profile {profile_id} for {meta.get('path')}")
+        return profile_id
+
+    def _prune(self):
+        metas = sorted(f for f in os.listdir(self.directory) if f.endswith(".json"))
+        for name in metas[:max(0, len(metas) - self.max_files)]:
+            for suffix in (".json", ".folded"):
+                try:
+                    os.remove(os.path.join(self.directory, name[:-len(".json")] + suffix))
+                except OSError:
+                    pass
+
+    def list(self) -> List[Dict]:
+        """Metadata of stored profiles, newest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            if name.endswith(".json"):
+                try:
+                    with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                        profiles.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return profiles
+
+    def load(self, profile_id: str) -> Tuple[Optional[Dict], Dict[str, int]]:
+        try:
+            with open(self._path(profile_id, ".json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            stacks = {}
+            with open(self._path(profile_id, ".folded"), encoding="utf-8") as f:
+                for line in f:
+                    stack, _, value = line.rstrip("\n").rpartition(" ")
+                    stacks[stack] = int(value)
+            return meta, stacks
+        except (OSError, ValueError):
+            return None, {}
+
+    def folded_text(self, profile_id: str) -> Optional[str]:
+        try:
+            with open(self._path(profile_id, ".folded"), encoding="utf-8") as f:
+                return f.read()
+        except (OSError, ValueError):
+            return None
+
+
+PROFILE_STORE = ProfileStore()
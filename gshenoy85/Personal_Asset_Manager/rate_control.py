@@ -0,0 +1,195 @@
+# rate_control.py
+"""
+Adaptive AIMD rate and concurrency control for screener.in fetches.
+
+Every fetch takes a permit from the process's AIMDController. A permit is
+only handed out while fewer than `concurrency` fetches are in flight. Start
+times are spaced 1/rate seconds apart, and no permit is handed out before a
+server-requested Retry-After has passed.
+
+A healthy response (2xx-4xx other than 429, with latency below the spike
+threshold) grows both limits additively. The rate gains roughly
+SCREENER_RATE_STEP req/s per second of traffic, and concurrency gains one
+slot per window of responses, as TCP grows its window. A 429, a 5xx, a
+connection error or a latency spike cuts both limits by
+SCREENER_RATE_BACKOFF. The spike threshold is SCREENER_LATENCY_SPIKE times
+the EWMA of healthy latencies, or SCREENER_LATENCY_CEILING seconds
+outright. At most one cut is made per round trip, so a burst of failures
+from requests already in flight counts as one congestion event.
+
+Interactive fetches (/load-single, page views) acquire with priority=True.
+They skip the paced schedule and the concurrency limit. Instead they start at
+once and push the bulk schedule back by one interval, so a user is never
+queued behind a bulk load. They wait out a Retry-After pause only up to
+SCREENER_PRIORITY_WAIT seconds. A longer pause raises ThrottledError at once,
+so a web request falls back instead of sleeping past the worker timeout.
+
+Limits are per process. When several processes fetch at once (the
+ingest workers of ingest_workers.py, or several app workers loading), set
+SCREENER_RATE_PROCESSES to their number. Each controller then takes that
+share of the rate and concurrency limits and of the additive step. The
+coordinator sets it for the workers it starts.
+
+The current limits, in-flight count and cuts are exported as
+screener_rate_limit, screener_concurrency_limit, screener_inflight and
+screener_throttle_total.
+"""
+import email.utils
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from instrumentation import (
+    SCREENER_CONCURRENCY_LIMIT, SCREENER_INFLIGHT, SCREENER_RATE_LIMIT, SCREENER_THROTTLE_TOTAL
+)
+
+logger = logging.getLogger(__name__)
+
+# The initial rate matches the old fixed two-second pause between stocks
+SCREENER_RATE_INITIAL = float(os.getenv("SCREENER_RATE_INITIAL", "0.5"))
+SCREENER_RATE_MIN = float(os.getenv("SCREENER_RATE_MIN", "0.05"))
+SCREENER_RATE_MAX = float(os.getenv("SCREENER_RATE_MAX", "10"))
+SCREENER_RATE_STEP = float(os.getenv("SCREENER_RATE_STEP", "0.1"))
+SCREENER_RATE_BACKOFF = float(os.getenv("SCREENER_RATE_BACKOFF", "0.5"))
+SCREENER_CONCURRENCY_MAX = int(os.getenv("SCREENER_CONCURRENCY_MAX", "8"))
+SCREENER_LATENCY_SPIKE = float(os.getenv("SCREENER_LATENCY_SPIKE", "3.0"))
+SCREENER_LATENCY_CEILING = float(os.getenv("SCREENER_LATENCY_CEILING", "10"))
+# Processes sharing screener.in's limits; each controller takes 1/N of them
+SCREENER_RATE_PROCESSES = max(1, int(os.getenv("SCREENER_RATE_PROCESSES", "1")))
+# Longest Retry-After honoured; longer values are clamped so a bad header cannot stall ingest for hours
+SCREENER_RETRY_AFTER_MAX = float(os.getenv("SCREENER_RETRY_AFTER_MAX", "300"))
+# Longest pause a priority (web request) fetch waits out before giving up
+SCREENER_PRIORITY_WAIT = float(os.getenv("SCREENER_PRIORITY_WAIT", "5"))
+_EWMA_ALPHA = 0.1
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date); None if absent or invalid"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            when = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        seconds = when.timestamp() - time.time()
+    return min(max(seconds, 0.0), SCREENER_RETRY_AFTER_MAX)
+
+
+class ThrottledError(Exception):
+    """A fetch would have to wait longer than its budget for screener.in's Retry-After pause"""
+
+    def __init__(self, wait: float):
+        super().__init__(f"screener.in asked to pause for another {wait:.0f}s")
+        self.wait = wait
+
+
+class AIMDController:
+    """Additive-increase / multiplicative-decrease limits on request rate and concurrency"""
+
+    def __init__(self, rate: float = SCREENER_RATE_INITIAL, min_rate: float = SCREENER_RATE_MIN,
+                 max_rate: float = SCREENER_RATE_MAX, step: float = SCREENER_RATE_STEP,
+                 backoff: float = SCREENER_RATE_BACKOFF, max_concurrency: int = SCREENER_CONCURRENCY_MAX,
+                 latency_spike: float = SCREENER_LATENCY_SPIKE, latency_ceiling: float = SCREENER_LATENCY_CEILING,
+                 processes: int = SCREENER_RATE_PROCESSES, priority_wait: float = SCREENER_PRIORITY_WAIT):
+        share = max(1, processes)
+        self.min_rate, self.max_rate, self.step = min_rate / share, max_rate / share, step / share
+        self.backoff = backoff
+        self.max_concurrency = max(1, max_concurrency // share)
+        self.latency_spike, self.latency_ceiling = latency_spike, latency_ceiling
+        self.priority_wait = priority_wait
+        self.rate = min(max(rate / share, self.min_rate), self.max_rate)
+        self.concurrency = 1.0
+        self.inflight = 0
+        self.baseline: Optional[float] = None
+        self._cond = threading.Condition()
+        self._next_start = 0.0
+        self._blocked_until = 0.0
+        self._last_cut = 0.0
+        self._publish()
+
+    def acquire(self, priority: bool = False) -> float:
+        """Block until a request may start; returns its start time for release()
+
+        A priority request only waits out a Retry-After pause, and raises ThrottledError instead when
+        the pause lasts longer than priority_wait; it takes the next paced slot from bulk traffic.
+        """
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    if priority and self._blocked_until - now > self.priority_wait:
+                        raise ThrottledError(self._blocked_until - now)
+                    self._cond.wait(self._blocked_until - now)
+                elif not priority and self.inflight >= int(self.concurrency):
+                    self._cond.wait()
+                else:
+                    break
+            if priority:
+                start = now
+                self._next_start = max(now, self._next_start) + 1.0 / self.rate
+            else:
+                start = max(now, self._next_start)
+                self._next_start = start + 1.0 / self.rate
+            self.inflight += 1
+            self._publish()
+        delay = start - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return time.monotonic()
+
+    def release(self, started: float, status: Optional[int], retry_after: Optional[float] = None):
+        """Record a finished request: status None means a connection error or timeout"""
+        now = time.monotonic()
+        latency = now - started
+        with self._cond:
+            self.inflight -= 1
+            if status is None or status == 429 or status >= 500:
+                self._cut("429" if status == 429 else "error" if status is None else "5xx", now)
+            elif latency > self.latency_ceiling or (
+                    self.baseline is not None and latency > self.latency_spike * self.baseline):
+                self._cut("latency", now)
+            else:
+                self.baseline = latency if self.baseline is None else (
+                    (1 - _EWMA_ALPHA) * self.baseline + _EWMA_ALPHA * latency)
+                self.rate = min(self.max_rate, self.rate + self.step / self.rate)
+                self.concurrency = min(float(self.max_concurrency), self.concurrency + 1.0 / self.concurrency)
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+                self._next_start = max(self._next_start, self._blocked_until)
+                logger.warning(f"⏸️ screener.in asked to retry after {retry_after:.0f}s; pausing fetches")
+            self._publish()
+            self._cond.notify_all()
+
+    def _cut(self, reason: str, now: float):
+        # Responses to requests sent before the last cut belong to the same congestion event
+        if now - self._last_cut < max(1.0 / self.rate, self.baseline or 0.0):
+            return
+        self._last_cut = now
+        self.rate = max(self.min_rate, self.rate * self.backoff)
+        self.concurrency = max(1.0, self.concurrency * self.backoff)
+        self._next_start = max(self._next_start, now + 1.0 / self.rate)
+        SCREENER_THROTTLE_TOTAL.inc(reason=reason)
+        logger.warning(f"🐢 screener.in throttling ({reason}): rate cut to {self.rate:.2f} req/s, "
+                       f"concurrency {int(self.concurrency)}")
+
+    def _publish(self):
+        SCREENER_RATE_LIMIT.set(self.rate)
+        SCREENER_CONCURRENCY_LIMIT.set(int(self.concurrency))
+        SCREENER_INFLIGHT.set(self.inflight)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                "rate": round(self.rate, 3),
+                "max_rate": round(self.max_rate, 3),
+                "concurrency": int(self.concurrency),
+                "inflight": self.inflight,
+                "baseline_latency": round(self.baseline, 3) if self.baseline is not None else None,
+                "paused_seconds": round(max(0.0, self._blocked_until - time.monotonic()), 1),
+            }
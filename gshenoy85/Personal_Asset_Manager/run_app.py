@@ -1,27 +1,131 @@
 #!/usr/bin/env python3
 """
 Simple script to run the stock recommender application
+
+    python run_app.py                                   # Werkzeug dev server with debugger
+    python run_app.py --production --workers 4 --threads 8
+    APP_MODE=production WEB_WORKERS=4 python run_app.py
+
+Production mode runs gunicorn (pip install gunicorn) with pre-forked gthread
+workers. The app is imported once in the master (preload) and workers are
+forked from it; on shutdown or a graceful restart (SIGHUP) each worker drains
+its background job queue and closes its pooled warehouse connections. Each
+worker runs the warm-up (WARMUP_* settings) before accepting connections, so
+WARMUP_TIMEOUT should stay below --timeout.
 """
+import argparse
+import multiprocessing
 import os
 import sys
-from stock_recommender import app
 
-def main():
-    """Main function to run the Flask application"""
-    print("🚀 Starting Stock Recommender Application")
-    print("="*50)
-    
-    # Check if environment variables are set
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the stock recommender application")
+    parser.add_argument("--production", action="store_const", const="production", dest="mode",
+                        help="Serve with a pre-forking multi-worker WSGI server")
+    parser.add_argument("--dev", action="store_const", const="dev", dest="mode",
+                        help="Serve with the Werkzeug development server (default)")
+    parser.add_argument("--bind", default=os.getenv("BIND", "0.0.0.0:5000"), help="host:port to listen on")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", multiprocessing.cpu_count() * 2 + 1)),
+                        help="Worker processes (production mode)")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("WEB_THREADS", "4")),
+                        help="Threads per worker (production mode)")
+    parser.add_argument("--timeout", type=int, default=int(os.getenv("WEB_TIMEOUT", "120")),
+                        help="Seconds before a silent worker is killed and restarted")
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("WEB_GRACEFUL_TIMEOUT", "60")),
+                        help="Seconds a worker gets to finish requests and drain jobs on shutdown")
+    parser.add_argument("--max-requests", type=int, default=int(os.getenv("WEB_MAX_REQUESTS", "0")),
+                        help="Recycle a worker after this many requests (0 = never)")
+    args = parser.parse_args(argv)
+    args.mode = args.mode or os.getenv("APP_MODE", "dev")
+    return args
+
+def check_environment() -> bool:
+    """Check if environment variables are set"""
+    if os.getenv("WAREHOUSE_CONNECTOR"):
+        print(f"✅ Using warehouse connector {os.getenv('WAREHOUSE_CONNECTOR')}")
+        return True
+
     required_vars = ["SNOWFLAKE_USER", "SNOWFLAKE_PASSWORD", "SNOWFLAKE_ACCOUNT"]
     missing_vars = [var for var in required_vars if not os.getenv(var)]
-    
+
     if missing_vars:
         print(f"⚠️  Missing environment variables: {', '.join(missing_vars)}")
         print("Please set these variables before running the application")
-        return
-    
+        return False
+
     print("✅ Environment variables configured")
-    print("🌐 Starting Flask application on http://localhost:5000")
+    return True
+
+def preload():
+    """Import-time work done once in the master before workers fork"""
+    import stock_recommender
+
+    # Compile templates up front so forked workers inherit them
+    stock_recommender.compile_templates()
+    stock_recommender.compile_category_matchers()
+    return stock_recommender
+
+def drain_worker(graceful_timeout: float):
+    """Shutdown hook: finish background jobs, then close pooled connections"""
+    import stock_recommender
+
+    stock_recommender.JOB_QUEUE.drain(timeout=graceful_timeout)
+    stock_recommender.WAREHOUSE_POOL.close_all()
+    stock_recommender.STOCK_TRAFFIC.save()
+
+def run_production(args):
+    """Serve through gunicorn's pre-forking arbiter"""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("❌ Production mode needs gunicorn: pip install gunicorn")
+        return 1
+
+    stock_recommender = preload()
+
+    def post_fork(server, worker):
+        stock_recommender.WAREHOUSE_POOL.reset_after_fork()
+        stock_recommender.JOB_QUEUE.reset_after_fork()
+        # Warm up before the worker accepts its first connection
+        stock_recommender.WARMUP.reset_after_fork()
+        stock_recommender.WARMUP.run()
+
+    def worker_exit(server, worker):
+        drain_worker(args.graceful_timeout)
+
+    class StockRecommenderServer(BaseApplication):
+        def load_config(self):
+            options = {
+                "bind": args.bind,
+                "workers": args.workers,
+                "threads": args.threads,
+                "worker_class": "gthread" if args.threads > 1 else "sync",
+                "timeout": args.timeout,
+                "graceful_timeout": args.graceful_timeout,
+                "max_requests": args.max_requests,
+                "max_requests_jitter": args.max_requests // 10,
+                "preload_app": True,
+                "post_fork": post_fork,
+                "worker_exit": worker_exit,
+                "accesslog": "-",
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return stock_recommender.app
+
+    print(f"🌐 Starting production server on {args.bind} "
+          f"({args.workers} workers × {args.threads} threads)")
+    StockRecommenderServer().run()
+    return 0
+
+def run_dev(args):
+    """Werkzeug development server with the debugger"""
+    import stock_recommender
+
+    host, _, port = args.bind.rpartition(":")
+    print(f"🌐 Starting Flask application on http://localhost:{port}")
     print("📊 Available endpoints:")
     print("  - /                    : Main dashboard")
     print("  - /quarterly/<stock>   : Quarterly view for stock")
@@ -31,14 +135,35 @@ def main():
     print("  - /debug/<stock>       : Debug database content")
     print("  - /load-single/<stock> : Load single stock data")
     print("="*50)
-    
+
+    # Warm up alongside the dev server; /ready reports 503 until it finishes
+    stock_recommender.WARMUP.start_background()
+
     # Run the Flask app
     try:
-        app.run(debug=True, host='0.0.0.0', port=5000)
+        stock_recommender.app.run(debug=True, host=host or "0.0.0.0", port=int(port))
     except KeyboardInterrupt:
         print("\n👋 Application stopped by user")
+    finally:
+        drain_worker(args.graceful_timeout)
+    return 0
+
+def main(argv=None):
+    """Main function to run the Flask application"""
+    args = parse_args(argv)
+    print("🚀 Starting Stock Recommender Application")
+    print("="*50)
+
+    if not check_environment():
+        return 1
+
+    try:
+        if args.mode == "production":
+            return run_production(args)
+        return run_dev(args)
     except Exception as e:
         print(f"❌ Error running application: {e}")
+        return 1
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,463 @@
+# screening.py
+"""
+Vectorised stock screening and scoring over the in-memory metric matrix.
+
+A filter is a small expression language evaluated for every stock at once:
+
+    ROCE % > 20 and Sales QoQ growth > 5%
+    (OPM % >= 15 or Net Profit YoY growth > 25) and not Interest > 10000
+    [Sales +] YoY growth > 10 and Net Profit / Sales * 100 > 10
+
+A bare metric name is the stock's latest reported value of that metric.
+Appending "QoQ growth" or "YoY growth" (also after a [bracketed] name)
+gives the % change from the same metric three or twelve months before
+that period. Names are matched case-insensitively against the metric
+registry, and "Sales" also finds the scraped "Sales +" row. Names that
+contain an operator character or the words and/or/not go in [brackets]
+or `backticks`.
+
+Scraped percent metrics ("OPM %", "ROCE %") are stored as fractions
+(0.126 for 12.6%) and are read here as percents, like the derived
+"... Growth %" and "... Margin %" metrics, so thresholds are written as
+percents: "OPM % > 15" means above 15%. A "%" after a number is
+decoration.
+
+A scoring model is a weighted list of expressions, "ROCE %:2, Sales YoY
+growth:1, Interest:-1". Each term is turned into a percentile rank
+among the screened stocks; a negative weight means lower is better. The
+score is the weighted mean rank on a 0-100 scale.
+
+Every expression compiles to closures over numpy arrays of shape
+(stocks,), so evaluation costs a few array operations per metric whatever
+the universe size.
+"""
+import re
+import time
+from functools import lru_cache
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from derived_metrics import DERIVED_CATEGORY, input_variants
+from matrix_store import FinancialMatrix, MatrixStore
+from metric_registry import MetricInfo, canonical_metric_name
+
+SCREEN_MAX_LIMIT = 500
+
+# Named scoring models, usable in place of a spec (?score=quality); terms over
+# metrics the registry does not know are left out rather than rejected
+SCORING_MODELS = {
+    "quality": "ROCE %:0.4, OPM %:0.3, Net Margin %:0.3",
+    "growth": "Sales YoY growth:0.5, Net Profit YoY growth:0.5",
+    "momentum": "Sales QoQ growth:0.4, Net Profit QoQ growth:0.4, OPM % QoQ growth:0.2",
+}
+
+_GROWTH_SUFFIXES = {"qoq growth": (3, "QoQ growth"), "yoy growth": (12, "YoY growth")}
+_COMPARATORS = {
+    ">": np.greater, ">=": np.greater_equal, "<": np.less, "<=": np.less_equal,
+    "=": np.equal, "==": np.equal, "!=": np.not_equal,
+}
+_ARITHMETIC = {"+": np.add, "-": np.subtract, "*": np.multiply, "/": np.divide}
+_TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?P<quoted>\[[^\]]*\]|`[^`]*`)
+      | (?P<op>>=|<=|==|!=|[<>=()+\-*/])
+      | (?P<number>\d+(?:\.\d+)?%?(?![\w.]))
+      | (?P<word>[^\s<>=!()+\-*/\[`]+)
+    )""", re.VERBOSE)
+_NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?%?")
+
+
+class ScreenError(ValueError):
+    """Invalid filter or scoring expression"""
+
+
+class Node(NamedTuple):
+    kind: str  # "num" or "bool"
+    evaluate: Callable[["ScreenContext"], np.ndarray]
+    label: str
+
+
+class ScreenContext:
+    """Per-request view of the matrix: a universe of stock rows plus cached per-metric latest values"""
+
+    def __init__(self, matrix: FinancialMatrix, rows: np.ndarray):
+        self.matrix = matrix
+        self.rows = rows
+        _, _, periods = matrix.shape
+        ids = np.array(matrix.period_ids[:periods], dtype=np.int64)
+        self._order = np.argsort(ids, kind="stable")
+        self._sorted_ids = ids[self._order]
+        self._lags: Dict[int, np.ndarray] = {}
+        self._latest: Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+
+    def _lag_columns(self, months: int) -> np.ndarray:
+        """Sorted period column `months` before each sorted column (-1 when absent or not a calendar period)"""
+        if months not in self._lags:
+            position = {int(pid): k for k, pid in enumerate(self._sorted_ids)}
+            lagged = []
+            for pid in self._sorted_ids:
+                year, month = divmod(int(pid), 100)
+                total = year * 12 + month - 1 - months
+                target = (total // 12) * 100 + total % 12 + 1
+                lagged.append(position.get(target, -1) if pid < 10_000_000 else -1)
+            self._lags[months] = np.array(lagged, dtype=np.intp)
+        return self._lags[months]
+
+    def _series(self, mid: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(stock x sorted period values, latest column per stock, whether the stock has any value)"""
+        if mid not in self._latest:
+            j = self.matrix.metric_index.get(mid)
+            _, _, periods = self.matrix.shape
+            if j is None or not periods:
+                series = np.full((len(self.rows), max(periods, 1)), np.nan)
+            else:
+                series = self.matrix.values[self.rows, j, :periods][:, self._order].astype(np.float64)
+            present = ~np.isnan(series)
+            latest = series.shape[1] - 1 - np.argmax(present[:, ::-1], axis=1)
+            self._latest[mid] = (series, latest, present.any(axis=1))
+        return self._latest[mid]
+
+    def latest(self, mid: int) -> np.ndarray:
+        series, latest, has = self._series(mid)
+        values = series[np.arange(len(self.rows)), latest]
+        return np.where(has, values, np.nan)
+
+    def growth(self, mid: int, months: int) -> np.ndarray:
+        """% change of the latest value against the value `months` earlier"""
+        series, latest, has = self._series(mid)
+        if not len(self._sorted_ids):
+            return np.full(len(self.rows), np.nan)
+        previous_col = self._lag_columns(months)[latest]
+        current = series[np.arange(len(self.rows)), latest]
+        previous = np.where(previous_col >= 0, series[np.arange(len(self.rows)), np.maximum(previous_col, 0)], np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            change = (current - previous) / np.abs(previous) * 100.0
+        return np.where(has & np.isfinite(change), change, np.nan)
+
+
+class _Parser:
+    """Recursive-descent parser compiling an expression into Node closures"""
+
+    def __init__(self, text: str, resolve: Callable[[str], MetricInfo]):
+        self.text = text
+        self.resolve = resolve
+        self.tokens = self._tokenize(text)
+        self.pos = 0
+        self.operands: List[Node] = []  # non-constant sides of comparisons, shown as result columns
+
+    @staticmethod
+    def _tokenize(text: str) -> List[Tuple[str, str]]:
+        tokens, pos = [], 0
+        text = text.strip()
+        while pos < len(text):
+            match = _TOKEN_RE.match(text, pos)
+            if not match or match.end() == pos:
+                raise ScreenError(f"Unexpected character {text[pos]!r} at position {pos}")
+            pos = match.end()
+            kind = match.lastgroup
+            value = match.group(kind)
+            if kind == "word" and value.lower() in ("and", "or", "not"):
+                kind, value = "op", value.lower()
+            tokens.append((kind, value))
+        return tokens
+
+    def _peek(self) -> Tuple[str, str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else ("end", "")
+
+    def _take(self) -> Tuple[str, str]:
+        token = self._peek()
+        self.pos += 1
+        return token
+
+    def _expect(self, value: str):
+        if self._take()[1] != value:
+            raise ScreenError(f"Expected {value!r} in {self.text!r}")
+
+    def parse(self) -> Node:
+        if not self.tokens:
+            raise ScreenError("Empty expression")
+        node = self._or()
+        if self._peek()[0] != "end":
+            raise ScreenError(f"Unexpected {self._peek()[1]!r} in {self.text!r}")
+        return node
+
+    def _or(self) -> Node:
+        node = self._and()
+        while self._peek() == ("op", "or"):
+            self._take()
+            node = _logical(node, self._and(), np.logical_or, "or")
+        return node
+
+    def _and(self) -> Node:
+        node = self._not()
+        while self._peek() == ("op", "and"):
+            self._take()
+            node = _logical(node, self._not(), np.logical_and, "and")
+        return node
+
+    def _not(self) -> Node:
+        if self._peek() == ("op", "not"):
+            self._take()
+            inner = _require(self._not(), "bool")
+            return Node("bool", lambda ctx: ~inner.evaluate(ctx), f"not {inner.label}")
+        return self._comparison()
+
+    def _comparison(self) -> Node:
+        left = self._sum()
+        op = self._peek()[1]
+        if op not in _COMPARATORS:
+            return left
+        self._take()
+        right = self._sum()
+        compare, lhs, rhs = _COMPARATORS[op], _require(left, "num"), _require(right, "num")
+        self.operands.extend(node for node in (lhs, rhs) if not _NUMBER_RE.fullmatch(node.label))
+
+        def evaluate(ctx):
+            with np.errstate(invalid="ignore"):
+                return compare(lhs.evaluate(ctx), rhs.evaluate(ctx))  # NaN compares False
+        return Node("bool", evaluate, f"{lhs.label} {op} {rhs.label}")
+
+    def _sum(self) -> Node:
+        node = self._product()
+        while self._peek()[1] in ("+", "-"):
+            node = _arithmetic(node, self._take()[1], self._product())
+        return node
+
+    def _product(self) -> Node:
+        node = self._unary()
+        while self._peek()[1] in ("*", "/"):
+            node = _arithmetic(node, self._take()[1], self._unary())
+        return node
+
+    def _unary(self) -> Node:
+        if self._peek() == ("op", "-"):
+            self._take()
+            inner = _require(self._unary(), "num")
+            return Node("num", lambda ctx: -inner.evaluate(ctx), f"-{inner.label}")
+        return self._atom()
+
+    def _atom(self) -> Node:
+        kind, value = self._take()
+        if value == "(":
+            node = self._or()
+            self._expect(")")
+            return node._replace(label=f"({node.label})")
+        if kind == "number":
+            if self._peek() == ("word", "%"):
+                self._take()
+            number = float(value.rstrip("%"))
+            return Node("num", lambda ctx: np.full(len(ctx.rows), number), value)
+        if kind == "quoted":
+            name = value[1:-1].strip()
+            following = self.tokens[self.pos:self.pos + 2]
+            suffix = " ".join(word for _, word in following).lower()
+            if suffix in _GROWTH_SUFFIXES and all(kind == "word" for kind, _ in following):
+                self.pos += 2
+                return self._growth(self.resolve(name), suffix)
+            return self._metric(name)
+        if kind == "word":
+            words = [value]
+            while self._peek()[0] in ("word", "number"):
+                words.append(self._take()[1])
+            return self._metric(" ".join(words))
+        raise ScreenError(f"Unexpected {value or 'end of expression'!r} in {self.text!r}")
+
+    def _metric(self, name: str) -> Node:
+        for suffix in _GROWTH_SUFFIXES:
+            if name.lower().endswith(" " + suffix):
+                return self._growth(self.resolve(name[:-len(suffix)].strip()), suffix)
+        info = self.resolve(name)
+        scale = percent_scale(info)
+        if scale == 1.0:
+            return Node("num", lambda ctx: ctx.latest(info.metric_id), info.name)
+        return Node("num", lambda ctx: ctx.latest(info.metric_id) * scale, info.name)
+
+    @staticmethod
+    def _growth(info: MetricInfo, suffix: str) -> Node:
+        months, display = _GROWTH_SUFFIXES[suffix]
+        return Node("num", lambda ctx: ctx.growth(info.metric_id, months), f"{info.name} {display}")
+
+
+def percent_scale(info: MetricInfo) -> float:
+    """100 for scraped percent metrics (stored as fractions by clean_value), 1 otherwise"""
+    return 100.0 if info.name.endswith("%") and info.category != DERIVED_CATEGORY else 1.0
+
+
+def _require(node: Node, kind: str) -> Node:
+    if node.kind != kind:
+        expected = "a comparison" if kind == "bool" else "a number"
+        raise ScreenError(f"Expected {expected}, got {node.label!r}")
+    return node
+
+
+def _logical(left: Node, right: Node, combine, word: str) -> Node:
+    lhs, rhs = _require(left, "bool"), _require(right, "bool")
+    return Node("bool", lambda ctx: combine(lhs.evaluate(ctx), rhs.evaluate(ctx)), f"{lhs.label} {word} {rhs.label}")
+
+
+def _arithmetic(left: Node, op: str, right: Node) -> Node:
+    lhs, rhs, apply = _require(left, "num"), _require(right, "num"), _ARITHMETIC[op]
+
+    def evaluate(ctx):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result = apply(lhs.evaluate(ctx), rhs.evaluate(ctx))
+        return np.where(np.isfinite(result), result, np.nan)
+    return Node("num", evaluate, f"{lhs.label} {op} {rhs.label}")
+
+
+class MetricResolver:
+    """Case-insensitive metric name lookup over one registry snapshot"""
+
+    def __init__(self, registry):
+        self._registry = registry
+        self._lower = {name.lower(): info for name, info in registry.snapshot.by_name.items()}
+
+    def __call__(self, name: str) -> MetricInfo:
+        # "Sales" also matches the scraped "Sales +" row
+        for variant in input_variants(canonical_metric_name(name)):
+            info = self._registry.lookup(variant) or self._lower.get(variant.lower())
+            if info is not None:
+                return info
+        raise ScreenError(f"Unknown metric {name!r}")
+
+
+@lru_cache(maxsize=256)
+def _compile(text: str, resolver: MetricResolver) -> Tuple[Node, Tuple[Node, ...]]:
+    parser = _Parser(text, resolver)
+    node = parser.parse()
+    return node, tuple(parser.operands)
+
+
+@lru_cache(maxsize=8)
+def _resolver(registry, version: int) -> MetricResolver:
+    return MetricResolver(registry)
+
+
+def compile_expression(text: str, registry) -> Node:
+    """Parse and resolve an expression (cached per registry version)"""
+    return _compile(text.strip(), _resolver(registry, registry.snapshot.version))[0]
+
+
+def comparison_operands(text: str, registry) -> List[Node]:
+    """Metric-valued sides of the comparisons in a filter"""
+    return list(_compile(text.strip(), _resolver(registry, registry.snapshot.version))[1])
+
+
+def parse_scoring(spec: str, registry) -> List[Tuple[Node, float]]:
+    """'expr:weight, expr:weight' (or a SCORING_MODELS name) -> [(numeric node, weight)]"""
+    named = spec.strip().lower() in SCORING_MODELS
+    spec = SCORING_MODELS.get(spec.strip().lower(), spec)
+    terms = []
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        expression, _, weight = part.rpartition(":") if ":" in part else (part, ":", "1")
+        try:
+            weight = float(weight)
+        except ValueError as e:
+            raise ScreenError(f"Invalid weight in {part.strip()!r}") from e
+        if not weight:
+            continue
+        try:
+            terms.append((_require(compile_expression(expression, registry), "num"), weight))
+        except ScreenError:
+            if not named:
+                raise
+    if not terms:
+        raise ScreenError("Scoring model has no weighted terms")
+    return terms
+
+
+def percentile_ranks(values: np.ndarray) -> np.ndarray:
+    """0..1 rank of each value among the non-NaN ones (NaN -> 0.5, neutral)"""
+    ranks = np.full(len(values), 0.5)
+    valid = np.flatnonzero(~np.isnan(values))
+    if len(valid) > 1:
+        order = np.argsort(values[valid], kind="stable")
+        ranks[valid[order]] = np.arange(len(valid)) / (len(valid) - 1)
+    elif len(valid) == 1:
+        ranks[valid] = 1.0
+    return ranks
+
+
+def screen(store: MatrixStore, filter_text: str = "", scoring: str = "", sort: str = "",
+           descending: bool = True, sector: str = "", limit: int = 50, offset: int = 0) -> Dict:
+    """Filter, score, rank and page the whole loaded universe"""
+    started = time.perf_counter()
+    matrix = store.matrix
+    if matrix is None:
+        raise ScreenError("Matrix store is not loaded")
+    registry = store.registry
+
+    if sector:
+        rows = matrix.sector_rows().get(sector, np.array([], dtype=np.intp))
+    else:
+        rows = np.arange(matrix.shape[0])
+    ctx = ScreenContext(matrix, rows)
+
+    columns: List[Node] = []
+    mask = np.ones(len(rows), dtype=bool)
+    if filter_text.strip():
+        condition = _require(compile_expression(filter_text, registry), "bool")
+        mask = condition.evaluate(ctx)
+        columns.extend(comparison_operands(filter_text, registry))
+
+    matched = np.flatnonzero(mask)
+    scores = None
+    if scoring.strip():
+        terms = parse_scoring(scoring, registry)
+        total = sum(abs(weight) for _, weight in terms)
+        scores = np.zeros(len(matched))
+        for node, weight in terms:
+            ranks = percentile_ranks(node.evaluate(ctx)[matched])
+            scores += abs(weight) * (ranks if weight > 0 else 1.0 - ranks)
+            columns.append(node)
+        scores = scores / total * 100.0
+        order = np.argsort(-scores, kind="stable")
+    elif sort.strip():
+        node = _require(compile_expression(sort, registry), "num")
+        keys = node.evaluate(ctx)[matched]
+        columns.append(node)
+        keys = np.where(np.isnan(keys), -np.inf if descending else np.inf, keys)
+        order = np.argsort(-keys if descending else keys, kind="stable")
+    else:
+        order = np.argsort([matrix.stocks[rows[i]].stock_code for i in matched], kind="stable")
+
+    limit = max(1, min(int(limit), SCREEN_MAX_LIMIT))
+    offset = max(0, int(offset))
+    page = order[offset:offset + limit]
+    columns = list({node.label: node for node in columns}.values())
+    column_values = [node.evaluate(ctx)[matched[page]] for node in columns]
+
+    results = []
+    for n, position in enumerate(page):
+        stock = matrix.stocks[rows[matched[position]]]
+        results.append({
+            "rank": offset + n + 1,
+            "code": stock.stock_code,
+            "industry": stock.industry,
+            "category": stock.category,
+            "score": None if scores is None else round(float(scores[position]), 2),
+            "values": {node.label: _number(values[n]) for node, values in zip(columns, column_values)},
+        })
+
+    return {
+        "filter": filter_text,
+        "scoring": scoring,
+        "sort": sort,
+        "sector": sector or None,
+        "universe": int(len(rows)),
+        "matched": int(len(matched)),
+        "offset": offset,
+        "limit": limit,
+        "results": results,
+        "matrix_version": matrix.version,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+
+
+def _number(value) -> Optional[float]:
+    value = float(value)
+    return None if np.isnan(value) else float(f"{value:.7g}")
+
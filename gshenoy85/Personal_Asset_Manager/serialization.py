@@ -0,0 +1,122 @@
+# serialization.py
+"""
+Central JSON serialisation layer for API responses and template payloads.
+
+Uses orjson when it is installed and falls back to the stdlib encoder otherwise.
+Financial values are emitted as native floats (or null) instead of the raw
+strings stored in FINANCIALS_QUARTERLY, so the browser never has to parseFloat.
+"""
+import datetime
+import decimal
+import json
+import math
+import sys
+from typing import Any, Iterable, List, Optional
+
+from flask import Response
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; stdlib json is used instead
+    orjson = None
+
+JSON_MIMETYPE = "application/json"
+
+_EMPTY_MARKERS = {"", "-", "n/a", "na", "none", "null", "nan"}
+
+
+def to_number(value: Any) -> Optional[float]:
+    """Convert a stored/scraped value such as '2,15,000' or '15.5' into a float (None if not numeric)"""
+    if value is None or isinstance(value, bool):
+        return None
+
+    if isinstance(value, (int, float, decimal.Decimal)):
+        number = float(value)
+    else:
+        text = str(value).strip().replace(",", "").replace("\xa0", "")
+        if text.lower() in _EMPTY_MARKERS:
+            return None
+        # Negative numbers in parentheses: (123) => -123
+        if text.startswith("(") and text.endswith(")"):
+            text = "-" + text[1:-1]
+        try:
+            number = float(text)
+        except ValueError:
+            return None
+
+    if math.isnan(number) or math.isinf(number):
+        return None
+    return number
+
+
+def to_number_list(values: Iterable[Any]) -> List[Optional[float]]:
+    """Convert a sequence of raw values into a list of floats/None"""
+    return [to_number(v) for v in values]
+
+
+def format_number(value: Any) -> str:
+    """Render a numeric value for HTML tables without a trailing '.0' on whole numbers"""
+    number = to_number(value)
+    if number is None:
+        return "" if value is None else str(value)
+    if number.is_integer():
+        return str(int(number))
+    return f"{number:.4f}".rstrip("0").rstrip(".")
+
+
+def _default(obj: Any) -> Any:
+    """Fallback encoder for types neither orjson nor json handle natively"""
+    # numpy values can only exist if numpy was imported elsewhere; never import it here
+    np = sys.modules.get("numpy")
+    if np is not None:
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        if isinstance(obj, np.generic):
+            return obj.item()
+    if isinstance(obj, decimal.Decimal):
+        return to_number(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    # Keep the previous `default=str` behaviour for anything else (debug payloads)
+    return str(obj)
+
+
+def _sanitize(obj: Any) -> Any:
+    """Replace NaN/inf floats with None for the stdlib encoder (orjson already emits null)"""
+    if isinstance(obj, float):
+        return None if math.isnan(obj) or math.isinf(obj) else obj
+    if isinstance(obj, dict):
+        return {k: _sanitize(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_sanitize(v) for v in obj]
+    np = sys.modules.get("numpy")
+    if np is not None and isinstance(obj, np.ndarray):
+        return _sanitize(obj.tolist())
+    return obj
+
+
+def dumps_bytes(obj: Any, indent: bool = False) -> bytes:
+    """Serialise obj to compact UTF-8 JSON bytes"""
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_default, option=option)
+
+    if indent:
+        text = json.dumps(_sanitize(obj), default=_default, indent=2, ensure_ascii=False)
+    else:
+        text = json.dumps(_sanitize(obj), default=_default, separators=(",", ":"), ensure_ascii=False)
+    return text.encode("utf-8")
+
+
+def dumps(obj: Any, indent: bool = False) -> str:
+    """Serialise obj to a JSON string (for embedding in templates and debug pages)"""
+    return dumps_bytes(obj, indent=indent).decode("utf-8")
+
+
+def json_response(obj: Any, status: int = 200) -> Response:
+    """Build a Flask JSON response using the fast encoder"""
+    return Response(dumps_bytes(obj), status=status, mimetype=JSON_MIMETYPE)
@@ -0,0 +1,228 @@
+# snapshot.py
+"""
+Versioned, memory-mapped snapshot of the full financial dataset.
+
+One file holds the value matrix and every dimension column. The stock,
+metric and period ids, codes, names, categories and labels are each stored
+as a fixed-width numpy array after a small JSON header. Opening a snapshot
+only parses the header and memory-maps the columns, so it takes
+milliseconds whatever the universe size. Every worker maps the same file,
+and the OS page cache keeps a single copy of it. The value matrix is mapped
+copy-on-write: ingests write into private pages and never touch the file.
+
+Workers load the snapshot during warm-up to serve immediately. Until the
+warehouse refresh finishes, and for as long as the warehouse stays down,
+it is also the degraded-mode data source.
+
+    python snapshot.py export            # warehouse -> SNAPSHOT_PATH
+    python snapshot.py info [path]
+"""
+import argparse
+import json
+import logging
+import os
+import struct
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from matrix_store import DTYPE, FinancialMatrix, MatrixStore
+from metric_registry import MetricInfo
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                        "snapshots", "financials.snap"))
+# Re-export after a warehouse load when the file is older than this (0 = only on demand)
+SNAPSHOT_EXPORT_INTERVAL = int(os.getenv("SNAPSHOT_EXPORT_INTERVAL", "3600"))
+
+MAGIC = b"PAMSNAP\0"
+FORMAT_VERSION = 1
+_PREAMBLE = struct.Struct("<8sII")  # magic, format version, header length
+_ALIGN = 64
+
+
+class SnapshotError(ValueError):
+    """Missing, truncated or incompatible snapshot file"""
+
+
+class Snapshot:
+    """An opened snapshot: header metadata plus memory-mapped columns"""
+
+    __slots__ = ("path", "header", "columns")
+
+    def __init__(self, path: str, header: Dict, columns: Dict[str, np.ndarray]):
+        self.path = path
+        self.header = header
+        self.columns = columns
+
+    @property
+    def created_at(self) -> float:
+        return float(self.header["created_at"])
+
+    def metrics(self) -> List[MetricInfo]:
+        created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.created_at))
+        return [MetricInfo(int(mid), str(name), str(category), created, created) for mid, name, category in
+                zip(self.columns["metric_ids"], self.columns["metric_names"], self.columns["metric_categories"])]
+
+    def to_matrix(self) -> FinancialMatrix:
+        return FinancialMatrix.from_arrays(self.columns)
+
+
+def _padding(offset: int) -> int:
+    return -offset % _ALIGN
+
+
+def write_snapshot(matrix: FinancialMatrix, metrics: Dict[int, MetricInfo], path: str = SNAPSHOT_PATH,
+                   source: str = "warehouse") -> Dict:
+    """Write the matrix and its dimensions atomically; returns the header"""
+    columns = matrix.to_arrays()
+    infos = [metrics.get(mid) for mid in matrix.metric_ids]
+    columns["metric_names"] = np.array([info.name if info else "" for info in infos], dtype=str)
+    columns["metric_categories"] = np.array([info.category if info else "" for info in infos], dtype=str)
+    # Fixed-width strings need at least one character of width
+    for name, column in columns.items():
+        if column.dtype.kind == "U" and column.dtype.itemsize == 0:
+            columns[name] = column.astype("<U1")
+
+    layout, offset = {}, 0
+    for name, column in columns.items():
+        column = columns[name] = np.ascontiguousarray(column, dtype=column.dtype.newbyteorder("<"))
+        layout[name] = {"dtype": column.dtype.str, "shape": list(column.shape), "offset": offset}
+        offset += column.nbytes + _padding(column.nbytes)
+
+    header = {
+        "format": FORMAT_VERSION,
+        "created_at": time.time(),
+        "source": source,
+        "shape": list(matrix.shape),
+        "facts": int(np.count_nonzero(~np.isnan(matrix.data))),
+        "columns": layout,
+    }
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_start = _PREAMBLE.size + len(header_bytes)
+    data_start += _padding(data_start)
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile("wb", dir=directory, delete=False, suffix=".tmp") as f:
+        f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b"\0" * (data_start - f.tell()))
+        for name, column in columns.items():
+            f.write(column.tobytes())
+            f.write(b"\0" * _padding(column.nbytes))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f.name, path)
+    logger.info(f"💾 Snapshot written to {path}: {header['shape']} ({header['facts']} facts)")
+    return header
+
+
+def read_header(path: str) -> Dict:
+    """Parse the preamble and JSON header, checking the format version"""
+    try:
+        with open(path, "rb") as f:
+            preamble = f.read(_PREAMBLE.size)
+            if len(preamble) < _PREAMBLE.size:
+                raise SnapshotError(f"{path} is truncated")
+            magic, version, header_len = _PREAMBLE.unpack(preamble)
+            if magic != MAGIC:
+                raise SnapshotError(f"{path} is not a snapshot file")
+            if version != FORMAT_VERSION:
+                raise SnapshotError(f"{path} has format {version}, expected {FORMAT_VERSION}")
+            header_bytes = f.read(header_len)
+            if len(header_bytes) < header_len:
+                raise SnapshotError(f"{path} is truncated (header)")
+            header = json.loads(header_bytes.decode("utf-8"))
+    except SnapshotError:
+        raise
+    except OSError as e:
+        raise SnapshotError(str(e)) from e
+    except ValueError as e:
+        raise SnapshotError(f"{path} has a corrupt header: {e}") from e
+    data_start = _PREAMBLE.size + header_len
+    header["data_start"] = data_start + _padding(data_start)
+    return header
+
+
+def open_snapshot(path: str = SNAPSHOT_PATH) -> Snapshot:
+    """Memory-map every column of a snapshot (the value matrix copy-on-write)"""
+    header = read_header(path)
+    size = os.path.getsize(path)
+    columns = {}
+    for name, spec in header["columns"].items():
+        dtype, shape = np.dtype(spec["dtype"]), tuple(spec["shape"])
+        offset = header["data_start"] + spec["offset"]
+        if offset + dtype.itemsize * int(np.prod(shape)) > size:
+            raise SnapshotError(f"{path} is truncated (column {name})")
+        if 0 in shape:
+            columns[name] = np.empty(shape, dtype=dtype)
+        else:
+            columns[name] = np.memmap(path, dtype=dtype, mode="c" if name == "values" else "r",
+                                      offset=offset, shape=shape)
+    if columns["values"].dtype != DTYPE:
+        raise SnapshotError(f"{path} stores {columns['values'].dtype} values, expected {np.dtype(DTYPE)}")
+    return Snapshot(path, header, columns)
+
+
+def load_snapshot(store: MatrixStore, path: str = SNAPSHOT_PATH) -> Dict:
+    """Serve from a snapshot: adopt its metrics into the registry and publish its matrix"""
+    snapshot = open_snapshot(path)
+    store.registry.adopt(snapshot.metrics())
+    store.publish(snapshot.to_matrix(), "snapshot", loaded_at=snapshot.created_at)
+    logger.info(f"📂 Matrix store opened snapshot {path} ({snapshot.header['facts']} facts, "
+                f"{time.time() - snapshot.created_at:.0f}s old)")
+    return snapshot.header
+
+
+def export_snapshot(store: MatrixStore, path: str = SNAPSHOT_PATH) -> Dict:
+    matrix = store.matrix
+    if matrix is None:
+        raise SnapshotError("Matrix store is not loaded")
+    return write_snapshot(matrix, store.registry.snapshot.by_id, path, source=store.source or "warehouse")
+
+
+def snapshot_age(path: str = SNAPSHOT_PATH) -> float:
+    """Seconds since the snapshot was written (inf if there is none)"""
+    try:
+        return time.time() - os.path.getmtime(path)
+    except OSError:
+        return float("inf")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export or inspect the financial data snapshot")
+    parser.add_argument("command", choices=["export", "info"])
+    parser.add_argument("path", nargs="?", default=SNAPSHOT_PATH)
+    args = parser.parse_args(argv)
+
+    if args.command == "info":
+        started = time.perf_counter()
+        snapshot = open_snapshot(args.path)
+        elapsed = (time.perf_counter() - started) * 1000
+        header = {k: v for k, v in snapshot.header.items() if k != "columns"}
+        header["age_seconds"] = round(time.time() - snapshot.created_at)
+        header["open_ms"] = round(elapsed, 2)
+        print(json.dumps(header, indent=2))
+        return 0
+
+    import stock_recommender
+    stock_recommender.create_snowflake_table()
+    stock_recommender.load_metric_registry()
+    stats = stock_recommender.load_matrix_store()
+    if not stats.get("loaded"):
+        print("❌ Matrix store is disabled (MATRIX_STORE_ENABLED)")
+        return 1
+    header = export_snapshot(stock_recommender.get_matrix_store(), args.path)
+    print(f"✅ Wrote {args.path}: {header['shape'][0]} stocks × {header['shape'][1]} metrics × "
+          f"{header['shape'][2]} periods ({header['facts']} facts)")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
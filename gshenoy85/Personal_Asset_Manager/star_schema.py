@@ -0,0 +1,418 @@
+# star_schema.py
+"""
+Star-schema storage for quarterly financials.
+
+FACT_FINANCIALS holds only integer keys and the numeric value. Stock, metric
+and period attributes live in DIM_STOCK, DIM_METRIC (see metric_registry) and
+DIM_PERIOD. FINANCIALS_QUARTERLY is recreated as a view joining them back
+together, so ad-hoc and debug queries keep working unchanged.
+
+A warehouse that still has the legacy FINANCIALS_QUARTERLY table is migrated
+once, before the app is started on it:
+
+    python star_schema.py status     # exit status 1 while a legacy table is left
+    python star_schema.py migrate
+
+Keys are derived from the natural keys (stock code, canonical metric name,
+period label), so the loader never needs a round trip to allocate ids and
+readers can turn ids back into labels from small in-process caches.
+"""
+import argparse
+import hashlib
+import logging
+import os
+import re
+import sys
+import threading
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from metric_registry import CREATE_DIM_METRIC_SQL, canonical_metric_name
+from serialization import to_number
+
+logger = logging.getLogger(__name__)
+
+LEGACY_TABLE = "FINANCIALS_QUARTERLY_LEGACY"
+# Rows per MERGE source; keeps statements well below the warehouse's statement size limit
+MERGE_BATCH_ROWS = int(os.getenv("MERGE_BATCH_ROWS", "5000"))
+# Stocks copied per step of the legacy migration, and rows fetched per round trip
+MIGRATION_BATCH_STOCKS = int(os.getenv("MIGRATION_BATCH_STOCKS", "100"))
+MIGRATION_FETCH_ROWS = 10_000
+
+DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS DIM_STOCK (
+        STOCK_ID NUMBER(18, 0),
+        STOCK_CODE STRING,
+        INDUSTRY STRING,
+        CATEGORY STRING,
+        FIRST_SEEN TIMESTAMP DEFAULT CURRENT_TIMESTAMP(),
+        LAST_SEEN TIMESTAMP DEFAULT CURRENT_TIMESTAMP()
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS DIM_PERIOD (
+        PERIOD_ID NUMBER(18, 0),
+        QUARTER STRING,
+        PERIOD_YEAR NUMBER(4, 0),
+        PERIOD_MONTH NUMBER(2, 0)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS FACT_FINANCIALS (
+        STOCK_ID NUMBER(18, 0),
+        METRIC_ID NUMBER(18, 0),
+        PERIOD_ID NUMBER(18, 0),
+        VALUE FLOAT,
+        UPDATED_AT TIMESTAMP DEFAULT CURRENT_TIMESTAMP()
+    )
+    """,
+]
+
+# Same columns as the original FINANCIALS_QUARTERLY table
+FINANCIALS_VIEW_SQL = """
+    CREATE VIEW IF NOT EXISTS FINANCIALS_QUARTERLY AS
+    SELECT
+        s.STOCK_CODE,
+        m.METRIC_NAME AS METRIC,
+        p.QUARTER,
+        f.VALUE,
+        s.INDUSTRY,
+        s.CATEGORY,
+        m.METRIC_CATEGORY,
+        'SCREENER' AS DATA_SOURCE,
+        f.UPDATED_AT AS CREATED_AT,
+        f.UPDATED_AT
+    FROM FACT_FINANCIALS f
+    JOIN DIM_STOCK s ON s.STOCK_ID = f.STOCK_ID
+    JOIN DIM_METRIC m ON m.METRIC_ID = f.METRIC_ID
+    JOIN DIM_PERIOD p ON p.PERIOD_ID = f.PERIOD_ID
+"""
+
+_MONTHS = {m: i for i, m in enumerate(
+    ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"], start=1)}
+_MONTH_NAMES = {i: m for m, i in _MONTHS.items()}
+_PERIOD_RE = re.compile(r"^([A-Z][a-z]{2}) (\d{4})$")
+# Ids of labels that are not "Mon YYYY" (e.g. "TTM") start here, after every yyyymm id
+_OTHER_PERIOD_BASE = 10_000_000
+
+
+def _hash_id(text: str, digest_size: int = 7) -> int:
+    return int(hashlib.blake2b(text.encode("utf-8"), digest_size=digest_size).hexdigest(), 16)
+
+
+def stock_id(stock_code: str) -> int:
+    """Stable 56-bit id of an upper-cased stock code"""
+    return _hash_id(stock_code.strip().upper())
+
+
+def period_id(label: str) -> int:
+    """yyyymm for "Mon YYYY" labels (so ids sort chronologically), a hashed id otherwise"""
+    label = label.strip()
+    match = _PERIOD_RE.match(label)
+    if match and match.group(1) in _MONTHS:
+        return int(match.group(2)) * 100 + _MONTHS[match.group(1)]
+    return _OTHER_PERIOD_BASE + _hash_id(label, digest_size=4)
+
+
+def period_label(pid: int) -> Optional[str]:
+    """Label of a yyyymm period id without a lookup (None for hashed ids)"""
+    if pid < _OTHER_PERIOD_BASE:
+        month = _MONTH_NAMES.get(pid % 100)
+        if month:
+            return f"{month} {pid // 100}"
+    return None
+
+
+class StockInfo(NamedTuple):
+    stock_id: int
+    stock_code: str
+    industry: str
+    category: str
+
+
+class DimensionCache:
+    """In-process id -> attribute caches for DIM_STOCK and DIM_PERIOD"""
+
+    def __init__(self):
+        self._stocks: Dict[int, StockInfo] = {}
+        self._periods: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def remember_stock(self, info: StockInfo):
+        with self._lock:
+            self._stocks[info.stock_id] = info
+
+    def remember_period(self, pid: int, label: str):
+        with self._lock:
+            self._periods[pid] = label
+
+    def stocks(self, cur, ids: Iterable[int]) -> Dict[int, StockInfo]:
+        """StockInfo for the given ids, loading unknown ones from DIM_STOCK"""
+        ids = set(ids)
+        missing = ids - self._stocks.keys()
+        if missing:
+            cur.execute(f"""
+                SELECT STOCK_ID, STOCK_CODE, INDUSTRY, CATEGORY FROM DIM_STOCK
+                WHERE STOCK_ID IN ({",".join(["%s"] * len(missing))})
+            """, tuple(missing))
+            for sid, code, industry, category in cur.fetchall():
+                self.remember_stock(StockInfo(int(sid), code, industry or "", category or ""))
+        return {sid: self._stocks[sid] for sid in ids if sid in self._stocks}
+
+    def period_labels(self, cur, ids: Iterable[int]) -> Dict[int, str]:
+        """Labels for the given period ids; only non "Mon YYYY" periods need DIM_PERIOD"""
+        labels = {}
+        missing = []
+        for pid in set(ids):
+            label = period_label(pid) or self._periods.get(pid)
+            if label is None:
+                missing.append(pid)
+            else:
+                labels[pid] = label
+        if missing:
+            cur.execute(f"""
+                SELECT PERIOD_ID, QUARTER FROM DIM_PERIOD
+                WHERE PERIOD_ID IN ({",".join(["%s"] * len(missing))})
+            """, tuple(missing))
+            for pid, label in cur.fetchall():
+                self.remember_period(int(pid), label)
+                labels[int(pid)] = label
+        return labels
+
+    def clear(self):
+        with self._lock:
+            self._stocks.clear()
+            self._periods.clear()
+
+
+DIMENSIONS = DimensionCache()
+
+
+def _values_clause(width: int, count: int) -> str:
+    row = "(" + ", ".join(["%s"] * width) + ")"
+    return ",".join([row] * count)
+
+
+def write_facts(cur, stocks: Sequence[StockInfo], periods: Dict[int, str],
+                facts: Sequence[Tuple[int, int, int, float]], batch_rows: int = MERGE_BATCH_ROWS) -> int:
+    """
+    MERGE dimension rows and (stock_id, metric_id, period_id, value) facts in
+    batches of batch_rows; the caller commits. Returns the facts written.
+    """
+    stocks = list({info.stock_id: info for info in stocks}.values())
+    for start in range(0, len(stocks), batch_rows):
+        batch = stocks[start:start + batch_rows]
+        cur.execute(f"""
+            MERGE INTO DIM_STOCK AS tgt
+            USING (
+                SELECT column1 AS STOCK_ID, column2 AS STOCK_CODE, column3 AS INDUSTRY, column4 AS CATEGORY
+                FROM VALUES {_values_clause(4, len(batch))}
+            ) AS src
+            ON tgt.STOCK_ID = src.STOCK_ID
+            WHEN MATCHED THEN
+                UPDATE SET INDUSTRY = src.INDUSTRY, CATEGORY = src.CATEGORY, LAST_SEEN = CURRENT_TIMESTAMP()
+            WHEN NOT MATCHED THEN
+                INSERT (STOCK_ID, STOCK_CODE, INDUSTRY, CATEGORY)
+                VALUES (src.STOCK_ID, src.STOCK_CODE, src.INDUSTRY, src.CATEGORY)
+        """, tuple(value for info in batch for value in info))
+    for info in stocks:
+        DIMENSIONS.remember_stock(info)
+
+    period_rows = list(periods.items())
+    for start in range(0, len(period_rows), batch_rows):
+        period_params = []
+        for pid, label in period_rows[start:start + batch_rows]:
+            period_params.extend([pid, label, pid // 100 if pid < _OTHER_PERIOD_BASE else None,
+                                  pid % 100 if pid < _OTHER_PERIOD_BASE else None])
+        cur.execute(f"""
+            MERGE INTO DIM_PERIOD AS tgt
+            USING (
+                SELECT column1 AS PERIOD_ID, column2 AS QUARTER, column3 AS PERIOD_YEAR, column4 AS PERIOD_MONTH
+                FROM VALUES {_values_clause(4, len(period_params) // 4)}
+            ) AS src
+            ON tgt.PERIOD_ID = src.PERIOD_ID
+            WHEN NOT MATCHED THEN
+                INSERT (PERIOD_ID, QUARTER, PERIOD_YEAR, PERIOD_MONTH)
+                VALUES (src.PERIOD_ID, src.QUARTER, src.PERIOD_YEAR, src.PERIOD_MONTH)
+        """, tuple(period_params))
+    for pid, label in period_rows:
+        DIMENSIONS.remember_period(pid, label)
+
+    # MERGE fails on duplicate source keys, so the last value per (stock, metric, period) wins
+    values = list({(sid, mid, pid): value for sid, mid, pid, value in facts}.items())
+    for start in range(0, len(values), batch_rows):
+        batch = values[start:start + batch_rows]
+        cur.execute(f"""
+            MERGE INTO FACT_FINANCIALS AS tgt
+            USING (
+                SELECT column1 AS STOCK_ID, column2 AS METRIC_ID, column3 AS PERIOD_ID, column4 AS VALUE
+                FROM VALUES {_values_clause(4, len(batch))}
+            ) AS src
+            ON tgt.STOCK_ID = src.STOCK_ID
+               AND tgt.METRIC_ID = src.METRIC_ID
+               AND tgt.PERIOD_ID = src.PERIOD_ID
+            WHEN MATCHED THEN
+                UPDATE SET VALUE = src.VALUE, UPDATED_AT = CURRENT_TIMESTAMP()
+            WHEN NOT MATCHED THEN
+                INSERT (STOCK_ID, METRIC_ID, PERIOD_ID, VALUE)
+                VALUES (src.STOCK_ID, src.METRIC_ID, src.PERIOD_ID, src.VALUE)
+        """, tuple(value for key, fact_value in batch for value in (*key, fact_value)))
+    return len(values)
+
+
+def write_stock_facts(cur, stock_code: str, industry: str, category: str,
+                      facts: Sequence[Tuple[int, str, float]]) -> int:
+    """MERGE one stock's (metric_id, period label, value) facts and its dimensions; the caller commits"""
+    if not facts:
+        return 0
+    stock = StockInfo(stock_id(stock_code), stock_code, industry, category)
+    periods = {period_id(label): label for _, label, _ in facts}
+    return write_facts(cur, [stock], periods,
+                       [(stock.stock_id, mid, period_id(label), value) for mid, label, value in facts])
+
+
+def financials_object_type(cur, table: str = "FINANCIALS_QUARTERLY") -> Optional[str]:
+    """'BASE TABLE' (legacy layout), 'VIEW' (star schema) or None if the table is missing"""
+    cur.execute("""
+        SELECT TABLE_TYPE FROM INFORMATION_SCHEMA.TABLES
+        WHERE TABLE_SCHEMA = CURRENT_SCHEMA() AND TABLE_NAME = %s
+    """, (table,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def migrate_legacy_rows(cur, registry, rows: Sequence[Tuple]) -> int:
+    """Write (stock, metric, quarter, value, industry, category) rows of the old table as facts"""
+    by_stock: Dict[str, Dict] = {}
+    for stock, metric, quarter, value, industry, category in rows:
+        entry = by_stock.setdefault(stock, {"industry": industry or "", "category": category or "", "facts": {}})
+        number = to_number(value)
+        if metric and quarter and number is not None:
+            entry["facts"][(metric, quarter)] = number
+
+    # Names refused by a full registry are left out
+    metrics = {info.name: info for info in registry.registered(registry.register(
+        {metric for entry in by_stock.values() for metric, _ in entry["facts"]}))}
+    registry.persist(cur)
+
+    written = 0
+    for stock, entry in by_stock.items():
+        facts = []
+        for (metric, quarter), value in entry["facts"].items():
+            info = metrics.get(canonical_metric_name(metric))
+            if info is not None:
+                facts.append((info.metric_id, quarter, value))
+        written += write_stock_facts(cur, stock, entry["industry"], entry["category"], facts)
+    return written
+
+
+def copy_legacy_table(cur, registry, table: str) -> int:
+    """Copy a legacy table into the star schema a batch of stocks at a time, streaming each batch's rows"""
+    cur.execute(f"SELECT DISTINCT STOCK_CODE FROM {table} ORDER BY STOCK_CODE")
+    stocks = [row[0] for row in cur.fetchall() if row[0]]
+    written = 0
+    for start in range(0, len(stocks), MIGRATION_BATCH_STOCKS):
+        batch = stocks[start:start + MIGRATION_BATCH_STOCKS]
+        cur.execute(f"""
+            SELECT STOCK_CODE, METRIC, QUARTER, VALUE, INDUSTRY, CATEGORY
+            FROM {table}
+            WHERE STOCK_CODE IN ({",".join(["%s"] * len(batch))})
+        """, tuple(batch))
+        rows = []
+        while True:
+            chunk = cur.fetchmany(MIGRATION_FETCH_ROWS)
+            if not chunk:
+                break
+            rows.extend(chunk)
+        written += migrate_legacy_rows(cur, registry, rows)
+    return written
+
+
+class LegacySchemaError(RuntimeError):
+    """FINANCIALS_QUARTERLY still has the legacy layout; the one-off migration has not run"""
+
+
+def create_tables(cur):
+    """CREATE the dimensions and the fact table if they are missing"""
+    cur.execute(CREATE_DIM_METRIC_SQL)
+    for statement in DDL:
+        cur.execute(statement)
+
+
+def legacy_table(cur) -> Optional[str]:
+    """The legacy table still to be migrated: FINANCIALS_QUARTERLY, a renamed leftover, or None"""
+    current = financials_object_type(cur)
+    if current == "BASE TABLE":
+        return "FINANCIALS_QUARTERLY"
+    if current is None and financials_object_type(cur, LEGACY_TABLE) == "BASE TABLE":
+        return LEGACY_TABLE
+    return None
+
+
+def ensure_star_schema(cur):
+    """
+    Create missing tables and the compatibility view; the caller commits.
+
+    Never migrates: copying a legacy FINANCIALS_QUARTERLY table is a one-off
+    job (`python star_schema.py migrate`), not something every worker should
+    start while warming up. Raises LegacySchemaError while a legacy table is
+    still waiting for it.
+    """
+    create_tables(cur)
+    table = legacy_table(cur)
+    if table is not None:
+        raise LegacySchemaError(f"{table} is a legacy base table; run `python star_schema.py migrate` once "
+                                f"before starting the app")
+    cur.execute(FINANCIALS_VIEW_SQL)
+
+
+def migrate_star_schema(cur, registry) -> int:
+    """
+    Copy a legacy FINANCIALS_QUARTERLY table into the star schema, then
+    rename it to FINANCIALS_QUARTERLY_LEGACY and create the view in its place.
+    The copy is an idempotent MERGE, so a migration that failed part-way
+    simply runs again. A legacy table left renamed without a view (by an
+    interrupted older migration) is copied too. Returns the facts written
+    (0 when there was nothing to migrate); the caller commits.
+    """
+    create_tables(cur)
+    table = legacy_table(cur)
+    written = 0
+    if table is not None:
+        logger.info(f"🔁 Migrating {table} to the star schema...")
+        written = copy_legacy_table(cur, registry, table)
+        if table != LEGACY_TABLE:
+            cur.execute(f"ALTER TABLE {table} RENAME TO {LEGACY_TABLE}")
+        logger.info(f"✅ Migrated {written} facts; the old table is kept as {LEGACY_TABLE}")
+    cur.execute(FINANCIALS_VIEW_SQL)
+    return written
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Check or migrate the warehouse star schema")
+    parser.add_argument("command", choices=["status", "migrate"])
+    args = parser.parse_args(argv)
+
+    import stock_recommender
+    registry = stock_recommender.METRIC_REGISTRY
+    conn = stock_recommender.snowflake_connect()
+    try:
+        cur = conn.cursor()
+        if args.command == "status":
+            table = legacy_table(cur)
+            print(f"{table} needs migrating" if table else "Star schema is up to date")
+            return 1 if table else 0
+        create_tables(cur)
+        registry.load(cur)
+        with registry.transaction():
+            written = migrate_star_schema(cur, registry)
+            conn.commit()
+        print(f"Migrated {written} facts")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -1,17 +1,44 @@
 # stock_recommender.py
-import requests
-import snowflake.connector
-import pandas as pd
-from bs4 import BeautifulSoup
-from flask import Flask, render_template, request
-import plotly.graph_objs as go
-import json
+# requests, bs4, snowflake.connector and numpy are imported where they are used
+# so workers and CLI tools start without paying for them (see benchmarks/startup.py)
+from flask import Flask, Response, g, request, url_for
+from markupsafe import escape
+from flask import render_template as flask_render_template
 import os
 from dotenv import load_dotenv
 import re
 import time
-from typing import Dict, List, Tuple, Optional
+from typing import TYPE_CHECKING, Callable, Dict, List, Mapping, Tuple, Optional
 import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count, islice
+from serialization import dumps, json_response, to_number, format_number
+from instrumentation import (
+    REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE, InstrumentedConnection,
+    HTTP_REQUEST_DURATION, SNOWFLAKE_CONNECT_DURATION, SCREENER_FETCH_DURATION, EXTRACT_DURATION,
+    FALLBACK_TOTAL, CACHE_REQUESTS_TOTAL, ROWS_MERGED_TOTAL, SCRAPE_ERRORS_TOTAL
+)
+from tracing import MEMORY_EXPORTER, in_current_span, start_span, traced
+from pooling import WAREHOUSE_POOL_SIZE, ConnectionPool
+from jobs import JOB_QUEUE
+from metric_registry import MetricInfo, MetricRegistry, canonical_metric_name
+from star_schema import DIMENSIONS, StockInfo, ensure_star_schema, period_id, stock_id, write_stock_facts
+from checkpoint import FAILED, FETCHED, MERGED, PARSED, CheckpointError, LoadCheckpoint
+from rate_control import SCREENER_CONCURRENCY_MAX, AIMDController, ThrottledError, parse_retry_after
+from universe import UNIVERSE_BATCH_SIZE, UNIVERSE_PAGE_SIZE, UniverseLoader, batches
+from warmup import WARMUP_POOL_MIN, WARMUP_TOP_STOCKS, StockTraffic, Warmup
+from profiling import (
+    PROFILE_MODE, PROFILE_STORE, PROFILING_ENABLED, TOKEN_HEADER, function_totals, is_authorized,
+    new_profiler, should_profile
+)
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
+    from html_archive import HtmlArchive
+    from matrix_store import MatrixStore
+    from peers import PeerService
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,7 +47,12 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 # ------------------- Configuration -------------------
-SCREENER_URL = "https://www.screener.in/company/{}/consolidated/"
+SCREENER_URL = os.getenv("SCREENER_URL", "https://www.screener.in/company/{}/consolidated/")
+# Optional "module:function" returning a DB-API connection used instead of Snowflake (e.g. the load-test stand-in)
+WAREHOUSE_CONNECTOR = os.getenv("WAREHOUSE_CONNECTOR", "")
+# In-memory stock x metric x period matrix serving views and analytics (see matrix_store.py)
+MATRIX_STORE_ENABLED = os.getenv("MATRIX_STORE_ENABLED", "1").lower() not in ("0", "false", "no")
+MATRIX_STORE_MAX_AGE = int(os.getenv("MATRIX_STORE_MAX_AGE", "300"))
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
     "Cookie": os.getenv("SCREENER_COOKIE", "")
@@ -30,6 +62,15 @@ STOCKS = {
     "Mid Cap": ["PIDILITIND", "CUMMINSIND"],
     "Small Cap": ["HATSUN", "BALAMINES"]
 }
+# Retries of one page on 429/5xx/connection errors; pacing between attempts comes from SCREENER_RATE
+SCREENER_MAX_RETRIES = int(os.getenv("SCREENER_MAX_RETRIES", "3"))
+# Stocks loaded in parallel by load_all_data; actual fetch concurrency is capped adaptively by SCREENER_RATE
+LOAD_CONCURRENCY = int(os.getenv("LOAD_CONCURRENCY", str(SCREENER_CONCURRENCY_MAX)))
+SCREENER_RATE = AIMDController()
+# Every fetched page is kept compressed for offline re-extraction (see html_archive.py)
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "1").lower() not in ("0", "false", "no")
+# The full listing comes from the versioned universe file; STOCKS is only the fallback when it is missing
+UNIVERSE = UniverseLoader(fallback=STOCKS)
 
 # ------------------- Comprehensive Metric Categories -------------------
 METRIC_CATEGORY_PATTERNS = {
@@ -96,86 +137,235 @@ METRIC_CATEGORY_PATTERNS = {
     ]
 }
 
-# ------------------- Dynamic Metric Categories -------------------
-DYNAMIC_METRIC_CATEGORIES = {
-    "Income Statement": set(),
-    "Balance Sheet": set(),
-    "Cash Flow": set(),
-    "Financial Ratios": set(),
-    "Per Share Data": set(),
-    "Valuation Metrics": set(),
-    "Other Financial Metrics": set()
-}
-
-def categorize_metric(metric_name: str) -> str:
-    """Automatically categorize a metric based on its name using pattern matching"""
+# ------------------- Metric Registry -------------------
+_CATEGORY_MATCHERS: Optional[List[Tuple[str, "re.Pattern"]]] = None
+
+def compile_category_matchers() -> List[Tuple[str, "re.Pattern"]]:
+    """One compiled alternation per category, checked in METRIC_CATEGORY_PATTERNS order"""
+    global _CATEGORY_MATCHERS
+    if _CATEGORY_MATCHERS is None:
+        _CATEGORY_MATCHERS = [
+            (category, re.compile("|".join(f"(?:{pattern})" for pattern in patterns)))
+            for category, patterns in METRIC_CATEGORY_PATTERNS.items()
+        ]
+    return _CATEGORY_MATCHERS
+
+def match_metric_category(metric_name: str) -> str:
+    """Categorize a metric name using pattern matching"""
     metric_lower = metric_name.lower().strip()
     
     # Check each category's patterns
-    for category, patterns in METRIC_CATEGORY_PATTERNS.items():
-        for pattern in patterns:
-            if re.search(pattern, metric_lower):
-                DYNAMIC_METRIC_CATEGORIES[category].add(metric_name)
-                return category
+    for category, matcher in compile_category_matchers():
+        if matcher.search(metric_lower):
+            return category
     
     # Default category for unmatched metrics
-    DYNAMIC_METRIC_CATEGORIES["Other Financial Metrics"].add(metric_name)
     return "Other Financial Metrics"
 
+# Known metrics (DIM_METRIC) with their canonical category; lock-free reads
+METRIC_REGISTRY = MetricRegistry(match_metric_category)
+
+def categorize_metric(metric_name: str) -> str:
+    """Category of a metric from the registry, registering new metrics on first sight"""
+    return METRIC_REGISTRY.category_of(metric_name)
+
 def get_all_metric_categories() -> Dict:
     """Get all metric categories including dynamically discovered ones"""
-    return {k: list(v) for k, v in DYNAMIC_METRIC_CATEGORIES.items() if v}
+    return METRIC_REGISTRY.snapshot.categories()
+
+def load_metric_registry() -> int:
+    """Load DIM_METRIC into the registry snapshot and write back metrics registered before the load"""
+    conn = snowflake_connect()
+    try:
+        cur = conn.cursor()
+        count = METRIC_REGISTRY.load(cur)
+        with METRIC_REGISTRY.transaction():
+            METRIC_REGISTRY.persist(cur)
+            conn.commit()
+        return count
+    finally:
+        conn.close()
 
 # ------------------- Batch Loader -------------------
-def load_all_data():
-    """Load all stock data with improved error handling and batch processing"""
-    logger.info("🔄 Loading all data")
-    
+@traced()
+def ingest_stock(conn, stock: str, on_stage: Optional[Callable] = None) -> int:
+    """Scrape one stock and merge it into the warehouse; returns the number of metrics loaded
+
+    on_stage(state, reason=None, metrics=None) is told about each step (see checkpoint.py).
+    Never loads the built-in fallback data: a failed fetch or an empty page raises ScrapeError.
+    """
+    stage = on_stage or (lambda state, **info: None)
+    data, quarters, stock_category, industry = get_financial_data(stock, on_fetched=lambda: stage(FETCHED),
+                                                                  fallback=False, priority=False)
+    stage(PARSED, metrics=len(data))
+    insert_quarterly_to_snowflake(conn, stock, data, quarters, stock_category, industry)
+    stage(MERGED)
+    logger.info(f"✅ Successfully loaded {stock} with {len(data)} metrics")
+    return len(data)
+
+@traced()
+def load_all_data(shard: int = 0, shards: int = 1, batch_size: int = UNIVERSE_BATCH_SIZE,
+                  resume: Optional[str] = None, retry_failed: Optional[str] = None) -> Optional[str]:
+    """Load every stock of one universe shard, batch by batch, checkpointing each stock's progress
+
+    resume / retry_failed take a run id (or "latest") and load only that run's unfinished / failed stocks.
+    Returns the run id.
+    """
     try:
+        checkpoint = LoadCheckpoint()
+        if resume or retry_failed:
+            run_id = checkpoint.resolve(resume or retry_failed)
+            stocks = checkpoint.remaining(run_id) if resume else checkpoint.reset_failed(run_id)
+            logger.info(f"🔄 {'Resuming' if resume else 'Retrying failed stocks of'} load run {run_id}: "
+                        f"{len(stocks)} stocks to load ({checkpoint.counts(run_id)[MERGED]} already merged)")
+        else:
+            stocks = [listing.symbol for listing in UNIVERSE.current().shard(shard, shards)]
+            run_id = checkpoint.start(stocks, description=f"shard {shard + 1}/{shards}")
+            logger.info(f"🔄 Loading all data (shard {shard + 1}/{shards}, run {run_id})")
+
         create_snowflake_table()
-        conn = snowflake_connect()
         
-        total_stocks = sum(len(stocks) for stocks in STOCKS.values())
-        current_stock = 0
+        total_stocks = len(stocks)
+        progress = count(1)
         
-        for category, stocks in STOCKS.items():
-            for stock in stocks:
-                current_stock += 1
-                logger.info(f"Processing {stock} ({current_stock}/{total_stocks})")
-                
-                try:
-                    data, quarters, stock_category, industry = get_financial_data(stock)
-                    if data and quarters:
-                        insert_quarterly_to_snowflake(conn, stock, data, quarters, stock_category, industry)
-                        logger.info(f"✅ Successfully loaded {stock} with {len(data)} metrics")
-                    else:
-                        logger.warning(f"⚠️ No data found for {stock}")
-                except Exception as e:
-                    logger.error(f"❌ Error processing {stock}: {e}")
-                    continue
-                
-                # Add delay to avoid overwhelming the server
-                time.sleep(2)
+        def load_stock(stock: str) -> int:
+            logger.info(f"Processing {stock} ({next(progress)}/{total_stocks})")
+            
+            def on_stage(state, reason=None, metrics=None):
+                checkpoint.mark(run_id, stock, state, reason, metrics)
+            conn = snowflake_connect()
+            try:
+                return ingest_stock(conn, stock, on_stage)
+            except ScrapeError as e:
+                logger.warning(f"⚠️ No data loaded for {stock}: {e}")
+                on_stage(FAILED, reason=str(e))
+                return 0
+            except Exception as e:
+                logger.error(f"❌ Error processing {stock}: {e}")
+                on_stage(FAILED, reason=f"{type(e).__name__}: {e}")
+                return 0
+            finally:
+                conn.close()
         
-        conn.close()
+        # Stocks run in parallel; SCREENER_RATE paces the fetches, so no fixed sleep is needed
+        done = 0
+        with ThreadPoolExecutor(max_workers=max(1, LOAD_CONCURRENCY), thread_name_prefix="load") as pool:
+            for batch_no, batch in enumerate(batches(stocks, batch_size), start=1):
+                loaded = sum(1 for metrics in pool.map(in_current_span(load_stock), batch) if metrics)
+                done += len(batch)
+                logger.info(f"📦 Batch {batch_no} done: {loaded}/{len(batch)} stocks loaded ({done}/{total_stocks}), "
+                            f"screener limits {SCREENER_RATE.stats()}")
+        
+        checkpoint.finish(run_id)
+        logger.info(f"📝 Load run {run_id} finished: {checkpoint.counts(run_id)}")
         
         # Log summary of discovered metrics
-        total_metrics = sum(len(metrics) for metrics in DYNAMIC_METRIC_CATEGORIES.values())
-        logger.info(f"✅ All data loaded successfully! Discovered {total_metrics} unique metrics")
+        snapshot = METRIC_REGISTRY.snapshot
+        logger.info(f"✅ All data loaded successfully! Discovered {len(snapshot)} unique metrics")
         
-        for category, metrics in DYNAMIC_METRIC_CATEGORIES.items():
-            if metrics:
-                logger.info(f"📊 {category}: {len(metrics)} metrics")
+        for category, metric_count in snapshot.category_counts():
+            logger.info(f"📊 {category}: {metric_count} metrics")
+        return run_id
         
     except Exception as e:
         logger.error(f"❌ Error during data loading: {e}")
         raise
 
+def load_all_data_job(*args, **kwargs) -> Optional[str]:
+    """load_all_data as a background job: a checkpoint problem (unknown run, id clash) is logged, not raised"""
+    try:
+        return load_all_data(*args, **kwargs)
+    except CheckpointError as e:
+        logger.error(f"❌ Load run not started: {e}")
+        return None
+
+def is_known_stock(code: str) -> bool:
+    """In the universe listing or loaded in the matrix store"""
+    if code in UNIVERSE.current():
+        return True
+    matrix = _MATRIX_STORE.matrix if _MATRIX_STORE is not None else None
+    return matrix is not None and matrix.stock_row(code) is not None
+
 # ------------------- Flask App -------------------
 app = Flask(__name__)
+app.add_template_filter(format_number, "num")
+STOCK_TRAFFIC = StockTraffic(known=is_known_stock)
+WARMUP = Warmup()
+
+@app.before_request
+def _start_request_timer():
+    g.request_start = time.perf_counter()
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    g.trace_scope = start_span(f"{request.method} {endpoint}", root=True, path=request.path)
+    g.trace_scope.__enter__()
+    if should_profile(request.headers):
+        g.profiler = new_profiler()
+        g.profiler.start()
+
+@app.after_request
+def _record_request_latency(response):
+    start = g.get("request_start")
+    if start is not None:
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_REQUEST_DURATION.observe(time.perf_counter() - start,
+                                      endpoint=endpoint, method=request.method, status=response.status_code)
+    scope = g.get("trace_scope")
+    if scope is not None and scope.span is not None:
+        scope.span.set_attribute("status", response.status_code)
+    profile_id = _save_request_profile(response.status_code)
+    if profile_id:
+        response.headers["X-Profile-Id"] = profile_id
+    return response
+
+def _save_request_profile(status) -> Optional[str]:
+    """Stop the request's profiler (if any) and store its folded stacks"""
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        return None
+    stacks = profiler.stop()
+    start = g.get("request_start")
+    scope = g.get("trace_scope")
+    try:
+        profile_id = PROFILE_STORE.save(stacks, {
+            "path": request.path,
+            "method": request.method,
+            "endpoint": request.url_rule.rule if request.url_rule else "unmatched",
+            "status": status,
+            "mode": PROFILE_MODE,
+            "unit": profiler.unit,
+            "started": time.time(),
+            "duration_ms": round((time.perf_counter() - start) * 1000, 1) if start else None,
+            "trace_id": scope.span.trace_id if scope is not None and scope.span is not None else None,
+        })
+    except OSError as e:
+        logger.warning(f"Could not save profile for {request.path}: {e}")
+        return None
+    if scope is not None and scope.span is not None:
+        scope.span.set_attribute("profile_id", profile_id)
+    return profile_id
+
+@app.teardown_request
+def _finish_request_trace(error=None):
+    # Requests that raised skip after_request; still keep their profile
+    _save_request_profile(500)
+    scope = g.pop("trace_scope", None)
+    if scope is not None:
+        scope.__exit__(type(error) if error else None, error, None)
+
+def render_template(template_name: str, **context) -> str:
+    """Render a Jinja template inside a tracing span"""
+    with start_span("render_template", template=template_name):
+        return flask_render_template(template_name, **context)
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus-style metrics for this worker process"""
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
 
 @app.route("/quarterly/<stock>")
+@traced()
 def quarterly_view(stock):
+    STOCK_TRAFFIC.record(stock)
     try:
         # Check if we can connect to Snowflake at all
         try:
@@ -197,17 +387,11 @@ def quarterly_view(stock):
             conn.close()
             return serve_fallback_quarterly_view(stock)
 
-        # Check if data exists for this stock
-        cur.execute("""
-            SELECT METRIC, QUARTER, VALUE, METRIC_CATEGORY
-            FROM FINANCIALS_QUARTERLY
-            WHERE STOCK_CODE=%s
-            ORDER BY METRIC_CATEGORY, METRIC, QUARTER
-        """, (stock,))
-        rows = cur.fetchall()
+        # Check if data exists for this stock (category index only; series load per category)
+        categories, quarters = query_category_index(cur, stock)
 
         # If no data found, try to load it automatically
-        if not rows:
+        if not categories:
             logger.info(f"No data found for {stock}, attempting to load...")
             try:
                 # Get financial data (with fallback)
@@ -219,13 +403,7 @@ def quarterly_view(stock):
                     logger.info(f"Successfully loaded data for {stock}")
                     
                     # Re-query the database
-                    cur.execute("""
-                        SELECT METRIC, QUARTER, VALUE, METRIC_CATEGORY
-                        FROM FINANCIALS_QUARTERLY
-                        WHERE STOCK_CODE=%s
-                        ORDER BY METRIC_CATEGORY, METRIC, QUARTER
-                    """, (stock,))
-                    rows = cur.fetchall()
+                    categories, quarters = query_category_index(cur, stock)
                 else:
                     conn.close()
                     return f"""
@@ -256,7 +434,7 @@ def quarterly_view(stock):
                 """
 
         # If still no data after attempting to load
-        if not rows:
+        if not categories:
             conn.close()
             return f"""
             <div class="container mt-5">
@@ -285,52 +463,13 @@ def quarterly_view(stock):
             </div>
             """
 
-        # Process the data for display
-        financial_data = {}
-        quarters = []
-        categories = {}
-
-        for metric, quarter, value, metric_category in rows:
-            if metric not in financial_data:
-                financial_data[metric] = {}
-                categories[metric] = metric_category
-            financial_data[metric][quarter] = value
-            if quarter not in quarters:
-                quarters.append(quarter)
-
-        # Sort quarters chronologically
-        quarters.sort()
-
-        # Convert row format and group by category
-        categorized_data = {}
-        for metric, quarter_data in financial_data.items():
-            category = categories[metric]
-            if category not in categorized_data:
-                categorized_data[category] = {}
-            
-            # Clean and filter values for charts
-            values = []
-            for q in quarters:
-                value = quarter_data.get(q, "")
-                # Ensure we have valid numeric data
-                if value and str(value).strip() and value != "":
-                    try:
-                        # Try to convert to float to validate
-                        float(value)
-                        values.append(str(value))
-                    except (ValueError, TypeError):
-                        values.append("")
-                else:
-                    values.append("")
-            
-            categorized_data[category][metric] = values
-
         conn.close()
+        max_points = parse_max_points(request.args.get("max_points"))
         return render_template("quarterly.html",
                                stock=stock,
                                quarters=quarters,
-                               financial_data=json.dumps(categorized_data),
-                               metric_categories=categorized_data)
+                               categories=categories,
+                               series_url=url_for("api_stock_series", stock=stock, max_points=max_points))
     
     except Exception as e:
         logger.error(f"Error in quarterly view for {stock}: {e}")
@@ -348,17 +487,29 @@ def quarterly_view(stock):
         """
 
 @app.route("/sector/<sector>")
+@traced()
 def sector_view(sector):
     try:
-        # First try database approach
-        
-                       
+        # In-memory matrix first: no warehouse round trip at all
+        store = ready_matrix_store()
+        if store is not None:
+            matched_category = next((c for c in store.sector_categories() if c.lower() == sector.lower()), None)
+            result = store.sector_series(matched_category) if matched_category else None
+            if result and result[1]:
+                quarters, categorized_data = result
+                return render_template("sector.html",
+                                       sector=sector,
+                                       quarters=quarters,
+                                       financial_data=categorized_data,
+                                       financial_json=dumps(categorized_data))
+
+        # Then the database approach
         try:
             conn = snowflake_connect()
             cur = conn.cursor()
 
             # First, get all available sectors/categories
-            cur.execute("SELECT DISTINCT CATEGORY FROM FINANCIALS_QUARTERLY WHERE CATEGORY IS NOT NULL")
+            cur.execute("SELECT DISTINCT CATEGORY FROM DIM_STOCK WHERE CATEGORY IS NOT NULL")
             available_categories = [row[0] for row in cur.fetchall()]
             
             # Try to find the sector, case-insensitive
@@ -369,42 +520,19 @@ def sector_view(sector):
                     break
             
             if matched_category:
+                # Integer keys only; names come from the cached dimensions
                 cur.execute("""
-                    SELECT STOCK_CODE, METRIC, QUARTER, VALUE, METRIC_CATEGORY
-                    FROM FINANCIALS_QUARTERLY
-                    WHERE CATEGORY=%s
-                    ORDER BY METRIC_CATEGORY, STOCK_CODE, METRIC
+                    SELECT f.STOCK_ID, f.METRIC_ID, f.PERIOD_ID, f.VALUE
+                    FROM FACT_FINANCIALS f
+                    JOIN DIM_STOCK s ON s.STOCK_ID = f.STOCK_ID
+                    WHERE s.CATEGORY=%s
                 """, (matched_category,))
                 
-                rows = cur.fetchall()
+                rows = decode_fact_rows(cur, cur.fetchall())
 
                 if rows:
                     # Process database data
-                    
-                    sector_data = {}
-                    quarters = set()
-                    
-                    for stock, metric, quarter, value, metric_category in rows:
-                        
-                        quarters.add(quarter)
-                        key = (stock, metric, metric_category)
-                        if key not in sector_data:
-                            sector_data[key] = {}
-                        sector_data[key][quarter] = value
-
-                    quarters = sorted(quarters)
-
-                    # Group by metric category
-                    categorized_data = {}
-                    for (stock, metric, metric_category), quarter_data in sector_data.items():
-                        
-                        if metric_category not in categorized_data:
-                            categorized_data[metric_category] = {}
-                        
-                        display_key = f"{stock} - {metric}"
-                        categorized_data[metric_category][display_key] = [
-                            quarter_data.get(q, "") for q in quarters
-                        ]
+                    quarters, categorized_data = pivot_sector_rows(rows)
 
                     conn.close()
                     logger.warning(f"Returning Data for render {matched_category}: {matched_category}")
@@ -412,7 +540,7 @@ def sector_view(sector):
                                            sector=sector,
                                            quarters=quarters,
                                            financial_data=(categorized_data),
-                                           financial_json=json.dumps(categorized_data))
+                                           financial_json=dumps(categorized_data))
                     
             conn.close()
         except Exception as db_error:
@@ -425,20 +553,48 @@ def sector_view(sector):
         logger.error(f"Error in sector view for {sector}: {e}")
         return serve_fallback_sector_view(sector)
 
+def pivot_sector_rows(rows: List[Tuple]) -> Tuple[List[str], Dict[str, Dict[str, List]]]:
+    """Pivot (stock, metric, quarter, value, metric_category) rows into per-category 'STOCK - Metric' series"""
+    sector_data = {}
+    quarters = set()
+    
+    for stock, metric, quarter, value, metric_category in rows:
+        quarters.add(quarter)
+        key = (stock, metric, metric_category)
+        if key not in sector_data:
+            sector_data[key] = {}
+        sector_data[key][quarter] = value
+
+    quarters = sorted(quarters)
+
+    # Group by metric category
+    categorized_data = {}
+    for (stock, metric, metric_category), quarter_data in sector_data.items():
+        if metric_category not in categorized_data:
+            categorized_data[metric_category] = {}
+        
+        display_key = f"{stock} - {metric}"
+        categorized_data[metric_category][display_key] = [
+            to_number(quarter_data.get(q)) for q in quarters
+        ]
+
+    return quarters, categorized_data
+
 def serve_fallback_sector_view(sector: str):
     """Serve sector comparison using fallback data"""
+    FALLBACK_TOTAL.inc(reason="sector_view")
     try:
         # Normalize sector name
         sector_normalized = sector.replace("%20", " ").replace("+", " ").strip()
         
-        # Find stocks in this sector using fallback data
-        sector_stocks = []
-        for stock_code, stock_info in FALLBACK_FINANCIAL_DATA.items():
-            if stock_info["category"].lower() == sector_normalized.lower():
-                sector_stocks.append(stock_code)
+        # Find stocks in this sector from the category index; only their entries are built below
+        fallback_data = fallback_financial_data()
+        sectors = fallback_sector_codes(fallback_data)
+        sector_stocks = [code for category, codes in sectors.items()
+                         if category.lower() == sector_normalized.lower() for code in codes]
         
         if not sector_stocks:
-            available_sectors = list(set([info["category"] for info in FALLBACK_FINANCIAL_DATA.values()]))
+            available_sectors = [category for category in sectors if category]
             return f"""
             <div class="container mt-5">
                 <div class="alert alert-warning">
@@ -453,13 +609,14 @@ def serve_fallback_sector_view(sector: str):
             """
         
         # Get common quarters (should be same for all stocks)
-        quarters = FALLBACK_FINANCIAL_DATA[sector_stocks[0]]["quarters"]
+        entries = {stock_code: fallback_data[stock_code] for stock_code in sector_stocks}
+        quarters = entries[sector_stocks[0]]["quarters"]
         
         # Organize data by metric category
         categorized_data = {}
         
         for stock_code in sector_stocks:
-            stock_data = FALLBACK_FINANCIAL_DATA[stock_code]["data"]
+            stock_data = entries[stock_code]["data"]
             
             for metric, values in stock_data.items():
                 # Categorize the metric
@@ -580,11 +737,26 @@ def serve_fallback_sector_view(sector: str):
 
 @app.route("/")
 def index():
-    return render_template("index.html", categories=STOCKS)
+    """Paginated, searchable universe (?q=&bucket=&sector=&page=), grouped by market-cap bucket"""
+    universe = UNIVERSE.current()
+    query = request.args.get("q", "").strip()
+    bucket = request.args.get("bucket", "").strip()
+    sector = request.args.get("sector", "").strip()
+    page = max(1, request.args.get("page", 1, type=int))
+    listings, total = universe.page(query, bucket, sector, (page - 1) * UNIVERSE_PAGE_SIZE, UNIVERSE_PAGE_SIZE)
+    categories: Dict[str, List] = {}
+    for listing in listings:
+        categories.setdefault(listing.bucket, []).append(listing)
+    return render_template("index.html", categories=categories, query=query, bucket=bucket, sector=sector,
+                           page=page, pages=max(1, -(-total // UNIVERSE_PAGE_SIZE)), total=total,
+                           buckets=universe.bucket_counts(), sectors=universe.sector_counts(),
+                           universe_version=universe.version)
 
 @app.route("/visualize", methods=["POST"])
+@traced()
 def visualize():
     stock = request.form['stock']
+    STOCK_TRAFFIC.record(stock)
     try:
         # Ensure table exists
         create_snowflake_table()
@@ -592,17 +764,11 @@ def visualize():
         conn = snowflake_connect()
         cur = conn.cursor()
         
-        # Select only the columns we need to avoid datetime serialization issues
-        cur.execute("""
-            SELECT STOCK_CODE, METRIC, QUARTER, VALUE, INDUSTRY, CATEGORY, METRIC_CATEGORY
-            FROM FINANCIALS_QUARTERLY 
-            WHERE STOCK_CODE=%s
-            ORDER BY METRIC_CATEGORY, METRIC, QUARTER
-        """, (stock,))
-        rows = cur.fetchall()
+        # Only the category index is sent with the page; series load per category
+        categories, quarters = query_category_index(cur, stock)
 
         # If no data found, try to load it automatically
-        if not rows:
+        if not categories:
             logger.info(f"No data found for {stock}, attempting to load...")
             try:
                 # Get financial data (with fallback)
@@ -614,13 +780,7 @@ def visualize():
                     logger.info(f"Successfully loaded data for {stock}")
                     
                     # Re-query the database
-                    cur.execute("""
-                        SELECT STOCK_CODE, METRIC, QUARTER, VALUE, INDUSTRY, CATEGORY, METRIC_CATEGORY
-                        FROM FINANCIALS_QUARTERLY 
-                        WHERE STOCK_CODE=%s
-                        ORDER BY METRIC_CATEGORY, METRIC, QUARTER
-                    """, (stock,))
-                    rows = cur.fetchall()
+                    categories, quarters = query_category_index(cur, stock)
                 else:
                     conn.close()
                     return f"""
@@ -650,7 +810,7 @@ def visualize():
                 """
 
         # If still no data
-        if not rows:
+        if not categories:
             conn.close()
             return f"""
             <div class="container mt-5">
@@ -662,36 +822,13 @@ def visualize():
             </div>
             """
 
-        # Group data by metric category and quarter
-        categorized_data = {}
-        quarters = set()
-        
-        for stock_code, metric, quarter, value, industry, category, metric_category in rows:
-            quarters.add(quarter)
-            
-            if metric_category not in categorized_data:
-                categorized_data[metric_category] = {}
-            if metric not in categorized_data[metric_category]:
-                categorized_data[metric_category][metric] = {}
-            
-            categorized_data[metric_category][metric][quarter] = value
-
-        # Sort quarters chronologically
-        quarters = sorted(quarters)
-
-        # Convert to format expected by template
-        formatted_data = {}
-        for category, metrics in categorized_data.items():
-            formatted_data[category] = {}
-            for metric, quarter_data in metrics.items():
-                formatted_data[category][metric] = [quarter_data.get(q, "") for q in quarters]
-
         conn.close()
+        max_points = parse_max_points(request.form.get("max_points") or request.args.get("max_points"))
         return render_template("visualize.html",
                             stock=stock,
                             years=quarters,  # Use actual quarters instead of generic years
-                            financial_data=json.dumps(formatted_data),
-                            metric_categories=formatted_data)
+                            categories=categories,
+                            series_url=url_for("api_stock_series", stock=stock, max_points=max_points))
     
     except Exception as e:
         logger.error(f"Error in visualize for {stock}: {e}")
@@ -744,11 +881,735 @@ def debug_data(stock):
         }
         
         conn.close()
-        return f"<pre>{json.dumps(debug_info, indent=2, default=str)}</pre>"
+        return f"<pre>{dumps(debug_info, indent=True)}</pre>"
         
     except Exception as e:
         return f"<pre>Error: {str(e)}</pre>"
 
+# ------------------- Per-Category Series API -------------------
+SERIES_CACHE_TTL = int(os.getenv("SERIES_CACHE_TTL", "300"))
+SERIES_CACHE_MAX_ENTRIES = int(os.getenv("SERIES_CACHE_MAX_ENTRIES", "1024"))
+MAX_POINTS_LIMIT = 5000
+
+class SeriesCache:
+    """Thread-safe LRU cache of pivoted category series keyed by (stock, category, max_points)"""
+
+    def __init__(self, ttl: int, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                CACHE_REQUESTS_TOTAL.inc(cache="series", result="miss")
+                return None
+            self._entries.move_to_end(key)
+            CACHE_REQUESTS_TOTAL.inc(cache="series", result="hit")
+            return entry[1]
+
+    def put(self, key: Tuple, value):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, stock: str):
+        """Drop every cached resolution and batch payload of a stock (called after new data is merged)"""
+        with self._lock:
+            batch_code = stock.upper()
+            for key in [k for k in self._entries
+                        if k[0] == stock or (isinstance(k[0], tuple) and batch_code in k[0])]:
+                del self._entries[key]
+
+SERIES_CACHE = SeriesCache(SERIES_CACHE_TTL, SERIES_CACHE_MAX_ENTRIES)
+
+def parse_max_points(raw) -> Optional[int]:
+    """Parse an optional max_points parameter; invalid or too-small values disable downsampling"""
+    try:
+        max_points = int(raw)
+    except (TypeError, ValueError):
+        return None
+    if max_points < 3:
+        return None
+    return min(max_points, MAX_POINTS_LIMIT)
+
+def metrics_by_id(cur, ids) -> Dict[int, MetricInfo]:
+    """Registry entries for metric ids, reloading DIM_METRIC if another worker added some"""
+    by_id = METRIC_REGISTRY.snapshot.by_id
+    if any(mid not in by_id for mid in ids):
+        METRIC_REGISTRY.load(cur)
+        by_id = METRIC_REGISTRY.snapshot.by_id
+    return by_id
+
+def decode_fact_rows(cur, rows: List[Tuple]) -> List[Tuple]:
+    """(stock_id, metric_id, period_id, value) -> (stock, metric, quarter, value, metric_category)"""
+    stocks = DIMENSIONS.stocks(cur, {row[0] for row in rows})
+    metrics = metrics_by_id(cur, {row[1] for row in rows})
+    periods = DIMENSIONS.period_labels(cur, {row[2] for row in rows})
+    decoded = []
+    for sid, mid, pid, value in rows:
+        metric = metrics.get(mid)
+        if sid in stocks and metric is not None and pid in periods:
+            decoded.append((stocks[sid].stock_code, metric.name, periods[pid], value, metric.category))
+    decoded.sort(key=lambda row: (row[4], row[0], row[1]))
+    return decoded
+
+def query_category_index(cur, stock: str) -> Tuple[List[Dict], List[str]]:
+    """Return the metric categories (with metric counts) and quarters available for a stock"""
+    store = ready_matrix_store()
+    indexed = store.category_index(stock) if store is not None else None
+    if indexed is not None:
+        return indexed
+
+    sid = stock_id(stock)
+    cur.execute("SELECT DISTINCT METRIC_ID FROM FACT_FINANCIALS WHERE STOCK_ID=%s", (sid,))
+    metric_ids = [int(row[0]) for row in cur.fetchall()]
+    metrics = metrics_by_id(cur, metric_ids)
+    counts = {}
+    for mid in metric_ids:
+        if mid in metrics:
+            counts[metrics[mid].category] = counts.get(metrics[mid].category, 0) + 1
+    categories = [{"name": name, "metric_count": counts[name]} for name in sorted(counts)]
+
+    cur.execute("SELECT DISTINCT PERIOD_ID FROM FACT_FINANCIALS WHERE STOCK_ID=%s", (sid,))
+    quarters = sorted(DIMENSIONS.period_labels(cur, [int(row[0]) for row in cur.fetchall()]).values())
+
+    return categories, quarters
+
+def query_category_series(cur, stock: str, category: str) -> Tuple[List[str], Dict[str, List]]:
+    """Fetch and pivot the series of a single metric category for a stock"""
+    cur.execute("""
+        SELECT f.METRIC_ID, f.PERIOD_ID, f.VALUE
+        FROM FACT_FINANCIALS f
+        JOIN DIM_METRIC m ON m.METRIC_ID = f.METRIC_ID
+        WHERE f.STOCK_ID=%s AND m.METRIC_CATEGORY=%s
+    """, (stock_id(stock), category))
+    rows = cur.fetchall()
+    metrics = metrics_by_id(cur, {row[0] for row in rows})
+    periods = DIMENSIONS.period_labels(cur, {row[1] for row in rows})
+    return pivot_category_rows(
+        (metrics[mid].name, periods[pid], value) for mid, pid, value in rows if mid in metrics and pid in periods
+    )
+
+def pivot_category_rows(rows) -> Tuple[List[str], Dict[str, List]]:
+    """Pivot (metric, quarter, value) rows into per-metric series over the sorted quarters"""
+    pivot = {}
+    quarters = set()
+    for metric, quarter, value in sorted(rows):
+        quarters.add(quarter)
+        pivot.setdefault(metric, {})[quarter] = value
+
+    quarters = sorted(quarters)
+    series = {
+        metric: [to_number(quarter_data.get(q)) for q in quarters]
+        for metric, quarter_data in pivot.items()
+    }
+    return quarters, series
+
+def fallback_category_index(stock: str) -> List[Dict]:
+    """Build the category index for a stock from fallback data"""
+    data, _, _, _ = use_fallback_data(stock)
+    counts = {}
+    for metric in data:
+        metric_category = categorize_metric(metric)
+        counts[metric_category] = counts.get(metric_category, 0) + 1
+    return [{"name": name, "metric_count": counts[name]} for name in sorted(counts)]
+
+def fallback_category_series(stock: str, category: str) -> Tuple[List[str], Dict[str, List]]:
+    """Build the series of one metric category for a stock from fallback data"""
+    data, quarters, _, _ = use_fallback_data(stock)
+    series = {
+        metric: [to_number(clean_value(str(value))) for value in values]
+        for metric, values in data.items()
+        if categorize_metric(metric) == category
+    }
+    return quarters, series
+
+def get_category_series(stock: str, category: str, max_points: Optional[int] = None) -> Dict:
+    """Return a category's series payload, downsampled to max_points and cached per resolution"""
+    cache_key = (stock, category, max_points)
+    payload = SERIES_CACHE.get(cache_key)
+    if payload is not None:
+        return payload
+
+    store = ready_matrix_store() if max_points is None else None
+    sliced = store.category_series(stock, category) if store is not None else None
+    if sliced is not None:
+        quarters, series = sliced
+        source = "memory"
+    elif max_points is None:
+        source = "warehouse"
+        try:
+            conn = snowflake_connect()
+            try:
+                quarters, series = query_category_series(conn.cursor(), stock, category)
+            finally:
+                conn.close()
+        except Exception as db_error:
+            logger.warning(f"Series query failed for {stock}/{category}, using fallback data: {db_error}")
+            FALLBACK_TOTAL.inc(reason="series_api")
+            quarters, series = fallback_category_series(stock, category)
+            source = "fallback"
+    else:
+        # Downsample from the full-resolution payload (itself cached)
+        from downsampling import downsample_series
+        full = get_category_series(stock, category)
+        quarters, series = downsample_series(full["quarters"], full["series"], max_points)
+        source = full["source"]
+
+    payload = {
+        "stock": stock,
+        "category": category,
+        "quarters": quarters,
+        "series": series,
+        "max_points": max_points,
+        "source": source
+    }
+    # Fallback payloads are not cached so the warehouse is retried once it is reachable
+    if source != "fallback":
+        SERIES_CACHE.put(cache_key, payload)
+    return payload
+
+@app.route("/api/v1/stock/<stock>/series")
+def api_stock_series(stock):
+    """API endpoint returning the pivoted series of one metric category (?category=...&max_points=...)"""
+    category = request.args.get("category", "").strip()
+    if not category:
+        return json_response({"error": "Missing required parameter: category"}, status=400)
+    STOCK_TRAFFIC.record(stock)
+
+    max_points = parse_max_points(request.args.get("max_points"))
+    return json_response(get_category_series(stock, category, max_points))
+
+# ------------------- Universe API -------------------
+@app.route("/api/v1/universe")
+def api_universe():
+    """Page through the stock universe (?q=&bucket=&sector=&offset=&limit=)"""
+    universe = UNIVERSE.current()
+    offset = max(0, request.args.get("offset", 0, type=int))
+    limit = request.args.get("limit", UNIVERSE_PAGE_SIZE, type=int)
+    listings, total = universe.page(request.args.get("q", ""), request.args.get("bucket", ""),
+                                    request.args.get("sector", ""), offset, limit)
+    return json_response({
+        **universe.stats(),
+        "total": total,
+        "offset": offset,
+        "results": [listing.as_dict() for listing in listings],
+    })
+
+@app.route("/api/v1/universe/<symbol>")
+def api_universe_symbol(symbol):
+    """Listing metadata (name, sector, industry, bucket, market cap) of one symbol"""
+    listing = UNIVERSE.current().get(symbol)
+    if listing is None:
+        return json_response({"error": f"{symbol.upper()} is not in the universe"}, status=404)
+    return json_response(listing.as_dict())
+
+# ------------------- Batch Series API -------------------
+BATCH_SERIES_MAX_STOCKS = int(os.getenv("BATCH_SERIES_MAX_STOCKS", "50"))
+BATCH_SERIES_MAX_METRICS = int(os.getenv("BATCH_SERIES_MAX_METRICS", "50"))
+# /compare without ?codes= shows the largest stocks of the universe
+COMPARE_DEFAULT_STOCKS = 8
+COMPARE_DEFAULT_METRICS = ("Sales", "Net Profit")
+
+def parse_code_list(raw: Optional[str]) -> List[str]:
+    """Comma-separated stock codes, upper-cased and de-duplicated in order"""
+    codes = [code.strip().upper() for code in (raw or "").split(",")]
+    return list(dict.fromkeys(code for code in codes if code))
+
+def resolve_batch_metrics(names: List[str], category: str) -> Tuple[List[MetricInfo], List[str]]:
+    """(registered metrics to fetch, unknown names) for a metrics= list or a whole category"""
+    if not names:
+        by_name = METRIC_REGISTRY.snapshot.by_name
+        return [by_name[name] for name in METRIC_REGISTRY.snapshot.by_category.get(category, ())], []
+    resolved, unknown = [], []
+    for name in names:
+        info = METRIC_REGISTRY.resolve(name)
+        if info is None:
+            unknown.append(name)
+        elif info not in resolved:
+            resolved.append(info)
+    return resolved, unknown
+
+def align_batch_facts(codes: List[str], metrics: List[MetricInfo], facts) -> Tuple[List[str], List[List[List]]]:
+    """Align (code, metric_id, period_id, quarter, value) facts on one period axis in date order"""
+    stock_index = {code: s for s, code in enumerate(codes)}
+    metric_index = {info.metric_id: m for m, info in enumerate(metrics)}
+    facts = [fact for fact in facts if fact[0] in stock_index and fact[1] in metric_index]
+    periods = {pid: quarter for _, _, pid, quarter, _ in facts}
+    period_index = {pid: k for k, pid in enumerate(sorted(periods))}
+    values = [[[None] * len(periods) for _ in codes] for _ in metrics]
+    for code, mid, pid, _, value in facts:
+        values[metric_index[mid]][stock_index[code]][period_index[pid]] = to_number(value)
+    return [periods[pid] for pid in sorted(periods)], values
+
+def query_batch_facts(cur, codes: List[str], metrics: List[MetricInfo]) -> List[Tuple]:
+    """All requested stocks and metrics in one set-based query"""
+    if not codes or not metrics:
+        return []
+    codes_by_id = {stock_id(code): code for code in codes}
+    cur.execute(f"""
+        SELECT STOCK_ID, METRIC_ID, PERIOD_ID, VALUE
+        FROM FACT_FINANCIALS
+        WHERE STOCK_ID IN ({",".join(["%s"] * len(codes_by_id))})
+          AND METRIC_ID IN ({",".join(["%s"] * len(metrics))})
+    """, (*codes_by_id, *(info.metric_id for info in metrics)))
+    rows = cur.fetchall()
+    labels = DIMENSIONS.period_labels(cur, {int(row[2]) for row in rows})
+    return [(codes_by_id[int(sid)], int(mid), int(pid), labels.get(int(pid)), value)
+            for sid, mid, pid, value in rows if int(pid) in labels]
+
+def fallback_batch_facts(codes: List[str], metrics: List[MetricInfo]) -> List[Tuple]:
+    """The same facts from fallback data"""
+    data = fallback_financial_data()
+    wanted = {info.name: info.metric_id for info in metrics}
+    facts = []
+    for code in codes:
+        entry = data.get(code)
+        if entry is None:
+            continue
+        for name, values in entry["data"].items():
+            mid = wanted.get(canonical_metric_name(name))
+            if mid is not None:
+                facts.extend((code, mid, period_id(quarter), quarter, clean_value(str(value)))
+                             for quarter, value in zip(entry["quarters"], values))
+    return facts
+
+def get_batch_series(codes: List[str], metrics: List[MetricInfo]) -> Dict:
+    """Columnar payload of several stocks' metrics: values[metric][stock][period] over shared quarters"""
+    cache_key = (tuple(codes), tuple(info.metric_id for info in metrics), "batch")
+    payload = SERIES_CACHE.get(cache_key)
+    if payload is not None:
+        return payload
+
+    store = ready_matrix_store()
+    sliced = store.batch_series(codes, [info.metric_id for info in metrics]) if store is not None else None
+    if sliced is not None:
+        quarters, values = sliced
+        source = "memory"
+    else:
+        source = "warehouse"
+        try:
+            conn = snowflake_connect()
+            try:
+                facts = query_batch_facts(conn.cursor(), codes, metrics)
+            finally:
+                conn.close()
+        except Exception as db_error:
+            logger.warning(f"Batch series query failed for {len(codes)} stocks, using fallback data: {db_error}")
+            FALLBACK_TOTAL.inc(reason="batch_series_api")
+            facts = fallback_batch_facts(codes, metrics)
+            source = "fallback"
+        quarters, values = align_batch_facts(codes, metrics, facts)
+
+    payload = {
+        "codes": codes,
+        "metrics": [info.name for info in metrics],
+        "categories": [info.category for info in metrics],
+        "quarters": quarters,
+        "values": values,
+        "missing": [code for s, code in enumerate(codes)
+                    if all(v is None for series in values for v in series[s])],
+        "source": source
+    }
+    if source != "fallback":
+        SERIES_CACHE.put(cache_key, payload)
+    return payload
+
+def default_compare_metrics() -> List[str]:
+    """Registered names of COMPARE_DEFAULT_METRICS, else the first registered metrics"""
+    names = [info.name for info in map(METRIC_REGISTRY.resolve, COMPARE_DEFAULT_METRICS) if info is not None]
+    return names or sorted(METRIC_REGISTRY.snapshot.by_name)[:len(COMPARE_DEFAULT_METRICS)]
+
+@app.route("/api/v1/stocks/series")
+def api_batch_series():
+    """API endpoint returning several stocks' series aligned on one period axis (?codes=A,B&metrics=X,Y or &category=...)"""
+    codes = parse_code_list(request.args.get("codes"))
+    names = [name.strip() for name in request.args.get("metrics", "").split(",") if name.strip()]
+    category = request.args.get("category", "").strip()
+    if not codes:
+        return json_response({"error": "Missing required parameter: codes"}, status=400)
+    if not names and not category:
+        return json_response({"error": "Missing required parameter: metrics or category"}, status=400)
+    if len(codes) > BATCH_SERIES_MAX_STOCKS:
+        return json_response({"error": f"At most {BATCH_SERIES_MAX_STOCKS} codes per request"}, status=400)
+
+    metrics, unknown = resolve_batch_metrics(names, category)
+    if len(metrics) > BATCH_SERIES_MAX_METRICS:
+        return json_response({"error": f"At most {BATCH_SERIES_MAX_METRICS} metrics per request"}, status=400)
+    for code in codes:
+        STOCK_TRAFFIC.record(code)
+
+    payload = get_batch_series(codes, metrics)
+    return json_response({**payload, "unknown_metrics": unknown} if unknown else payload)
+
+@app.route("/compare")
+def compare_view():
+    """Side-by-side chart of one or more metrics across a watchlist (?codes=A,B&metrics=X,Y)"""
+    codes = parse_code_list(request.args.get("codes"))
+    metrics = request.args.get("metrics") or ",".join(default_compare_metrics())
+    return render_template("compare.html",
+                           codes=",".join(codes or UNIVERSE.current().symbols()[:COMPARE_DEFAULT_STOCKS]),
+                           metrics=metrics,
+                           metric_names=sorted(METRIC_REGISTRY.snapshot.by_name),
+                           max_stocks=BATCH_SERIES_MAX_STOCKS)
+
+# ------------------- Matrix Store -------------------
+_MATRIX_STORE: Optional["MatrixStore"] = None
+_MATRIX_STORE_LOCK = threading.Lock()
+
+def get_matrix_store() -> Optional["MatrixStore"]:
+    """The process's matrix store, created on first use so numpy loads lazily (None when disabled)"""
+    global _MATRIX_STORE
+    if not MATRIX_STORE_ENABLED:
+        return None
+    with _MATRIX_STORE_LOCK:
+        if _MATRIX_STORE is None:
+            from matrix_store import MatrixStore
+            _MATRIX_STORE = MatrixStore(METRIC_REGISTRY)
+    return _MATRIX_STORE
+
+def load_matrix_store() -> Dict:
+    """(Re)load the whole universe from the star schema, re-exporting the snapshot when it is stale"""
+    store = get_matrix_store()
+    if store is None:
+        return {"loaded": False, "enabled": False}
+    try:
+        conn = snowflake_connect()
+        try:
+            store.load(conn.cursor())
+        finally:
+            conn.close()
+    finally:
+        # A failed connect or build must not leave the refresh claimed or ingests buffering forever
+        store.end_refresh()
+
+    from snapshot import SNAPSHOT_EXPORT_INTERVAL, SNAPSHOT_PATH, export_snapshot, snapshot_age
+    if SNAPSHOT_EXPORT_INTERVAL > 0 and snapshot_age(SNAPSHOT_PATH) > SNAPSHOT_EXPORT_INTERVAL:
+        try:
+            export_snapshot(store, SNAPSHOT_PATH)
+        except Exception as e:
+            logger.warning(f"⚠️ Snapshot export to {SNAPSHOT_PATH} failed: {e}")
+    return store.stats()
+
+def open_matrix_snapshot() -> Optional[Dict]:
+    """Serve from the memory-mapped snapshot if there is one (header, or None)"""
+    store = get_matrix_store()
+    from snapshot import SNAPSHOT_PATH, SnapshotError, load_snapshot
+    if store is None or not os.path.exists(SNAPSHOT_PATH):
+        return None
+    try:
+        return load_snapshot(store, SNAPSHOT_PATH)
+    except SnapshotError as e:
+        logger.warning(f"⚠️ Ignoring snapshot {SNAPSHOT_PATH}: {e}")
+        return None
+
+def ready_matrix_store() -> Optional["MatrixStore"]:
+    """Loaded matrix store for reads; schedules a background reload once older than MATRIX_STORE_MAX_AGE"""
+    store = _MATRIX_STORE
+    if store is None or not store.ready:
+        return None
+    # Other workers ingest too; a periodic reload picks up their writes
+    if store.begin_refresh(MATRIX_STORE_MAX_AGE):
+        JOB_QUEUE.submit(load_matrix_store, name="matrix_store_refresh")
+    return store
+
+@app.route("/debug/matrix-store")
+def debug_matrix_store():
+    """Shape, size and age of this worker's matrix store"""
+    store = _MATRIX_STORE
+    return json_response(store.stats() if store is not None else {"loaded": False, "enabled": MATRIX_STORE_ENABLED})
+
+# ------------------- Screening API -------------------
+@app.route("/api/v1/screen")
+def api_screen():
+    """Rank the loaded universe (?filter=...&score=...&sort=...&order=&sector=&limit=&offset=; see screening.py)"""
+    store = ready_matrix_store()
+    if store is None:
+        return json_response({"error": "Matrix store is not loaded; screening is unavailable"}, status=503)
+    from screening import ScreenError, screen
+    try:
+        payload = screen(store,
+                         filter_text=request.args.get("filter", ""),
+                         scoring=request.args.get("score", ""),
+                         sort=request.args.get("sort", ""),
+                         descending=request.args.get("order", "desc").lower() != "asc",
+                         sector=request.args.get("sector", "").strip(),
+                         limit=request.args.get("limit", 50, type=int),
+                         offset=request.args.get("offset", 0, type=int))
+    except ScreenError as e:
+        return json_response({"error": str(e)}, status=400)
+    return json_response(payload)
+
+# ------------------- Peer Similarity -------------------
+_PEER_SERVICE: Optional["PeerService"] = None
+
+def get_peer_service() -> Optional["PeerService"]:
+    """The process's peer index over the matrix store (None when the store is disabled)"""
+    global _PEER_SERVICE
+    if not MATRIX_STORE_ENABLED:
+        return None
+    with _MATRIX_STORE_LOCK:
+        if _PEER_SERVICE is None:
+            from peers import PeerService
+            _PEER_SERVICE = PeerService()
+    return _PEER_SERVICE
+
+@app.route("/api/v1/stock/<stock>/peers")
+def api_stock_peers(stock):
+    """Most similar stocks by growth, margin, return and working-capital profile (?k=10)"""
+    store = ready_matrix_store()
+    if store is None:
+        return json_response({"error": "Matrix store is not loaded; peer search is unavailable"}, status=503)
+    STOCK_TRAFFIC.record(stock)
+    payload = get_peer_service().peers(store, stock, request.args.get("k", 10, type=int))
+    if payload is None:
+        return json_response({"error": f"No financial profile for {stock}"}, status=404)
+    return json_response(payload)
+
+# ------------------- Warm-up & Readiness -------------------
+def compile_templates() -> int:
+    """Compile every Jinja template into the environment's cache"""
+    names = app.jinja_env.list_templates()
+    for name in names:
+        app.jinja_env.get_template(name)
+    return len(names)
+
+@WARMUP.step("warehouse_pool", required=True)
+def warm_warehouse_pool() -> Dict:
+    """Log in the minimum number of pooled connections up front"""
+    count = min(WARMUP_POOL_MIN, WAREHOUSE_POOL.max_idle) if WAREHOUSE_POOL_SIZE > 0 else 0
+    connections = [snowflake_connect() for _ in range(count)]
+    for conn in connections:
+        conn.close()
+    return {"connections": len(connections)}
+
+@WARMUP.step("category_matchers")
+def warm_category_matchers() -> Dict:
+    return {"categories": len(compile_category_matchers())}
+
+@WARMUP.step("warehouse_schema", required=True)
+def warm_warehouse_schema() -> None:
+    create_snowflake_table()
+
+@WARMUP.step("metric_registry")
+def warm_metric_registry() -> Dict:
+    return {"metrics": load_metric_registry()}
+
+@WARMUP.step("matrix_store")
+def warm_matrix_store() -> Dict:
+    """Open the snapshot for an instant start and refresh from the warehouse behind it"""
+    if open_matrix_snapshot() is None:
+        return load_matrix_store()
+    if _MATRIX_STORE.begin_refresh():
+        JOB_QUEUE.submit(load_matrix_store, name="matrix_store_refresh")
+    return _MATRIX_STORE.stats()
+
+@WARMUP.step("peer_index")
+def warm_peer_index() -> Dict:
+    store = ready_matrix_store()
+    if store is None:
+        return {"built": False}
+    service = get_peer_service()
+    service.ensure_current(store)
+    return service.stats()
+
+@WARMUP.step("templates")
+def warm_templates() -> Dict:
+    return {"templates": compile_templates()}
+
+@WARMUP.step("hot_stocks")
+def warm_hot_stocks() -> Dict:
+    """Prefetch every category series of the most requested stocks into SERIES_CACHE"""
+    stocks = STOCK_TRAFFIC.top(WARMUP_TOP_STOCKS)
+    if not stocks:
+        stocks = UNIVERSE.current().symbols()[:WARMUP_TOP_STOCKS]
+    conn = snowflake_connect()
+    try:
+        cur = conn.cursor()
+        indexes = {stock: query_category_index(cur, stock)[0] for stock in stocks}
+    finally:
+        conn.close()
+    series = 0
+    for stock, categories in indexes.items():
+        for category in categories:
+            get_category_series(stock, category["name"])
+            series += 1
+    return {"stocks": stocks, "series": series}
+
+@app.route("/ready")
+def readiness():
+    """Readiness probe: 503 until this worker has finished warming up"""
+    if WARMUP.state == "pending":
+        WARMUP.start_background()
+    status = WARMUP.status()
+    return json_response(status, status=200 if status["ready"] else 503)
+
+@app.route("/debug/traces")
+def debug_traces():
+    """Trace viewer listing the slowest recent requests and background jobs"""
+    limit = request.args.get("limit", 20, type=int)
+    rows = ""
+    for root in MEMORY_EXPORTER.slowest(limit):
+        started = time.strftime("%H:%M:%S", time.localtime(root["start"]))
+        status = root["attributes"].get("status", root["status"])
+        linked = " 🔗" if root["links"] else ""
+        rows += f"""
+        <tr>
+            <td><a href="/debug/traces/{root['trace_id']}">{escape(root['name'])}</a>{linked}</td>
+            <td>{escape(root['attributes'].get('path', ''))}</td>
+            <td class="text-end">{root['duration_ms']:.1f}</td>
+            <td>{status}</td>
+            <td>{started}</td>
+        </tr>"""
+
+    return f"""
+    <div class="container mt-4" style="font-family: Arial, sans-serif;">
+        <h2>🐢 Slowest Recent Traces</h2>
+        <table class="table table-striped" border="1" cellpadding="6" style="border-collapse: collapse;">
+            <thead><tr><th>Root span</th><th>Path</th><th>Duration (ms)</th><th>Status</th><th>Started</th></tr></thead>
+            <tbody>{rows or '<tr><td colspan="5">No traces recorded yet</td></tr>'}</tbody>
+        </table>
+        <a href="/" class="btn btn-primary">← Back to Dashboard</a>
+    </div>
+    """
+
+@app.route("/debug/traces/<trace_id>")
+def debug_trace_detail(trace_id):
+    """Waterfall view of all spans in one trace"""
+    spans = MEMORY_EXPORTER.get_trace(trace_id)
+    if not spans:
+        return f"<h2>Trace {escape(trace_id)} not found</h2>", 404
+
+    trace_start = spans[0]["start"]
+    total_ms = max((s["start"] - trace_start) * 1000 + s["duration_ms"] for s in spans) or 1.0
+    children = {}
+    for span in spans:
+        children.setdefault(span["parent_id"], []).append(span)
+
+    rows = []
+    def add_rows(parent_id, depth):
+        for span in children.get(parent_id, []):
+            offset = (span["start"] - trace_start) * 1000
+            left = offset / total_ms * 100
+            width = max(span["duration_ms"] / total_ms * 100, 0.5)
+            color = "#dc3545" if span["status"] == "error" else "#667eea"
+            attrs = ", ".join(f"{k}={v}" for k, v in span["attributes"].items())
+            links = "".join(f' <a href="/debug/traces/{l["trace_id"]}">🔗 parent</a>' for l in span["links"])
+            rows.append(f"""
+            <tr>
+                <td style="padding-left: {depth * 20 + 6}px;">{escape(span['name'])}{links}</td>
+                <td class="text-end">{span['duration_ms']:.1f}</td>
+                <td style="width: 50%;"><div style="margin-left: {left:.2f}%; width: {width:.2f}%; background: {color}; height: 12px;"></div></td>
+                <td><small>{escape(attrs)}</small></td>
+            </tr>""")
+            add_rows(span["span_id"], depth + 1)
+    add_rows(None, 0)
+    dropped = MEMORY_EXPORTER.dropped(trace_id)
+    notice = f'<p class="text-muted">{dropped:,} more spans were not kept (TRACE_MAX_SPANS)</p>' if dropped else ""
+
+    return f"""
+    <div class="container mt-4" style="font-family: Arial, sans-serif;">
+        <h2>🔍 Trace {escape(trace_id)}</h2>
+        {notice}
+        <table class="table" border="1" cellpadding="4" style="border-collapse: collapse; width: 100%;">
+            <thead><tr><th>Span</th><th>ms</th><th>Timeline</th><th>Attributes</th></tr></thead>
+            <tbody>{''.join(rows)}</tbody>
+        </table>
+        <a href="/debug/traces">← Slowest traces</a>
+    </div>
+    """
+
+@app.route("/debug/profiles")
+def debug_profiles():
+    """Admin list of captured request profiles (requires the profiling admin token header)"""
+    if not PROFILING_ENABLED:
+        return "<h2>Profiling is disabled</h2>", 404
+    # Header only: a token in the URL would end up in access logs, history and Referer headers
+    if not is_authorized(request.headers.get(TOKEN_HEADER)):
+        return "<h2>Forbidden</h2>", 403
+
+    rows = ""
+    for meta in PROFILE_STORE.list():
+        started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(meta.get("started", 0)))
+        trace = f'<a href="/debug/traces/{escape(meta["trace_id"])}">trace</a>' if meta.get("trace_id") else ""
+        rows += f"""
+        <tr>
+            <td><a href="/debug/profiles/{escape(meta['id'])}">{escape(meta['id'])}</a></td>
+            <td>{escape(meta.get('method', ''))} {escape(meta.get('path', ''))}</td>
+            <td>{meta.get('status', '')}</td>
+            <td class="text-end">{meta.get('duration_ms') or ''}</td>
+            <td>{escape(meta.get('mode', ''))}</td>
+            <td>{started}</td>
+            <td><a href="/debug/profiles/{escape(meta['id'])}.folded">folded</a> {trace}</td>
+        </tr>"""
+
+    return f"""
+    <div class="container mt-4" style="font-family: Arial, sans-serif;">
+        <h2>🔥 Request Profiles</h2>
+        <p>Send <code>X-Profile: 1</code> and <code>{TOKEN_HEADER}</code> with a request to profile it.
+           These pages also need the <code>{TOKEN_HEADER}</code> header.
+           Folded files open in speedscope or <code>flamegraph.pl</code>.</p>
+        <table class="table table-striped" border="1" cellpadding="6" style="border-collapse: collapse;">
+            <thead><tr><th>Profile</th><th>Request</th><th>Status</th><th>Duration (ms)</th><th>Mode</th><th>Captured</th><th>Files</th></tr></thead>
+            <tbody>{rows or '<tr><td colspan="7">No profiles captured yet</td></tr>'}</tbody>
+        </table>
+        <a href="/" class="btn btn-primary">← Back to Dashboard</a>
+    </div>
+    """
+
+@app.route("/debug/profiles/<profile_id>")
+def debug_profile_detail(profile_id):
+    """Top frames of one profile by inclusive time, or the raw folded file (<id>.folded)"""
+    if not PROFILING_ENABLED:
+        return "<h2>Profiling is disabled</h2>", 404
+    if not is_authorized(request.headers.get(TOKEN_HEADER)):
+        return "<h2>Forbidden</h2>", 403
+
+    if profile_id.endswith(".folded"):
+        folded = PROFILE_STORE.folded_text(profile_id[:-len(".folded")])
+        if folded is None:
+            return "Profile not found", 404
+        return Response(folded, mimetype="text/plain",
+                        headers={"Content-Disposition": f"attachment; filename={profile_id}"})
+
+    meta, stacks = PROFILE_STORE.load(profile_id)
+    if meta is None:
+        return f"<h2>Profile {escape(profile_id)} not found</h2>", 404
+
+    total = meta.get("total") or 1
+    rows = ""
+    for frame, inclusive, own in function_totals(stacks):
+        rows += f"""
+        <tr>
+            <td><code>{escape(frame)}</code></td>
+            <td class="text-end">{inclusive:,}</td>
+            <td class="text-end">{inclusive / total:.1%}</td>
+            <td class="text-end">{own:,}</td>
+        </tr>"""
+
+    return f"""
+    <div class="container mt-4" style="font-family: Arial, sans-serif;">
+        <h2>🔥 Profile {escape(profile_id)}</h2>
+        <p>{escape(meta.get('method', ''))} {escape(meta.get('path', ''))} →
+           {meta.get('status', '')} in {meta.get('duration_ms', '?')} ms ({escape(meta.get('mode', ''))},
+           {meta.get('total', 0):,} {escape(meta.get('unit', ''))})</p>
+        <table class="table" border="1" cellpadding="4" style="border-collapse: collapse;">
+            <thead><tr><th>Frame</th><th>Inclusive</th><th>Share</th><th>Self</th></tr></thead>
+            <tbody>{rows}</tbody>
+        </table>
+        <a href="/debug/profiles/{escape(profile_id)}.folded">Download folded stacks</a> ·
+        <a href="/debug/profiles">← All profiles</a>
+    </div>
+    """
+
 # ------------------- Enhanced Screener Scraper -------------------
 def clean_metric_name(metric_name: str) -> str:
     """Clean metric name while preserving important special characters"""
@@ -790,48 +1651,134 @@ def clean_value(val: str) -> str:
     
     return ""
 
-def get_financial_data(stock_code: str) -> Tuple[Dict, List, str, str]:
+@traced()
+def fetch_screener_page(url: str, priority: bool = True):
+    """GET a screener.in page under the adaptive rate limiter, retrying 429/5xx/connection errors
+
+    Interactive fetches keep priority=True and go ahead of bulk loads (see rate_control.py). They do not
+    retry a 429 and raise ThrottledError rather than sleep through a long Retry-After, so a web request
+    never waits out screener.in's pause.
+    """
+    import requests
+
+    for attempt in range(SCREENER_MAX_RETRIES + 1):
+        started = SCREENER_RATE.acquire(priority)
+        fetch_start = time.perf_counter()
+        try:
+            res = requests.get(url, headers=HEADERS, timeout=30)
+        except requests.RequestException:
+            SCREENER_FETCH_DURATION.observe(time.perf_counter() - fetch_start, status="error")
+            SCREENER_RATE.release(started, None)
+            if attempt == SCREENER_MAX_RETRIES:
+                raise
+            continue
+        SCREENER_FETCH_DURATION.observe(time.perf_counter() - fetch_start, status=res.status_code)
+        SCREENER_RATE.release(started, res.status_code, parse_retry_after(res.headers.get("Retry-After")))
+        retry = res.status_code >= 500 or (res.status_code == 429 and not priority)
+        if retry and attempt < SCREENER_MAX_RETRIES:
+            logger.info(f"🔁 {url} returned {res.status_code}; retrying ({attempt + 1}/{SCREENER_MAX_RETRIES})")
+            continue
+        return res
+
+def parse_financial_page(content: bytes, stock_code: str) -> Tuple[Dict, List, str, str]:
+    """Run every extractor over one screener.in page: (data_dict, quarters_list, category, industry)"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(content, "html.parser")
+
+    # Extract industry and sector/category info
+    category, industry = extract_company_info(soup)
+    
+    # Extract ALL financial data from multiple sections
+    all_data, quarters = extract_all_financial_data(soup, stock_code)
+    return all_data, quarters, category, industry
+
+_HTML_ARCHIVE: Optional["HtmlArchive"] = None
+_HTML_ARCHIVE_LOCK = threading.Lock()
+
+def get_html_archive() -> "HtmlArchive":
+    """The process's raw-page archive, opened on first use"""
+    global _HTML_ARCHIVE
+    with _HTML_ARCHIVE_LOCK:
+        if _HTML_ARCHIVE is None:
+            from html_archive import HtmlArchive
+            _HTML_ARCHIVE = HtmlArchive()
+    return _HTML_ARCHIVE
+
+def archive_screener_page(stock_code: str, url: str, res):
+    """Keep the raw page for offline re-extraction; archiving problems never fail an ingest"""
+    try:
+        get_html_archive().store(stock_code, url, res.content, status=res.status_code,
+                                 headers=dict(res.headers), elapsed=res.elapsed.total_seconds())
+    except Exception as e:
+        logger.warning(f"⚠️ Could not archive page for {stock_code}: {e}")
+
+class ScrapeError(Exception):
+    """A screener.in page could not be fetched or yielded no data; the message is the reason"""
+
+def get_financial_data(stock_code: str, on_fetched: Optional[Callable[[], None]] = None,
+                       fallback: bool = True, priority: bool = True) -> Tuple[Dict, List, str, str]:
     """
     Fetch ALL financial data from screener.in with comprehensive scraping
     Returns: (data_dict, quarters_list, category, industry)
+    on_fetched is called once the page has been downloaded
+    With fallback=False a failure raises ScrapeError instead of returning the built-in fallback data
+    Bulk loads pass priority=False so interactive fetches go first
     """
+    import requests
+
+    def failed(reason: str) -> Tuple[Dict, List, str, str]:
+        if not fallback:
+            raise ScrapeError(reason)
+        return use_fallback_data(stock_code)
+
     url = SCREENER_URL.format(stock_code)
     logger.info(f"🔎 Fetching ALL metrics for {stock_code} from: {url}")
     
     try:
-        res = requests.get(url, headers=HEADERS, timeout=30)
+        res = fetch_screener_page(url, priority)
         res.raise_for_status()
         
         if res.status_code != 200:
             logger.error(f"❌ Failed to fetch {stock_code}: HTTP {res.status_code}")
+            SCRAPE_ERRORS_TOTAL.inc(kind="http_status")
             # Try fallback data
-            return use_fallback_data(stock_code)
-
-        soup = BeautifulSoup(res.content, "html.parser")
+            return failed(f"HTTP {res.status_code}")
+        if on_fetched:
+            on_fetched()
+        if ARCHIVE_ENABLED:
+            archive_screener_page(stock_code, url, res)
 
-        # Extract industry and sector/category info
-        category, industry = extract_company_info(soup)
-        
-        # Extract ALL financial data from multiple sections
-        all_data, quarters = extract_all_financial_data(soup, stock_code)
+        all_data, quarters, category, industry = parse_financial_page(res.content, stock_code)
         
         # If no data extracted, try fallback
         if not all_data or not quarters:
             logger.warning(f"No data extracted from scraping for {stock_code}, trying fallback")
-            return use_fallback_data(stock_code)
+            SCRAPE_ERRORS_TOTAL.inc(kind="empty_extraction")
+            return failed("no data extracted")
         
         return all_data, quarters, category, industry
         
+    except ScrapeError:
+        raise
+    except ThrottledError as e:
+        logger.warning(f"⏸️ Not fetching {stock_code}: {e}")
+        SCRAPE_ERRORS_TOTAL.inc(kind="throttled")
+        return failed(str(e))
     except requests.RequestException as e:
         logger.error(f"❌ Request failed for {stock_code}: {e}")
+        SCRAPE_ERRORS_TOTAL.inc(kind="request")
         # Try fallback data
-        return use_fallback_data(stock_code)
+        response = getattr(e, "response", None)
+        return failed(f"HTTP {response.status_code}" if response is not None else f"{type(e).__name__}: {e}")
     except Exception as e:
         logger.error(f"❌ Unexpected error for {stock_code}: {e}")
+        SCRAPE_ERRORS_TOTAL.inc(kind="unexpected")
         # Try fallback data
-        return use_fallback_data(stock_code)
+        return failed(f"{type(e).__name__}: {e}")
 
-def extract_company_info(soup: BeautifulSoup) -> Tuple[str, str]:
+@EXTRACT_DURATION.time(function="extract_company_info")
+def extract_company_info(soup: "BeautifulSoup") -> Tuple[str, str]:
     """Extract company category and industry from breadcrumb"""
     try:
         breadcrumb = soup.select_one(".breadcrumb")
@@ -847,7 +1794,9 @@ def extract_company_info(soup: BeautifulSoup) -> Tuple[str, str]:
     
     return "", ""
 
-def extract_all_financial_data(soup: BeautifulSoup, stock_code: str) -> Tuple[Dict, List]:
+@traced()
+@EXTRACT_DURATION.time(function="extract_all_financial_data")
+def extract_all_financial_data(soup: "BeautifulSoup", stock_code: str) -> Tuple[Dict, List]:
     """Extract ALL financial data from multiple sections of the page"""
     all_data = {}
     quarters = []
@@ -893,7 +1842,8 @@ def extract_all_financial_data(soup: BeautifulSoup, stock_code: str) -> Tuple[Di
         logger.error(f"Error extracting all financial data for {stock_code}: {e}")
         return {}, []
 
-def extract_quarterly_data(soup: BeautifulSoup, stock_code: str) -> Tuple[Dict, List]:
+@EXTRACT_DURATION.time(function="extract_quarterly_data")
+def extract_quarterly_data(soup: "BeautifulSoup", stock_code: str) -> Tuple[Dict, List]:
     """Extract quarterly financial data from the main quarterly table"""
     
     # Try multiple selectors for quarterly data
@@ -964,7 +1914,8 @@ def extract_quarterly_data(soup: BeautifulSoup, stock_code: str) -> Tuple[Dict,
         logger.error(f"Error extracting quarterly data for {stock_code}: {e}")
         return {}, []
 
-def extract_annual_data(soup: BeautifulSoup, stock_code: str) -> Tuple[Dict, List]:
+@EXTRACT_DURATION.time(function="extract_annual_data")
+def extract_annual_data(soup: "BeautifulSoup", stock_code: str) -> Tuple[Dict, List]:
     """Extract annual financial data if available"""
     annual_table = soup.find("section", id="profit-loss")
     if not annual_table:
@@ -995,7 +1946,8 @@ def extract_annual_data(soup: BeautifulSoup, stock_code: str) -> Tuple[Dict, Lis
         logger.warning(f"Could not extract annual data for {stock_code}: {e}")
         return {}, []
 
-def extract_ratios_data(soup: BeautifulSoup, stock_code: str, quarters: List) -> Dict:
+@EXTRACT_DURATION.time(function="extract_ratios_data")
+def extract_ratios_data(soup: "BeautifulSoup", stock_code: str, quarters: List) -> Dict:
     """Extract financial ratios from ratios section"""
     try:
         # Look for ratios in various possible sections
@@ -1032,7 +1984,8 @@ def extract_ratios_data(soup: BeautifulSoup, stock_code: str, quarters: List) ->
         logger.warning(f"Could not extract ratios for {stock_code}: {e}")
         return {}
 
-def extract_balance_sheet_data(soup: BeautifulSoup, stock_code: str, quarters: List) -> Dict:
+@EXTRACT_DURATION.time(function="extract_balance_sheet_data")
+def extract_balance_sheet_data(soup: "BeautifulSoup", stock_code: str, quarters: List) -> Dict:
     """Extract detailed balance sheet data"""
     try:
         balance_sheet_section = soup.find("section", id="balance-sheet")
@@ -1058,7 +2011,8 @@ def extract_balance_sheet_data(soup: BeautifulSoup, stock_code: str, quarters: L
         logger.warning(f"Could not extract balance sheet data for {stock_code}: {e}")
         return {}
 
-def extract_cashflow_data(soup: BeautifulSoup, stock_code: str, quarters: List) -> Dict:
+@EXTRACT_DURATION.time(function="extract_cashflow_data")
+def extract_cashflow_data(soup: "BeautifulSoup", stock_code: str, quarters: List) -> Dict:
     """Extract cash flow statement data"""
     try:
         cashflow_section = soup.find("section", id="cash-flow")
@@ -1084,7 +2038,8 @@ def extract_cashflow_data(soup: BeautifulSoup, stock_code: str, quarters: List)
         logger.warning(f"Could not extract cash flow data for {stock_code}: {e}")
         return {}
 
-def extract_per_share_data(soup: BeautifulSoup, stock_code: str, quarters: List) -> Dict:
+@EXTRACT_DURATION.time(function="extract_per_share_data")
+def extract_per_share_data(soup: "BeautifulSoup", stock_code: str, quarters: List) -> Dict:
     """Extract per share data and other key metrics"""
     try:
         # Look for per share data in various sections
@@ -1119,9 +2074,20 @@ def extract_per_share_data(soup: BeautifulSoup, stock_code: str, quarters: List)
         return {}
 
 # ------------------- Enhanced Snowflake Integration -------------------
-def snowflake_connect():
+def load_warehouse_connector(spec: str):
+    """Resolve a "module:function" connector factory configured through WAREHOUSE_CONNECTOR"""
+    import importlib
+    module_name, _, func_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), func_name or "connect")
+
+def _open_warehouse_connection():
     """Create Snowflake connection with better error handling"""
     try:
+        if WAREHOUSE_CONNECTOR:
+            with SNOWFLAKE_CONNECT_DURATION.time():
+                conn = load_warehouse_connector(WAREHOUSE_CONNECTOR)()
+            return InstrumentedConnection(conn)
+        
         logger.info("Connecting to Snowflake...")
         
         # Validate environment variables
@@ -1130,54 +2096,111 @@ def snowflake_connect():
             if not os.getenv(var):
                 raise ValueError(f"Missing required environment variable: {var}")
         
-        conn = snowflake.connector.connect(
-            user=os.getenv("SNOWFLAKE_USER"),
-            password=os.getenv("SNOWFLAKE_PASSWORD"),
-            account=os.getenv("SNOWFLAKE_ACCOUNT"),
-            warehouse='SNOWFLAKE_LEARNING_WH',
-            database='STOCK_DB',
-            schema='STOCK_SOURCE',
-            client_session_keep_alive=True
-        )
+        import snowflake.connector
+        with SNOWFLAKE_CONNECT_DURATION.time():
+            conn = snowflake.connector.connect(
+                user=os.getenv("SNOWFLAKE_USER"),
+                password=os.getenv("SNOWFLAKE_PASSWORD"),
+                account=os.getenv("SNOWFLAKE_ACCOUNT"),
+                warehouse='SNOWFLAKE_LEARNING_WH',
+                database='STOCK_DB',
+                schema='STOCK_SOURCE',
+                client_session_keep_alive=True
+            )
         
         logger.info("✅ Snowflake connection established")
-        return conn
+        return InstrumentedConnection(conn)
         
     except Exception as e:
         logger.error(f"❌ Snowflake connection failed: {e}")
         raise
 
+WAREHOUSE_POOL = ConnectionPool(_open_warehouse_connection)
+
+@traced()
+def snowflake_connect():
+    """Warehouse connection from the per-process pool; close() hands it back"""
+    if WAREHOUSE_POOL_SIZE <= 0:
+        return _open_warehouse_connection()
+    return WAREHOUSE_POOL.acquire()
+
+_SCHEMA_READY = False
+_SCHEMA_LOCK = threading.Lock()
+
+@traced()
 def create_snowflake_table():
-    """Create the enhanced financials table if it doesn't exist"""
+    """Create the star schema (and FINANCIALS_QUARTERLY view) once per process; never migrates legacy data"""
+    global _SCHEMA_READY
+    if _SCHEMA_READY:
+        return
+    with _SCHEMA_LOCK:
+        if _SCHEMA_READY:
+            return
+        try:
+            conn = snowflake_connect()
+            try:
+                cur = conn.cursor()
+                logger.info("📋 Creating/checking star schema tables...")
+                with METRIC_REGISTRY.transaction():
+                    ensure_star_schema(cur)
+                    from derived_metrics import CREATE_DERIVED_STATE_SQL
+                    cur.execute(CREATE_DERIVED_STATE_SQL)
+                    conn.commit()
+            finally:
+                conn.close()
+            _SCHEMA_READY = True
+            logger.info("✅ Star schema created/verified successfully")
+
+        except Exception as e:
+            logger.error(f"❌ Error creating table: {e}")
+            raise
+
+def refresh_stock_derived(cur, stock: StockInfo) -> List[Tuple[int, str, float]]:
+    """Recompute a stock's derived metrics if its inputs changed (see derived_metrics.py); [] otherwise"""
+    from derived_metrics import refresh_derived
     try:
-        conn = snowflake_connect()
-        cur = conn.cursor()
-        
-        logger.info("📋 Creating/checking enhanced Snowflake table...")
-        
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS FINANCIALS_QUARTERLY (
-                STOCK_CODE STRING,
-                METRIC STRING,
-                QUARTER STRING,
-                VALUE STRING,
-                INDUSTRY STRING,
-                CATEGORY STRING,
-                METRIC_CATEGORY STRING,
-                DATA_SOURCE STRING DEFAULT 'SCREENER',
-                CREATED_AT TIMESTAMP DEFAULT CURRENT_TIMESTAMP(),
-                UPDATED_AT TIMESTAMP DEFAULT CURRENT_TIMESTAMP()
-            )
-        """)
-        
-        conn.commit()
-        conn.close()
-        logger.info("✅ Enhanced table created/verified successfully")
-        
+        return refresh_derived(cur, [stock], METRIC_REGISTRY).get(stock.stock_id, [])
     except Exception as e:
-        logger.error(f"❌ Error creating table: {e}")
-        raise
-
+        # Derived facts are recomputed on the next ingest or backfill; never lose the raw facts
+        logger.warning(f"⚠️ Derived metrics for {stock.stock_code} not refreshed: {e}")
+        return []
+
+def quarterly_facts(financials: Dict, quarters: List) -> List[Tuple[int, str, float]]:
+    """(metric_id, quarter, value) for every numeric cell of scraped financials; registers new metrics"""
+    metrics = METRIC_REGISTRY.register(financials.keys())
+    registered = {info.name for info in METRIC_REGISTRY.registered(metrics)}
+    facts = []
+    for info, values in zip(metrics, financials.values()):
+        if info.name not in registered:
+            continue  # refused by a full registry: its facts could never be named
+
+        for i, quarter in enumerate(quarters):
+            value = to_number(values[i]) if i < len(values) else None
+            if value is not None:  # Only insert numeric values
+                facts.append((info.metric_id, quarter, value))
+    return facts
+
+def merge_stock_facts(conn, stock_code: str, category: str, industry: str,
+                      facts: List[Tuple[int, str, float]], metric_names) -> int:
+    """MERGE facts plus dimensions, refresh derived metrics, commit and update the in-memory views"""
+    cur = conn.cursor()
+    with METRIC_REGISTRY.transaction():
+        # New metrics and last-seen times go to DIM_METRIC in the same transaction
+        METRIC_REGISTRY.touch(metric_names)
+        METRIC_REGISTRY.persist(cur)
+        merged = write_stock_facts(cur, stock_code, industry, category, facts)
+        stock = StockInfo(stock_id(stock_code), stock_code, industry, category)
+        derived = refresh_stock_derived(cur, stock)
+        conn.commit()
+    if _MATRIX_STORE is not None:
+        _MATRIX_STORE.upsert(stock, facts + derived)
+    if _PEER_SERVICE is not None:
+        _PEER_SERVICE.mark_dirty(stock_code)
+    ROWS_MERGED_TOTAL.inc(merged + len(derived))
+    SERIES_CACHE.invalidate(stock_code)
+    return merged
+
+@traced()
 def insert_quarterly_to_snowflake(conn, stock_code: str, financials: Dict, quarters: List, category: str, industry: str):
     """Insert quarterly data with enhanced categorization"""
     if not financials or not quarters:
@@ -1185,66 +2208,16 @@ def insert_quarterly_to_snowflake(conn, stock_code: str, financials: Dict, quart
         return
     
     try:
-        cur = conn.cursor()
-        batch_data = []
-        
-        # Prepare batch data with automatic categorization
-        for metric, values in financials.items():
-            metric_category = categorize_metric(metric)
-            
-            for i, quarter in enumerate(quarters):
-                value = values[i] if i < len(values) else ""
-                
-                if value:  # Only insert non-empty values
-                    batch_data.append((
-                        stock_code, metric, quarter, value, industry, category, metric_category
-                    ))
-        
-        if not batch_data:
+        # Facts carry only the metric id, quarter and numeric value
+        facts = quarterly_facts(financials, quarters)
+
+        if not facts:
             logger.warning(f"No valid data to insert for {stock_code}")
             return
+
+        merged = merge_stock_facts(conn, stock_code, category, industry, facts, financials.keys())
         
-        # Use batch insert with MERGE for better performance
-        merge_query = """
-            MERGE INTO FINANCIALS_QUARTERLY AS tgt
-            USING (
-                SELECT 
-                    column1 AS STOCK_CODE,
-                    column2 AS METRIC,
-                    column3 AS QUARTER,
-                    column4 AS VALUE,
-                    column5 AS INDUSTRY,
-                    column6 AS CATEGORY,
-                    column7 AS METRIC_CATEGORY
-                FROM VALUES %s
-            ) AS src
-            ON tgt.STOCK_CODE = src.STOCK_CODE 
-               AND tgt.METRIC = src.METRIC 
-               AND tgt.QUARTER = src.QUARTER
-            WHEN MATCHED THEN 
-                UPDATE SET 
-                    VALUE = src.VALUE,
-                    INDUSTRY = src.INDUSTRY,
-                    METRIC_CATEGORY = src.METRIC_CATEGORY,
-                    UPDATED_AT = CURRENT_TIMESTAMP()
-            WHEN NOT MATCHED THEN 
-                INSERT (STOCK_CODE, METRIC, QUARTER, VALUE, INDUSTRY, CATEGORY, METRIC_CATEGORY)
-                VALUES (src.STOCK_CODE, src.METRIC, src.QUARTER, src.VALUE, src.INDUSTRY, src.CATEGORY, src.METRIC_CATEGORY)
-        """
-        
-        # Format data for VALUES clause with proper escaping
-        values_list = []
-        for d in batch_data:
-            escaped_values = [str(val).replace("'", "''") for val in d]
-            values_list.append(f"('{escaped_values[0]}', '{escaped_values[1]}', '{escaped_values[2]}', '{escaped_values[3]}', '{escaped_values[4]}', '{escaped_values[5]}', '{escaped_values[6]}')")
-        
-        values_str = ",".join(values_list)
-        final_query = merge_query % values_str
-        
-        cur.execute(final_query)
-        conn.commit()
-        
-        logger.info(f"✅ Inserted {len(batch_data)} records for {stock_code}")
+        logger.info(f"✅ Inserted {merged} records for {stock_code}")
         
     except Exception as e:
         logger.error(f"❌ Error inserting data for {stock_code}: {e}")
@@ -1256,19 +2229,34 @@ def insert_quarterly_to_snowflake(conn, stock_code: str, financials: Dict, quart
 def metrics_summary():
     """Show summary of all discovered metrics by category"""
     try:
-        conn = snowflake_connect()
-        cur = conn.cursor()
-        
-        cur.execute("""
-            SELECT METRIC_CATEGORY, COUNT(DISTINCT METRIC) as METRIC_COUNT,
-                   COUNT(DISTINCT STOCK_CODE) as STOCK_COUNT
-            FROM FINANCIALS_QUARTERLY
-            GROUP BY METRIC_CATEGORY
-            ORDER BY METRIC_COUNT DESC
-        """)
-        
-        summary_data = cur.fetchall()
-        conn.close()
+        if not METRIC_REGISTRY.loaded:
+            try:
+                load_metric_registry()
+            except Exception as db_error:
+                logger.warning(f"Metric registry not loaded from DIM_METRIC: {db_error}")
+
+        # Stock coverage still needs the fact table; metric counts come from the snapshot
+        stock_counts = {}
+        try:
+            conn = snowflake_connect()
+            try:
+                cur = conn.cursor()
+                cur.execute("""
+                    SELECT m.METRIC_CATEGORY, COUNT(DISTINCT f.STOCK_ID) as STOCK_COUNT
+                    FROM FACT_FINANCIALS f
+                    JOIN DIM_METRIC m ON m.METRIC_ID = f.METRIC_ID
+                    GROUP BY m.METRIC_CATEGORY
+                """)
+                stock_counts = dict(cur.fetchall())
+            finally:
+                conn.close()
+        except Exception as db_error:
+            logger.warning(f"Stock counts unavailable for metrics summary: {db_error}")
+
+        summary_data = [
+            (category, metric_count, stock_counts.get(category, 0))
+            for category, metric_count in METRIC_REGISTRY.snapshot.category_counts()
+        ]
         
         return render_template("metrics_summary.html", summary_data=summary_data)
         
@@ -1280,16 +2268,33 @@ def metrics_summary():
 def load_data_endpoint():
     """API endpoint to trigger data loading"""
     try:
-        # This would typically be run in the background
-        import threading
-        thread = threading.Thread(target=load_all_data)
-        thread.start()
-        
-        return json.dumps({"status": "success", "message": "Data loading initiated"})
+        # ?shard=&shards= loads one hash slice of the universe, so several workers can split it
+        shards = max(1, request.args.get("shards", 1, type=int))
+        shard = request.args.get("shard", 0, type=int)
+        if not 0 <= shard < shards:
+            return json_response({"status": "error", "message": f"shard must be in 0..{shards - 1}"}, status=400)
+        # ?resume=<run|latest> continues an interrupted run, ?retry_failed=<run|latest> reloads its failures
+        resume = request.args.get("resume") or None
+        retry_failed = request.args.get("retry_failed") or None
+        if resume or retry_failed:
+            try:
+                run_id = LoadCheckpoint().resolve(resume or retry_failed)
+            except CheckpointError as e:
+                return json_response({"status": "error", "message": str(e)}, status=404)
+            JOB_QUEUE.submit(load_all_data_job, resume=run_id if resume else None,
+                             retry_failed=run_id if retry_failed else None)
+            return json_response({"status": "success", "message": f"Load run {run_id} {'resumed' if resume else 'retrying failed stocks'}",
+                                  "run": run_id})
+        # Queued as a background job (its own trace, linked to this request)
+        JOB_QUEUE.submit(load_all_data_job, shard, shards)
+        
+        return json_response({"status": "success", "message": "Data loading initiated",
+                              "shard": shard, "shards": shards,
+                              "stocks": len(UNIVERSE.current().shard(shard, shards))})
         
     except Exception as e:
         logger.error(f"Error initiating data load: {e}")
-        return json.dumps({"status": "error", "message": str(e)})
+        return json_response({"status": "error", "message": str(e)})
 
 @app.route("/load-single/<stock>", methods=["POST"])
 def load_single_stock(stock):
@@ -1316,17 +2321,17 @@ def load_single_stock(stock):
                 "category": category,
                 "industry": industry
             }
-            return json.dumps(result)
+            return json_response(result)
         else:
             conn.close()
-            return json.dumps({
+            return json_response({
                 "status": "error", 
                 "message": f"No data found for {stock_code}. Please check if the stock code is correct."
             })
             
     except Exception as e:
         logger.error(f"Error loading single stock {stock}: {e}")
-        return json.dumps({"status": "error", "message": str(e)})
+        return json_response({"status": "error", "message": str(e)})
 
 @app.route("/test-scraper/<stock>")
 def test_scraper_route(stock):
@@ -1337,7 +2342,7 @@ def test_scraper_route(stock):
         
         # Test the scraping
         try:
-            response = requests.get(url, headers=HEADERS, timeout=30)
+            response = fetch_screener_page(url)
             response_status = response.status_code
             scraping_success = response.status_code == 200
         except Exception as e:
@@ -1357,11 +2362,11 @@ def test_scraper_route(stock):
             "category": category,
             "industry": industry,
             "sample_metrics": list(data.keys())[:10] if data else [],
-            "fallback_used": stock_code in FALLBACK_FINANCIAL_DATA,
-            "data_source": "fallback" if stock_code in FALLBACK_FINANCIAL_DATA and not scraping_success else "web_scraping"
+            "fallback_used": stock_code in fallback_financial_data(),
+            "data_source": "fallback" if stock_code in fallback_financial_data() and not scraping_success else "web_scraping"
         }
         
-        return f"<pre>{json.dumps(result, indent=2)}</pre>"
+        return f"<pre>{dumps(result, indent=True)}</pre>"
         
     except Exception as e:
         return f"<h2>Error testing scraper for {stock}: {e}</h2>"
@@ -1414,7 +2419,7 @@ def test_full_flow(stock):
             "quarters": quarters
         }
         
-        return f"<pre>{json.dumps(result, indent=2, default=str)}</pre>"
+        return f"<pre>{dumps(result, indent=True)}</pre>"
         
     except Exception as e:
         return f"<h2>Error in full flow test for {stock}: {e}</h2>"
@@ -1436,11 +2441,11 @@ def api_metrics_by_category(category):
         metrics = [row[0] for row in cur.fetchall()]
         conn.close()
         
-        return json.dumps({"category": category, "metrics": metrics})
+        return json_response({"category": category, "metrics": metrics})
         
     except Exception as e:
         logger.error(f"Error in API metrics by category: {e}")
-        return json.dumps({"error": str(e)})
+        return json_response({"error": str(e)})
 
 @app.route("/simple-quarterly/<stock>")
 def simple_quarterly_view(stock):
@@ -1448,8 +2453,9 @@ def simple_quarterly_view(stock):
     stock = stock.upper()
     
     # Check if stock exists in fallback data
-    if stock not in FALLBACK_FINANCIAL_DATA:
-        available_stocks = list(FALLBACK_FINANCIAL_DATA.keys())
+    fallback_data = fallback_financial_data()
+    if stock not in fallback_data:
+        available_stocks = list(islice(fallback_data.keys(), 20))
         return f"""
         <div style="font-family: Arial, sans-serif; max-width: 800px; margin: 50px auto; padding: 20px;">
             <h2>❌ Stock {stock} not available in simple view</h2>
@@ -1462,7 +2468,7 @@ def simple_quarterly_view(stock):
         """
     
     # Get stock data
-    stock_info = FALLBACK_FINANCIAL_DATA[stock]
+    stock_info = fallback_data[stock]
     data = stock_info["data"]
     quarters = stock_info["quarters"]
     category = stock_info["category"]
@@ -1531,7 +2537,7 @@ def simple_quarterly_view(stock):
     """
     
     # Add links to other stocks
-    for other_stock in FALLBACK_FINANCIAL_DATA.keys():
+    for other_stock in islice(fallback_data.keys(), 20):
         if other_stock != stock:
             color = "#007bff" if other_stock in ["RELIANCE", "TCS", "ITC"] else "#28a745" if other_stock in ["PIDILITIND", "CUMMINSIND"] else "#ffc107"
             text_color = "white" if color != "#ffc107" else "black"
@@ -1551,14 +2557,16 @@ def debug_fallback(stock):
     try:
         stock = stock.upper()
         
+        fallback_data = fallback_financial_data()
         debug_info = {
             "stock": stock,
-            "available_stocks": list(FALLBACK_FINANCIAL_DATA.keys()),
-            "stock_exists": stock in FALLBACK_FINANCIAL_DATA,
+            "fallback_source": fallback_source_name(),
+            "available_stocks": list(islice(fallback_data.keys(), 50)),
+            "stock_exists": stock in fallback_data,
         }
         
-        if stock in FALLBACK_FINANCIAL_DATA:
-            raw_data = FALLBACK_FINANCIAL_DATA[stock]
+        if stock in fallback_data:
+            raw_data = fallback_data[stock]
             debug_info["raw_data_type"] = type(raw_data).__name__
             debug_info["raw_data_keys"] = list(raw_data.keys()) if isinstance(raw_data, dict) else "Not a dict"
             debug_info["raw_data_sample"] = str(raw_data)[:500]
@@ -1589,7 +2597,7 @@ def debug_fallback(stock):
         except Exception as e:
             debug_info["function_test_error"] = str(e)
         
-        return f"<pre>{json.dumps(debug_info, indent=2, default=str)}</pre>"
+        return f"<pre>{dumps(debug_info, indent=True)}</pre>"
         
     except Exception as e:
         return f"<pre>Debug error: {str(e)}</pre>"
@@ -1648,8 +2656,9 @@ def diagnostic():
     
     # 4. Fallback Data Check
     try:
-        diagnostics["fallback_check"]["available_stocks"] = list(FALLBACK_FINANCIAL_DATA.keys())
-        diagnostics["fallback_check"]["count"] = len(FALLBACK_FINANCIAL_DATA)
+        fallback_data = fallback_financial_data()
+        diagnostics["fallback_check"]["available_stocks"] = list(islice(fallback_data.keys(), 50))
+        diagnostics["fallback_check"]["count"] = len(fallback_data)
         
         # Test one fallback
         data, quarters, category, industry = use_fallback_data("RELIANCE")
@@ -1664,13 +2673,11 @@ def diagnostic():
     # 5. Import Check
     try:
         import snowflake.connector
-        import pandas as pd
         import requests
         from bs4 import BeautifulSoup
         from flask import Flask, render_template, request
         
         diagnostics["import_check"]["snowflake"] = "✅ Available"
-        diagnostics["import_check"]["pandas"] = "✅ Available"
         diagnostics["import_check"]["requests"] = "✅ Available"
         diagnostics["import_check"]["beautifulsoup"] = "✅ Available"
         diagnostics["import_check"]["flask"] = "✅ Available"
@@ -1701,9 +2708,10 @@ def diagnostic():
     
     diagnostics["recommendations"] = recommendations
     
-    return f"<pre>{json.dumps(diagnostics, indent=2, default=str)}</pre>"
+    return f"<pre>{dumps(diagnostics, indent=True)}</pre>"
 
 # ------------------- Fallback Data for Testing -------------------
+# Built-in sample, used only until a matrix store (snapshot or warehouse) is loaded
 FALLBACK_FINANCIAL_DATA = {
     # Large Cap Stocks
     "RELIANCE": {
@@ -1817,11 +2825,36 @@ FALLBACK_FINANCIAL_DATA = {
     }
 }
 
+def fallback_financial_data() -> Mapping[str, Dict]:
+    """Degraded-mode data: the loaded matrix store (snapshot or warehouse), else the built-in sample above"""
+    store = _MATRIX_STORE
+    if store is not None and store.ready:
+        from matrix_store import FallbackView
+        return FallbackView(store)
+    return FALLBACK_FINANCIAL_DATA
+
+def fallback_sector_codes(fallback_data: Mapping[str, Dict]) -> Dict[str, List[str]]:
+    """Stock codes per sector category without building every fallback entry"""
+    sector_codes = getattr(fallback_data, "sector_codes", None)
+    if sector_codes is not None:
+        return sector_codes()
+    grouped: Dict[str, List[str]] = {}
+    for stock_code, stock_info in fallback_data.items():
+        grouped.setdefault(stock_info["category"], []).append(stock_code)
+    return grouped
+
+def fallback_source_name() -> str:
+    store = _MATRIX_STORE
+    if store is not None and store.ready:
+        return "Warehouse snapshot" if store.source == "snapshot" else "In-memory warehouse copy"
+    return "Built-in fallback data"
+
 def use_fallback_data(stock_code: str) -> Tuple[Dict, List, str, str]:
     """Use fallback data when web scraping fails"""
     try:
-        if stock_code in FALLBACK_FINANCIAL_DATA:
-            fallback_entry = FALLBACK_FINANCIAL_DATA[stock_code]
+        fallback_data = fallback_financial_data()
+        if stock_code in fallback_data:
+            fallback_entry = fallback_data[stock_code]
             
             # Validate structure
             if not isinstance(fallback_entry, dict):
@@ -1849,6 +2882,7 @@ def use_fallback_data(stock_code: str) -> Tuple[Dict, List, str, str]:
                 return {}, [], "", ""
             
             logger.info(f"Using fallback data for {stock_code}: {len(data)} metrics, {len(quarters)} quarters")
+            FALLBACK_TOTAL.inc(reason="financial_data")
             return data, quarters, category, industry
         else:
             logger.warning(f"No fallback data available for {stock_code}")
@@ -1860,6 +2894,7 @@ def use_fallback_data(stock_code: str) -> Tuple[Dict, List, str, str]:
 
 def serve_fallback_quarterly_view(stock: str):
     """Serve quarterly view using only fallback data (no database required)"""
+    FALLBACK_TOTAL.inc(reason="quarterly_view")
     try:
         # Get fallback data
         data, quarters, category, industry = use_fallback_data(stock)
@@ -1881,9 +2916,6 @@ def serve_fallback_quarterly_view(stock: str):
             </div>
             """
         
-        # Process fallback data for display
-        categorized_data = {}
-        
         # Ensure data is a dictionary
         if not isinstance(data, dict):
             logger.error(f"Fallback data for {stock} is not a dictionary: {type(data)}")
@@ -1898,44 +2930,24 @@ def serve_fallback_quarterly_view(stock: str):
             </div>
             """
         
-        for metric, values in data.items():
-            # Categorize the metric
-            metric_category = categorize_metric(metric)
-            
-            if metric_category not in categorized_data:
-                categorized_data[metric_category] = {}
-            
-            # Ensure values is a list
-            if not isinstance(values, list):
-                logger.warning(f"Values for {metric} is not a list: {type(values)}")
-                values = [str(values)]  # Convert to list if it's not
-            
-            # Clean values 
-            cleaned_values = []
-            for value in values:
-                cleaned_value = clean_value(str(value))
-                if cleaned_value:
-                    cleaned_values.append(cleaned_value)
-                else:
-                    cleaned_values.append(str(value))  # Keep original if cleaning fails
-            
-            categorized_data[metric_category][metric] = cleaned_values
+        categories = fallback_category_index(stock)
         
         # Add notice about fallback data
         fallback_notice = f"""
         <div class="alert alert-info mb-4">
             <h5>📊 Displaying Sample Data for {stock}</h5>
             <p><strong>Note:</strong> Database connection unavailable. Showing sample financial data for demonstration.</p>
-            <p><strong>Data Source:</strong> Built-in fallback data | <strong>Category:</strong> {category} | <strong>Industry:</strong> {industry}</p>
+            <p><strong>Data Source:</strong> {fallback_source_name()} | <strong>Category:</strong> {category} | <strong>Industry:</strong> {industry}</p>
         </div>
         """
         
         # Render the template with fallback data
+        max_points = parse_max_points(request.args.get("max_points"))
         quarterly_html = render_template("quarterly.html",
                                        stock=stock,
                                        quarters=quarters,
-                                       financial_data=json.dumps(categorized_data),
-                                       metric_categories=categorized_data)
+                                       categories=categories,
+                                       series_url=url_for("api_stock_series", stock=stock, max_points=max_points))
         
         # Inject the notice into the HTML
         if '<div class="container">' in quarterly_html:
@@ -1969,6 +2981,13 @@ if __name__ == '__main__':
     parser.add_argument('--load-data', action='store_true', help='Load all stock data')
     parser.add_argument('--run-app', action='store_true', help='Run Flask application')
     parser.add_argument('--test-single', type=str, help='Test scraping for a single stock')
+    parser.add_argument('--shard', type=int, default=0, help='Universe shard to load (0-based, with --load-data)')
+    parser.add_argument('--shards', type=int, default=1, help='Number of universe shards (one per ingest worker)')
+    parser.add_argument('--batch-size', type=int, default=UNIVERSE_BATCH_SIZE, help='Stocks per ingest batch')
+    parser.add_argument('--resume', nargs='?', const='latest', metavar='RUN_ID',
+                        help='With --load-data: continue an interrupted load run (default: the newest)')
+    parser.add_argument('--retry-failed', nargs='?', const='latest', metavar='RUN_ID',
+                        help='With --load-data: reload only the failed stocks of a run (default: the newest)')
     
     args = parser.parse_args()
     
@@ -1979,7 +2998,10 @@ if __name__ == '__main__':
         for metric in sorted(data.keys()):
             print(f"  - {metric}: {categorize_metric(metric)}")
     elif args.load_data:
-        load_all_data()
+        try:
+            load_all_data(args.shard, args.shards, args.batch_size, args.resume, args.retry_failed)
+        except CheckpointError as e:
+            parser.error(str(e))
     elif args.run_app:
         app.run(debug=True, host='0.0.0.0', port=5000)
     else:
@@ -0,0 +1,90 @@
+# tests/conftest.py
+"""
+Shared fixtures: the app runs against the SQLite fake warehouse
+(loadtest/fake_warehouse.py) with Snowflake credentials blanked, so no test
+can reach a real warehouse or screener.in.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE_HTML = os.path.join(APP_DIR, "benchmarks", "fixtures", "screener_SYNTHETIC.html")
+_WORK_DIR = tempfile.mkdtemp(prefix="pam-tests-")
+
+# Set before stock_recommender is imported; load_dotenv() does not override existing variables
+os.environ.update({
+    "SNOWFLAKE_USER": "", "SNOWFLAKE_PASSWORD": "", "SNOWFLAKE_ACCOUNT": "",
+    "WAREHOUSE_CONNECTOR": "fake_warehouse:connect",
+    "FAKE_WAREHOUSE_PATH": os.path.join(_WORK_DIR, "warehouse.sqlite3"),
+    "SCREENER_URL": "http://127.0.0.1:9/company/{}/consolidated/",
+    "WARMUP_ENABLED": "0",
+    "ARCHIVE_ENABLED": "0",
+    "TRAFFIC_FILE": os.path.join(_WORK_DIR, "traffic.json"),
+    "CHECKPOINT_PATH": os.path.join(_WORK_DIR, "checkpoints.db"),
+    "ARCHIVE_DIR": os.path.join(_WORK_DIR, "archive"),
+})
+for path in (APP_DIR, os.path.join(APP_DIR, "loadtest")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    import stock_recommender
+    stock_recommender.create_snowflake_table()
+    stock_recommender.load_metric_registry()
+    return stock_recommender
+
+
+@pytest.fixture(scope="session")
+def fixture_page() -> bytes:
+    with open(FIXTURE_HTML, "rb") as f:
+        return f.read()
+
+
+@pytest.fixture(scope="session")
+def ingested(app_module, fixture_page):
+    """The synthetic screener page ingested as SYNTHETIC; returns the stock code"""
+    financials, quarters, category, industry = app_module.parse_financial_page(fixture_page, "SYNTHETIC")
+    conn = app_module.snowflake_connect()
+    try:
+        app_module.insert_quarterly_to_snowflake(conn, "SYNTHETIC", financials, quarters, category, industry)
+    finally:
+        conn.close()
+    return "SYNTHETIC"
+
+
+@pytest.fixture
+def warehouse(app_module):
+    conn = app_module.snowflake_connect()
+    try:
+        yield conn.cursor()
+    finally:
+        conn.close()
+
+
+@pytest.fixture(scope="session")
+def matrix_store(app_module, ingested):
+    """A MatrixStore holding only the ingested fixture stock (other tests add stocks to the warehouse)"""
+    from matrix_store import FinancialMatrix, MatrixStore
+    from star_schema import StockInfo, stock_id
+    conn = app_module.snowflake_connect()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT INDUSTRY, CATEGORY FROM DIM_STOCK WHERE STOCK_ID = %s", (stock_id(ingested),))
+        industry, category = cur.fetchone()
+        cur.execute("""
+            SELECT f.METRIC_ID, p.QUARTER, f.VALUE FROM FACT_FINANCIALS f
+            JOIN DIM_PERIOD p ON p.PERIOD_ID = f.PERIOD_ID
+            WHERE f.STOCK_ID = %s
+        """, (stock_id(ingested),))
+        facts = [(int(mid), label, float(value)) for mid, label, value in cur.fetchall()]
+    finally:
+        conn.close()
+    store = MatrixStore(app_module.METRIC_REGISTRY)
+    store.publish(FinancialMatrix.empty(), "tests")
+    store.upsert(StockInfo(stock_id(ingested), ingested, industry, category), facts)
+    return store
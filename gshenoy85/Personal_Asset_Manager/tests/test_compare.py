@@ -0,0 +1,17 @@
+# tests/test_compare.py
+from warmup import StockTraffic
+
+
+def test_compare_defaults_to_registered_metric_names(app_module, ingested):
+    page = app_module.app.test_client().get("/compare").get_data(as_text=True)
+    assert 'value="Sales +,Net Profit +"' in page
+
+
+def test_batch_series_resolves_names_and_records_only_known_codes(app_module, ingested, monkeypatch, tmp_path):
+    traffic = StockTraffic(path=str(tmp_path / "traffic.json"), known=app_module.is_known_stock)
+    monkeypatch.setattr(app_module, "STOCK_TRAFFIC", traffic)
+    response = app_module.app.test_client().get("/api/v1/stocks/series?codes=RELIANCE,NOSUCHCODE,SYNTHETIC"
+                                                "&metrics=Sales")
+    assert response.status_code == 200
+    assert response.get_json()["metrics"] == ["Sales +"]
+    assert traffic.top(10) == ["RELIANCE"]
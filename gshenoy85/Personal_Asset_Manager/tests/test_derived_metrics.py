@@ -0,0 +1,33 @@
+# tests/test_derived_metrics.py
+import numpy as np
+
+from derived_metrics import DERIVED_CATALOG, compute_derived, input_names
+from metric_registry import metric_id
+from star_schema import stock_id
+
+
+def test_scraped_expander_names_feed_the_catalogue(warehouse, ingested):
+    derived_ids = {metric_id(metric.name): metric.name for metric in DERIVED_CATALOG}
+    warehouse.execute(f"""
+        SELECT METRIC_ID, COUNT(*) FROM FACT_FINANCIALS
+        WHERE STOCK_ID = %s AND METRIC_ID IN ({",".join(["%s"] * len(derived_ids))})
+        GROUP BY METRIC_ID
+    """, (stock_id(ingested), *derived_ids))
+    counts = {derived_ids[int(mid)]: n for mid, n in warehouse.fetchall()}
+    # 13 quarters: 12 QoQ points, 9 YoY points, every quarter has a margin
+    assert counts["Sales QoQ Growth %"] == 12
+    assert counts["Net Profit YoY Growth %"] == 9
+    assert counts["Operating Margin %"] == 13
+    assert counts["Net Margin %"] == 13
+    assert counts["Sales TTM"] >= 10
+
+
+def test_compute_derived_growth_and_margin():
+    names = input_names()
+    grid = np.full((1, len(names), 4), np.nan)
+    grid[0, names.index("Sales"), :] = [100.0, np.nan, np.nan, 110.0]
+    grid[0, names.index("Net Profit"), 3] = 11.0
+    derived = compute_derived(grid, names)
+    assert derived["Sales QoQ Growth %"][0, 3] == 10.0
+    assert derived["Net Margin %"][0, 3] == 10.0
+    assert np.isnan(derived["Sales QoQ Growth %"][0, 0])
@@ -0,0 +1,37 @@
+# tests/test_downsampling.py
+import numpy as np
+
+from downsampling import downsample_series, lttb_indices
+
+
+def quarter_labels(n):
+    return [f"Q{i:03d}" for i in range(n)]
+
+
+def test_shared_axis_never_exceeds_max_points():
+    rng = np.random.default_rng(7)
+    quarters = quarter_labels(40)
+    series = {f"metric {m}": [float(v) for v in rng.normal(size=40).cumsum()] for m in range(30)}
+    series["metric 0"][5] = None
+    for max_points in (3, 10, 25):
+        new_quarters, new_series = downsample_series(quarters, series, max_points)
+        assert len(new_quarters) <= max_points
+        assert new_quarters == sorted(new_quarters)
+        assert new_quarters[0] == quarters[0] and new_quarters[-1] == quarters[-1]
+        assert all(len(values) == len(new_quarters) for values in new_series.values())
+
+
+def test_a_spike_in_one_small_series_survives():
+    quarters = quarter_labels(50)
+    flat = [float(i) * 1000 for i in range(50)]
+    spiky = [1.0] * 50
+    spiky[23] = 5.0
+    new_quarters, new_series = downsample_series(quarters, {"Sales": flat, "OPM %": spiky}, 10)
+    assert "Q023" in new_quarters
+    assert new_series["OPM %"][new_quarters.index("Q023")] == 5.0
+
+
+def test_periods_without_any_value_are_dropped():
+    y = np.array([[np.nan, 1.0, 2.0, np.nan, 3.0, 1.0, 4.0, np.nan]])
+    assert list(lttb_indices(y, 10)) == [1, 2, 4, 5, 6]
+    assert set(lttb_indices(y, 3)) <= {1, 2, 4, 5, 6}
@@ -0,0 +1,36 @@
+# tests/test_html_archive.py
+from html_archive import HtmlArchive, reextract
+from metric_registry import metric_id
+from star_schema import period_id, stock_id
+
+
+def stored_facts(cur, code):
+    cur.execute("SELECT METRIC_ID, PERIOD_ID FROM FACT_FINANCIALS WHERE STOCK_ID = %s", (stock_id(code),))
+    return {(int(mid), int(pid)) for mid, pid in cur.fetchall()}
+
+
+def test_prune_keeps_quarters_that_rolled_off_the_page(app_module, fixture_page, warehouse, tmp_path):
+    code = "ARCHIVED"
+    archive = HtmlArchive(str(tmp_path / "archive"))
+    archive.store(code, "http://screener.test/company/ARCHIVED/", fixture_page)
+    financials, quarters, category, industry = app_module.parse_financial_page(fixture_page, code)
+    conn = app_module.snowflake_connect()
+    try:
+        app_module.insert_quarterly_to_snowflake(conn, code, financials, quarters, category, industry)
+        # An older quarter no longer on the page, and a misnamed value in one of the page's quarters
+        app_module.merge_stock_facts(conn, code, category, industry,
+                                     [(metric_id("Sales +"), "Sep 2021", 150000.0),
+                                      (metric_id("Sales Misparsed"), "Dec 2024", 1.0)],
+                                     ["Sales +", "Sales Misparsed"])
+    finally:
+        conn.close()
+
+    summary = reextract(archive, [code], workers=1, prune=True)
+    assert summary["errors"] == []
+    assert summary["facts_pruned"] == 1
+    facts = stored_facts(warehouse, code)
+    assert (metric_id("Sales +"), period_id("Sep 2021")) in facts
+    assert (metric_id("Sales Misparsed"), period_id("Dec 2024")) not in facts
+
+    # A second pass has nothing left to do
+    assert reextract(archive, [code], workers=1, prune=True)["unchanged"] == 1
@@ -0,0 +1,57 @@
+# tests/test_load_checkpoint.py
+import requests
+
+from checkpoint import FAILED, MERGED, LoadCheckpoint
+from tracing import MEMORY_EXPORTER
+
+
+def fake_response(status: int, content: bytes) -> requests.Response:
+    res = requests.Response()
+    res.status_code = status
+    res._content = content
+    res.url = "http://screener.test/"
+    return res
+
+
+def test_failed_fetches_are_checkpointed_as_failed(app_module, fixture_page, monkeypatch):
+    pages = {"RELIANCE": fake_response(404, b"Not found"), "BLANKPAGE": fake_response(200, b"<html></html>"),
+             "FIXTURE": fake_response(200, fixture_page)}
+
+    def fetch(url, priority=True):
+        assert not priority  # bulk loads yield to interactive fetches
+        if "DOWN" in url:
+            raise requests.ConnectionError("connection refused")
+        return next(res for code, res in pages.items() if f"/{code}/" in url)
+    monkeypatch.setattr(app_module, "fetch_screener_page", fetch)
+
+    checkpoint = LoadCheckpoint()
+    run_id = checkpoint.start(["RELIANCE", "BLANKPAGE", "DOWN", "FIXTURE"])
+    MEMORY_EXPORTER.clear()
+    app_module.load_all_data(resume=run_id)
+
+    # One trace for the run, with a child span per stock
+    root = MEMORY_EXPORTER.slowest(1)[0]
+    assert root["name"] == "load_all_data"
+    spans = MEMORY_EXPORTER.get_trace(root["trace_id"])
+    assert sum(span["name"] == "ingest_stock" for span in spans) == 4
+
+    status = checkpoint.status(run_id)
+    # RELIANCE has built-in fallback data, which must not be merged in its place
+    assert status["counts"][MERGED] == 1 and status["counts"][FAILED] == 3
+    assert {f["stock"]: f["reason"] for f in status["failures"]} == {
+        "RELIANCE": "HTTP 404",
+        "BLANKPAGE": "no data extracted",
+        "DOWN": "ConnectionError: connection refused",
+    }
+
+
+def test_runs_started_together_get_distinct_ids():
+    checkpoint = LoadCheckpoint()
+    first, second = checkpoint.start(["TCS"]), checkpoint.start(["ITC"])
+    assert first != second
+    assert checkpoint.remaining(first) == ["TCS"] and checkpoint.remaining(second) == ["ITC"]
+
+
+def test_background_job_reports_unknown_run(app_module, caplog):
+    assert app_module.load_all_data_job(resume="load-19700101-000000-000000") is None
+    assert "No load run load-19700101-000000-000000" in caplog.text
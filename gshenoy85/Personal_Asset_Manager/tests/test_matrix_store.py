@@ -0,0 +1,47 @@
+# tests/test_matrix_store.py
+import pytest
+
+from matrix_store import MatrixStore
+from star_schema import StockInfo
+
+
+def test_failed_load_releases_the_refresh(app_module, monkeypatch):
+    store = MatrixStore(app_module.METRIC_REGISTRY)
+    monkeypatch.setattr(app_module, "_MATRIX_STORE", store)
+    monkeypatch.setattr(app_module, "MATRIX_STORE_ENABLED", True)
+
+    def broken_load(cur):
+        store._replay = []
+        raise MemoryError("matrix too large")
+    monkeypatch.setattr(store, "load", broken_load)
+
+    assert store.begin_refresh()
+    with pytest.raises(MemoryError):
+        app_module.load_matrix_store()
+    # Ingests are no longer buffered and the next refresh can be claimed
+    store.upsert(StockInfo(1, "X", "", ""), [(1, "Dec 2024", 1.0)])
+    assert store._replay is None
+    store._last_refresh = 0.0
+    assert store.begin_refresh()
+
+
+def test_sector_view_builds_only_sector_entries(app_module, monkeypatch):
+    from matrix_store import FinancialMatrix
+    store = MatrixStore(app_module.METRIC_REGISTRY)
+    store.publish(FinancialMatrix.empty(), "tests")
+    store.upsert(StockInfo(1, "BANKCO", "Private Bank", "Banking"), [(1, "Dec 2024", 1.0)])
+    store.upsert(StockInfo(2, "STEELCO", "Steel", "Metals"), [(1, "Dec 2024", 2.0)])
+    monkeypatch.setattr(app_module, "_MATRIX_STORE", store)
+    built = []
+    stock_financials = store.stock_financials
+
+    def counting(stock_code):
+        built.append(stock_code)
+        return stock_financials(stock_code)
+    monkeypatch.setattr(store, "stock_financials", counting)
+
+    assert app_module.fallback_financial_data().sector_codes() == {"Banking": ["BANKCO"], "Metals": ["STEELCO"]}
+    assert "STEELCO" in app_module.serve_fallback_sector_view("metals")
+    assert built == ["STEELCO"]
+    assert "Banking" in app_module.serve_fallback_sector_view("No Such Sector")
+    assert built == ["STEELCO"]
@@ -0,0 +1,65 @@
+# tests/test_metric_registry.py
+import pytest
+
+from metric_registry import MetricRegistry
+
+
+class RecordingCursor:
+    def __init__(self, rows=()):
+        self.statements = []
+        self.rows = list(rows)
+
+    def execute(self, statement, params=None):
+        self.statements.append((" ".join(statement.split()), params))
+
+    def fetchall(self):
+        return self.rows
+
+
+def merged_names(cur):
+    return [params[i] for statement, params in cur.statements if statement.startswith("MERGE INTO DIM_METRIC")
+            for i in range(1, len(params), 5)]
+
+
+def test_rows_of_a_rolled_back_transaction_are_persisted_again():
+    registry = MetricRegistry(lambda name: "Other")
+    registry.register(["Sales +"])
+    cur = RecordingCursor()
+    with pytest.raises(RuntimeError):
+        with registry.transaction():
+            registry.persist(cur)
+            raise RuntimeError("commit failed")
+    assert merged_names(cur) == ["Sales +"]
+
+    retry = RecordingCursor()
+    with registry.transaction():
+        assert registry.persist(retry) == 1
+    assert merged_names(retry) == ["Sales +"]
+    assert registry.persist(RecordingCursor()) == 0
+
+
+def test_nested_failure_requeues_once():
+    registry = MetricRegistry(lambda name: "Other")
+    registry.register(["A"])
+    with pytest.raises(RuntimeError):
+        with registry.transaction():
+            with registry.transaction():
+                registry.persist(RecordingCursor())
+            raise RuntimeError("outer rollback")
+    retry = RecordingCursor()
+    assert registry.persist(retry) == 1
+    assert merged_names(retry) == ["A"]
+
+
+def test_names_refused_when_full_are_not_registered():
+    registry = MetricRegistry(lambda name: "Other", max_metrics=1)
+    infos = registry.register(["Sales +", "Net Profit +"])
+    assert [info.name for info in registry.registered(infos)] == ["Sales +"]
+
+
+def test_load_reads_only_dim_metric():
+    registry = MetricRegistry(lambda name: "Other")
+    cur = RecordingCursor()
+    assert registry.load(cur) == 0
+    assert [statement for statement, _ in cur.statements] == [
+        "SELECT METRIC_ID, METRIC_NAME, METRIC_CATEGORY, FIRST_SEEN, LAST_SEEN FROM DIM_METRIC"]
@@ -0,0 +1,112 @@
+# tests/test_parquet_dataset.py
+import json
+import os
+
+import numpy as np
+import pytest
+
+import fake_warehouse
+from matrix_store import MatrixStore
+from metric_registry import MetricRegistry
+from star_schema import ensure_star_schema, write_stock_facts
+
+pytest.importorskip("pyarrow")
+from parquet_dataset import MANIFEST_NAME, export_dataset, import_dataset  # noqa: E402
+
+STOCKS = [("TCS", "IT Services", "Large Cap"), ("INFY", "IT Services", "Large Cap"),
+          ("TINYCO", "Chemicals", "Small Cap")]
+QUARTERS = ["Sep 2023", "Dec 2023", "Mar 2024", "Jun 2024"]
+METRICS = ["Sales +", "OPM %", "Net Profit +"]
+FACTS = len(STOCKS) * len(QUARTERS) * len(METRICS)
+
+
+def open_warehouse(path):
+    conn = fake_warehouse.connect(path)
+    ensure_star_schema(conn.cursor())
+    conn.commit()
+    return conn
+
+
+def fact_count(path) -> int:
+    conn = fake_warehouse.connect(path)
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*) FROM FACT_FINANCIALS")
+        return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    """A source warehouse with FACTS facts, exported in 5-row chunks"""
+    conn = open_warehouse(str(tmp_path / "source.sqlite3"))
+    cur = conn.cursor()
+    registry = MetricRegistry(lambda name: "Profit & Loss")
+    infos = registry.register(METRICS)
+    registry.persist(cur)
+    for n, (code, industry, sector) in enumerate(STOCKS):
+        write_stock_facts(cur, code, industry, sector,
+                          [(info.metric_id, quarter, float(n * 100 + q * 10 + m))
+                           for m, info in enumerate(infos) for q, quarter in enumerate(QUARTERS)])
+    conn.commit()
+    out_dir = str(tmp_path / "export")
+    manifest = export_dataset(cur, out_dir, chunk_rows=5)
+    conn.close()
+    return out_dir, manifest
+
+
+def test_export_writes_one_file_per_year_and_sector(dataset):
+    out_dir, manifest = dataset
+    assert manifest["rows"] == FACTS
+    assert [entry["path"] for entry in manifest["files"]] == [
+        os.path.join("period_year=2023", "sector=Large%20Cap", "part-0.parquet"),
+        os.path.join("period_year=2023", "sector=Small%20Cap", "part-0.parquet"),
+        os.path.join("period_year=2024", "sector=Large%20Cap", "part-0.parquet"),
+        os.path.join("period_year=2024", "sector=Small%20Cap", "part-0.parquet"),
+    ]
+    assert sum(entry["rows"] for entry in manifest["files"]) == FACTS
+    assert all(os.path.isfile(os.path.join(out_dir, entry["path"])) for entry in manifest["files"])
+    assert {metric["name"] for metric in manifest["metrics"]} == set(METRICS)
+
+
+def test_import_into_the_warehouse(dataset, tmp_path):
+    out_dir, _ = dataset
+    target = str(tmp_path / "target.sqlite3")
+    open_warehouse(target).close()
+    registry = MetricRegistry(lambda name: "Other")
+
+    summary = import_dataset(out_dir, "warehouse", registry, connect=lambda: fake_warehouse.connect(target),
+                             workers=2)
+    assert summary["errors"] == [] and summary["rows"] == FACTS
+    assert fact_count(target) == FACTS
+    conn = fake_warehouse.connect(target)
+    cur = conn.cursor()
+    cur.execute("SELECT METRIC_NAME, METRIC_CATEGORY FROM DIM_METRIC")
+    assert sorted(cur.fetchall()) == sorted((name, "Profit & Loss") for name in METRICS)
+    conn.close()
+
+
+def test_import_into_the_matrix_store(dataset):
+    out_dir, _ = dataset
+    store = MatrixStore(MetricRegistry(lambda name: "Other"))
+    summary = import_dataset(out_dir, "store", store.registry, store=store, workers=2)
+    assert summary["errors"] == [] and summary["rows"] == FACTS
+    matrix = store.matrix
+    assert matrix.shape == (len(STOCKS), len(METRICS), len(QUARTERS))
+    assert int(np.count_nonzero(~np.isnan(matrix.data))) == FACTS
+    assert store.registry.lookup("OPM %").category == "Profit & Loss"
+
+
+def test_file_with_a_bad_checksum_is_reported(dataset):
+    out_dir, manifest = dataset
+    bad = manifest["files"][0]
+    bad["sha256"] = "0" * 64
+    with open(os.path.join(out_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+    store = MatrixStore(MetricRegistry(lambda name: "Other"))
+    summary = import_dataset(out_dir, "store", store.registry, store=store)
+    assert [error["path"] for error in summary["errors"]] == [bad["path"]]
+    assert "checksum" in summary["errors"][0]["error"]
+    assert summary["rows"] == FACTS - bad["rows"]
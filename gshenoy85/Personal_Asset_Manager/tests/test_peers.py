@@ -0,0 +1,17 @@
+# tests/test_peers.py
+from peers import PEER_FEATURES, PEER_MIN_FEATURES, PeerService
+
+
+def test_index_covers_the_ingested_fixture(matrix_store):
+    service = PeerService()
+    service.rebuild(matrix_store)
+    stats = service.stats()
+    assert stats["indexed"] == 1
+    assert len(stats["features"]) >= PEER_MIN_FEATURES
+    assert stats["unavailable_features"] == []
+
+    payload = service.peers(matrix_store, "synthetic")
+    assert payload is not None
+    assert payload["features"] == [name for name, _ in PEER_FEATURES]
+    assert all(value is not None for value in payload["profile"].values())
+    assert payload["peers"] == []
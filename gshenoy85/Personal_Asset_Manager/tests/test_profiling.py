@@ -0,0 +1,26 @@
+# tests/test_profiling.py
+import pytest
+
+import profiling
+from profiling import TOKEN_HEADER, ProfileStore
+
+TOKEN = "test-admin-token"
+
+
+@pytest.fixture
+def profiles(app_module, monkeypatch, tmp_path):
+    store = ProfileStore(str(tmp_path))
+    profile_id = store.save({"main;work": 3}, {"method": "GET", "path": "/"})
+    monkeypatch.setattr(app_module, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(app_module, "PROFILE_STORE", store)
+    monkeypatch.setattr(profiling, "PROFILE_ADMIN_TOKEN", TOKEN)
+    return profile_id
+
+
+def test_admin_token_is_only_accepted_as_a_header(app_module, profiles):
+    client = app_module.app.test_client()
+    for path in ("/debug/profiles", f"/debug/profiles/{profiles}", f"/debug/profiles/{profiles}.folded"):
+        assert client.get(f"{path}?token={TOKEN}").status_code == 403
+        response = client.get(path, headers={TOKEN_HEADER: TOKEN})
+        assert response.status_code == 200
+        assert TOKEN not in response.get_data(as_text=True)
@@ -0,0 +1,64 @@
+# tests/test_rate_control.py
+import time
+
+import pytest
+
+from rate_control import AIMDController, ThrottledError
+
+
+def test_priority_requests_skip_the_bulk_queue():
+    controller = AIMDController(rate=1.0, max_concurrency=1)
+    controller.acquire()  # one bulk fetch in flight fills the concurrency limit
+    started = time.monotonic()
+    controller.release(controller.acquire(priority=True), 200)
+    assert time.monotonic() - started < 0.1
+    # The interactive fetch took the next paced slot from bulk traffic
+    assert controller._next_start - started > 1.5
+
+
+def test_priority_requests_honour_retry_after():
+    controller = AIMDController(rate=100.0)
+    controller.release(controller.acquire(), 429, retry_after=0.3)
+    started = time.monotonic()
+    controller.acquire(priority=True)
+    assert time.monotonic() - started >= 0.25
+
+
+def test_limits_are_split_between_processes():
+    controller = AIMDController(rate=2.0, max_rate=10.0, step=0.1, max_concurrency=8, processes=4)
+    assert controller.rate == 0.5
+    assert controller.max_rate == 2.5
+    assert controller.max_concurrency == 2
+
+
+def test_priority_requests_do_not_wait_out_a_long_retry_after():
+    controller = AIMDController(rate=100.0, priority_wait=1.0)
+    controller.release(controller.acquire(), 429, retry_after=300)
+    started = time.monotonic()
+    with pytest.raises(ThrottledError) as raised:
+        controller.acquire(priority=True)
+    assert time.monotonic() - started < 0.1
+    assert raised.value.wait > 290
+
+
+def test_throttled_page_view_fails_fast(app_module, monkeypatch):
+    import requests
+    calls = []
+
+    def get(url, **kwargs):
+        calls.append(url)
+        res = requests.Response()
+        res.status_code, res._content, res.url = 429, b"", url
+        res.headers["Retry-After"] = "3600"
+        return res
+    monkeypatch.setattr(requests, "get", get)
+    monkeypatch.setattr(app_module, "SCREENER_RATE", AIMDController(rate=100.0, priority_wait=1.0))
+
+    started = time.monotonic()
+    with pytest.raises(app_module.ScrapeError, match="HTTP 429"):
+        app_module.get_financial_data("TCS", fallback=False)
+    with pytest.raises(app_module.ScrapeError, match="pause"):
+        app_module.get_financial_data("TCS", fallback=False)
+    assert time.monotonic() - started < 1.0
+    # The 429 was not retried and the second view did not reach screener.in
+    assert len(calls) == 1
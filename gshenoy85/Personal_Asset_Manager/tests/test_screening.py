@@ -0,0 +1,55 @@
+# tests/test_screening.py
+import pytest
+
+from screening import SCORING_MODELS, ScreenError, compile_expression, parse_scoring, screen
+
+
+def codes(payload):
+    return [row["code"] for row in payload["results"]]
+
+
+def test_percent_metrics_compare_as_percents(matrix_store):
+    # Latest ROCE % is 0.3 as stored (30%), latest OPM % 0.083 (8.3%)
+    assert codes(screen(matrix_store, "ROCE % > 20")) == ["SYNTHETIC"]
+    assert codes(screen(matrix_store, "ROCE % > 35")) == []
+    payload = screen(matrix_store, "OPM % > 8% and OPM % < 9%")
+    assert codes(payload) == ["SYNTHETIC"]
+    assert payload["results"][0]["values"]["OPM %"] == pytest.approx(8.3)
+
+
+def test_bare_names_match_scraped_expander_rows(matrix_store):
+    payload = screen(matrix_store, "Sales QoQ growth > 5%")
+    assert payload["matched"] == 0
+    payload = screen(matrix_store, "Sales QoQ growth < 0 and Net Profit / Sales * 100 > 100")
+    assert codes(payload) == ["SYNTHETIC"]
+    values = payload["results"][0]["values"]
+    assert values["Sales + QoQ growth"] == pytest.approx((4687 - 125350) / 125350 * 100, rel=1e-5)
+
+
+def test_growth_suffix_after_bracketed_name(matrix_store):
+    node = compile_expression("[Sales +] YoY growth", matrix_store.registry)
+    assert node.label == "Sales + YoY growth"
+    assert codes(screen(matrix_store, "[Sales +] YoY growth < -90")) == ["SYNTHETIC"]
+
+
+@pytest.mark.parametrize("model", sorted(SCORING_MODELS))
+def test_named_models_score(matrix_store, model):
+    payload = screen(matrix_store, scoring=model)
+    assert codes(payload) == ["SYNTHETIC"]
+    assert payload["results"][0]["score"] is not None
+
+
+def test_custom_models_still_reject_unknown_metrics(matrix_store):
+    with pytest.raises(ScreenError, match="Unknown metric"):
+        parse_scoring("ROCE %:1, No Such Metric:1", matrix_store.registry)
+
+
+@pytest.mark.parametrize("text, error", [
+    ("ROCE % >", "Unexpected"),
+    ("(ROCE % > 1", r"Expected '\)'"),
+    ("ROCE % and OPM % > 1", "Expected a comparison"),
+    ("ROCE % ! 1", "Unexpected character"),
+])
+def test_parser_errors(matrix_store, text, error):
+    with pytest.raises(ScreenError, match=error):
+        screen(matrix_store, text)
@@ -0,0 +1,94 @@
+# tests/test_snapshot.py
+import struct
+
+import numpy as np
+import pytest
+
+from matrix_store import DTYPE, MatrixStore
+from metric_registry import MetricRegistry
+from snapshot import (
+    FORMAT_VERSION, MAGIC, SnapshotError, export_snapshot, load_snapshot, open_snapshot, read_header
+)
+from star_schema import StockInfo
+
+
+@pytest.fixture
+def snapshot_path(matrix_store, tmp_path):
+    path = str(tmp_path / "financials.snap")
+    export_snapshot(matrix_store, path)
+    return path
+
+
+def test_round_trip_keeps_shape_dtypes_and_labels(matrix_store, snapshot_path):
+    source = matrix_store.matrix
+    snapshot = open_snapshot(snapshot_path)
+    assert snapshot.header["format"] == FORMAT_VERSION
+    assert snapshot.header["shape"] == list(source.shape)
+    assert isinstance(snapshot.columns["values"], np.memmap)
+    assert snapshot.columns["values"].dtype == DTYPE
+    assert snapshot.columns["stock_ids"].dtype == np.int64
+
+    store = MatrixStore(MetricRegistry(lambda name: "Other"))
+    header = load_snapshot(store, snapshot_path)
+    matrix = store.matrix
+    assert header["facts"] == int(np.count_nonzero(~np.isnan(source.data)))
+    assert matrix.shape == source.shape
+    assert matrix.stocks == source.stocks
+    assert matrix.metric_ids == source.metric_ids
+    assert matrix.period_labels == source.period_labels
+    np.testing.assert_array_equal(matrix.data, source.data)
+    # Metric names and categories come back into the (empty) registry
+    assert {info.name for info in store.registry.snapshot.by_name.values()} == {
+        matrix_store.registry.snapshot.by_id[mid].name for mid in source.metric_ids}
+    assert store.source == "snapshot"
+
+
+def test_ingests_never_write_through_to_the_file(snapshot_path):
+    store = MatrixStore(MetricRegistry(lambda name: "Other"))
+    load_snapshot(store, snapshot_path)
+    matrix = store.matrix
+    i, j, k = (int(axis[0]) for axis in np.nonzero(~np.isnan(matrix.data)))
+    stock, mid, label = matrix.stocks[i], matrix.metric_ids[j], matrix.period_labels[k]
+    original = matrix.value(stock.stock_code, mid, label)
+    with open(snapshot_path, "rb") as f:
+        before = f.read()
+
+    store.upsert(stock, [(mid, label, original + 1000.0)])
+    store.upsert(StockInfo(99, "NEWCO", "", ""), [(mid, label, 1.0)])
+    assert store.matrix.value(stock.stock_code, mid, label) == pytest.approx(original + 1000.0)
+    with open(snapshot_path, "rb") as f:
+        assert f.read() == before
+    assert open_snapshot(snapshot_path).to_matrix().value(stock.stock_code, mid, label) == original
+
+
+def rewrite(path, transform):
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(transform(data))
+
+
+def test_bad_magic_is_rejected(snapshot_path):
+    rewrite(snapshot_path, lambda data: b"NOTASNAP" + data[len(MAGIC):])
+    with pytest.raises(SnapshotError, match="not a snapshot"):
+        open_snapshot(snapshot_path)
+
+
+def test_other_format_version_is_rejected(snapshot_path):
+    rewrite(snapshot_path, lambda data: data[:8] + struct.pack("<I", FORMAT_VERSION + 1) + data[12:])
+    with pytest.raises(SnapshotError, match="format"):
+        open_snapshot(snapshot_path)
+
+
+@pytest.mark.parametrize("keep", ["columns", "header", "preamble"])
+def test_truncated_file_is_rejected(snapshot_path, keep):
+    data_start = read_header(snapshot_path)["data_start"]
+    end = {"columns": data_start + 8, "header": 20, "preamble": 10}[keep]
+    rewrite(snapshot_path, lambda data: data[:end])
+    with pytest.raises(SnapshotError, match="truncated"):
+        open_snapshot(snapshot_path)
+
+
+def test_missing_file_is_a_snapshot_error(tmp_path):
+    with pytest.raises(SnapshotError):
+        open_snapshot(str(tmp_path / "missing.snap"))
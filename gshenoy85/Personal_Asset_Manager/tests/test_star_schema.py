@@ -0,0 +1,78 @@
+# tests/test_star_schema.py
+import pytest
+
+import fake_warehouse
+import star_schema
+from metric_registry import MetricRegistry
+from star_schema import (
+    LEGACY_TABLE, LegacySchemaError, ensure_star_schema, financials_object_type, migrate_star_schema
+)
+
+LEGACY_ROWS = [(stock, metric, quarter, value, "Software", "IT")
+               for stock in ("AAA", "BBB", "CCC")
+               for metric, value in (("Sales +", "1,200"), ("OPM %", "0.25"))
+               for quarter in ("Sep 2024", "Dec 2024")]
+
+
+@pytest.fixture
+def legacy_cursor(tmp_path, monkeypatch):
+    monkeypatch.setattr(star_schema, "MIGRATION_BATCH_STOCKS", 1)
+    conn = fake_warehouse.connect(str(tmp_path / "legacy.sqlite3"))
+    cur = conn.cursor()
+    cur.execute("""CREATE TABLE FINANCIALS_QUARTERLY (STOCK_CODE TEXT, METRIC TEXT, QUARTER TEXT, VALUE TEXT,
+                                                      INDUSTRY TEXT, CATEGORY TEXT)""")
+    cur.executemany("INSERT INTO FINANCIALS_QUARTERLY VALUES (%s, %s, %s, %s, %s, %s)", LEGACY_ROWS)
+    conn.commit()
+    yield cur
+    conn.close()
+
+
+def fact_count(cur) -> int:
+    cur.execute("SELECT COUNT(*) FROM FACT_FINANCIALS")
+    return cur.fetchone()[0]
+
+
+def test_schema_check_refuses_a_legacy_table(legacy_cursor):
+    with pytest.raises(LegacySchemaError, match="star_schema.py migrate"):
+        ensure_star_schema(legacy_cursor)
+    # Nothing was copied or renamed
+    assert fact_count(legacy_cursor) == 0
+    assert financials_object_type(legacy_cursor) == "BASE TABLE"
+
+
+def test_copy_runs_before_the_rename(legacy_cursor):
+    assert migrate_star_schema(legacy_cursor, MetricRegistry(lambda name: "Other")) == len(LEGACY_ROWS)
+    assert fact_count(legacy_cursor) == len(LEGACY_ROWS)
+    assert financials_object_type(legacy_cursor) == "VIEW"
+    assert financials_object_type(legacy_cursor, LEGACY_TABLE) == "BASE TABLE"
+    ensure_star_schema(legacy_cursor)
+
+
+def test_failed_copy_is_retried_on_the_next_run(legacy_cursor, monkeypatch):
+    real_migrate = star_schema.migrate_legacy_rows
+    calls = []
+
+    def failing_migrate(cur, registry, rows):
+        calls.append(rows)
+        if len(calls) == 2:
+            raise RuntimeError("warehouse went away")
+        return real_migrate(cur, registry, rows)
+    monkeypatch.setattr(star_schema, "migrate_legacy_rows", failing_migrate)
+
+    registry = MetricRegistry(lambda name: "Other")
+    with pytest.raises(RuntimeError):
+        migrate_star_schema(legacy_cursor, registry)
+    # The legacy table is untouched, so the next run migrates it again
+    assert financials_object_type(legacy_cursor) == "BASE TABLE"
+    assert migrate_star_schema(legacy_cursor, registry)
+    assert fact_count(legacy_cursor) == len(LEGACY_ROWS)
+
+
+def test_resumes_a_table_renamed_by_an_interrupted_migration(legacy_cursor):
+    legacy_cursor.execute(f"ALTER TABLE FINANCIALS_QUARTERLY RENAME TO {LEGACY_TABLE}")
+    with pytest.raises(LegacySchemaError, match=LEGACY_TABLE):
+        ensure_star_schema(legacy_cursor)
+    assert migrate_star_schema(legacy_cursor, MetricRegistry(lambda name: "Other")) == len(LEGACY_ROWS)
+    assert financials_object_type(legacy_cursor) == "VIEW"
+    # Once the view exists, later runs do not copy again
+    assert migrate_star_schema(legacy_cursor, MetricRegistry(lambda name: "Other")) == 0
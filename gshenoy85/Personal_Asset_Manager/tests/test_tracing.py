@@ -0,0 +1,37 @@
+# tests/test_tracing.py
+from tracing import InMemoryExporter, Span
+
+
+def finished(name, trace_id, parent_id=None):
+    span = Span(name, trace_id, parent_id)
+    span.finish()
+    return span
+
+
+def test_spans_beyond_the_cap_are_counted_not_kept():
+    exporter = InMemoryExporter(max_traces=10, max_spans=3)
+    root = Span("load_all_data", "t1")
+    for i in range(5):
+        exporter.export(finished(f"ingest_stock {i}", "t1", root.span_id))
+    root.finish()
+    exporter.export(root)
+
+    spans = exporter.get_trace("t1")
+    assert [span["name"] for span in spans] == ["load_all_data", "ingest_stock 0", "ingest_stock 1",
+                                                "ingest_stock 2"]
+    assert exporter.dropped("t1") == 2
+    assert exporter.slowest(1)[0]["name"] == "load_all_data"
+
+
+def test_open_traces_outlive_newer_completed_ones():
+    exporter = InMemoryExporter(max_traces=2)
+    open_root = Span("load_all_data", "open")
+    exporter.export(finished("ingest_stock", "open", open_root.span_id))
+    for trace_id in ("a", "b", "c"):
+        exporter.export(finished("GET /", trace_id))
+    open_root.finish()
+    exporter.export(open_root)
+
+    assert len(exporter.get_trace("open")) == 2
+    assert [root["name"] for root in exporter.slowest()].count("GET /") == 1
+    assert exporter.get_trace("a") == [] and exporter.get_trace("b") == []
@@ -0,0 +1,117 @@
+# tests/test_universe.py
+import os
+import random
+
+import pytest
+
+from universe import UNCLASSIFIED, UniverseError, UniverseLoader, parse_listing
+
+SYMBOLS = 5000
+SECTORS = ["Banks", "IT", "FMCG", "Chemicals", "Capital Goods", "Pharma"]
+HEADER = "symbol,name,sector,industry,market_cap_bucket,market_cap,exchange"
+
+
+def listing_rows(count=SYMBOLS, seed=1):
+    """count rows; symbol SYMnnnn has market cap count - n crores, so SYM0000 is the largest"""
+    rows = [f"SYM{n:04d},Company {n:04d} {SECTORS[n % len(SECTORS)]} Holdings,{SECTORS[n % len(SECTORS)]},"
+            f"Industry {n % 17},,{count - n},NSE" for n in range(count)]
+    random.Random(seed).shuffle(rows)
+    return rows
+
+
+def listing_text(rows, version="2024.6"):
+    return "\n".join([f"# version: {version}", HEADER] + rows) + "\n"
+
+
+@pytest.fixture(scope="module")
+def universe():
+    return parse_listing(listing_text(listing_rows()))
+
+
+def test_listing_is_ordered_and_bucketed_by_market_cap(universe):
+    assert len(universe) == SYMBOLS and universe.version == "2024.6"
+    assert universe.symbols()[:3] == ["SYM0000", "SYM0001", "SYM0002"]
+    assert universe.get("sym0099").bucket == "Large Cap"
+    assert universe.get("SYM0100").bucket == "Mid Cap"
+    assert universe.get("SYM0249").bucket == "Mid Cap"
+    assert universe.get("SYM0250").bucket == "Small Cap"
+    assert dict(universe.bucket_counts()) == {"Large Cap": 100, "Mid Cap": 150, "Small Cap": SYMBOLS - 250}
+
+
+def test_explicit_buckets_win_and_rows_without_a_cap_are_unclassified():
+    universe = parse_listing("\n".join([HEADER, "BIG,Big,,,,900,NSE", "SMALLISH,Smallish,,,small,1000,NSE",
+                                        "NOCAP,No Cap,,,,,NSE", "TAGGED,Tagged,,,MID_CAP,,BSE"]))
+    assert universe.get("SMALLISH").bucket == "Small Cap"
+    # SMALLISH still takes rank 1, so BIG ranks second
+    assert universe.get("BIG").bucket == "Large Cap"
+    assert universe.get("NOCAP").bucket == UNCLASSIFIED
+    assert universe.get("TAGGED").bucket == "Mid Cap" and universe.get("TAGGED").exchange == "BSE"
+
+
+def test_prefix_search_on_symbols_and_name_words(universe):
+    listings, total = universe.page(query="sym004")
+    assert total == 10 and [l.symbol for l in listings] == [f"SYM{n:04d}" for n in range(40, 50)]
+    listings, total = universe.page(query="pharma hold", limit=5)
+    assert total == SYMBOLS // len(SECTORS) and all(l.sector == "Pharma" for l in listings)
+    assert listings[0].symbol == "SYM0005"
+    _, total = universe.page(query="company 12", bucket="small", sector="it")
+    assert total == sum(1 for n in range(250, SYMBOLS) if f"{n:04d}".startswith("12") and n % 6 == 1)
+    assert universe.page(query="nosuchword") == ([], 0)
+
+
+def test_paging_is_bounded(universe):
+    listings, total = universe.page(offset=4990, limit=60)
+    assert total == SYMBOLS and len(listings) == 10
+    assert len(universe.page(limit=10_000)[0]) == 500
+
+
+def test_shards_are_disjoint_complete_and_stable(universe):
+    shards = [universe.shard(i, 4) for i in range(4)]
+    symbols = [listing.symbol for shard in shards for listing in shard]
+    assert len(symbols) == len(set(symbols)) == SYMBOLS
+    assert all(abs(len(shard) - SYMBOLS / 4) < SYMBOLS * 0.05 for shard in shards)
+    # Assignment depends only on the symbol, not on row order or the rest of the listing
+    reordered = parse_listing(listing_text(listing_rows(seed=2)[:4000]))
+    for i in range(4):
+        assert {l.symbol for l in reordered.shard(i, 4)} <= {l.symbol for l in shards[i]}
+    with pytest.raises(ValueError):
+        universe.shard(4, 4)
+
+
+@pytest.mark.parametrize("text, message", [
+    ("ticker,name\nTCS,Tata", "no 'symbol' column"),
+    (f"{HEADER}\nTCS,Tata,IT,IT,,12 crore,NSE", "Bad market_cap"),
+    (f"{HEADER}\nTCS,Tata,IT,IT,Mega Cap,,NSE", "Unknown market_cap_bucket 'Mega Cap' on line 2"),
+])
+def test_malformed_listings_are_rejected(text, message):
+    with pytest.raises(UniverseError, match=message):
+        parse_listing(text)
+
+
+def test_duplicate_symbols_keep_the_largest_row():
+    universe = parse_listing("\n".join([HEADER, "TCS,Old,,,,10,NSE", "tcs,New,,,,20,NSE"]))
+    assert len(universe) == 1 and universe.get("TCS").name == "New"
+
+
+def test_loader_reloads_on_mtime_change_and_keeps_the_last_good_listing(tmp_path):
+    path = str(tmp_path / "listing.csv")
+    loader = UniverseLoader(path, fallback={"Large Cap": ["RELIANCE"]})
+    assert loader.current().symbols() == ["RELIANCE"]
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(listing_text(listing_rows(count=300), version="1"))
+    first = loader.current()
+    assert len(first) == 300 and loader.current() is first
+
+    def rewrite(text, mtime):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.utime(path, (mtime, mtime))
+
+    stamp = os.stat(path).st_mtime
+    rewrite(listing_text(listing_rows(count=3000), version="2"), stamp + 10)
+    second = loader.current()
+    assert len(second) == 3000 and second.version == "2"
+
+    rewrite("ticker\nTCS\n", stamp + 20)
+    assert loader.current() is second
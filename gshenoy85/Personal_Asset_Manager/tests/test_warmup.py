@@ -0,0 +1,73 @@
+# tests/test_warmup.py
+import multiprocessing
+import threading
+import time
+
+from warmup import StockTraffic, Warmup
+
+WORKERS, SAVES = 4, 25
+
+
+def record_and_save(path: str):
+    traffic = StockTraffic(path=path, save_interval=3600)
+    for _ in range(SAVES):
+        traffic.record("TCS")
+        traffic.save()
+
+
+def test_concurrent_saves_keep_every_count(tmp_path):
+    path = str(tmp_path / "traffic.json")
+    workers = [multiprocessing.get_context("fork").Process(target=record_and_save, args=(path,))
+               for _ in range(WORKERS)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert sum(counts["TCS"] for counts in StockTraffic(path=path)._read().values()) == WORKERS * SAVES
+
+
+def test_unknown_symbols_are_not_counted(tmp_path):
+    traffic = StockTraffic(path=str(tmp_path / "traffic.json"), known=lambda stock: stock == "TCS")
+    for stock in ("tcs", "NOSUCHCODE", "TCS"):
+        traffic.record(stock)
+    traffic.save()
+    assert traffic.top(5) == ["TCS"]
+    assert traffic._read()[traffic._today()] == {"TCS": 2}
+
+
+def test_hung_step_is_cut_off_at_the_deadline():
+    warmup = Warmup(enabled=True, timeout=0.3)
+    release = threading.Event()
+    warmup.step("hangs")(lambda: release.wait(5))
+    warmup.step("after")(lambda: "never started")
+
+    started = time.monotonic()
+    assert warmup.run()
+    assert time.monotonic() - started < 1.0
+    assert [(step["name"], step["status"]) for step in warmup.steps] == [("hangs", "timed_out"), ("after", "skipped")]
+    release.set()
+
+
+def test_failed_required_step_leaves_the_worker_not_ready():
+    warmup = Warmup(enabled=True, timeout=5)
+
+    @warmup.step("warehouse_schema", required=True)
+    def broken_schema():
+        raise RuntimeError("legacy table")
+    warmup.step("templates")(lambda: {"templates": 3})
+
+    assert not warmup.run()
+    status = warmup.status()
+    assert status["status"] == "failed" and not status["ready"]
+    assert status["steps"][0]["error"] == "legacy table"
+    assert status["steps"][1]["status"] == "ok" and status["steps"][1]["detail"] == {"templates": 3}
+
+
+def test_failed_optional_step_still_becomes_ready():
+    warmup = Warmup(enabled=True, timeout=5)
+
+    @warmup.step("hot_stocks")
+    def broken_prefetch():
+        raise RuntimeError("warehouse down")
+
+    assert warmup.run() and warmup.ready
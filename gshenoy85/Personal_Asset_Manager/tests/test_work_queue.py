@@ -0,0 +1,111 @@
+# tests/test_work_queue.py
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+from ingest_workers import run_worker
+from work_queue import DONE, FAILED, LEASED, QUEUED, SQLiteWorkQueue, WorkQueue, open_work_queue
+
+
+def test_backends_must_implement_the_interface():
+    class PartialQueue(WorkQueue):
+        def enqueue(self, run_id, items):
+            return 0
+
+    with pytest.raises(TypeError, match="abstract"):
+        PartialQueue()
+
+
+def test_factory_must_return_a_work_queue(tmp_path, monkeypatch):
+    module = types.ModuleType("queue_factories")
+    module.sqlite = lambda: SQLiteWorkQueue(str(tmp_path / "queue.db"))
+    module.broken = lambda: object()
+    monkeypatch.setitem(sys.modules, "queue_factories", module)
+
+    assert isinstance(open_work_queue("queue_factories:sqlite"), SQLiteWorkQueue)
+    with pytest.raises(TypeError, match="not a WorkQueue"):
+        open_work_queue("queue_factories:broken")
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteWorkQueue(str(tmp_path / "queue.db"), max_attempts=2, retry_delay=0)
+
+
+def test_expired_leases_are_requeued(queue):
+    queue.enqueue("run", ["TCS", "INFY"])
+    assert [item.item for item in queue.lease("run", "w1", limit=2, lease_seconds=0.05)] == ["TCS", "INFY"]
+    assert queue.lease("run", "w2", limit=2) == []
+    time.sleep(0.1)
+    assert queue.reap("run") == 2
+    assert queue.counts("run")[QUEUED] == 2
+    # The next lease counts the lost attempt
+    assert [(item.item, item.attempts) for item in queue.lease("run", "w2", limit=2)] == [("TCS", 2), ("INFY", 2)]
+
+
+def test_expired_item_out_of_attempts_fails(queue):
+    queue.enqueue("run", ["TCS"])
+    for _ in range(2):
+        queue.lease("run", "w1", lease_seconds=0.05)
+        time.sleep(0.1)
+    assert queue.reap("run") == 1
+    assert queue.failures("run")[0]["error"] == "lease expired (worker w1 lost)"
+
+
+def test_completion_after_the_lease_moved_is_refused(queue):
+    queue.enqueue("run", ["TCS"])
+    queue.lease("run", "slow", lease_seconds=0.05)
+    time.sleep(0.1)
+    assert queue.lease("run", "fast")[0].item == "TCS"
+    assert not queue.complete("run", "TCS", "slow", "late")
+    assert not queue.fail("run", "TCS", "slow", "late")
+    assert queue.complete("run", "TCS", "fast", "ok")
+    assert queue.counts("run")[DONE] == 1
+
+
+def test_failures_are_retried_until_out_of_attempts(queue):
+    queue.enqueue("run", ["TCS", "INFY"])
+    queue.lease("run", "w1", limit=2)
+    assert queue.fail("run", "TCS", "w1", "HTTP 503")
+    assert queue.fail("run", "INFY", "w1", "no data extracted", retry=False)
+    assert queue.counts("run") == {QUEUED: 1, LEASED: 0, DONE: 0, FAILED: 1}
+
+    assert [item.item for item in queue.lease("run", "w1")] == ["TCS"]
+    assert queue.fail("run", "TCS", "w1", "HTTP 503")
+    assert queue.counts("run")[FAILED] == 2
+    assert {f["item"]: f["attempts"] for f in queue.failures("run")} == {"TCS": 2, "INFY": 1}
+
+
+def test_heartbeat_extends_only_held_leases(queue):
+    queue.enqueue("run", ["TCS", "INFY"])
+    queue.lease("run", "w1", lease_seconds=0.2)
+    queue.lease("run", "w2", lease_seconds=0.2)
+    time.sleep(0.1)
+    assert queue.heartbeat("run", "w1", ["TCS", "INFY"], lease_seconds=5) == 1
+    time.sleep(0.15)
+    # w2 did not heartbeat, so only INFY expired
+    assert queue.reap("run") == 1
+    assert queue.complete("run", "TCS", "w1")
+
+
+def test_release_returns_items_without_using_an_attempt(queue):
+    queue.enqueue("run", ["TCS", "INFY"])
+    queue.lease("run", "w1", limit=2)
+    assert queue.release("run", "w1", ["INFY"]) == 1
+    assert queue.release("run", "w2", ["TCS"]) == 0
+    assert [(item.item, item.attempts) for item in queue.lease("run", "w2")] == [("INFY", 1)]
+
+
+def test_stopped_worker_releases_the_rest_of_its_batch(queue):
+    queue.enqueue("run", ["TCS", "INFY", "ITC"])
+    stop = threading.Event()
+
+    def process(symbol):
+        stop.set()  # as the SIGTERM handler does
+        return 1
+    summary = run_worker(queue, "run", process, worker="w1", batch=3, stop=stop)
+    assert summary["done"] == 1
+    assert queue.counts("run") == {QUEUED: 2, LEASED: 0, DONE: 1, FAILED: 0}
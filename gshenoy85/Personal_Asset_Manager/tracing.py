@@ -0,0 +1,241 @@
+# tracing.py
+"""
+Lightweight request tracing without an external collector.
+
+Spans are nested through a context variable, so any traced function called
+while a span is active becomes its child. Thread pools do not inherit the
+variable, so work handed to one is wrapped in in_current_span(). Finished spans go to an in-memory
+exporter (used by the /debug/traces viewer) and, when TRACE_FILE is set, are
+also appended to a JSON-lines file. Background jobs start their own trace and
+carry a link back to the span that scheduled them.
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1").lower() not in ("0", "false", "no")
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "200"))
+# Spans kept per trace; a bulk load traces one span per stock, so the rest are only counted
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "1000"))
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def _new_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+class Span:
+    """A timed operation within a trace"""
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None,
+                 attributes: Optional[Dict] = None, links: Optional[List[Dict]] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id()
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.links = list(links or [])
+        self.status = "ok"
+        self.start_wall = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException):
+        self.status = "error"
+        self.attributes["error"] = f"{type(error).__name__}: {error}"
+
+    def finish(self):
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._start
+
+    def context(self) -> Dict:
+        """Reference used to link a background job back to this span"""
+        return {"trace_id": self.trace_id, "span_id": self.span_id}
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start_wall,
+            "duration_ms": round((self.duration or 0.0) * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+            "links": self.links,
+        }
+
+
+class InMemoryExporter:
+    """Keeps the most recent traces, grouped by trace id
+
+    Completed traces (root span finished) are evicted oldest first. A trace still
+    in progress is only evicted when more than max_traces are open at once.
+    Each trace keeps at most max_spans spans plus its root; later spans are
+    counted as dropped.
+    """
+
+    def __init__(self, max_traces: int, max_spans: int = TRACE_MAX_SPANS):
+        self.max_traces = max_traces
+        self.max_spans = max_spans
+        self._traces = OrderedDict()
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        with self._lock:
+            trace = self._traces.get(span.trace_id)
+            if trace is None:
+                trace = self._traces[span.trace_id] = {"spans": [], "root": None, "dropped": 0}
+                self._evict()
+            if span.parent_id is None:
+                trace["root"] = span.to_dict()
+                trace["spans"].append(trace["root"])
+            elif len(trace["spans"]) < self.max_spans:
+                trace["spans"].append(span.to_dict())
+            else:
+                trace["dropped"] += 1
+
+    def _evict(self):
+        while len(self._traces) > self.max_traces:
+            oldest = next((trace_id for trace_id, trace in self._traces.items() if trace["root"] is not None),
+                          next(iter(self._traces)))
+            del self._traces[oldest]
+
+    def slowest(self, limit: int = 20) -> List[Dict]:
+        """Completed traces ordered by root span duration, slowest first"""
+        with self._lock:
+            roots = [t["root"] for t in self._traces.values() if t["root"] is not None]
+        return sorted(roots, key=lambda r: r["duration_ms"], reverse=True)[:limit]
+
+    def get_trace(self, trace_id: str) -> List[Dict]:
+        with self._lock:
+            trace = self._traces.get(trace_id)
+            return sorted(trace["spans"], key=lambda s: s["start"]) if trace else []
+
+    def dropped(self, trace_id: str) -> int:
+        """Spans of a trace not kept because it reached max_spans"""
+        with self._lock:
+            trace = self._traces.get(trace_id)
+            return trace["dropped"] if trace else 0
+
+    def clear(self):
+        with self._lock:
+            self._traces.clear()
+
+
+class FileExporter:
+    """Appends finished spans to a JSON-lines file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str)
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            logger.warning(f"Could not write span to {self.path}: {e}")
+
+
+MEMORY_EXPORTER = InMemoryExporter(TRACE_BUFFER_SIZE)
+EXPORTERS = [MEMORY_EXPORTER] + ([FileExporter(TRACE_FILE)] if TRACE_FILE else [])
+
+
+class _SpanScope:
+    """Context manager that activates a span and exports it on exit"""
+
+    def __init__(self, name: str, attributes: Dict, links: Optional[List[Dict]], root: bool):
+        self._name = name
+        self._attributes = attributes
+        self._links = links
+        self._root = root
+        self._token = None
+        self.span = None
+
+    def __enter__(self) -> Optional[Span]:
+        if not TRACING_ENABLED:
+            return None
+        parent = None if self._root else _current_span.get()
+        trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span = Span(self._name, trace_id, parent.span_id if parent else None,
+                         self._attributes, self._links)
+        self._token = _current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.span is None:
+            return False
+        if exc is not None:
+            self.span.record_error(exc)
+        self.span.finish()
+        _current_span.reset(self._token)
+        for exporter in EXPORTERS:
+            exporter.export(self.span)
+        return False
+
+
+def start_span(name: str, links: Optional[List[Dict]] = None, root: bool = False, **attributes) -> _SpanScope:
+    """Open a span as a child of the active one (or a new trace when root=True or none is active)"""
+    return _SpanScope(name, attributes, links, root)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_context() -> Optional[Dict]:
+    """Link reference for the active span, to pass to background jobs"""
+    span = _current_span.get()
+    return span.context() if span else None
+
+
+def traced(name: Optional[str] = None):
+    """Decorator wrapping a function call in a span named after the function"""
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with start_span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def in_current_span(func):
+    """Bind func to the caller's active span, so calls from pool threads add child spans to it"""
+    span = _current_span.get()
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _current_span.set(span)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _current_span.reset(token)
+    return wrapper
+
+
+def run_linked(func, link: Optional[Dict], name: Optional[str] = None):
+    """Wrap a background job so it runs as a new trace linked to the scheduling span"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with start_span(name or func.__name__, links=[link] if link else None, root=True, background=True):
+            return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,298 @@
+# universe.py
+"""
+The stock universe: the exchange listing loaded from a versioned CSV file.
+
+The listing (UNIVERSE_PATH) has one row per symbol. The columns are symbol,
+name, sector, industry, market_cap_bucket, market_cap (in crores) and
+exchange. Only symbol is required. Leading "# key: value" lines are
+metadata, and "# version: 2024-06" names the listing revision. Rows with
+no bucket are classified by market-cap rank: the top 100 are Large Cap,
+the next 150 Mid Cap and the rest Small Cap. Rows with neither a bucket
+nor a market cap are Unclassified.
+
+A Universe is immutable. Listings are ordered by market cap (largest
+first) and indexed by symbol, bucket and sector. A sorted token list
+(symbols plus name words) answers prefix searches by bisection, so paging
+and searching never scan the whole listing. UniverseLoader re-reads the
+file when its mtime changes, so a new listing goes live without a
+restart. shard() splits the universe by a stable symbol hash, so several
+ingest workers can each take a disjoint slice.
+
+The shipped universe/listing.csv is only a placeholder holding the 8
+original tickers with no market caps. The full exchange listing has to be
+supplied as that file, or through UNIVERSE_PATH.
+"""
+import bisect
+import csv
+import hashlib
+import io
+import logging
+import os
+import threading
+import zlib
+from typing import Dict, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+UNIVERSE_PATH = os.getenv("UNIVERSE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                        "universe", "listing.csv"))
+UNIVERSE_PAGE_SIZE = int(os.getenv("UNIVERSE_PAGE_SIZE", "60"))
+UNIVERSE_BATCH_SIZE = int(os.getenv("UNIVERSE_BATCH_SIZE", "50"))
+UNIVERSE_MAX_PAGE_SIZE = 500
+
+MARKET_CAP_BUCKETS = ("Large Cap", "Mid Cap", "Small Cap")
+UNCLASSIFIED = "Unclassified"
+# Rank cut-offs used when a row has a market cap but no bucket
+_BUCKET_RANKS = ((100, "Large Cap"), (250, "Mid Cap"))
+_T = TypeVar("_T")
+_COLUMNS = ("symbol", "name", "sector", "industry", "market_cap_bucket", "market_cap", "exchange")
+
+
+class UniverseError(ValueError):
+    """The listing file is malformed"""
+
+
+class Listing(NamedTuple):
+    symbol: str
+    name: str
+    sector: str
+    industry: str
+    bucket: str
+    market_cap: Optional[float]
+    exchange: str
+
+    def as_dict(self) -> Dict:
+        return self._asdict()
+
+
+def normalise_bucket(value: str) -> str:
+    """'large', 'LARGE_CAP', 'Large Cap' -> 'Large Cap'; unknown or empty -> ''"""
+    key = value.strip().lower().replace("_", " ").replace("-", " ")
+    key = key[:-4].strip() if key.endswith(" cap") else key
+    return next((bucket for bucket in MARKET_CAP_BUCKETS if bucket.lower().startswith(key + " ")), "") if key else ""
+
+
+def _tokens(text: str) -> List[str]:
+    return [token for token in "".join(c if c.isalnum() else " " for c in text.lower()).split() if token]
+
+
+class Universe:
+    """An immutable listing indexed by symbol, bucket, sector and name-token prefix"""
+
+    def __init__(self, listings: Sequence[Listing], version: str = "", source: str = ""):
+        ordered = sorted(listings, key=lambda l: (-(l.market_cap or 0.0), l.symbol))
+        self.by_symbol: Dict[str, Listing] = {}
+        kept: List[Listing] = []
+        for listing in ordered:
+            if listing.symbol in self.by_symbol:
+                logger.warning(f"⚠️ Duplicate symbol {listing.symbol} in universe listing; keeping the first row")
+                continue
+            self.by_symbol[listing.symbol] = listing
+            kept.append(listing)
+        self.listings: Tuple[Listing, ...] = tuple(kept)
+        self.version = version
+        self.source = source
+
+        self._by_bucket: Dict[str, List[int]] = {}
+        self._by_sector: Dict[str, List[int]] = {}
+        tokens = []
+        for i, listing in enumerate(self.listings):
+            self._by_bucket.setdefault(listing.bucket, []).append(i)
+            if listing.sector:
+                self._by_sector.setdefault(listing.sector.lower(), []).append(i)
+            tokens.append((listing.symbol.lower(), i))
+            tokens.extend((token, i) for token in _tokens(listing.name))
+        tokens.sort()
+        self._token_keys = [token for token, _ in tokens]
+        self._token_rows = [i for _, i in tokens]
+        self._sector_names = {listing.sector.lower(): listing.sector for listing in self.listings if listing.sector}
+
+        digest = hashlib.sha256()
+        for listing in self.listings:
+            digest.update("\x1f".join(str(v) for v in listing).encode("utf-8") + b"\n")
+        self.content_hash = digest.hexdigest()[:16]
+
+    def __len__(self) -> int:
+        return len(self.listings)
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol.upper() in self.by_symbol
+
+    def get(self, symbol: str) -> Optional[Listing]:
+        return self.by_symbol.get(symbol.upper())
+
+    def symbols(self) -> List[str]:
+        return [listing.symbol for listing in self.listings]
+
+    def bucket_counts(self) -> List[Tuple[str, int]]:
+        order = list(MARKET_CAP_BUCKETS) + sorted(b for b in self._by_bucket if b not in MARKET_CAP_BUCKETS)
+        return [(bucket, len(self._by_bucket[bucket])) for bucket in order if bucket in self._by_bucket]
+
+    def sector_counts(self) -> List[Tuple[str, int]]:
+        return sorted(((self._sector_names[key], len(rows)) for key, rows in self._by_sector.items()),
+                      key=lambda item: item[0])
+
+    def _prefix_rows(self, prefix: str) -> set:
+        lo = bisect.bisect_left(self._token_keys, prefix)
+        hi = bisect.bisect_left(self._token_keys, prefix + "￿", lo)
+        return set(self._token_rows[lo:hi])
+
+    def _matching_rows(self, query: str, bucket: str, sector: str) -> Optional[List[int]]:
+        """Sorted row positions matching every filter; None means no filter (the whole listing)"""
+        candidates: Optional[set] = None
+        for token in _tokens(query):
+            rows = self._prefix_rows(token)
+            candidates = rows if candidates is None else candidates & rows
+            if not candidates:
+                return []
+        filtered: Optional[List[int]] = None
+        if bucket:
+            filtered = self._by_bucket.get(normalise_bucket(bucket) or bucket, [])
+        if sector:
+            rows = self._by_sector.get(sector.strip().lower(), [])
+            filtered = rows if filtered is None else sorted(set(filtered).intersection(rows))
+        if candidates is None:
+            return filtered
+        if filtered is not None:
+            candidates.intersection_update(filtered)
+        return sorted(candidates)
+
+    def page(self, query: str = "", bucket: str = "", sector: str = "",
+             offset: int = 0, limit: int = UNIVERSE_PAGE_SIZE) -> Tuple[List[Listing], int]:
+        """(listings on this page, total matches); search is a prefix match on symbol and name words"""
+        offset = max(0, int(offset))
+        limit = max(1, min(int(limit), UNIVERSE_MAX_PAGE_SIZE))
+        rows = self._matching_rows(query, bucket, sector)
+        if rows is None:
+            return list(self.listings[offset:offset + limit]), len(self.listings)
+        return [self.listings[i] for i in rows[offset:offset + limit]], len(rows)
+
+    def shard(self, index: int, count: int) -> List[Listing]:
+        """The listings of shard `index` of `count`, assigned by a stable hash of the symbol"""
+        if count < 1 or not 0 <= index < count:
+            raise ValueError(f"Shard {index} of {count} is out of range")
+        if count == 1:
+            return list(self.listings)
+        return [listing for listing in self.listings
+                if zlib.crc32(listing.symbol.encode("utf-8")) % count == index]
+
+    def stats(self) -> Dict:
+        return {
+            "version": self.version,
+            "source": self.source,
+            "content_hash": self.content_hash,
+            "symbols": len(self.listings),
+            "buckets": dict(self.bucket_counts()),
+            "sectors": len(self._by_sector),
+        }
+
+
+def batches(items: Sequence[_T], size: int = UNIVERSE_BATCH_SIZE) -> Iterator[List[_T]]:
+    """Consecutive batches of at most `size` items (listings or symbols)"""
+    size = max(1, size)
+    for start in range(0, len(items), size):
+        yield list(items[start:start + size])
+
+
+def _market_cap(value: str, symbol: str) -> Optional[float]:
+    value = value.replace(",", "").strip()
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise UniverseError(f"Bad market_cap {value!r} for {symbol}")
+
+
+def parse_listing(text: str, source: str = "") -> Universe:
+    """Parse listing CSV text (with optional '# key: value' header lines) into a Universe"""
+    metadata: Dict[str, str] = {}
+    lines = text.splitlines()
+    body_start = 0
+    for body_start, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped and not stripped.startswith("#"):
+            break
+        key, sep, value = stripped.lstrip("#").partition(":")
+        if sep:
+            metadata[key.strip().lower()] = value.strip()
+    else:
+        body_start = len(lines)
+
+    reader = csv.DictReader(io.StringIO("\n".join(lines[body_start:])))
+    header = [column.strip().lower() for column in reader.fieldnames or []]
+    if "symbol" not in header:
+        raise UniverseError(f"Universe listing {source or '<text>'} has no 'symbol' column")
+    reader.fieldnames = header
+
+    rows = []
+    for line_no, row in enumerate(reader, start=body_start + 2):
+        values = {column: (row.get(column) or "").strip() for column in _COLUMNS}
+        symbol = values["symbol"].upper()
+        if not symbol or symbol.startswith("#"):
+            continue
+        raw_bucket = values["market_cap_bucket"]
+        bucket = normalise_bucket(raw_bucket)
+        if raw_bucket and not bucket:
+            raise UniverseError(f"Unknown market_cap_bucket {raw_bucket!r} on line {line_no}")
+        rows.append([symbol, values["name"] or symbol, values["sector"], values["industry"], bucket,
+                     _market_cap(values["market_cap"], symbol), values["exchange"] or "NSE"])
+
+    # Rank the unbucketed rows that report a market cap among all rows that do
+    ranked = sorted((row for row in rows if row[5] is not None), key=lambda row: -row[5])
+    for rank, row in enumerate(ranked, start=1):
+        if not row[4]:
+            row[4] = next((bucket for limit, bucket in _BUCKET_RANKS if rank <= limit), "Small Cap")
+    listings = [Listing(*row[:4], row[4] or UNCLASSIFIED, *row[5:]) for row in rows]
+    return Universe(listings, version=metadata.get("version", ""), source=source)
+
+
+def universe_from_groups(groups: Mapping[str, Sequence[str]], version: str = "builtin") -> Universe:
+    """A minimal universe from a {bucket: [symbols]} mapping (the built-in fallback)"""
+    listings = [Listing(symbol.upper(), symbol.upper(), "", "", normalise_bucket(bucket) or bucket, None, "NSE")
+                for bucket, symbols in groups.items() for symbol in symbols]
+    return Universe(listings, version=version, source="builtin")
+
+
+def load_universe(path: str = UNIVERSE_PATH) -> Universe:
+    with open(path, encoding="utf-8") as f:
+        universe = parse_listing(f.read(), source=path)
+    logger.info(f"🌐 Universe loaded: {len(universe)} symbols (version {universe.version or 'unversioned'}) from {path}")
+    return universe
+
+
+class UniverseLoader:
+    """The current Universe, re-read when the listing file changes; falls back to built-in groups"""
+
+    def __init__(self, path: str = UNIVERSE_PATH, fallback: Optional[Mapping[str, Sequence[str]]] = None):
+        self.path = path
+        self.fallback = fallback or {}
+        self._lock = threading.Lock()
+        self._universe: Optional[Universe] = None
+        self._mtime: Optional[float] = None
+
+    def current(self) -> Universe:
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            mtime = None
+        universe = self._universe
+        if universe is not None and mtime == self._mtime:
+            return universe
+        with self._lock:
+            if self._universe is not None and mtime == self._mtime:
+                return self._universe
+            if mtime is None:
+                if self._universe is None:
+                    logger.warning(f"⚠️ No universe listing at {self.path}; using the built-in stock list")
+                    self._universe = universe_from_groups(self.fallback)
+            else:
+                try:
+                    self._universe = load_universe(self.path)
+                except (OSError, UniverseError) as e:
+                    # Keep serving the previous listing rather than an empty page
+                    logger.error(f"❌ Could not load universe listing {self.path}: {e}")
+                    if self._universe is None:
+                        self._universe = universe_from_groups(self.fallback)
+            self._mtime = mtime
+            return self._universe
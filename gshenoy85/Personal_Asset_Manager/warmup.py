@@ -0,0 +1,238 @@
+# warmup.py
+"""
+Worker warm-up and readiness.
+
+A Warmup runs a list of named steps (open pool connections, compile matchers
+and templates, prefetch hot stocks) once per worker process and records how
+each one went. The /ready endpoint reports 503 until the run has finished.
+Steps are isolated: a failing step is logged and recorded, and the worker
+still becomes ready, only colder, unless the step was registered as
+required; then the run ends "failed" and /ready keeps reporting 503.
+
+The whole run stays within WARMUP_TIMEOUT. Each step runs in a helper thread
+that is given only the time left; a step that overruns is recorded as
+"timed_out" and left to finish in the background, and steps not started
+before the deadline are skipped.
+
+StockTraffic counts stock page/API requests per day and persists them to
+TRAFFIC_FILE, so the next deploy knows which tickers are popular right now.
+Workers merge their counts into the file under an exclusive lock on
+TRAFFIC_FILE + ".lock", so concurrent saves do not drop each other's counts.
+Only symbols accepted by the `known` predicate are counted, so requests for
+made-up codes cannot grow the file or reach the warm-up list.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves are not serialised across processes
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1").lower() not in ("0", "false", "no")
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "60"))
+WARMUP_TOP_STOCKS = int(os.getenv("WARMUP_TOP_STOCKS", "5"))
+WARMUP_POOL_MIN = int(os.getenv("WARMUP_POOL_MIN", "2"))
+TRAFFIC_FILE = os.getenv("TRAFFIC_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".stock_traffic.json"))
+TRAFFIC_WINDOW_DAYS = int(os.getenv("TRAFFIC_WINDOW_DAYS", "7"))
+TRAFFIC_SAVE_INTERVAL = float(os.getenv("TRAFFIC_SAVE_INTERVAL", "60"))
+
+
+class StockTraffic:
+    """Per-day request counts per stock, merged into a JSON file shared by all workers"""
+
+    def __init__(self, path: str = TRAFFIC_FILE, window_days: int = TRAFFIC_WINDOW_DAYS,
+                 save_interval: float = TRAFFIC_SAVE_INTERVAL, known: Optional[Callable[[str], bool]] = None):
+        self.path = path
+        self.known = known
+        self.window_days = window_days
+        self.save_interval = save_interval
+        self._unsaved = Counter()
+        self._last_save = time.monotonic()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _today() -> str:
+        return time.strftime("%Y-%m-%d")
+
+    def record(self, stock: str):
+        stock = stock.upper()
+        if self.known is not None and not self.known(stock):
+            return
+        with self._lock:
+            self._unsaved[stock] += 1
+            due = time.monotonic() - self._last_save >= self.save_interval
+        if due:
+            self.save()
+
+    def _read(self) -> Dict[str, Dict[str, int]]:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """Exclusive lock serialising the read-merge-replace of the file across worker processes"""
+        with open(self.path + ".lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def save(self):
+        """Merge unsaved counts into today's bucket and drop days outside the window"""
+        with self._lock:
+            unsaved, self._unsaved = self._unsaved, Counter()
+            self._last_save = time.monotonic()
+        if not unsaved:
+            return
+        cutoff = time.strftime("%Y-%m-%d", time.localtime(time.time() - self.window_days * 86400))
+        try:
+            with self._file_lock():
+                days = self._read()
+                today = days.setdefault(self._today(), {})
+                for stock, count in unsaved.items():
+                    today[stock] = today.get(stock, 0) + count
+                days = {day: counts for day, counts in days.items() if day >= cutoff}
+                directory = os.path.dirname(self.path) or "."
+                with tempfile.NamedTemporaryFile("w", dir=directory, delete=False, suffix=".tmp",
+                                                 encoding="utf-8") as f:
+                    json.dump(days, f)
+                os.replace(f.name, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save stock traffic to {self.path}: {e}")
+            # Keep the counts for the next save
+            with self._lock:
+                self._unsaved.update(unsaved)
+
+    def top(self, n: int) -> List[str]:
+        """Most requested stocks over the window, including this process's unsaved counts"""
+        totals = Counter()
+        for counts in self._read().values():
+            totals.update(counts)
+        with self._lock:
+            totals.update(self._unsaved)
+        return [stock for stock, _ in totals.most_common(n)]
+
+
+class Warmup:
+    """Ordered warm-up steps with per-step timing and a readiness flag"""
+
+    def __init__(self, enabled: bool = WARMUP_ENABLED, timeout: float = WARMUP_TIMEOUT):
+        self.enabled = enabled
+        self.timeout = timeout
+        self.state = "pending" if enabled else "ready"
+        self.steps: List[Dict] = []
+        self._funcs: List = []
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        if not enabled:
+            self._done.set()
+
+    def step(self, name: str, required: bool = False):
+        """Decorator registering a warm-up step; steps run in registration order
+
+        A required step that fails or times out leaves the worker not ready.
+        """
+        def decorator(func: Callable):
+            self._funcs.append((name, func, required))
+            return func
+        return decorator
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    @staticmethod
+    def _run_step(func: Callable, timeout: float) -> Dict:
+        """Run func in a daemon thread for at most timeout seconds"""
+        outcome: Dict = {"status": "timed_out"}
+
+        def target():
+            try:
+                outcome.update(status="ok", detail=func())
+            except Exception as e:
+                outcome.update(status="error", error=str(e))
+        thread = threading.Thread(target=target, name="warmup-step", daemon=True)
+        thread.start()
+        thread.join(timeout)
+        # A step still running keeps writing to its own dict, never to the recorded result
+        return dict(outcome)
+
+    def run(self) -> bool:
+        """Run all steps once (later calls wait for the first run); True when ready"""
+        with self._lock:
+            if self.state != "pending":
+                start_run = False
+            else:
+                self.state, start_run = "running", True
+        if not start_run:
+            return self._done.wait(self.timeout) and self.ready
+
+        started = time.perf_counter()
+        deadline = started + self.timeout
+        results = []
+        failed_required = []
+        for name, func, required in self._funcs:
+            result = {"name": name, "status": "skipped", "duration_ms": 0.0}
+            remaining = deadline - time.perf_counter()
+            if remaining > 0:
+                step_start = time.perf_counter()
+                outcome = self._run_step(func, remaining)
+                result["status"] = outcome["status"]
+                if outcome.get("detail") is not None:
+                    result["detail"] = outcome["detail"]
+                if outcome["status"] == "error":
+                    result["error"] = outcome["error"]
+                    logger.warning(f"⚠️ Warm-up step {name} failed: {outcome['error']}")
+                elif outcome["status"] == "timed_out":
+                    logger.warning(f"⚠️ Warm-up step {name} still running after WARMUP_TIMEOUT; not waiting")
+                result["duration_ms"] = round((time.perf_counter() - step_start) * 1000, 1)
+            if required:
+                result["required"] = True
+                if result["status"] != "ok":
+                    failed_required.append(name)
+            results.append(result)
+
+        self.steps = results
+        self.state = "failed" if failed_required else "ready"
+        self._done.set()
+        logger.info(f"🔥 Warm-up finished in {time.perf_counter() - started:.2f}s "
+                    f"({sum(r['status'] == 'ok' for r in results)}/{len(results)} steps ok)")
+        if failed_required:
+            logger.error(f"❌ Worker not ready: required warm-up steps {', '.join(failed_required)} did not complete")
+        return self.ready
+
+    def start_background(self) -> Optional[threading.Thread]:
+        """Run the warm-up in a daemon thread (for servers without a pre-serve hook)"""
+        if self.state != "pending":
+            return None
+        thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def reset_after_fork(self):
+        """A forked worker starts cold even if the parent had warmed up"""
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self.steps = []
+        self.state = "pending" if self.enabled else "ready"
+        if not self.enabled:
+            self._done.set()
+
+    def status(self) -> Dict:
+        return {"status": self.state, "ready": self.ready, "steps": self.steps}
@@ -0,0 +1,306 @@
+# work_queue.py
+"""
+Durable work queue with leases, shared by ingest workers (see ingest_workers.py).
+
+A run is a named set of items, one per stock symbol. A worker leases a few
+queued items at a time. The lease expires after lease_seconds unless the
+worker heartbeats it. Each item ends up done, or failed after
+WORK_MAX_ATTEMPTS attempts. When a worker crashes, its leases expire and
+the next lease() call by any worker, or the coordinator's reap(), puts the
+items back in the queue. Completing an item whose lease has already moved
+to another worker is refused, so one stock is never recorded twice.
+
+WORK_QUEUE_URL selects the backend:
+    sqlite:///path/to/queue.db     the local default (WAL mode, BEGIN IMMEDIATE leasing)
+    module:factory                 any callable returning a WorkQueue, e.g. for a network-backed queue
+SQLite is safe for many processes on one host. Workers on several hosts need
+a shared backend plugged in through module:factory.
+"""
+import importlib
+import logging
+import os
+import socket
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+WORK_QUEUE_URL = os.getenv("WORK_QUEUE_URL", "sqlite:///" + os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "work", "ingest_queue.db"))
+WORK_LEASE_SECONDS = float(os.getenv("WORK_LEASE_SECONDS", "120"))
+WORK_MAX_ATTEMPTS = int(os.getenv("WORK_MAX_ATTEMPTS", "3"))
+WORK_RETRY_DELAY = float(os.getenv("WORK_RETRY_DELAY", "30"))
+
+QUEUED, LEASED, DONE, FAILED = "queued", "leased", "done", "failed"
+STATES = (QUEUED, LEASED, DONE, FAILED)
+
+
+class WorkItem(NamedTuple):
+    run_id: str
+    item: str
+    attempts: int
+    lease_expires: float
+
+
+class WorkQueue(ABC):
+    """The queue interface; backends implement every method"""
+
+    @abstractmethod
+    def enqueue(self, run_id: str, items: Iterable[str]) -> int:
+        """Add items to a run (existing items are left alone); returns how many were new"""
+
+    @abstractmethod
+    def lease(self, run_id: str, worker: str, limit: int = 1,
+              lease_seconds: float = WORK_LEASE_SECONDS) -> List[WorkItem]:
+        ...
+
+    @abstractmethod
+    def heartbeat(self, run_id: str, worker: str, items: Iterable[str],
+                  lease_seconds: float = WORK_LEASE_SECONDS) -> int:
+        """Extend this worker's leases on items; returns how many it still holds"""
+
+    @abstractmethod
+    def complete(self, run_id: str, item: str, worker: str, result: str = "") -> bool:
+        """Mark a leased item done; False if the lease was lost meanwhile"""
+
+    @abstractmethod
+    def fail(self, run_id: str, item: str, worker: str, error: str, retry: bool = True) -> bool:
+        """Re-queue (after WORK_RETRY_DELAY) or, out of attempts or retry=False, fail a leased item"""
+
+    @abstractmethod
+    def release(self, run_id: str, worker: str, items: Iterable[str]) -> int:
+        """Hand leased items back untouched (graceful worker shutdown)"""
+
+    @abstractmethod
+    def reap(self, run_id: Optional[str] = None) -> int:
+        """Re-queue items whose lease expired; returns how many"""
+
+    @abstractmethod
+    def counts(self, run_id: str) -> Dict[str, int]:
+        ...
+
+    @abstractmethod
+    def register_worker(self, run_id: str, worker: str):
+        ...
+
+    @abstractmethod
+    def workers(self, run_id: str) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    def runs(self) -> List[str]:
+        """Run ids, newest first"""
+
+    @abstractmethod
+    def failures(self, run_id: str) -> List[Dict]:
+        ...
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS work_items (
+    run_id TEXT NOT NULL,
+    item TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    worker TEXT,
+    lease_expires REAL,
+    available_at REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    result TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (run_id, item)
+);
+CREATE INDEX IF NOT EXISTS work_items_queue ON work_items (run_id, state, available_at, seq);
+CREATE TABLE IF NOT EXISTS work_runs (
+    run_id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS work_workers (
+    run_id TEXT NOT NULL,
+    worker TEXT NOT NULL,
+    host TEXT,
+    pid INTEGER,
+    started_at REAL NOT NULL,
+    heartbeat_at REAL NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (run_id, worker)
+);
+"""
+
+
+class SQLiteWorkQueue(WorkQueue):
+    """WorkQueue in one SQLite file; a short-lived connection per call keeps it thread- and fork-safe"""
+
+    def __init__(self, path: str, max_attempts: int = WORK_MAX_ATTEMPTS, retry_delay: float = WORK_RETRY_DELAY):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=30)
+        try:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+        finally:
+            db.close()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            db.execute("PRAGMA synchronous=NORMAL")
+            # IMMEDIATE takes the write lock up front, so two workers never lease the same row
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        finally:
+            db.close()
+
+    def _reap(self, db: sqlite3.Connection, now: float, run_id: Optional[str]) -> int:
+        where = "state = ? AND lease_expires < ?" + (" AND run_id = ?" if run_id else "")
+        params = [LEASED, now] + ([run_id] if run_id else [])
+        expired = db.execute(f"SELECT COUNT(*) FROM work_items WHERE {where}", params).fetchone()[0]
+        if expired:
+            db.execute(f"""UPDATE work_items SET
+                               state = CASE WHEN attempts >= ? THEN ? ELSE ? END,
+                               last_error = 'lease expired (worker ' || COALESCE(worker, '?') || ' lost)',
+                               worker = NULL, lease_expires = NULL, updated_at = ?
+                           WHERE {where}""", [self.max_attempts, FAILED, QUEUED, now] + params)
+            logger.warning(f"⏰ Re-queued {expired} work items with expired leases")
+        return expired
+
+    def enqueue(self, run_id: str, items: Iterable[str]) -> int:
+        now = time.time()
+        with self._transaction() as db:
+            db.execute("INSERT OR IGNORE INTO work_runs (run_id, created_at) VALUES (?, ?)", (run_id, now))
+            start = db.execute("SELECT COALESCE(MAX(seq), 0) FROM work_items WHERE run_id = ?", (run_id,)).fetchone()[0]
+            before = db.total_changes
+            db.executemany("INSERT OR IGNORE INTO work_items (run_id, item, seq, updated_at) VALUES (?, ?, ?, ?)",
+                           [(run_id, item, start + i, now) for i, item in enumerate(items, start=1)])
+            return db.total_changes - before
+
+    def lease(self, run_id: str, worker: str, limit: int = 1,
+              lease_seconds: float = WORK_LEASE_SECONDS) -> List[WorkItem]:
+        now = time.time()
+        expires = now + lease_seconds
+        with self._transaction() as db:
+            self._reap(db, now, run_id)
+            rows = db.execute("""SELECT item, attempts FROM work_items
+                                 WHERE run_id = ? AND state = ? AND available_at <= ?
+                                 ORDER BY seq LIMIT ?""", (run_id, QUEUED, now, limit)).fetchall()
+            db.executemany("""UPDATE work_items SET state = ?, worker = ?, lease_expires = ?,
+                                  attempts = attempts + 1, updated_at = ?
+                              WHERE run_id = ? AND item = ?""",
+                           [(LEASED, worker, expires, now, run_id, item) for item, _ in rows])
+            db.execute("UPDATE work_workers SET heartbeat_at = ? WHERE run_id = ? AND worker = ?",
+                       (now, run_id, worker))
+        return [WorkItem(run_id, item, attempts + 1, expires) for item, attempts in rows]
+
+    def heartbeat(self, run_id: str, worker: str, items: Iterable[str],
+                  lease_seconds: float = WORK_LEASE_SECONDS) -> int:
+        now = time.time()
+        items = list(items)
+        with self._transaction() as db:
+            before = db.total_changes
+            db.executemany("""UPDATE work_items SET lease_expires = ?, updated_at = ?
+                              WHERE run_id = ? AND item = ? AND worker = ? AND state = ?""",
+                           [(now + lease_seconds, now, run_id, item, worker, LEASED) for item in items])
+            held = db.total_changes - before
+            db.execute("UPDATE work_workers SET heartbeat_at = ? WHERE run_id = ? AND worker = ?",
+                       (now, run_id, worker))
+        return held
+
+    def _finish(self, db: sqlite3.Connection, run_id: str, item: str, worker: str, **columns) -> bool:
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        cursor = db.execute(f"""UPDATE work_items SET {assignments}, worker = NULL, lease_expires = NULL, updated_at = ?
+                                WHERE run_id = ? AND item = ? AND worker = ? AND state = ?""",
+                            list(columns.values()) + [time.time(), run_id, item, worker, LEASED])
+        if cursor.rowcount == 0:
+            logger.warning(f"⚠️ {worker} lost its lease on {item} (run {run_id}); result discarded")
+            return False
+        return True
+
+    def complete(self, run_id: str, item: str, worker: str, result: str = "") -> bool:
+        with self._transaction() as db:
+            ok = self._finish(db, run_id, item, worker, state=DONE, result=result, last_error=None)
+            if ok:
+                db.execute("UPDATE work_workers SET done = done + 1 WHERE run_id = ? AND worker = ?", (run_id, worker))
+            return ok
+
+    def fail(self, run_id: str, item: str, worker: str, error: str, retry: bool = True) -> bool:
+        with self._transaction() as db:
+            row = db.execute("SELECT attempts FROM work_items WHERE run_id = ? AND item = ?", (run_id, item)).fetchone()
+            final = not retry or row is None or row[0] >= self.max_attempts
+            ok = self._finish(db, run_id, item, worker, state=FAILED if final else QUEUED,
+                              last_error=error[:1000], available_at=0 if final else time.time() + self.retry_delay)
+            if ok and final:
+                db.execute("UPDATE work_workers SET failed = failed + 1 WHERE run_id = ? AND worker = ?", (run_id, worker))
+            return ok
+
+    def release(self, run_id: str, worker: str, items: Iterable[str]) -> int:
+        with self._transaction() as db:
+            before = db.total_changes
+            db.executemany("""UPDATE work_items SET state = ?, worker = NULL, lease_expires = NULL,
+                                  attempts = MAX(attempts - 1, 0), updated_at = ?
+                              WHERE run_id = ? AND item = ? AND worker = ? AND state = ?""",
+                           [(QUEUED, time.time(), run_id, item, worker, LEASED) for item in items])
+            return db.total_changes - before
+
+    def reap(self, run_id: Optional[str] = None) -> int:
+        with self._transaction() as db:
+            return self._reap(db, time.time(), run_id)
+
+    def counts(self, run_id: str) -> Dict[str, int]:
+        with self._transaction() as db:
+            rows = db.execute("SELECT state, COUNT(*) FROM work_items WHERE run_id = ? GROUP BY state",
+                              (run_id,)).fetchall()
+        counts = {state: 0 for state in STATES}
+        counts.update(rows)
+        return counts
+
+    def register_worker(self, run_id: str, worker: str):
+        now = time.time()
+        with self._transaction() as db:
+            db.execute("""INSERT OR REPLACE INTO work_workers (run_id, worker, host, pid, started_at, heartbeat_at)
+                          VALUES (?, ?, ?, ?, ?, ?)""", (run_id, worker, socket.gethostname(), os.getpid(), now, now))
+
+    def workers(self, run_id: str) -> List[Dict]:
+        with self._transaction() as db:
+            rows = db.execute("""SELECT worker, host, pid, started_at, heartbeat_at, done, failed
+                                 FROM work_workers WHERE run_id = ? ORDER BY started_at""", (run_id,)).fetchall()
+        now = time.time()
+        return [{"worker": worker, "host": host, "pid": pid, "done": done, "failed": failed,
+                 "uptime_seconds": round(now - started, 1), "last_seen_seconds": round(now - seen, 1)}
+                for worker, host, pid, started, seen, done, failed in rows]
+
+    def runs(self) -> List[str]:
+        with self._transaction() as db:
+            return [row[0] for row in db.execute("SELECT run_id FROM work_runs ORDER BY created_at DESC, run_id DESC")]
+
+    def failures(self, run_id: str) -> List[Dict]:
+        with self._transaction() as db:
+            rows = db.execute("""SELECT item, attempts, last_error FROM work_items
+                                 WHERE run_id = ? AND state = ? ORDER BY seq""", (run_id, FAILED)).fetchall()
+        return [{"item": item, "attempts": attempts, "error": error} for item, attempts, error in rows]
+
+
+def open_work_queue(url: str = WORK_QUEUE_URL) -> WorkQueue:
+    """A WorkQueue for a sqlite:/// path or a "module:factory" spec"""
+    if url.startswith("sqlite:///"):
+        return SQLiteWorkQueue(url[len("sqlite:///"):])
+    module_name, sep, factory = url.partition(":")
+    if not sep or not factory:
+        raise ValueError(f"Unsupported WORK_QUEUE_URL {url!r} (use sqlite:///path or module:factory)")
+    queue = getattr(importlib.import_module(module_name), factory)()
+    if not isinstance(queue, WorkQueue):
+        raise TypeError(f"WORK_QUEUE_URL factory {url!r} returned {type(queue).__name__}, not a WorkQueue")
+    return queue